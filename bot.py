@@ -16,17 +16,22 @@ from datetime import datetime
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
 from aiohttp.web_app import Application
 
 # 导入项目配置和组件
-from config import bot_config, ADMIN_IDS, WEB_CONFIG, RATE_LIMIT, AUTO_REPLY_CONFIG, POLLING_LOCK_ENABLED
+from config import (
+    bot_config, ADMIN_IDS, WEB_CONFIG, RATE_LIMIT, AUTO_REPLY_CONFIG, POLLING_LOCK_ENABLED, WEBHOOK_SHARD_CONFIG,
+    INGESTION_CONFIG
+)
 from pathmanager import PathManager
 from database.db_connection import db_manager
 from database.db_logs import ActivityLogsDatabase
+from database.db_fsm_storage import create_fsm_storage
 from handlers.user import get_user_router, init_user_handler
 from handlers.admin import admin_router
 from handlers.merchant import get_merchant_router, init_merchant_handler
@@ -34,8 +39,16 @@ from handlers.auto_reply import get_auto_reply_router, init_auto_reply_handler
 from handlers.subscription_guard import subscription_middleware
 from handlers.reviews import get_reviews_router, init_reviews_handler
 # from debug_handler import get_debug_router  # 文件不存在，暂时注释
-from middleware import ThrottlingMiddleware, LoggingMiddleware, ErrorHandlerMiddleware
+from middleware import (
+    ThrottlingMiddleware, LoggingMiddleware, ErrorHandlerMiddleware, IngestionMiddleware, HandlerMetricsMiddleware,
+    ProfileCacheMiddleware
+)
+from middleware.tracing import (
+    UpdateTracingMiddleware, HandlerTracingMiddleware, BotApiTracingMiddleware, traced
+)
 from utils import HealthMonitor
+from utils.metrics import metrics
+from utils.startup_timer import startup_timer
 # 移除了过度复杂的安全中间件
 
 # 配置日志
@@ -61,14 +74,21 @@ class TelegramMerchantBot:
         if not ADMIN_IDS or ADMIN_IDS == [123456789]:
             logger.warning("管理员ID未正确设置，请在环境变量中设置ADMIN_IDS")
         
-        # 创建机器人实例
+        # 创建机器人实例（配置了自定义 Bot API 地址时改走该服务器）
+        session = None
+        if bot_config.api_server:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(bot_config.api_server))
+            logger.info(f"使用自定义 Bot API 服务器: {bot_config.api_server}")
         self.bot = Bot(
             token=bot_config.token,
+            session=session,
             default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN)
         )
+        # Bot API 调用计入当前更新的 trace（未启用追踪时直接放行）
+        self.bot.session.middleware(BotApiTracingMiddleware())
         
-        # 创建调度器
-        self.dp = Dispatcher(storage=MemoryStorage())
+        # 创建调度器（Webhook 分片到多个 worker 时使用共享的持久化 FSM 存储）
+        self.dp = Dispatcher(storage=create_fsm_storage(WEBHOOK_SHARD_CONFIG["fsm_storage"]))
         
         # 初始化数据库组件
         self.logs_db = None
@@ -160,11 +180,23 @@ class TelegramMerchantBot:
     def _setup_middleware(self):
         """设置中间件"""
         try:
+            # 追踪根 span（最外层，覆盖接入调度的排队时间；未启用追踪时直接放行）
+            self.dp.update.outer_middleware(UpdateTracingMiddleware())
+
+            # 用户网名缓存：每个更新的 from_user 免费刷新（纯内存，变更批量落库）
+            self.dp.update.outer_middleware(ProfileCacheMiddleware())
+            
+            # 0. 接入调度（在路由之前按优先级通道限制并发，过载时丢弃低优先级更新）
+            if INGESTION_CONFIG.get("enabled", True):
+                self.dp.update.outer_middleware(IngestionMiddleware())
+                logger.info("接入调度中间件设置完成")
+            
             # 1. 错误处理中间件（最外层，优先级最高）
             error_middleware = ErrorHandlerMiddleware(
                 notify_admins=True,
                 max_retries=3
             )
+            error_middleware = traced(error_middleware, "error_handler")
             self.dp.message.middleware(error_middleware)
             self.dp.callback_query.middleware(error_middleware)
             logger.info("错误处理中间件设置完成")
@@ -176,14 +208,16 @@ class TelegramMerchantBot:
                 admin_rate=RATE_LIMIT["admin"],
                 cleanup_interval=300
             )
+            throttling_middleware = traced(throttling_middleware, "throttling")
             self.dp.message.middleware(throttling_middleware)
             self.dp.callback_query.middleware(throttling_middleware)
             logger.info("限流中间件设置完成")
             
             # 3. 订阅验证中间件（对用户路由生效）
             # 注意：这里是全局注册，但中间件内部会检查管理员豁免
-            self.dp.message.middleware(subscription_middleware)
-            self.dp.callback_query.middleware(subscription_middleware)
+            subscription_stage = traced(subscription_middleware, "subscription")
+            self.dp.message.middleware(subscription_stage)
+            self.dp.callback_query.middleware(subscription_stage)
             logger.info("频道订阅验证中间件设置完成")
             
             # 4. 日志记录中间件（最内层，记录所有通过的请求）
@@ -240,23 +274,38 @@ class TelegramMerchantBot:
             logger.error(f"处理器注册失败: {e}")
             raise
     
-    async def _setup_database(self):
-        """初始化数据库连接"""
+    async def _setup_database(self, init_schema: bool = True):
+        """
+        初始化数据库连接
+        
+        Args:
+            init_schema: 是否执行表结构初始化/迁移（分片 worker 由 Web 进程预先完成，传 False）
+        """
         try:
             # 初始化数据库表结构
-            from database.db_init import init_database
-            success = await init_database()
-            if not success:
-                raise Exception("数据库表初始化失败")
-            logger.info("数据库表结构初始化完成")
+            if init_schema:
+                from database.db_init import init_database
+                success = await init_database()
+                if not success:
+                    raise Exception("数据库表初始化失败")
+                logger.info("数据库表结构初始化完成")
             
             # 初始化日志数据库
             self.logs_db = ActivityLogsDatabase()
             
             # 设置日志记录中间件（需要数据库连接）
             logging_middleware = LoggingMiddleware(self.logs_db)
-            self.dp.message.middleware(logging_middleware)
-            self.dp.callback_query.middleware(logging_middleware)
+            logging_stage = traced(logging_middleware, "logging")
+            self.dp.message.middleware(logging_stage)
+            self.dp.callback_query.middleware(logging_stage)
+            
+            # 处理器耗时指标与 span（最内层）
+            handler_metrics = HandlerMetricsMiddleware()
+            self.dp.message.middleware(handler_metrics)
+            self.dp.callback_query.middleware(handler_metrics)
+            handler_tracing = HandlerTracingMiddleware()
+            self.dp.message.middleware(handler_tracing)
+            self.dp.callback_query.middleware(handler_tracing)
             logger.info("日志记录中间件设置完成")
             
         except Exception as e:
@@ -266,6 +315,11 @@ class TelegramMerchantBot:
     async def _cleanup_database(self):
         """清理数据库连接"""
         try:
+            # 写入尚未落库的用户网名与会话上下文
+            from services.profile_cache import profile_cache
+            from services.session_context import session_context
+            await profile_cache.flush()
+            await session_context.flush()
             # await db_manager.close()  # No close method available
             logger.info("数据库连接已关闭")
         except Exception as e:
@@ -275,7 +329,8 @@ class TelegramMerchantBot:
         """启动时的初始化操作"""
         try:
             # 初始化数据库
-            await self._setup_database()
+            with startup_timer.stage("bot_database_init"):
+                await self._setup_database()
             
             # 初始化模板管理器
             from database.db_templates import template_manager
@@ -303,6 +358,9 @@ class TelegramMerchantBot:
             asyncio.create_task(self.health_monitor.start_monitoring())
             logger.info("健康监控已启动")
 
+            # 定期写入指标快照，由 Web 进程的 /metrics 汇总（与 Web 同进程时沿用其角色）
+            metrics.start_exporter("bot")
+
             # 启动后台任务队列workers（用于异步Telegram I/O）
             try:
                 from services.task_queue import start_task_workers
@@ -310,7 +368,18 @@ class TelegramMerchantBot:
                 logger.info("后台任务队列已启动（bot）")
             except Exception as e:
                 logger.warning(f"启动后台任务队列失败（bot）: {e}")
+
+            # 预加载实时排行榜（失败时首次查询再加载）；快照表只由机器人主进程写入
+            try:
+                from services.live_leaderboard import live_leaderboard
+                live_leaderboard.enable_persist()
+                await live_leaderboard.ensure_loaded()
+            except Exception as e:
+                logger.warning(f"预加载实时排行榜失败（bot）: {e}")
             
+            # 启动耗时报告（与 Web 同进程时已在服务器启动时输出）
+            startup_timer.report()
+
             # 通知管理员机器人启动
             startup_message = f"🤖 机器人启动成功\n\n" \
                              f"📅 启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n" \
@@ -354,12 +423,36 @@ class TelegramMerchantBot:
                 pass
             await self._cleanup_database()
             await self.bot.session.close()
+            metrics.stop_exporter()
             
             logger.info("机器人关闭完成")
             
         except Exception as e:
             logger.error(f"关闭清理失败: {e}")
     
+    async def _on_worker_startup(self):
+        """
+        Webhook 分片 worker 的初始化：只准备处理更新所需的组件
+        （Webhook 设置、健康监控和管理员通知由 Web 进程负责）
+        """
+        await self._setup_database(init_schema=False)
+        try:
+            from services.task_queue import start_task_workers
+            await start_task_workers(worker_count=3)
+        except Exception as e:
+            logger.warning(f"启动后台任务队列失败（分片 worker）: {e}")
+        metrics.start_exporter("bot")
+    
+    async def _on_worker_shutdown(self):
+        """Webhook 分片 worker 的清理"""
+        try:
+            await self._cleanup_database()
+            await self.dp.storage.close()
+            await self.bot.session.close()
+            metrics.stop_exporter()
+        except Exception as e:
+            logger.error(f"分片 worker 关闭清理失败: {e}")
+    
     async def start_polling(self):
         """启动轮询模式"""
         try:
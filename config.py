@@ -16,6 +16,7 @@ class BotConfig:
     webhook_path: str = "/webhook"  # Webhook路径
     webhook_port: int = 8000  # Webhook端口
     use_webhook: bool = True  # 是否使用Webhook模式，开发时设为False使用轮询
+    api_server: str = ""  # 自定义 Bot API 地址（本地 Bot API 服务器或压测用的模拟服务器），为空时使用官方地址
 
 
 @dataclass
@@ -98,7 +99,8 @@ POST_STATUSES = [
 bot_config = BotConfig(
     token=BOT_TOKEN,  # 机器人令牌
     webhook_url=WEBHOOK_URL,  # Webhook URL
-    use_webhook=os.getenv("USE_WEBHOOK", "true").lower() == "true"  # 是否使用Webhook模式
+    use_webhook=os.getenv("USE_WEBHOOK", "true").lower() == "true",  # 是否使用Webhook模式
+    api_server=os.getenv("TELEGRAM_API_SERVER", ""),  # 自定义 Bot API 地址
 )
 
 # 轮询单实例锁开关：默认仅在轮询模式开启（开发环境常用），生产Webhook默认关闭
@@ -108,6 +110,16 @@ if _env_lock is None:
 else:
     POLLING_LOCK_ENABLED = _env_lock.lower() == "true"
 
+# Webhook 分片配置：workers > 1 时，Web 进程只负责接收更新，按 chat_id 分发到多个机器人 worker 进程
+_webhook_workers = int(os.getenv("WEBHOOK_WORKERS", "0"))
+WEBHOOK_SHARD_CONFIG = {
+    "workers": _webhook_workers,  # worker 进程数，0/1 表示在 Web 进程内直接处理
+    "queue_size": int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000")),  # 每个 worker 的待处理更新上限，满则返回 503 让 Telegram 重投
+    "max_concurrency": int(os.getenv("WEBHOOK_WORKER_CONCURRENCY", "64")),  # 单个 worker 同时处理的更新数
+    # FSM 存储：多 worker 时必须共享（sqlite），单进程默认内存
+    "fsm_storage": os.getenv("FSM_STORAGE", "sqlite" if _webhook_workers > 1 else "memory").lower(),
+}
+
 # 消息模板配置 - 定义机器人发送的各种消息格式
 MESSAGE_TEMPLATES = {
     # 管理员相关消息
@@ -554,6 +566,75 @@ RATE_LIMIT = {
     "burst": 20     # 允许突发20个请求（支持快速点击）
 }
 
+# 令牌桶限流配置（utils.rate_limiter）：动作 -> (每秒补充令牌数, 桶容量)
+RATE_LIMIT_CONFIG = {
+    "buckets": {
+        "default": (RATE_LIMIT["default"], RATE_LIMIT["burst"]),
+        "message": (RATE_LIMIT["default"], RATE_LIMIT["burst"]),
+        "callback": (RATE_LIMIT["default"], RATE_LIMIT["burst"]),
+        "order": (float(os.getenv("RATE_LIMIT_ORDER_PER_MIN", "6")) / 60, 3),  # 创建订单（额外计入）
+        "security": (1.0, 60),  # SecurityManager.check_rate_limit：每分钟60次
+    },
+    # 回调数据前缀 -> 额外计入的动作桶
+    "callback_actions": {
+        "order_now_": "order",
+    },
+    "max_keys": int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")),  # 进程内最多保留的桶数量（LRU）
+    "shared_store": os.getenv("RATE_LIMIT_SHARED_STORE", ""),  # 多 worker 共享限流的 SQLite 文件路径，空为进程内
+}
+
+# 更新接入调度配置（middleware.ingestion）：在路由前按优先级通道限制并发
+# priority 越小越优先；max_share 为该通道最多可占用的并发比例（为高优先级通道预留余量）；
+# max_queue / max_wait 超出时丢弃该更新（None 表示不限）
+INGESTION_CONFIG = {
+    "enabled": os.getenv("INGESTION_ENABLED", "true").lower() == "true",
+    "max_concurrency": int(os.getenv("INGESTION_MAX_CONCURRENCY", "64")),
+    "lanes": {
+        "admin": {"priority": 0, "max_share": 1.0, "max_queue": None, "max_wait": None},
+        "flow": {"priority": 1, "max_share": 1.0, "max_queue": 1000, "max_wait": 30.0},  # 下单 / 商户入驻 / 评价
+        "browse": {"priority": 2, "max_share": 0.75, "max_queue": 500, "max_wait": 10.0},  # 地区浏览、个人中心等
+        "auto_reply": {"priority": 3, "max_share": 0.5, "max_queue": 200, "max_wait": 3.0},  # 无状态的普通文本
+    },
+    # 归入 flow 通道的回调数据前缀
+    "flow_callback_prefixes": (
+        "order_now_", "order_choose_", "binding_", "merchant_edit_", "merchant_media_done",
+        "merchant_submit_review", "merchant_back_to_menu", "edit_region_", "rv:", "rating_",
+    ),
+    # 归入 flow 通道的文本关键词
+    "flow_text_keywords": ("上榜流程",),
+}
+
+# 请求追踪配置（utils.tracing）：按更新记录 span 树，调试页 /debug/traces 查看
+TRACING_CONFIG = {
+    "enabled": os.getenv("TRACING_ENABLED", "false").lower() == "true",
+    "sample_rate": float(os.getenv("TRACING_SAMPLE_RATE", "0.1")),  # 普通请求的保留比例
+    "slow_ms": float(os.getenv("TRACING_SLOW_MS", "1000")),  # 慢于该值的请求一律保留
+    "buffer_size": int(os.getenv("TRACING_BUFFER_SIZE", "200")),  # 环形缓冲区保留的 trace 数
+    "max_spans": 500,  # 单个 trace 最多记录的 span 数
+}
+
+# 运行指标配置（utils.metrics）：Web 进程的 /metrics 输出 Prometheus 文本格式
+METRICS_CONFIG = {
+    "enabled": os.getenv("METRICS_ENABLED", "true").lower() == "true",
+    # 各进程定期把指标快照写入该目录，/metrics 汇总全部进程；留空为 data/metrics
+    "multiprocess_dir": os.getenv("METRICS_DIR", ""),
+    "flush_interval": float(os.getenv("METRICS_FLUSH_INTERVAL", "15")),  # 快照写入间隔（秒）
+    "retention_seconds": 7 * 86400,  # 已退出进程的快照保留时长
+    "max_series": 500,  # 单个指标最多的标签组合数，超出归入 "other"
+    "token": os.getenv("METRICS_TOKEN", ""),  # /metrics 访问令牌（Bearer），留空时仅允许管理员登录会话访问
+}
+
+# 慢查询日志配置（database.db_query_profiler）：调试页 /debug/queries 查看
+SLOW_QUERY_CONFIG = {
+    "enabled": os.getenv("SLOW_QUERY_ENABLED", "true").lower() == "true",
+    "threshold_ms": float(os.getenv("SLOW_QUERY_MS", "100")),  # 超过该耗时的语句记为慢查询
+    "explain": os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true",  # 每个 SQL 指纹抓取一次执行计划
+    "large_table_rows": int(os.getenv("SLOW_QUERY_LARGE_TABLE_ROWS", "1000")),  # 全表扫描超过该行数的表会被标记
+    "max_fingerprints": 2000,  # 进程内最多跟踪的 SQL 指纹数
+    "recent_size": 200,  # 最近慢查询样本数
+    "flush_interval": 60,  # 汇总写入 slow_queries 表的间隔（秒）
+}
+
 # 商户注册模式配置
 QUICK_REGISTRATION_MODE = os.getenv("QUICK_REGISTRATION_MODE", "true").lower() == "true"  # True=快速注册(管理员填写), False=7步用户填写
 
@@ -577,6 +658,131 @@ AUTO_REPLY_CONFIG = {
     "max_message_length": 4000,  # 单条回复消息最大长度
 }
 
+# 媒体代理缓存配置（/media-proxy）
+MEDIA_CACHE_CONFIG = {
+    "max_bytes": int(os.getenv("MEDIA_CACHE_MAX_MB", "512")) * 1024 * 1024,  # 磁盘缓存上限
+    "file_path_ttl": int(os.getenv("MEDIA_FILE_PATH_TTL", "3000")),  # file_id→file_path 映射有效期（秒）
+    "browser_max_age": int(os.getenv("MEDIA_BROWSER_MAX_AGE", "86400")),  # 浏览器缓存时间（秒）
+}
+
+# 媒体缩略图配置（后台管理列表/详情页预览）
+MEDIA_THUMBNAIL_CONFIG = {
+    "sizes": {"sm": 160, "md": 480},  # 规格名 -> 最长边像素
+    "quality": int(os.getenv("MEDIA_THUMB_QUALITY", "80")),  # WebP 质量
+    "workers": int(os.getenv("MEDIA_THUMB_WORKERS", "2")),  # 进程池大小
+    "poster_offset": float(os.getenv("MEDIA_POSTER_OFFSET", "1.0")),  # 视频封面帧截取时间点（秒）
+}
+
+# 用户评分实时排行榜配置
+LEADERBOARD_CONFIG = {
+    "min_reviews": int(os.getenv("LEADERBOARD_MIN_REVIEWS", "6")),  # 入榜最小有效评价次数
+    "sync_interval": float(os.getenv("LEADERBOARD_SYNC_INTERVAL", "5")),  # 读取时拉取其它进程变更的最小间隔（秒）
+    "persist_delay": float(os.getenv("LEADERBOARD_PERSIST_DELAY", "5")),  # 变更后延迟写入 user_score_leaderboards（秒）
+}
+
+# 用户资料（Telegram 网名）缓存配置
+PROFILE_CACHE_CONFIG = {
+    "max_entries": int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "50000")),  # 进程内最多缓存的用户数（LRU）
+    "stale_after": int(os.getenv("PROFILE_CACHE_STALE_SECONDS", "86400")),  # 超过该时长的资料在读取时后台刷新（秒）
+    "fetch_concurrency": int(os.getenv("PROFILE_CACHE_FETCH_CONCURRENCY", "8")),  # 批量 getChat 的并发上限
+    "flush_interval": float(os.getenv("PROFILE_CACHE_FLUSH_SECONDS", "5")),  # 来自更新的资料变更批量写入 users 的间隔（秒）
+}
+
+# 会话上下文配置（services.session_context）：当前城市、最近深链等按用户的短期上下文
+SESSION_CONTEXT_CONFIG = {
+    "max_entries": int(os.getenv("SESSION_CONTEXT_MAX_ENTRIES", "20000")),  # 进程内最多保留的条目数（LRU）
+    "ttl": int(os.getenv("SESSION_CONTEXT_TTL", "604800")),  # 默认有效期（秒），到期视为不存在并由每日清理删除
+    "recheck_after": int(os.getenv("SESSION_CONTEXT_RECHECK_SECONDS", "300")),  # 内存条目超过该时长后重新读表（多 worker 一致性）
+    "flush_interval": float(os.getenv("SESSION_CONTEXT_FLUSH_SECONDS", "2")),  # 写入批量落库的间隔（秒）
+}
+
+# 评价发布配置（services.review_publish_service）
+REVIEW_PUBLISH_CONFIG = {
+    "channel_cache_ttl": int(os.getenv("REVIEW_CHANNEL_CACHE_TTL", "60")),  # 频道配置缓存时长（秒），web 端修改后最多延迟该时长生效
+    "channel_per_minute": float(os.getenv("REVIEW_PUBLISH_PER_MINUTE", "20")),  # 单个频道每分钟最多发布条数（Telegram 频道限额约 20 条/分钟）
+    "channel_burst": int(os.getenv("REVIEW_PUBLISH_BURST", "3")),  # 单个频道允许的突发条数
+    "batch_limit": int(os.getenv("REVIEW_PUBLISH_BATCH_LIMIT", "200")),  # 批量补发时单次最多处理的评价数（每个方向）
+}
+
+# 分析只读快照配置（database.db_snapshot）：后台报表与统计读取主库的在线备份副本
+ANALYTICS_SNAPSHOT_CONFIG = {
+    "enabled": os.getenv("ANALYTICS_SNAPSHOT_ENABLED", "true").lower() == "true",
+    "path": os.getenv("ANALYTICS_SNAPSHOT_PATH", ""),  # 快照文件路径，空为主库同目录下的 <主库名>.analytics.db
+    "interval": int(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "300")),  # 调度器刷新间隔（秒）
+    "max_age": int(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE", "1800")),  # 超过该时长的快照不再使用，回退读主库（秒）
+    "pages_per_step": int(os.getenv("ANALYTICS_SNAPSHOT_PAGES_PER_STEP", "1024")),  # 在线备份每步复制的页数
+    "step_sleep": float(os.getenv("ANALYTICS_SNAPSHOT_STEP_SLEEP", "0.01")),  # 两步之间让出的时间（秒）
+    "max_restarts": int(os.getenv("ANALYTICS_SNAPSHOT_MAX_RESTARTS", "3")),  # 主库写入导致备份重来超过该次数后改为单步复制
+}
+
+# 数据库维护配置（database.db_maintenance，调度器执行）：WAL 检查点、PRAGMA optimize、增量 VACUUM
+DB_MAINTENANCE_CONFIG = {
+    "enabled": os.getenv("DB_MAINTENANCE_ENABLED", "true").lower() == "true",
+    "check_interval": int(os.getenv("DB_MAINTENANCE_CHECK_SECONDS", "60")),  # 检查 WAL/空闲页的间隔（秒）
+    "wal_passive_mb": float(os.getenv("DB_WAL_PASSIVE_MB", "16")),  # WAL 超过该大小时执行 PASSIVE 检查点
+    "wal_truncate_mb": float(os.getenv("DB_WAL_TRUNCATE_MB", "64")),  # WAL 超过该大小且已全部回写时执行 TRUNCATE 收缩文件
+    "truncate_timeout": float(os.getenv("DB_WAL_TRUNCATE_TIMEOUT", "1")),  # TRUNCATE 等待读写方的最长时间（秒），超时下次再试
+    "quiet_hours": os.getenv("DB_MAINTENANCE_QUIET_HOURS", "3-6"),  # 允许 VACUUM 的本地时段（起始小时-结束小时）
+    "vacuum_min_free_pages": int(os.getenv("DB_VACUUM_MIN_FREE_PAGES", "1000")),  # 空闲页超过该数量才回收
+    "vacuum_pages_per_step": int(os.getenv("DB_VACUUM_PAGES_PER_STEP", "256")),  # 每步增量回收的页数（每步一个短写事务）
+    "vacuum_max_steps": int(os.getenv("DB_VACUUM_MAX_STEPS", "40")),  # 每轮最多执行的步数
+    "vacuum_step_sleep": float(os.getenv("DB_VACUUM_STEP_SLEEP", "0.2")),  # 步间让出的时间（秒）
+    "full_vacuum_max_mb": float(os.getenv("DB_FULL_VACUUM_MAX_MB", "200")),  # 旧库切换增量回收模式需一次完整 VACUUM，超过该大小不自动执行
+}
+
+# 迁移执行配置（database.db_migrations）：大表上的索引/标注 @online_rebuild 的表结构变更改为影子表分批复制
+MIGRATION_CONFIG = {
+    "online_min_rows": int(os.getenv("MIGRATION_ONLINE_MIN_ROWS", "50000")),  # 表行数（按 MAX(rowid) 估计）达到该值时索引在迁移提交后分批构建
+    "batch_rows": int(os.getenv("MIGRATION_BATCH_ROWS", "2000")),  # 在线重建每批复制的行数（每批一个短写事务）
+    "step_sleep": float(os.getenv("MIGRATION_STEP_SLEEP", "0.05")),  # 批间让出的时间（秒）
+    "strict_since": os.getenv("MIGRATION_STRICT_SINCE", "2026.10.18.1"),  # 自该版本起任一语句失败即整体回滚；更早的历史迁移沿用逐条容错
+}
+
+# 数据库备份配置（utils.backup_manager）：读快照逐页流式写出压缩的全量/增量（变更页）备份
+BACKUP_CONFIG = {
+    "dir": os.getenv("BACKUP_DIR", ""),  # 备份目录，空为 data/backups
+    "max_chains": int(os.getenv("BACKUP_MAX_CHAINS", "3")),  # 保留的备份链数（一个全量及其后的增量为一条链）
+    "full_every": int(os.getenv("BACKUP_FULL_EVERY", "7")),  # 每条链最多的增量备份数，达到后下一次做全量
+    "full_change_ratio": float(os.getenv("BACKUP_FULL_CHANGE_RATIO", "0.5")),  # 变更页超过该比例时改做全量
+    "pages_per_step": int(os.getenv("BACKUP_PAGES_PER_STEP", "1024")),  # 经 sqlite_dbpage 读取时每批的页数
+    "compresslevel": int(os.getenv("BACKUP_COMPRESS_LEVEL", "3")),  # gzip 压缩级别（1 最快，9 最小）
+}
+
+# 启动优化配置（main.py / database.db_init / web.app）
+STARTUP_CONFIG = {
+    "schema_fingerprint_cache": os.getenv("SCHEMA_FINGERPRINT_CACHE", "true").lower() == "true",  # 表结构指纹（PRAGMA schema_version + 迁移文件集）未变时跳过表验证
+    "lazy_routes": os.getenv("LAZY_ROUTES", "true").lower() == "true",  # 调试/开发工具/分析等低频路由在首次访问时才导入
+}
+
+# 按城市分库配置（database.db_shards）：订单/评价等城市维度的表写入各城市分片文件，主库保留用户、商户、配置与模板
+SHARDING_CONFIG = {
+    "enabled": os.getenv("DB_SHARDING", "false").lower() == "true",  # 是否启用分片（默认关闭，全部数据在主库）
+    "dir": os.getenv("DB_SHARD_DIR", ""),  # 分片文件目录，空为主库目录下的 shards/
+    "tables": [t.strip() for t in os.getenv(
+        "DB_SHARD_TABLES", "orders,reviews,merchant_score_totals,merchant_scores,row_counters"
+    ).split(",") if t.strip()],  # 分片表（须包含其触发器写入的表）
+    "buckets": int(os.getenv("DB_SHARD_BUCKETS", "0")),  # 分片数，按 (city_id - 1) % N 合并城市；0 或超过 SQLite 附加库上限（默认 10）时取该上限
+    "id_span": int(os.getenv("DB_SHARD_ID_SPAN", "1000000000")),  # 每个分片的自增ID区间（分片号 × id_span 起），按ID即可定位分片
+}
+
+# 预约下单配置（services.order_service）
+ORDER_CONFIG = {
+    "idempotency_window": int(os.getenv("ORDER_IDEMPOTENCY_WINDOW_SECONDS", "60")),  # 幂等时间窗（秒），窗口内同一用户/商户/课程的重复点击复用同一订单
+}
+
+# 帖子发布/服务到期时间线配置（调度器）
+PUBLISH_TIMELINE_CONFIG = {
+    "reconcile_interval": int(os.getenv("PUBLISH_TIMELINE_RECONCILE_SECONDS", "300")),  # 与数据库全量对账的间隔（秒）
+    "change_poll_interval": int(os.getenv("PUBLISH_TIMELINE_POLL_SECONDS", "5")),  # 轮询 merchant_schedule_changes 变更信号的间隔（秒）
+    "retry_delay": int(os.getenv("PUBLISH_TIMELINE_RETRY_SECONDS", "300")),  # 发布失败/跳过后的重试间隔（秒）
+}
+
+# 活动日志分区与归档配置
+ACTIVITY_LOG_CONFIG = {
+    "retention_days": int(os.getenv("ACTIVITY_LOG_RETENTION_DAYS", "90")),  # 保留天数（按整月分区删除）
+    "archive_dir": os.getenv("ACTIVITY_LOG_ARCHIVE_DIR", ""),  # 过期分区 NDJSON 归档目录，空为 data/archives/activity_logs
+}
+
 # 订阅验证功能配置
 SUBSCRIPTION_VERIFICATION_CONFIG = {
     "enabled": os.getenv("SUBSCRIPTION_VERIFICATION_ENABLED", "false").lower() == "true",  # 总开关
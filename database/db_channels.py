@@ -3,17 +3,25 @@
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from database.db_connection import db_manager
+from config import REVIEW_PUBLISH_CONFIG
+from utils.metrics import CACHE_REQUESTS
 
 logger = logging.getLogger(__name__)
 
+# role -> (读取时间, 激活频道)；本进程内的写操作提交后立即清空，其他进程（web 后台）的修改按 TTL 生效
+_active_cache: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+
 
 class PostingChannelsDB:
     @staticmethod
     async def add_channel(display_name: str, channel_chat_id: Optional[str], channel_link: Optional[str], is_active: bool = True, role: str = 'post') -> int:
         query = "INSERT INTO posting_channels (display_name, channel_chat_id, channel_link, is_active, role) VALUES (?, ?, ?, ?, ?)"
-        return await db_manager.get_last_insert_id(query, (display_name, channel_chat_id, channel_link, 1 if is_active else 0, role))
+        channel_id = await db_manager.get_last_insert_id(query, (display_name, channel_chat_id, channel_link, 1 if is_active else 0, role))
+        PostingChannelsDB.invalidate_cache()
+        return channel_id
 
     @staticmethod
     async def get_all_channels() -> List[Dict[str, Any]]:
@@ -31,6 +39,31 @@ class PostingChannelsDB:
         row = await db_manager.fetch_one("SELECT * FROM posting_channels WHERE is_active = 1 AND role = ? ORDER BY id DESC LIMIT 1", (role,))
         return dict(row) if row else None
 
+    @staticmethod
+    async def get_active_channel_cached(role: str = 'post') -> Optional[Dict[str, Any]]:
+        """
+        带 TTL 缓存的激活频道（评价发布等高频路径使用）
+
+        Args:
+            role: 频道角色（post / review_u2m / review_m2u）
+
+        Returns:
+            频道配置字典（调用方不应修改），未配置时返回None
+        """
+        ttl = REVIEW_PUBLISH_CONFIG.get('channel_cache_ttl', 60)
+        cached = _active_cache.get(role)
+        if cached is not None and time.monotonic() - cached[0] < ttl:
+            CACHE_REQUESTS.inc(cache='posting_channel', result='hit')
+            return cached[1]
+        CACHE_REQUESTS.inc(cache='posting_channel', result='miss')
+        channel = await PostingChannelsDB.get_active_channel_by_role(role)
+        _active_cache[role] = (time.monotonic(), channel)
+        return channel
+
+    @staticmethod
+    def invalidate_cache() -> None:
+        _active_cache.clear()
+
     @staticmethod
     async def set_active_channel(channel_id: int) -> bool:
         # 兼容旧方法：将指定记录的 role 取出后，仅对该 role 范围内切换
@@ -42,6 +75,9 @@ class PostingChannelsDB:
         except Exception as e:
             logger.error(f"设置激活频道失败: {e}")
             return False
+        finally:
+            # 写入提交后再清缓存，避免并发读取在提交前把旧值重新放回缓存
+            PostingChannelsDB.invalidate_cache()
 
     @staticmethod
     async def set_active_channel_for_role(channel_id: int) -> bool:
@@ -66,11 +102,15 @@ class PostingChannelsDB:
         updates.append("updated_at = CURRENT_TIMESTAMP")
         params.append(channel_id)
         query = f"UPDATE posting_channels SET {', '.join(updates)} WHERE id = ?"
-        return (await db_manager.execute_query(query, tuple(params))) > 0
+        updated = (await db_manager.execute_query(query, tuple(params))) > 0
+        PostingChannelsDB.invalidate_cache()
+        return updated
 
     @staticmethod
     async def delete_channel(channel_id: int) -> bool:
-        return (await db_manager.execute_query("DELETE FROM posting_channels WHERE id = ?", (channel_id,))) > 0
+        deleted = (await db_manager.execute_query("DELETE FROM posting_channels WHERE id = ?", (channel_id,))) > 0
+        PostingChannelsDB.invalidate_cache()
+        return deleted
 
 
 posting_channels_db = PostingChannelsDB()
@@ -6,17 +6,36 @@
 import aiosqlite
 import asyncio
 import logging
+import time
 from typing import Any, Dict, List, Optional, Tuple, Union
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 import os
 from pathlib import Path
 
 # 导入路径管理器
 from pathmanager import PathManager
+from database.db_query_profiler import query_profiler
+from utils.metrics import DB_QUERY_ERRORS, DB_QUERY_SECONDS
+from utils.tracing import sql_fingerprint, tracer
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 当前上下文的读取是否改走只读快照（见 DatabaseManager.snapshot_reads）
+_snapshot_reads: ContextVar[bool] = ContextVar("db_snapshot_reads", default=False)
+# 当前上下文的读取是否只读主库文件、不汇总分片（见 DatabaseManager.local_reads）
+_local_reads: ContextVar[bool] = ContextVar("db_local_reads", default=False)
+
+
+def _observe_query(op: str, query: str, params: Any, started: float):
+    """记录语句耗时指标（按 SQL 指纹聚合），并交给慢查询分析器"""
+    elapsed = time.perf_counter() - started
+    fingerprint = sql_fingerprint(query)
+    DB_QUERY_SECONDS.observe(elapsed, op=op, statement=fingerprint)
+    query_profiler.record(op, query, fingerprint, params, elapsed * 1000)
+
+
 class DatabaseManager:
     """
     数据库连接管理器类
@@ -38,6 +57,10 @@ class DatabaseManager:
             self.db_path = PathManager.get_database_path()
             self.connection_pool = []
             self.max_connections = 10
+            # 只读副本（database.db_snapshot 注册），提供 available() 与 connection()
+            self.read_replica = None
+            # 城市分片路由（database.db_shards 在启用分片时注册）
+            self.shards = None
             self.initialized = True
             logger.info(f"数据库管理器初始化完成，数据库路径: {self.db_path}")
 
@@ -80,6 +103,8 @@ class DatabaseManager:
             conn.row_factory = aiosqlite.Row
             
             # 配置SQLite参数以提高性能和并发性
+            # 新库建表前启用增量回收；已有库在下一次 VACUUM 时切换（见 database.db_maintenance）
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
             await conn.execute("PRAGMA journal_mode=WAL")  # 启用WAL模式提高并发性
             await conn.execute("PRAGMA synchronous=NORMAL")  # 平衡性能和安全性
             await conn.execute("PRAGMA cache_size=10000")  # 增加缓存大小
@@ -129,6 +154,86 @@ class DatabaseManager:
                         await conn.close()
                         logger.debug("连接池已满，关闭连接")
     
+    @contextmanager
+    def snapshot_reads(self):
+        """
+        只读路由范围：范围内（含其中创建的子任务）的 fetch_one/fetch_all 读取分析快照
+
+        快照未启用、不存在或过旧时仍读主库；写操作始终走主库。
+        """
+        token = _snapshot_reads.set(True)
+        try:
+            yield
+        finally:
+            _snapshot_reads.reset(token)
+
+    @contextmanager
+    def local_reads(self):
+        """
+        本地读取范围：范围内的 fetch_one/fetch_all 只读主库文件，不汇总各城市分片
+
+        分片未启用时与普通读取相同；用于按文件分别统计/对账的维护任务。
+        """
+        token = _local_reads.set(True)
+        try:
+            yield
+        finally:
+            _local_reads.reset(token)
+
+    def for_city(self, city_id: Optional[int]) -> 'DatabaseManager':
+        """
+        城市分片的数据库管理器（查询接口与主库相同）
+
+        Args:
+            city_id: 城市ID
+
+        Returns:
+            分片未启用或城市为空时返回主库管理器
+        """
+        if self.shards is None or not city_id:
+            return self
+        return self.shards.for_city(city_id)
+
+    def for_id(self, row_id: Optional[int]) -> 'DatabaseManager':
+        """按分片表的行ID（订单、评价等）定位所在分片；主库ID区间或分片未启用时返回主库管理器"""
+        if self.shards is None or not row_id:
+            return self
+        return self.shards.for_id(row_id)
+
+    async def for_merchant(self, merchant_id: Optional[int]) -> 'DatabaseManager':
+        """按商户所在城市定位分片（新订单写入该分片）"""
+        if self.shards is None or not merchant_id:
+            return self
+        return await self.shards.for_merchant(merchant_id)
+
+    def databases_for(self, table: str) -> List['DatabaseManager']:
+        """持有该表数据的全部数据库管理器（主库及已有分片），用于按文件分别维护"""
+        if self.shards is None:
+            return [self]
+        return self.shards.databases_for(table)
+
+    def all_databases(self) -> List['DatabaseManager']:
+        """全部数据库文件的管理器（主库及磁盘上已有的分片），用于备份、检查点与 VACUUM"""
+        if self.shards is None:
+            return [self]
+        return self.shards.all_databases()
+
+    def _read_connection(self, span):
+        """
+        按当前上下文选择读连接：
+        启用分片时用汇总各分片的连接（local_reads 范围内除外；分析快照只含主库文件，分片时停用）；
+        快照范围内且快照可用时用只读副本；否则用主库连接池
+        """
+        shards = self.shards
+        if shards is not None and not _local_reads.get():
+            span.set("db.shards", "fan_out")
+            return shards.fan_out_connection()
+        replica = self.read_replica
+        if _snapshot_reads.get() and replica is not None and replica.available():
+            span.set("db.replica", "snapshot")
+            return replica.connection()
+        return self.get_connection()
+
     async def execute_query(
         self, 
         query: str, 
@@ -148,46 +253,60 @@ class DatabaseManager:
         """
         max_retries = 3
         retry_delay = 0.1
+        span = tracer.db_span("execute", query)
+        started = time.perf_counter()
         
-        for attempt in range(max_retries):
-            try:
-                async with self.get_connection() as conn:
-                    if params:
-                        cursor = await conn.execute(query, params)
-                    else:
-                        cursor = await conn.execute(query)
-                    
-                    if fetch_result:
-                        if query.strip().upper().startswith('SELECT'):
-                            # 对于SELECT查询，返回所有结果
-                            result = await cursor.fetchall()
-                            logger.debug(f"查询执行成功，返回 {len(result)} 行数据")
-                            return result
+        try:
+            for attempt in range(max_retries):
+                try:
+                    async with self.get_connection() as conn:
+                        if params:
+                            cursor = await conn.execute(query, params)
+                        else:
+                            cursor = await conn.execute(query)
+                        
+                        if fetch_result:
+                            if query.strip().upper().startswith('SELECT'):
+                                # 对于SELECT查询，返回所有结果
+                                result = await cursor.fetchall()
+                                span.set("db.rows", len(result))
+                                logger.debug(f"查询执行成功，返回 {len(result)} 行数据")
+                                return result
+                            else:
+                                # 对于其他查询，返回受影响的行数
+                                await conn.commit()
+                                result = cursor.rowcount
+                                span.set("db.rows", result)
+                                logger.debug(f"查询执行成功，影响 {result} 行")
+                                return result
                         else:
-                            # 对于其他查询，返回受影响的行数
                             await conn.commit()
                             result = cursor.rowcount
+                            span.set("db.rows", result)
                             logger.debug(f"查询执行成功，影响 {result} 行")
                             return result
+                            
+                except aiosqlite.OperationalError as e:
+                    if "database is locked" in str(e).lower() and attempt < max_retries - 1:
+                        logger.warning(f"数据库锁定，第 {attempt + 1} 次重试...")
+                        span.add_event("db.locked_retry", attempt=attempt + 1)
+                        await asyncio.sleep(retry_delay * (2 ** attempt))
+                        continue
                     else:
-                        await conn.commit()
-                        result = cursor.rowcount
-                        logger.debug(f"查询执行成功，影响 {result} 行")
-                        return result
-                        
-            except aiosqlite.OperationalError as e:
-                if "database is locked" in str(e).lower() and attempt < max_retries - 1:
-                    logger.warning(f"数据库锁定，第 {attempt + 1} 次重试...")
-                    await asyncio.sleep(retry_delay * (2 ** attempt))
-                    continue
-                else:
-                    logger.error(f"数据库操作错误: {e}")
+                        logger.error(f"数据库操作错误: {e}")
+                        span.set_error(e)
+                        DB_QUERY_ERRORS.inc(op="execute")
+                        raise
+                except Exception as e:
+                    logger.error(f"执行查询失败: {e}, SQL: {query}")
+                    span.set_error(e)
+                    DB_QUERY_ERRORS.inc(op="execute")
                     raise
-            except Exception as e:
-                logger.error(f"执行查询失败: {e}, SQL: {query}")
-                raise
-        
-        raise Exception(f"查询执行失败，已重试 {max_retries} 次")
+            
+            raise Exception(f"查询执行失败，已重试 {max_retries} 次")
+        finally:
+            span.end()
+            _observe_query("execute", query, params, started)
     
     async def fetch_one(
         self, 
@@ -204,20 +323,28 @@ class DatabaseManager:
         Returns:
             单行查询结果或None
         """
+        span = tracer.db_span("fetch_one", query)
+        started = time.perf_counter()
         try:
-            async with self.get_connection() as conn:
+            async with self._read_connection(span) as conn:
                 if params:
                     cursor = await conn.execute(query, params)
                 else:
                     cursor = await conn.execute(query)
                 
                 result = await cursor.fetchone()
+                span.set("db.rows", 0 if result is None else 1)
                 logger.debug(f"单行查询执行成功: {query[:50]}...")
                 return result
                 
         except Exception as e:
             logger.error(f"单行查询失败: {e}, SQL: {query}")
+            span.set_error(e)
+            DB_QUERY_ERRORS.inc(op="fetch_one")
             raise
+        finally:
+            span.end()
+            _observe_query("fetch_one", query, params, started)
     
     async def fetch_all(
         self, 
@@ -234,21 +361,63 @@ class DatabaseManager:
         Returns:
             查询结果列表
         """
+        span = tracer.db_span("fetch_all", query)
+        started = time.perf_counter()
         try:
-            async with self.get_connection() as conn:
+            async with self._read_connection(span) as conn:
                 if params:
                     cursor = await conn.execute(query, params)
                 else:
                     cursor = await conn.execute(query)
                 
                 result = await cursor.fetchall()
+                span.set("db.rows", len(result))
                 logger.debug(f"多行查询执行成功，返回 {len(result)} 行: {query[:50]}...")
                 return result
                 
         except Exception as e:
             logger.error(f"多行查询失败: {e}, SQL: {query}")
+            span.set_error(e)
+            DB_QUERY_ERRORS.inc(op="fetch_all")
             raise
+        finally:
+            span.end()
+            _observe_query("fetch_all", query, params, started)
     
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        写事务上下文：BEGIN IMMEDIATE，正常退出提交，异常回滚并继续抛出
+
+        IMMEDIATE 在事务开始时即取得写锁（忙时按连接 timeout 等待），
+        事务内先读后写不会因锁升级失败而报 database is locked。
+
+        使用方式：
+            async with db_manager.transaction() as conn:
+                await conn.execute(...)
+
+        Yields:
+            事务所在的连接
+        """
+        span = tracer.db_span("transaction", "BEGIN IMMEDIATE")
+        started = time.perf_counter()
+        try:
+            async with self.get_connection() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                    await conn.commit()
+                except BaseException:
+                    await conn.rollback()
+                    raise
+        except Exception as e:
+            span.set_error(e)
+            DB_QUERY_ERRORS.inc(op="transaction")
+            raise
+        finally:
+            span.end()
+            _observe_query("transaction", "BEGIN IMMEDIATE", None, started)
+
     async def execute_transaction(self, queries: List[Tuple[str, Optional[Union[Tuple, Dict]]]]) -> bool:
         """
         执行事务操作
@@ -259,10 +428,13 @@ class DatabaseManager:
         Returns:
             事务是否成功执行
         """
+        span = tracer.db_span("transaction", queries[0][0] if queries else "")
+        started = time.perf_counter()
+        span.set("db.statements", len(queries))
         try:
             async with self.get_connection() as conn:
-                # 开始事务
-                await conn.execute("BEGIN TRANSACTION")
+                # 开始事务（立即取得写锁）
+                await conn.execute("BEGIN IMMEDIATE")
                 
                 try:
                     for query, params in queries:
@@ -284,7 +456,14 @@ class DatabaseManager:
                     
         except Exception as e:
             logger.error(f"事务操作失败: {e}")
+            span.set_error(e)
+            DB_QUERY_ERRORS.inc(op="transaction")
             return False
+        finally:
+            span.end()
+            _observe_query(
+                "transaction", queries[0][0] if queries else "", queries[0][1] if queries else None, started
+            )
     
     async def get_last_insert_id(self, query: str, params: Optional[Union[Tuple, Dict]] = None) -> int:
         """
@@ -297,6 +476,8 @@ class DatabaseManager:
         Returns:
             最后插入的行ID
         """
+        span = tracer.db_span("insert", query)
+        started = time.perf_counter()
         try:
             async with self.get_connection() as conn:
                 if params:
@@ -306,12 +487,18 @@ class DatabaseManager:
                 
                 await conn.commit()
                 last_id = cursor.lastrowid
+                span.set("db.rows", cursor.rowcount)
                 logger.debug(f"插入操作成功，返回ID: {last_id}")
                 return last_id
                 
         except Exception as e:
             logger.error(f"插入操作失败: {e}, SQL: {query}")
+            span.set_error(e)
+            DB_QUERY_ERRORS.inc(op="insert")
             raise
+        finally:
+            span.end()
+            _observe_query("insert", query, params, started)
     
     async def close_all_connections(self):
         """关闭所有连接池中的连接"""
@@ -324,6 +511,10 @@ class DatabaseManager:
             
             self.connection_pool.clear()
             logger.info("所有数据库连接已关闭")
+        if self.read_replica is not None:
+            await self.read_replica.close()
+        if self.shards is not None:
+            await self.shards.close()
     
     async def health_check(self) -> bool:
         """
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+行数计数器数据访问层
+
+表：row_counters（新增表）
+
+说明：
+- 后台列表的总数（全部 / 按状态 / 按等级）由表上的触发器在写入时增减，
+  读取是一次主键查询，不再随每次翻页执行 COUNT(*)。
+- 键格式：'<表名>' 与 '<表名>:<维度>:<值>'，如 'orders'、'orders:status:已完成'、
+  'users:level:新手'。
+- 带其它筛选条件（日期、商户、搜索等）的统计仍走 COUNT(*)。
+"""
+
+from typing import Dict, Iterable
+import logging
+
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+# (表名, 分组列, 键中的维度名)
+COUNTER_SOURCES = [
+    ('orders', 'status', 'status'),
+    ('merchants', 'status', 'status'),
+    ('reviews', 'status', 'status'),
+    ('users', 'level_name', 'level'),
+]
+
+
+class RowCounters:
+    """行数计数器管理器"""
+
+    @staticmethod
+    async def get(key: str) -> int:
+        """读取单个计数器，不存在视为0"""
+        row = await db_manager.fetch_one("SELECT value FROM row_counters WHERE counter_key = ?", (key,))
+        return int(row['value']) if row else 0
+
+    @staticmethod
+    async def get_many(keys: Iterable[str]) -> Dict[str, int]:
+        """批量读取计数器"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        rows = await db_manager.fetch_all(
+            f"SELECT counter_key, value FROM row_counters WHERE counter_key IN ({placeholders})", tuple(keys)
+        )
+        found = {r['counter_key']: int(r['value']) for r in rows or []}
+        return {k: found.get(k, 0) for k in keys}
+
+    @staticmethod
+    async def rebuild() -> int:
+        """
+        按源表重新统计全部计数器（修复/工具用）
+
+        Returns:
+            写入的计数器数量
+        """
+        # 启用城市分片时每个库只统计本库的行，读取时按键汇总
+        for db in db_manager.databases_for('row_counters'):
+            queries = [("DELETE FROM row_counters", ())]
+            for table, column, label in COUNTER_SOURCES:
+                if db is not db_manager and table not in db_manager.shards.tables:
+                    continue
+                queries.append((
+                    f"INSERT INTO row_counters (counter_key, value) SELECT '{table}', COUNT(*) FROM {table}", ()
+                ))
+                queries.append((
+                    f"INSERT INTO row_counters (counter_key, value) "
+                    f"SELECT '{table}:{label}:' || COALESCE({column}, ''), COUNT(*) FROM {table} "
+                    f"GROUP BY COALESCE({column}, '')", ()
+                ))
+            if not await db.execute_transaction(queries):
+                raise RuntimeError("row_counters 重建失败")
+        row = await db_manager.fetch_one("SELECT COUNT(*) AS c FROM row_counters")
+        count = int(row['c']) if row else 0
+        logger.info(f"row_counters 重建完成：{count} 个计数器")
+        return count
+
+
+row_counters = RowCounters()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+FSM 状态持久化存储
+
+表：fsm_storage（新增表）
+
+说明：
+- aiogram 的 MemoryStorage 只存在于单个进程内；Webhook 分片到多个 worker 进程后，
+  同一用户的对话状态必须在进程间共享（也可在重启后保留），因此改为存入业务库。
+- 键格式：'<bot_id>:<chat_id>:<user_id>:<thread_id>:<destiny>'，与 StorageKey 一一对应。
+- state 与 data 分列存储，data 为 JSON；读写均为单条主键操作。
+- 与 fsm_states（db_fsm，按 user_id 保存商户流程数据）相互独立，过期清理同为7天。
+"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+def storage_key(key: StorageKey) -> str:
+    """StorageKey -> 表主键"""
+    thread_id = '' if key.thread_id is None else key.thread_id
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{thread_id}:{key.destiny}"
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """基于 fsm_storage 表的 FSM 存储，供多进程共享对话状态"""
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await db_manager.execute_query(
+            """
+            INSERT INTO fsm_storage (storage_key, state, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(storage_key) DO UPDATE SET state = excluded.state, updated_at = CURRENT_TIMESTAMP
+            """,
+            (storage_key(key), value)
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await db_manager.fetch_one(
+            "SELECT state FROM fsm_storage WHERE storage_key = ?", (storage_key(key),)
+        )
+        return row['state'] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await db_manager.execute_query(
+            """
+            INSERT INTO fsm_storage (storage_key, data, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(storage_key) DO UPDATE SET data = excluded.data, updated_at = CURRENT_TIMESTAMP
+            """,
+            (storage_key(key), json.dumps(data, ensure_ascii=False, default=str))
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await db_manager.fetch_one(
+            "SELECT data FROM fsm_storage WHERE storage_key = ?", (storage_key(key),)
+        )
+        if not row or not row['data']:
+            return {}
+        try:
+            return json.loads(row['data'])
+        except (TypeError, ValueError):
+            logger.warning(f"FSM 数据解析失败，按空数据处理: {storage_key(key)}")
+            return {}
+
+    @staticmethod
+    async def cleanup(days: int = 7) -> int:
+        """删除超过保留天数未更新的记录"""
+        return await db_manager.execute_query(
+            "DELETE FROM fsm_storage WHERE updated_at < ?",
+            (datetime.now() - timedelta(days=days),)
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+def create_fsm_storage(kind: str) -> BaseStorage:
+    """按配置创建 FSM 存储：'sqlite' 为持久化共享存储，其它为进程内存储"""
+    if kind == 'sqlite':
+        return SQLiteFSMStorage()
+    from aiogram.fsm.storage.memory import MemoryStorage
+    return MemoryStorage()
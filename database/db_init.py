@@ -7,6 +7,7 @@ import os
 import logging
 import glob
 import re
+import hashlib
 from typing import Dict, List, Optional, Tuple
 import json
 from datetime import datetime, timedelta
@@ -14,9 +15,15 @@ from datetime import datetime, timedelta
 # 导入数据库连接管理器
 from .db_connection import db_manager
 from .schema_sync import schema_sync
+from .db_log_partitions import log_partitions
+from .db_migrations import migration_engine, Migration
+from .db_shards import shard_router
+from .db_fsm_storage import SQLiteFSMStorage
+from .db_query_profiler import QueryProfiler
 
 # 导入路径管理器
 from pathmanager import PathManager
+from config import STARTUP_CONFIG
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -26,7 +33,7 @@ class DatabaseInitializer:
     
     def __init__(self):
         """初始化数据库初始化器"""
-        self.current_schema_version = "2025.10.08.2"
+        self.current_schema_version = "2026.10.19.1"
         self.migrations_dir = PathManager.get_database_migration_path()
         self.migration_history = []
     
@@ -52,6 +59,9 @@ class DatabaseInitializer:
                 if current_version != self.current_schema_version:
                     logger.info(f"需要迁移到版本: {self.current_schema_version}")
                     success = await self._migrate_database(current_version, self.current_schema_version)
+                elif await self._schema_unchanged():
+                    logger.info("数据库版本已是最新，表结构指纹未变化，跳过表验证")
+                    success = True
                 else:
                     logger.info("数据库版本已是最新，无需迁移")
                     success = await self._verify_tables()
@@ -76,9 +86,20 @@ class DatabaseInitializer:
                         success = await self._verify_tables()
             
             if success:
+                # 继续执行上次中断的在线 DDL（大表索引/表重建）
+                await migration_engine.run_pending()
+                # 城市分片：按迁移后的主库结构同步各分片
+                if db_manager.shards is not None:
+                    await shard_router.prepare()
+                # 活动日志分区：拆分迁移遗留的旧表并确保当月分区
+                try:
+                    await log_partitions.prepare()
+                except Exception as e:
+                    logger.warning(f"活动日志分区准备失败: {e}")
                 # 确保关键模板存在 + 补齐所有关键键
                 await self._ensure_critical_templates()
                 await self._verify_critical_templates()
+                await self._save_schema_fingerprint()
                 logger.info(f"数据库就绪，当前版本: {self.current_schema_version}")
                 return True
             else:
@@ -89,6 +110,48 @@ class DatabaseInitializer:
             logger.error(f"数据库初始化失败: {e}")
             return False
     
+    async def _schema_fingerprint(self) -> str:
+        """
+        表结构指纹：PRAGMA schema_version（任何 DDL 都会递增）+ 代码版本 + 迁移文件集及其内容校验和
+
+        Returns:
+            十六进制摘要
+        """
+        row = await db_manager.fetch_one("PRAGMA schema_version")
+        migrations = []
+        if os.path.isdir(self.migrations_dir):
+            for entry in sorted(os.scandir(self.migrations_dir), key=lambda e: e.name):
+                if entry.name.endswith('.sql'):
+                    # 与 migration_history.checksum 同一算法；等长改写也会改变指纹
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        migrations.append([entry.name, Migration(entry.name, f.read()).checksum])
+        payload = json.dumps([self.current_schema_version, int(row[0]), migrations], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def _schema_unchanged(self) -> bool:
+        """上次验证通过后表结构与迁移集均未变化"""
+        if not STARTUP_CONFIG.get("schema_fingerprint_cache", True):
+            return False
+        try:
+            row = await db_manager.fetch_one(
+                "SELECT config_value FROM system_config WHERE config_key = ?",
+                ('schema_fingerprint',)
+            )
+            return bool(row) and row[0] == await self._schema_fingerprint()
+        except Exception as e:
+            logger.debug(f"读取表结构指纹失败，执行完整验证: {e}")
+            return False
+
+    async def _save_schema_fingerprint(self):
+        """记录验证通过时的表结构指纹（写入数据行不会改变 schema_version）"""
+        try:
+            await db_manager.execute_query(
+                "INSERT OR REPLACE INTO system_config (config_key, config_value, description) VALUES (?, ?, ?)",
+                ('schema_fingerprint', await self._schema_fingerprint(), '最近一次验证通过的表结构指纹')
+            )
+        except Exception as e:
+            logger.warning(f"记录表结构指纹失败: {e}")
+
     async def _verify_tables(self) -> bool:
         """
         验证所有必需的表是否存在
@@ -105,17 +168,17 @@ class DatabaseInitializer:
         ]
         
         try:
-            for table in required_tables:
-                result = await db_manager.fetch_one(
-                    "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
-                    (table,)
-                )
-                
-                if not result:
-                    logger.error(f"表 {table} 不存在")
-                    return False
-                    
-                logger.debug(f"表 {table} 验证成功")
+            # activity_logs 为按月分区的视图
+            placeholders = ','.join('?' * len(required_tables))
+            rows = await db_manager.fetch_all(
+                f"SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name IN ({placeholders})",
+                tuple(required_tables)
+            )
+            existing = {row[0] for row in rows or []}
+            missing = [table for table in required_tables if table not in existing]
+            if missing:
+                logger.error(f"表不存在: {missing}")
+                return False
             
             logger.info("所有数据库表验证成功")
             return True
@@ -238,9 +301,10 @@ class DatabaseInitializer:
     async def _log_initialization(self):
         """记录初始化日志"""
         try:
+            table = await log_partitions.table_for_write()
             await db_manager.execute_query(
-                """INSERT INTO activity_logs (user_id, action_type, details, timestamp) 
-                   VALUES (?, ?, ?, ?)""",
+                f"""INSERT INTO {table} (user_id, action_type, details) 
+                   VALUES (?, ?, ?)""",
                 (
                     0,  # 系统用户ID
                     'system_init',
@@ -248,8 +312,7 @@ class DatabaseInitializer:
                         'action': 'database_initialized',
                         'schema_version': self.current_schema_version,
                         'timestamp': datetime.now().isoformat()
-                    }, ensure_ascii=False),
-                    datetime.now()
+                    }, ensure_ascii=False)
                 )
             )
             logger.info("数据库初始化日志记录完成")
@@ -297,7 +360,7 @@ class DatabaseInitializer:
     
     async def run_migration(self, migration_name: str, migration_sql: str) -> bool:
         """
-        执行数据库迁移
+        执行数据库迁移（整个文件一个事务，失败回滚，见 database.db_migrations）
         
         Args:
             migration_name: 迁移名称
@@ -306,97 +369,21 @@ class DatabaseInitializer:
         Returns:
             迁移是否成功
         """
-        try:
-            logger.info(f"开始执行迁移: {migration_name}")
-            
-            # 检查迁移是否已经执行过
-            if await self._is_migration_applied(migration_name):
-                logger.info(f"迁移 {migration_name} 已经执行过，跳过")
-                return True
-            
-            # 根据内容选择执行策略：包含事务/触发器的迁移使用 executescript，避免分号拆分导致的语法不完整
-            lower_sql = migration_sql.lower()
-            contains_complex = any(k in lower_sql for k in [
-                'create trigger', 'begin transaction', 'commit', 'pragma foreign_keys'
-            ])
-
-            success_count = 0
-            error_count = 0
-
-            if contains_complex:
-                try:
-                    await self._execute_sql_script(migration_sql)
-                    success_count = 1
-                    sql_statements = [migration_sql]
-                except Exception as stmt_error:
-                    logger.error(f"整脚本执行失败: {stmt_error}")
-                    sql_statements = [migration_sql]
-                    error_count = 1
-            else:
-                sql_statements = [stmt.strip() for stmt in migration_sql.split(';') if stmt.strip()]
-                for statement in sql_statements:
-                    if statement:
-                        try:
-                            await db_manager.execute_query(statement)
-                            success_count += 1
-                            logger.debug(f"SQL语句执行成功: {statement[:50]}...")
-                        except Exception as stmt_error:
-                            error_msg = str(stmt_error).lower()
-                            # SQLite容错处理：忽略可预期的错误
-                            if any(ignore_phrase in error_msg for ignore_phrase in [
-                                'duplicate column name',  # 列已存在
-                                'table already exists',   # 表已存在
-                                'index already exists',   # 索引已存在
-                            ]):
-                                logger.warning(f"忽略预期错误: {stmt_error}")
-                                logger.info(f"SQL语句跳过（结构已存在）: {statement[:50]}...")
-                                success_count += 1
-                            else:
-                                logger.error(f"SQL语句执行失败: {statement[:50]}... | 错误: {stmt_error}")
-                                error_count += 1
-            
-            # 判断迁移成功条件：至少有一条语句成功，或者所有错误都是可忽略的
-            if success_count > 0 or error_count == 0:
-                # 记录迁移历史
-                await self._record_migration(migration_name)
-                logger.info(f"✅ 迁移 {migration_name} 执行成功 (成功:{success_count}, 跳过:{len(sql_statements)-success_count-error_count}, 错误:{error_count})")
-                return True
-            else:
-                logger.error(f"❌ 迁移 {migration_name} 执行失败，所有语句都失败了")
-                return False
-            
-        except Exception as e:
-            logger.error(f"迁移 {migration_name} 执行失败: {e}")
-            return False
+        logger.info(f"开始执行迁移: {migration_name}")
+        return await migration_engine.apply(Migration(migration_name, migration_sql))
     
     async def _is_migration_applied(self, migration_name: str) -> bool:
         """检查迁移是否已经应用"""
         try:
-            # 首先确保迁移历史表存在
-            await db_manager.execute_query("""
-                CREATE TABLE IF NOT EXISTS migration_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    migration_name TEXT UNIQUE NOT NULL,
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            result = await db_manager.fetch_one(
-                "SELECT migration_name FROM migration_history WHERE migration_name = ?",
-                (migration_name,)
-            )
-            return result is not None
+            return migration_name in await migration_engine.applied()
         except Exception as e:
             logger.error(f"检查迁移状态失败: {e}")
             return False
     
-    async def _record_migration(self, migration_name: str):
+    async def _record_migration(self, migration_name: str, migration_sql: str = ""):
         """记录迁移历史"""
         try:
-            await db_manager.execute_query(
-                "INSERT INTO migration_history (migration_name) VALUES (?)",
-                (migration_name,)
-            )
+            await migration_engine.record(Migration(migration_name, migration_sql))
         except Exception as e:
             logger.error(f"记录迁移历史失败: {e}")
     
@@ -413,12 +400,8 @@ class DatabaseInitializer:
             )
             logger.info(f"清理了 {result} 个过期绑定码")
             
-            # 清理旧的活动日志（保留30天）
-            old_log_time = datetime.now() - timedelta(days=30)
-            result = await db_manager.execute_query(
-                "DELETE FROM activity_logs WHERE timestamp < ?",
-                (old_log_time,)
-            )
+            # 清理旧的活动日志（保留30天，过期月分区归档后整表删除）
+            result = await log_partitions.drop_expired(30)
             logger.info(f"清理了 {result} 条旧活动日志")
             
             # 清理旧的FSM状态（保留7天）
@@ -428,6 +411,19 @@ class DatabaseInitializer:
                 (old_state_time,)
             )
             logger.info(f"清理了 {result} 个旧FSM状态")
+            result = await SQLiteFSMStorage.cleanup(7)
+            logger.info(f"清理了 {result} 个旧FSM存储记录")
+
+            # 清理已过期的会话上下文
+            result = await db_manager.execute_query(
+                "DELETE FROM session_context WHERE expires_at < ?",
+                (int(datetime.now().timestamp()),)
+            )
+            logger.info(f"清理了 {result} 条过期会话上下文")
+
+            # 清理30天未再出现的慢查询汇总
+            result = await QueryProfiler.cleanup(30)
+            logger.info(f"清理了 {result} 条旧慢查询汇总")
             
             # 清理旧的自动回复每日统计（保留90天）
             old_stats_time = datetime.now() - timedelta(days=90)
@@ -605,14 +601,15 @@ class DatabaseInitializer:
                 await self._auto_generate_migration(from_version, to_version)
                 return True
             
-            # 按版本顺序执行迁移
-            for migration_file in sorted(migration_files):
+            # 按版本号（数值）与文件头声明的依赖排序执行
+            migrations = migration_engine.order(
+                [Migration.load(PathManager.get_database_migration_file_path(name)) for name in migration_files],
+                applied=await migration_engine.applied()
+            )
+            for migration in migrations:
+                migration_file = migration.name
                 logger.info(f"执行迁移: {migration_file}")
                 
-                migration_path = PathManager.get_database_migration_file_path(migration_file)
-                with open(migration_path, 'r', encoding='utf-8') as f:
-                    migration_sql = f.read()
-                
                 # 条件跳过：2025-09-16-2 城市区县切换在新库（已无旧表/旧列）上无需执行
                 try:
                     if '2025_09_16_2_切换为城市区县并重命名外键' in migration_file:
@@ -634,13 +631,13 @@ class DatabaseInitializer:
                                 return False
                         if not has_old_cols and not (await table_exists('provinces')) and not (await table_exists('regions')):
                             logger.info("跳过迁移 2025_09_16_2：未检测到旧表/旧列（已是新结构）")
-                            await self._record_migration(migration_file)
+                            await migration_engine.record(migration)
                             continue
                 except Exception as e:
                     logger.warning(f"迁移前置检查异常（继续尝试执行）: {e}")
 
                 # 执行迁移
-                success = await self.run_migration(migration_file, migration_sql)
+                success = await migration_engine.apply(migration)
                 if not success:
                     logger.error(f"迁移失败: {migration_file}")
                     return False
@@ -785,6 +782,23 @@ class DatabaseInitializer:
             logger.error(f"模板数据初始化失败: {e}")
             return False
     
+    async def _fetch_templates(self, keys: List[str]) -> Dict[str, str]:
+        """
+        一次查询读取多个模板
+        
+        Args:
+            keys: 模板键列表
+            
+        Returns:
+            {key: content}，不存在的键不在结果中
+        """
+        placeholders = ','.join('?' * len(keys))
+        rows = await db_manager.fetch_all(
+            f"SELECT key, content FROM templates WHERE key IN ({placeholders})",
+            tuple(keys)
+        )
+        return {row[0]: row[1] for row in rows or []}
+
     async def _verify_critical_templates(self) -> bool:
         """
         验证关键模板是否存在，如缺失则自动补齐
@@ -841,16 +855,8 @@ class DatabaseInitializer:
             'user_profile_card'
         ]
         
-        missing_templates = []
-        
-        for template_key in critical_templates:
-            result = await db_manager.fetch_one(
-                "SELECT key FROM templates WHERE key = ?", 
-                (template_key,)
-            )
-            
-            if not result:
-                missing_templates.append(template_key)
+        existing = await self._fetch_templates(critical_templates)
+        missing_templates = [key for key in critical_templates if key not in existing]
         
         if missing_templates:
             logger.warning(f"检测到缺失的关键模板: {missing_templates}")
@@ -913,57 +919,43 @@ class DatabaseInitializer:
                 )
             }
             
-            for template_key in missing_templates:
-                if template_key in default_templates:
-                    try:
-                        await db_manager.execute_query(
-                            "INSERT OR IGNORE INTO templates (key, content) VALUES (?, ?)",
-                            (
-                                template_key,
-                                default_templates[template_key]
-                            )
-                        )
-                        logger.info(f"✅ 自动补齐模板: {template_key}")
-                    except Exception as e:
-                        logger.error(f"补齐模板失败 {template_key}: {e}")
+            fill = [key for key in missing_templates if key in default_templates]
+            if fill:
+                if await db_manager.execute_transaction([
+                    ("INSERT OR IGNORE INTO templates (key, content) VALUES (?, ?)", (key, default_templates[key]))
+                    for key in fill
+                ]):
+                    logger.info(f"✅ 自动补齐模板: {fill}")
+                else:
+                    logger.error(f"补齐模板失败: {fill}")
             
             return len(missing_templates) == 0
         else:
             logger.info("✅ 所有关键模板验证通过")
             # 兼容性修正：将历史模板中的“/panel/商户面板”引导改为“我的资料”按钮
             try:
-                row = await db_manager.fetch_one(
-                    "SELECT content FROM templates WHERE key = ?",
-                    ('merchant_help_existing',)
-                )
-                if row:
-                    content = row['content'] if isinstance(row, dict) else row[0]
-                    if isinstance(content, str) and ("/panel" in content or "商户面板" in content):
-                        new_content = content.replace('/panel', '点击“我的资料”').replace('商户面板', '“我的资料”')
-                        await db_manager.execute_query(
-                            "UPDATE templates SET content = ? WHERE key = ?",
-                            (new_content, 'merchant_help_existing')
-                        )
-                        logger.info("🔧 已更新 merchant_help_existing 模板为“我的资料”引导")
+                content = existing.get('merchant_help_existing')
+                if isinstance(content, str) and ("/panel" in content or "商户面板" in content):
+                    new_content = content.replace('/panel', '点击“我的资料”').replace('商户面板', '“我的资料”')
+                    await db_manager.execute_query(
+                        "UPDATE templates SET content = ? WHERE key = ?",
+                        (new_content, 'merchant_help_existing')
+                    )
+                    logger.info("🔧 已更新 merchant_help_existing 模板为“我的资料”引导")
             except Exception as e:
                 logger.debug(f"模板兼容修正跳过: {e}")
 
             # 兼容性修正：将 user_profile_card 中的字面量 "\\n"、"\\t" 迁移为真实换行/制表符
             try:
-                row2 = await db_manager.fetch_one(
-                    "SELECT content FROM templates WHERE key = ?",
-                    ('user_profile_card',)
-                )
-                if row2:
-                    raw = row2['content'] if isinstance(row2, dict) else row2[0]
-                    if isinstance(raw, str) and ("\\n" in raw or "\\t" in raw):
-                        fixed = raw.replace("\\n", "\n").replace("\\t", "\t")
-                        if fixed != raw:
-                            await db_manager.execute_query(
-                                "UPDATE templates SET content = ? WHERE key = ?",
-                                (fixed, 'user_profile_card')
-                            )
-                            logger.info("🔧 已将 user_profile_card 模板中的\\n/\\t 迁移为真实换行/制表符")
+                raw = existing.get('user_profile_card')
+                if isinstance(raw, str) and ("\\n" in raw or "\\t" in raw):
+                    fixed = raw.replace("\\n", "\n").replace("\\t", "\t")
+                    if fixed != raw:
+                        await db_manager.execute_query(
+                            "UPDATE templates SET content = ? WHERE key = ?",
+                            (fixed, 'user_profile_card')
+                        )
+                        logger.info("🔧 已将 user_profile_card 模板中的\\n/\\t 迁移为真实换行/制表符")
             except Exception as e:
                 logger.debug(f"user_profile_card 模板换行修正跳过: {e}")
             return True
@@ -1108,14 +1100,9 @@ VALUES ('schema_version', '{next_version}', '{description}');
                 "order_notification_merchant"
             ]
             
+            existing = await self._fetch_templates(critical_templates)
             for template_key in critical_templates:
-                # 检查模板是否已存在于数据库
-                result = await db_manager.fetch_one(
-                    "SELECT key FROM templates WHERE key = ?",
-                    (template_key,)
-                )
-                
-                if not result:
+                if template_key not in existing:
                     # 从config.py获取模板内容
                     template_content = MESSAGE_TEMPLATES.get(template_key)
                     if template_content:
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+活动日志按月分区管理
+
+结构：
+- activity_logs_YYYYMM：每月一张物理表（列与原 activity_logs 相同，各自带索引）
+- activity_logs：UNION ALL 全部分区的视图，原有查询语句不变；视图上的
+  INSTEAD OF INSERT 触发器按 timestamp 的月份把直接写视图的语句转到对应分区
+  （该月分区不存在时落入当月分区）
+- activity_logs_unpartitioned：迁移前的旧表，prepare() 时按月拆分后删除
+
+保留策略不再执行 DELETE：整月都早于保留期的分区先导出为 gzip 压缩的 NDJSON
+归档（默认 data/archives/activity_logs/activity_logs_YYYYMM.ndjson.gz），再整表
+DROP 并重建视图。保留粒度因此是整月（最多多保留一个月）。
+
+各分区的自增ID通过 sqlite_sequence 衔接已有最大ID，跨分区全局递增、不重复。
+月份按 UTC 计算，与列默认值 CURRENT_TIMESTAMP 一致。
+未执行分区迁移的库（activity_logs 仍是普通表）保持原有行为。
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Sequence, Set, Tuple
+
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+VIEW_NAME = 'activity_logs'
+TRIGGER_NAME = 'trg_activity_logs_insert'
+LEGACY_TABLE = 'activity_logs_unpartitioned'
+COLUMNS = ('id', 'user_id', 'action_type', 'details', 'button_id', 'merchant_id', 'timestamp')
+_PARTITION_GLOB = 'activity_logs_[0-9][0-9][0-9][0-9][0-9][0-9]'
+_INSERT_COLUMNS = ', '.join(COLUMNS[1:])
+
+
+def utc_now() -> datetime:
+    """当前 UTC 时间（naive，与 CURRENT_TIMESTAMP 写入的值可直接比较）"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def month_key(dt: datetime) -> str:
+    return dt.strftime('%Y%m')
+
+
+def current_month_key() -> str:
+    return month_key(utc_now())
+
+
+def partition_name(key: str) -> str:
+    return f"activity_logs_{key}"
+
+
+def month_bounds(key: str) -> Tuple[datetime, datetime]:
+    """分区月份的 [起, 止) 时间"""
+    start = datetime(int(key[:4]), int(key[4:]), 1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _partition_ddl(key: str) -> List[Tuple[str, tuple]]:
+    table = partition_name(key)
+    return [
+        (f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                action_type TEXT NOT NULL,
+                details TEXT,
+                button_id TEXT,
+                merchant_id INTEGER,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE SET NULL
+            )
+        """, ()),
+        (f"CREATE INDEX IF NOT EXISTS idx_{table}_user_id ON {table}(user_id)", ()),
+        (f"CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table}(timestamp)", ()),
+        (f"CREATE INDEX IF NOT EXISTS idx_{table}_action_type ON {table}(action_type)", ()),
+        (f"CREATE INDEX IF NOT EXISTS idx_{table}_merchant_id ON {table}(merchant_id)", ()),
+        # 新分区从已有最大ID之后开始编号
+        ("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, COALESCE((SELECT MAX(seq) FROM sqlite_sequence WHERE name LIKE 'activity_logs%'), 0)
+            WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+        """, (table, table)),
+    ]
+
+
+def _view_ddl(keys: Sequence[str], target: str, include_legacy: bool) -> List[Tuple[str, tuple]]:
+    """重建 UNION ALL 视图与写入触发器（target：月份没有对应分区的写入落入的分区）"""
+    cols = ', '.join(COLUMNS)
+    keys = sorted(set(keys) | {target})
+    sources = [partition_name(k) for k in reversed(keys)]
+    if include_legacy:
+        sources.append(LEGACY_TABLE)
+    union = "\nUNION ALL\n".join(f"SELECT {cols} FROM {src}" for src in sources)
+    target_table = partition_name(target)
+
+    # 按写入行的月份路由。自增序列在语句开始时载入、结束时写回，触发器内无法推进，
+    # 因此显式取全局下一个ID（各分区 MAX(id) 为 rowid 查找），写回后分区序列随之衔接
+    ts = "COALESCE(NEW.timestamp, CURRENT_TIMESTAMP)"
+    month = f"strftime('%Y%m', {ts})"
+    next_id = "max(" + ", ".join(
+        ["COALESCE((SELECT MAX(seq) FROM sqlite_sequence WHERE name LIKE 'activity_logs%'), 0)"]
+        + [f"COALESCE((SELECT MAX(id) FROM {partition_name(k)}), 0)" for k in keys]
+    ) + ") + 1"
+    values = f"{next_id}, NEW.user_id, NEW.action_type, NEW.details, NEW.button_id, NEW.merchant_id, {ts}"
+    others = [k for k in keys if k != target]
+    statements = []
+    for k in others:
+        statements.append(f"""
+                INSERT INTO {partition_name(k)} (id, {_INSERT_COLUMNS})
+                SELECT {values} WHERE {month} = '{k}';""")
+    fallback = ', '.join(f"'{k}'" for k in others) or "''"
+    statements.append(f"""
+                INSERT INTO {target_table} (id, {_INSERT_COLUMNS})
+                SELECT {values} WHERE COALESCE({month}, '') NOT IN ({fallback});""")
+    return [
+        (f"DROP VIEW IF EXISTS {VIEW_NAME}", ()),
+        (f"CREATE VIEW {VIEW_NAME} AS\n{union}", ()),
+        (f"""
+            CREATE TRIGGER {TRIGGER_NAME}
+            INSTEAD OF INSERT ON {VIEW_NAME}
+            BEGIN{''.join(statements)}
+            END
+        """, ()),
+        ("""
+            UPDATE sqlite_sequence
+            SET seq = (SELECT MAX(seq) FROM sqlite_sequence WHERE name LIKE 'activity_logs%')
+            WHERE name = ?
+        """, (target_table,)),
+    ]
+
+
+class ActivityLogPartitions:
+    """活动日志分区管理器"""
+
+    def __init__(self, archive_dir: Optional[str] = None, batch_size: int = 5000):
+        self._archive_dir = archive_dir
+        self.batch_size = batch_size
+        self._db_path: Optional[str] = None
+        self._enabled = False
+        self._known: Set[str] = set()
+
+    @property
+    def archive_dir(self) -> str:
+        if not self._archive_dir:
+            from config import ACTIVITY_LOG_CONFIG
+            from pathmanager import PathManager
+            self._archive_dir = ACTIVITY_LOG_CONFIG.get("archive_dir") or os.path.join(
+                PathManager.get_root_directory(), 'data', 'archives', 'activity_logs'
+            )
+        os.makedirs(self._archive_dir, exist_ok=True)
+        return self._archive_dir
+
+    async def _table_exists(self, name: str) -> bool:
+        row = await db_manager.fetch_one(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+        )
+        return bool(row)
+
+    async def list_partitions(self) -> List[str]:
+        """已存在的分区月份（YYYYMM，升序）"""
+        rows = await db_manager.fetch_all(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB ? ORDER BY name",
+            (_PARTITION_GLOB,)
+        )
+        return [r['name'][-6:] for r in rows or []]
+
+    async def _sync_state(self) -> bool:
+        """按当前数据库路径刷新分区状态（切换数据库时重新探测）"""
+        if self._db_path != db_manager.db_path:
+            row = await db_manager.fetch_one(
+                "SELECT type FROM sqlite_master WHERE name=?", (VIEW_NAME,)
+            )
+            self._enabled = bool(row) and row['type'] == 'view'
+            self._known = set(await self.list_partitions()) if self._enabled else set()
+            self._db_path = db_manager.db_path
+        return self._enabled
+
+    async def _apply(self, queries: List[Tuple[str, tuple]], action: str) -> None:
+        if not await db_manager.execute_transaction(queries):
+            raise RuntimeError(f"活动日志分区{action}失败")
+
+    async def _rebuild(self, keys: Sequence[str], extra: Optional[List[Tuple[str, tuple]]] = None) -> None:
+        current = current_month_key()
+        include_legacy = await self._table_exists(LEGACY_TABLE)
+        queries = list(extra or [])
+        if current not in keys:
+            queries = _partition_ddl(current) + queries
+            keys = list(keys) + [current]
+        ddl = _view_ddl(keys, current, include_legacy)
+        if queries or not await self._view_matches(ddl):
+            await self._apply(queries + ddl, "视图重建")
+        self._known = set(keys)
+
+    async def _view_matches(self, ddl: List[Tuple[str, tuple]]) -> bool:
+        """现有视图与触发器定义和将要重建的一致（热启动时跳过重建，不占用表结构写锁）"""
+        rows = await db_manager.fetch_all(
+            "SELECT name, sql FROM sqlite_master WHERE name IN (?, ?)", (VIEW_NAME, TRIGGER_NAME)
+        )
+        existing = {r['name']: (r['sql'] or '').strip() for r in rows or []}
+        return existing.get(VIEW_NAME) == ddl[1][0].strip() and existing.get(TRIGGER_NAME) == ddl[2][0].strip()
+
+    async def ensure_partition(self, key: str) -> str:
+        """确保某月分区存在并已纳入视图"""
+        table = partition_name(key)
+        if key in self._known:
+            return table
+        if not await self._table_exists(table):
+            keys = set(await self.list_partitions()) | {key}
+            await self._rebuild(sorted(keys), _partition_ddl(key))
+            logger.info(f"已创建活动日志分区: {table}")
+        self._known.add(key)
+        return table
+
+    async def table_for_write(self) -> str:
+        """新日志应写入的表：当月分区；未分区的库返回 activity_logs"""
+        if not await self._sync_state():
+            return VIEW_NAME
+        return await self.ensure_partition(current_month_key())
+
+    async def prepare(self) -> int:
+        """
+        启动时调用：拆分迁移遗留的旧表，确保当月分区，并重建视图/触发器
+
+        Returns:
+            从旧表拆分出的日志条数
+        """
+        self._db_path = None
+        if not await self._sync_state():
+            return 0
+        moved = await self._split_legacy()
+        await self._rebuild(await self.list_partitions())
+        return moved
+
+    async def _split_legacy(self) -> int:
+        if not await self._table_exists(LEGACY_TABLE):
+            return 0
+        row = await db_manager.fetch_one(f"SELECT COUNT(*) AS c FROM {LEGACY_TABLE}")
+        total = int(row['c']) if row else 0
+        current = current_month_key()
+        rows = await db_manager.fetch_all(
+            f"SELECT DISTINCT strftime('%Y%m', timestamp) AS k FROM {LEGACY_TABLE}"
+        )
+        keys = {r['k'] for r in rows or [] if r['k']} | {current}
+
+        cols = ', '.join(COLUMNS)
+        queries: List[Tuple[str, tuple]] = []
+        for key in sorted(keys):
+            queries.extend(_partition_ddl(key))
+            where = "strftime('%Y%m', timestamp) = ?"
+            if key == current:
+                where = f"({where} OR strftime('%Y%m', timestamp) IS NULL)"
+            queries.append((
+                f"INSERT INTO {partition_name(key)} ({cols}) SELECT {cols} FROM {LEGACY_TABLE} WHERE {where}",
+                (key,)
+            ))
+        queries.append((f"DROP VIEW IF EXISTS {VIEW_NAME}", ()))
+        queries.append((f"DROP TABLE {LEGACY_TABLE}", ()))
+        all_keys = set(await self.list_partitions()) | keys
+        await self._apply(queries + _view_ddl(sorted(all_keys), current, False), "拆分旧表")
+        self._known = all_keys
+        logger.info(f"活动日志旧表已按月拆分: {total} 条 -> {len(keys)} 个分区")
+        return total
+
+    async def archive_partition(self, key: str) -> Tuple[int, str]:
+        """
+        把一个分区导出为 gzip NDJSON（先写临时文件再改名）
+
+        Returns:
+            (导出条数, 归档文件路径)
+        """
+        table = partition_name(key)
+        path = os.path.join(self.archive_dir, f"{table}.ndjson.gz")
+        tmp_path = f"{path}.tmp"
+        cols = ', '.join(COLUMNS)
+        count, last_id = 0, 0
+        fh = await asyncio.to_thread(gzip.open, tmp_path, 'wt', encoding='utf-8')
+        try:
+            while True:
+                rows = await db_manager.fetch_all(
+                    f"SELECT {cols} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.batch_size)
+                )
+                if not rows:
+                    break
+                lines = ''.join(
+                    json.dumps(dict(r), ensure_ascii=False, default=str) + '\n' for r in rows
+                )
+                await asyncio.to_thread(fh.write, lines)
+                count += len(rows)
+                last_id = rows[-1]['id']
+        finally:
+            await asyncio.to_thread(fh.close)
+        os.replace(tmp_path, path)
+        return count, path
+
+    async def drop_expired(self, retention_days: int, archive: bool = True) -> int:
+        """
+        归档并删除整月早于保留期的分区
+
+        Args:
+            retention_days: 保留天数
+            archive: 删除前是否导出归档
+
+        Returns:
+            随分区删除的日志条数
+        """
+        cutoff = utc_now() - timedelta(days=retention_days)
+        if not await self._sync_state():
+            return await db_manager.execute_query(
+                f"DELETE FROM {VIEW_NAME} WHERE timestamp < ?", (cutoff,)
+            )
+
+        current = current_month_key()
+        await self.ensure_partition(current)
+        removed = 0
+        for key in await self.list_partitions():
+            if key == current or month_bounds(key)[1] > cutoff:
+                continue
+            table = partition_name(key)
+            if archive:
+                count, path = await self.archive_partition(key)
+                logger.info(f"活动日志分区 {table} 已归档: {count} 条 -> {path}")
+            else:
+                row = await db_manager.fetch_one(f"SELECT COUNT(*) AS c FROM {table}")
+                count = int(row['c']) if row else 0
+            remaining = [k for k in await self.list_partitions() if k != key]
+            await self._rebuild(remaining, [(f"DROP VIEW IF EXISTS {VIEW_NAME}", ()), (f"DROP TABLE IF EXISTS {table}", ())])
+            removed += count
+        return removed
+
+
+log_partitions = ActivityLogPartitions()
@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 from enum import Enum
 
 from .db_connection import db_manager
+from .db_log_partitions import log_partitions
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -359,8 +360,10 @@ class ActivityLogsDatabase:
             日志记录ID
         """
         try:
-            insert_query = """
-                INSERT INTO activity_logs (user_id, action_type, details, button_id, merchant_id)
+            # 直接写入当月分区（经视图触发器写入时无法取得新行ID）
+            table = await log_partitions.table_for_write()
+            insert_query = f"""
+                INSERT INTO {table} (user_id, action_type, details, button_id, merchant_id)
                 VALUES (?, ?, ?, ?, ?)
             """
             
@@ -699,21 +702,24 @@ class ActivityLogsDatabase:
             raise
     
     @staticmethod
-    async def cleanup_old_logs(days_to_keep: int = 90) -> int:
+    async def cleanup_old_logs(days_to_keep: Optional[int] = None) -> int:
         """
         清理旧的日志记录
         
+        整月早于保留期的月分区先归档为 NDJSON，再整表删除（不再逐行 DELETE）。
+        
         Args:
-            days_to_keep: 保留的天数
+            days_to_keep: 保留的天数，默认取 ACTIVITY_LOG_CONFIG['retention_days']
             
         Returns:
             清理的日志数量
         """
         try:
-            cutoff_date = datetime.now() - timedelta(days=days_to_keep)
+            if days_to_keep is None:
+                from config import ACTIVITY_LOG_CONFIG
+                days_to_keep = ACTIVITY_LOG_CONFIG['retention_days']
             
-            delete_query = "DELETE FROM activity_logs WHERE timestamp < ?"
-            result = await db_manager.execute_query(delete_query, (cutoff_date,))
+            result = await log_partitions.drop_expired(days_to_keep)
             
             if result > 0:
                 logger.info(f"清理旧日志成功，删除 {result} 条记录")
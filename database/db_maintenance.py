@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+数据库维护（WAL 检查点、PRAGMA optimize、增量 VACUUM）
+
+使用方式（scheduler.py）：
+    from database.db_maintenance import db_maintenance
+    await db_maintenance.run_cycle()   # 每 check_interval 秒
+    await db_maintenance.optimize()    # 批量任务结束后
+
+策略：
+    - 按文件逐个维护：主库，以及启用城市分片时磁盘上已有的各分片（db_manager.all_databases()）
+    - 每轮记录各库/WAL 文件大小与空闲页数（指标 db_file_bytes、db_freelist_pages，按 database 标签区分）
+    - WAL 超过 wal_passive_mb：PASSIVE 检查点（不等待、不阻塞读写）
+    - 回写完成且 WAL 仍超过 wal_truncate_mb：TRUNCATE 收缩文件；使用独立连接与短超时，
+      避免长时间持有写锁；有读方占用时放弃，下轮再试
+    - 检查点未能全部回写（长读事务钉住 WAL）时计数并告警
+    - 静默时段内空闲页超过阈值：分步 incremental_vacuum（每步一个短写事务，步间让出）；
+      旧库尚未启用增量模式时，在大小允许范围内执行一次完整 VACUUM 完成切换
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from config import DB_MAINTENANCE_CONFIG
+from database.db_connection import DatabaseManager, db_manager
+from utils.metrics import (
+    DB_CHECKPOINT_RUNS,
+    DB_CHECKPOINT_SECONDS,
+    DB_FILE_BYTES,
+    DB_FREELIST_PAGES,
+    DB_VACUUM_PAGES,
+)
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _parse_hours(value: str) -> Tuple[int, int]:
+    """解析 '3-6' 形式的时段（结束小时不含，可跨零点，如 '23-5'）"""
+    start, _, end = str(value).partition('-')
+    return int(start) % 24, int(end or start) % 24
+
+
+def _label(db: DatabaseManager) -> str:
+    """指标与日志中的库名：主库为 main，分片为 shard_<分片号>"""
+    shard_id = getattr(db, 'shard_id', 0)
+    return f"shard_{shard_id}" if shard_id else 'main'
+
+
+class DatabaseMaintenance:
+    """数据库维护任务"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or DB_MAINTENANCE_CONFIG
+        self.enabled = bool(config.get('enabled', True))
+        self.check_interval = int(config.get('check_interval', 60))
+        self.wal_passive_bytes = float(config.get('wal_passive_mb', 16)) * _MB
+        self.wal_truncate_bytes = float(config.get('wal_truncate_mb', 64)) * _MB
+        self.truncate_timeout = float(config.get('truncate_timeout', 1))
+        self.quiet_hours = _parse_hours(config.get('quiet_hours', '3-6'))
+        self.vacuum_min_free_pages = int(config.get('vacuum_min_free_pages', 1000))
+        self.vacuum_pages_per_step = max(1, int(config.get('vacuum_pages_per_step', 256)))
+        self.vacuum_max_steps = int(config.get('vacuum_max_steps', 40))
+        self.vacuum_step_sleep = float(config.get('vacuum_step_sleep', 0.2))
+        self.full_vacuum_max_bytes = float(config.get('full_vacuum_max_mb', 200)) * _MB
+        # 各库连续未能全部回写的检查点次数（长读事务钉住 WAL）
+        self.pinned_checkpoints: Dict[str, int] = {}
+
+    # ---------- 状态 ---------- #
+
+    async def stats(self, db: Optional[DatabaseManager] = None) -> Dict[str, int]:
+        """
+        采集数据库文件状态并更新指标
+
+        Args:
+            db: 要采集的库（默认主库；分片传入对应的管理器）
+
+        Returns:
+            {'db_bytes', 'wal_bytes', 'page_size', 'page_count', 'freelist_pages', 'auto_vacuum'}
+        """
+        db = db or db_manager
+        path = db.db_path
+        result = {
+            'db_bytes': os.path.getsize(path) if os.path.exists(path) else 0,
+            'wal_bytes': os.path.getsize(f"{path}-wal") if os.path.exists(f"{path}-wal") else 0,
+        }
+        # 在该库自己的连接上读取（汇总读连接会附加其它分片）
+        async with db.get_connection() as conn:
+            for pragma in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'):
+                row = await (await conn.execute(f"PRAGMA {pragma}")).fetchone()
+                result['freelist_pages' if pragma == 'freelist_count' else pragma] = int(row[0])
+        label = _label(db)
+        DB_FILE_BYTES.set(result['db_bytes'], database=label, file='db')
+        DB_FILE_BYTES.set(result['wal_bytes'], database=label, file='wal')
+        DB_FREELIST_PAGES.set(result['freelist_pages'], database=label)
+        return result
+
+    def in_quiet_hours(self, now: Optional[datetime] = None) -> bool:
+        """当前是否处于允许 VACUUM 的静默时段"""
+        hour = (now or datetime.now()).hour
+        start, end = self.quiet_hours
+        if start == end:
+            return False
+        if start < end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    # ---------- 检查点 ---------- #
+
+    async def checkpoint(self, mode: str = 'PASSIVE', db: Optional[DatabaseManager] = None) -> Dict[str, int]:
+        """
+        执行 WAL 检查点
+
+        Args:
+            mode: PASSIVE 在连接池上执行（不等待）；TRUNCATE 使用独立短超时连接
+            db: 要执行的库（默认主库）
+
+        Returns:
+            {'busy', 'log', 'checkpointed'}（SQLite wal_checkpoint 的三个返回值）
+        """
+        db = db or db_manager
+        started = time.perf_counter()
+        try:
+            if mode == 'PASSIVE':
+                async with db.get_connection() as conn:
+                    row = await (await conn.execute("PRAGMA wal_checkpoint(PASSIVE)")).fetchone()
+                busy, log, checkpointed = (int(v) for v in row)
+            else:
+                busy, log, checkpointed = await asyncio.to_thread(self._blocking_checkpoint, mode, db.db_path)
+        except Exception:
+            DB_CHECKPOINT_RUNS.inc(mode=mode.lower(), result='error')
+            raise
+        finally:
+            DB_CHECKPOINT_SECONDS.observe(time.perf_counter() - started, mode=mode.lower())
+        result = 'busy' if busy else ('partial' if checkpointed < log else 'ok')
+        DB_CHECKPOINT_RUNS.inc(mode=mode.lower(), result=result)
+        return {'busy': busy, 'log': log, 'checkpointed': checkpointed}
+
+    def _blocking_checkpoint(self, mode: str, path: str) -> Tuple[int, int, int]:
+        conn = sqlite3.connect(path, timeout=self.truncate_timeout, isolation_level=None)
+        try:
+            row = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+            return int(row[0]), int(row[1]), int(row[2])
+        finally:
+            conn.close()
+
+    async def _adaptive_checkpoint(self, wal_bytes: int, db: DatabaseManager) -> Optional[str]:
+        if wal_bytes < self.wal_passive_bytes:
+            return None
+        label = _label(db)
+        result = await self.checkpoint('PASSIVE', db)
+        if result['log'] >= 0 and result['checkpointed'] < result['log']:
+            pinned = self.pinned_checkpoints[label] = self.pinned_checkpoints.get(label, 0) + 1
+            if pinned % 10 == 1:
+                logger.warning(
+                    f"{label} WAL 检查点未能全部回写（{result['checkpointed']}/{result['log']} 帧，"
+                    f"连续 {pinned} 次），可能有长读事务"
+                )
+            return 'passive'
+        self.pinned_checkpoints.pop(label, None)
+        if wal_bytes >= self.wal_truncate_bytes:
+            truncated = await self.checkpoint('TRUNCATE', db)
+            if truncated['busy']:
+                logger.info(f"{label} WAL 收缩遇到读写方占用，下轮再试")
+                return 'passive'
+            logger.info(f"{label} WAL 已收缩（原 {wal_bytes / _MB:.1f}MB）")
+            return 'truncate'
+        return 'passive'
+
+    # ---------- optimize / vacuum ---------- #
+
+    async def optimize(self) -> None:
+        """批量任务后对各库执行 PRAGMA optimize（限制分析行数，耗时可控）"""
+        if not self.enabled:
+            return
+        for db in db_manager.all_databases():
+            async with db.get_connection() as conn:
+                await conn.execute("PRAGMA analysis_limit=400")
+                await conn.execute("PRAGMA optimize")
+        logger.info("PRAGMA optimize 完成")
+
+    async def incremental_vacuum(self, stats: Dict[str, int], db: Optional[DatabaseManager] = None) -> int:
+        """
+        分步回收空闲页
+
+        Args:
+            stats: stats() 的结果
+            db: 要回收的库（默认主库）
+
+        Returns:
+            本轮回收的页数
+        """
+        db = db or db_manager
+        free = stats['freelist_pages']
+        if free < self.vacuum_min_free_pages:
+            return 0
+        if stats['auto_vacuum'] != _AUTO_VACUUM_INCREMENTAL:
+            return await self._convert_to_incremental(stats, db)
+
+        freed = 0
+        for step in range(self.vacuum_max_steps):
+            async with db.get_connection() as conn:
+                await (await conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages_per_step})")).fetchall()
+                row = await (await conn.execute("PRAGMA freelist_count")).fetchone()
+            remaining = int(row[0])
+            freed += max(0, free - remaining)
+            free = remaining
+            if free == 0:
+                break
+            await asyncio.sleep(self.vacuum_step_sleep)
+        DB_VACUUM_PAGES.inc(freed, mode='incremental')
+        DB_FREELIST_PAGES.set(free, database=_label(db))
+        logger.info(f"{_label(db)} 增量 VACUUM 回收 {freed} 页，剩余空闲页 {free}")
+        return freed
+
+    async def _convert_to_incremental(self, stats: Dict[str, int], db: DatabaseManager) -> int:
+        if stats['db_bytes'] > self.full_vacuum_max_bytes:
+            logger.warning(
+                f"数据库 {db.db_path} {stats['db_bytes'] / _MB:.0f}MB 未启用增量回收，超过自动完整 VACUUM 上限，"
+                f"请在维护窗口手动执行 PRAGMA auto_vacuum=INCREMENTAL; VACUUM"
+            )
+            return 0
+        # auto_vacuum 的变更只在同一连接上的 VACUUM 中生效
+        async with db.get_connection() as conn:
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.execute("VACUUM")
+        DB_VACUUM_PAGES.inc(stats['freelist_pages'], mode='full')
+        logger.info(f"{_label(db)} 已执行完整 VACUUM 并切换为增量回收模式，回收 {stats['freelist_pages']} 页")
+        return stats['freelist_pages']
+
+    # ---------- 入口 ---------- #
+
+    async def run_cycle(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        一轮维护：对主库及各分片依次采集状态 → 按 WAL 大小执行检查点 → 静默时段内回收空闲页
+
+        Returns:
+            主库的 {'stats', 'checkpoint', 'vacuumed'}；启用分片时另含 'shards': {分片名: 同结构}
+        """
+        if not self.enabled:
+            return {}
+        quiet = self.in_quiet_hours(now)
+        results = {}
+        for db in db_manager.all_databases():
+            stats = await self.stats(db)
+            checkpoint = await self._adaptive_checkpoint(stats['wal_bytes'], db)
+            vacuumed = await self.incremental_vacuum(stats, db) if quiet else 0
+            results[_label(db)] = {'stats': stats, 'checkpoint': checkpoint, 'vacuumed': vacuumed}
+        result = results.pop('main')
+        if results:
+            result['shards'] = results
+        return result
+
+
+db_maintenance = DatabaseMaintenance()
@@ -68,10 +68,81 @@ class MediaDB:
         """
         query = "INSERT INTO media (merchant_id, telegram_file_id, media_type, sort_order) VALUES (?, ?, ?, ?)"
         try:
-            return await db_manager.get_last_insert_id(query, (merchant_id, telegram_file_id, media_type, sort_order))
+            media_id = await db_manager.get_last_insert_id(query, (merchant_id, telegram_file_id, media_type, sort_order))
         except Exception as e:
             logger.error(f"为商家 {merchant_id} 添加媒体文件时出错: {e}")
             return None
 
+        # 后台生成缩略图/封面帧（失败不影响媒体入库）
+        try:
+            from services.media_thumbnails import schedule_thumbnails
+            schedule_thumbnails(media_id, telegram_file_id, media_type)
+        except Exception as e:
+            logger.warning(f"提交媒体 {media_id} 缩略图任务失败: {e}")
+        return media_id
+
+    @staticmethod
+    async def get_media(media_id: int) -> Optional[Dict[str, Any]]:
+        """
+        根据媒体ID获取媒体记录。
+
+        Args:
+            media_id: 媒体表中的主键ID。
+
+        Returns:
+            媒体记录字典，未找到返回 None。
+        """
+        query = "SELECT id, merchant_id, telegram_file_id, media_type, sort_order FROM media WHERE id = ?"
+        try:
+            result = await db_manager.fetch_one(query, (media_id,))
+            return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"获取媒体 {media_id} 时出错: {e}")
+            return None
+
+    @staticmethod
+    async def save_thumbnails(media_id: int, variants: List[Dict[str, Any]]) -> bool:
+        """
+        保存媒体的缩略图/封面帧记录（同一规格覆盖写入）。
+
+        Args:
+            media_id: 媒体ID。
+            variants: 每项包含 variant, file_path, width, height, file_size。
+
+        Returns:
+            是否保存成功。
+        """
+        if not variants:
+            return True
+        query = """
+            INSERT OR REPLACE INTO media_thumbnails (media_id, variant, file_path, width, height, file_size)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """
+        queries = [
+            (query, (media_id, v['variant'], v['file_path'], v['width'], v['height'], v['file_size']))
+            for v in variants
+        ]
+        return await db_manager.execute_transaction(queries)
+
+    @staticmethod
+    async def get_thumbnail(media_id: int, variant: str) -> Optional[Dict[str, Any]]:
+        """
+        获取指定规格的缩略图记录。
+
+        Args:
+            media_id: 媒体ID。
+            variant: 规格名（如 'sm'、'md'、'poster'）。
+
+        Returns:
+            缩略图记录字典，未生成时返回 None。
+        """
+        query = "SELECT media_id, variant, file_path, width, height, file_size FROM media_thumbnails WHERE media_id = ? AND variant = ?"
+        try:
+            result = await db_manager.fetch_one(query, (media_id, variant))
+            return dict(result) if result else None
+        except Exception as e:
+            logger.error(f"获取媒体 {media_id} 缩略图({variant})时出错: {e}")
+            return None
+
 # 创建实例
 media_db = MediaDB()
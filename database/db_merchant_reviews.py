@@ -41,6 +41,15 @@ def _validate_ratings_m2u(ratings: Dict[str, Any]) -> bool:
         return False
 
 
+def _notify_leaderboard() -> None:
+    """有效评分可能变化：通知实时排行榜同步（失败不影响写入）"""
+    try:
+        from services.live_leaderboard import live_leaderboard
+        live_leaderboard.notify_changed()
+    except Exception as e:
+        logger.warning(f"通知实时排行榜失败: {e}")
+
+
 class MerchantReviewsManager:
     @staticmethod
     async def create(
@@ -158,7 +167,10 @@ class MerchantReviewsManager:
         )
         try:
             rc = await db_manager.execute_query(sql, params)
-            return bool(rc and rc >= 0)
+            ok = bool(rc and rc >= 0)
+            if ok:
+                _notify_leaderboard()
+            return ok
         except Exception as e:
             logger.error(f"update_scores m2u failed: {e}")
             return False
@@ -182,7 +194,10 @@ class MerchantReviewsManager:
         )
         try:
             rc = await db_manager.execute_query(sql, (admin_id, review_id))
-            return bool(rc and rc >= 0)
+            ok = bool(rc and rc >= 0)
+            if ok:
+                _notify_leaderboard()
+            return ok
         except Exception as e:
             logger.error(f"confirm_by_admin m2u failed: {e}")
             return False
@@ -192,7 +207,10 @@ class MerchantReviewsManager:
         sql = "UPDATE merchant_reviews SET is_active=?, updated_at=CURRENT_TIMESTAMP WHERE id=?"
         try:
             rc = await db_manager.execute_query(sql, (1 if is_active else 0, review_id))
-            return bool(rc and rc >= 0)
+            ok = bool(rc and rc >= 0)
+            if ok:
+                _notify_leaderboard()
+            return ok
         except Exception as e:
             logger.error(f"toggle_active m2u failed: {e}")
             return False
@@ -202,7 +220,10 @@ class MerchantReviewsManager:
         sql = "UPDATE merchant_reviews SET is_deleted=1, updated_at=CURRENT_TIMESTAMP WHERE id=?"
         try:
             rc = await db_manager.execute_query(sql, (review_id,))
-            return bool(rc and rc >= 0)
+            ok = bool(rc and rc >= 0)
+            if ok:
+                _notify_leaderboard()
+            return ok
         except Exception as e:
             logger.error(f"soft_delete m2u failed: {e}")
             return False
@@ -12,10 +12,22 @@ from typing import List, Dict, Any, Optional, Union
 # 导入项目模块
 
 from database.db_connection import db_manager
+from database.db_pagination import keyset_condition, keyset_order, cursor_after
+from database.db_counters import row_counters
+from database.db_log_partitions import log_partitions
 
 logger = logging.getLogger(__name__)
 
 
+def _notify_schedule_changed(merchant_id: int) -> None:
+    """发布/到期时间可能变化：通知调度器的发布时间线（失败不影响写入）"""
+    try:
+        from services.publish_timeline import notify_merchant_schedule_changed
+        notify_merchant_schedule_changed(merchant_id)
+    except Exception as e:
+        logger.warning(f"通知发布时间线失败: {e}")
+
+
 class MerchantManager:
     """
     商户管理器类，与实际数据库结构保持一致。
@@ -290,7 +302,7 @@ class MerchantManager:
             return None
 
     @staticmethod
-    async def get_merchants(status: Optional[str] = None, search: Optional[str] = None, region_id: Optional[int] = None, limit: int = 30, offset: int = 0) -> List[Dict[str, Any]]:
+    async def get_merchants(status: Optional[str] = None, search: Optional[str] = None, region_id: Optional[int] = None, limit: int = 30, offset: int = 0, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         获取商户列表（使用实际数据库字段）
         
@@ -300,6 +312,7 @@ class MerchantManager:
             region_id: 地区ID过滤（使用实际字段名）
             limit: 限制返回数量
             offset: 偏移量
+            cursor: 上一页末行游标（提供时使用键集分页，忽略offset）
             
         Returns:
             商户信息列表（包含地区信息）
@@ -327,22 +340,29 @@ class MerchantManager:
             
             if search:
                 # 支持名称模糊搜索和ID精确搜索
-                conditions.append("(m.name LIKE ? OR CAST(m.id AS TEXT) = ?)")
-                params.extend([f"%{search}%", search])
+                conditions.append("(m.name LIKE ? OR m.id = ?)")
+                params.extend([f"%{search}%", int(search) if str(search).strip().isdigit() else None])
 
             if region_id:
                 conditions.append("m.district_id = ?")
                 params.append(region_id)
 
+            keyset_cond, keyset_params = keyset_condition(cursor, "m.created_at", "m.id")
+            if keyset_cond:
+                conditions.append(keyset_cond)
+                params.extend(keyset_params)
+
             if conditions:
                 base_query += " WHERE " + " AND ".join(conditions)
             
             # 分页：仅当提供有效的limit时才追加LIMIT/OFFSET，防止SQLite类型不匹配
+            base_query += f" ORDER BY {keyset_order('m.created_at', 'm.id')}"
             if isinstance(limit, int):
-                base_query += " ORDER BY m.created_at DESC LIMIT ? OFFSET ?"
-                params.extend([int(limit), int(offset or 0)])
-            else:
-                base_query += " ORDER BY m.created_at DESC"
+                base_query += " LIMIT ?"
+                params.append(int(limit))
+                if not keyset_cond:
+                    base_query += " OFFSET ?"
+                    params.append(int(offset or 0))
 
             results = await db_manager.fetch_all(base_query, tuple(params))
             
@@ -520,6 +540,11 @@ class MerchantManager:
             
             if result > 0:
                 logger.info(f"商户更新成功，永久ID: {merchant_id}")
+                if {'status', 'publish_time', 'expiration_time'} & update_data.keys():
+                    _notify_schedule_changed(merchant_id)
+                if 'city_id' in update_data and db_manager.shards is not None:
+                    # 新订单写入新城市分片；历史订单仍在原分片，按 ID 路由可达
+                    db_manager.shards.forget_merchant(merchant_id)
                 
                 # 记录活动日志
                 await MerchantManager._log_merchant_activity(
@@ -569,6 +594,7 @@ class MerchantManager:
             
             if result > 0:
                 logger.info(f"商户状态更新成功，永久ID: {merchant_id}, 新状态: {status}")
+                _notify_schedule_changed(merchant_id)
                 
                 # 记录活动日志
                 await MerchantManager._log_merchant_activity(
@@ -608,6 +634,10 @@ class MerchantManager:
             
             if result > 0:
                 logger.info(f"商户删除成功，永久ID: {merchant_id}, 名称: {merchant['name']}")
+                _notify_schedule_changed(merchant_id)
+                if db_manager.shards is not None:
+                    # 分片文件没有指向 merchants 的外键，级联删除需手动补做
+                    await db_manager.shards.cascade_delete('merchants', merchant_id)
                 
                 # 记录活动日志
                 await MerchantManager._log_merchant_activity(
@@ -691,10 +721,7 @@ class MerchantManager:
     async def count_merchants() -> int:
         """统计商户总数"""
         try:
-            row = await db_manager.fetch_one("SELECT COUNT(*) as cnt FROM merchants")
-            if isinstance(row, dict):
-                return int(row.get('cnt', 0))
-            return int(row[0] if row else 0)
+            return await row_counters.get('merchants')
         except Exception as e:
             logger.error(f"统计商户总数失败: {e}")
             return 0
@@ -808,15 +835,19 @@ class MerchantManager:
         status: Optional[str] = None,
         district_id: Optional[int] = None,
         search: Optional[str] = None,
-        sort_by: str = 'created_at'
+        sort_by: str = 'created_at',
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取帖子（商户）分页列表，用于 Web 后台“帖子管理”。
 
+        按 created_at 排序且提供 cursor（上一页末行游标）时使用键集分页；
+        无搜索/地区筛选时总数读取 row_counters。
+
         返回结构:
             {
               'posts': [ {id, name, status, city_name, district_name, publish_time, expiration_time, created_at, updated_at}... ],
-              'total': <int>, 'page': <int>, 'per_page': <int>
+              'total': <int>, 'page': <int>, 'per_page': <int>, 'next_cursor': <str|None>
             }
         """
         try:
@@ -874,9 +905,24 @@ class MerchantManager:
             where_clause = (" WHERE " + " AND ".join(conditions)) if conditions else ""
 
             # 统计总数
-            count_sql = "SELECT COUNT(*) as cnt" + base_from + where_clause
-            total_row = await db_manager.fetch_one(count_sql, tuple(params))
-            total = int(total_row['cnt'] if total_row and 'cnt' in total_row.keys() else (total_row[0] if total_row else 0))
+            if not (district_id or search):
+                total = await row_counters.get(f"merchants:status:{status}" if status else "merchants")
+            else:
+                count_sql = "SELECT COUNT(*) as cnt" + base_from + where_clause
+                total_row = await db_manager.fetch_one(count_sql, tuple(params))
+                total = int(total_row['cnt'] if total_row and 'cnt' in total_row.keys() else (total_row[0] if total_row else 0))
+
+            # 键集分页仅适用于 created_at 排序
+            keyset_cond, keyset_params = (None, [])
+            if order_by == 'm.created_at':
+                keyset_cond, keyset_params = keyset_condition(cursor, "m.created_at", "m.id")
+            if keyset_cond:
+                where_clause += (" AND " if where_clause else " WHERE ") + keyset_cond
+                page_params = params + keyset_params + [per_page]
+                page_sql_tail = f" ORDER BY {keyset_order('m.created_at', 'm.id')} LIMIT ?"
+            else:
+                page_params = params + [per_page, offset]
+                page_sql_tail = f" ORDER BY {order_by} DESC, m.id DESC LIMIT ? OFFSET ?"
 
             # 分页查询
             # 列表页需要展示联系方式、频道用户名/链接等字段，这里一并返回
@@ -885,9 +931,9 @@ class MerchantManager:
                 " COALESCE(c.name, '') as city_name, COALESCE(d.name, '') as district_name, "
                 " m.publish_time, m.expiration_time, m.created_at, m.updated_at, "
                 " m.contact_info, m.channel_chat_id, m.channel_link, m.user_info "
-                + base_from + where_clause + f" ORDER BY {order_by} DESC LIMIT ? OFFSET ?"
+                + base_from + where_clause + page_sql_tail
             )
-            rows = await db_manager.fetch_all(select_sql, tuple(params + [per_page, offset]))
+            rows = await db_manager.fetch_all(select_sql, tuple(page_params))
 
             posts = [dict(row) for row in rows]
             return {
@@ -895,6 +941,7 @@ class MerchantManager:
                 'total': total,
                 'page': page,
                 'per_page': per_page,
+                'next_cursor': cursor_after(posts, per_page) if order_by == 'm.created_at' else None,
             }
         except Exception as e:
             logger.error(f"获取帖子列表失败: {e}")
@@ -1684,9 +1731,11 @@ class MerchantManager:
             details: 活动详情
         """
         try:
-            query = """
-                INSERT INTO activity_logs (user_id, action_type, details, merchant_id, timestamp)
-                VALUES (?, ?, ?, ?, ?)
+            # 写入当月分区（跨月时由 table_for_write 创建新分区）；时间戳取列默认值（UTC）
+            table = await log_partitions.table_for_write()
+            query = f"""
+                INSERT INTO {table} (user_id, action_type, details, merchant_id)
+                VALUES (?, ?, ?, ?)
             """
             
             await db_manager.execute_query(
@@ -1695,8 +1744,7 @@ class MerchantManager:
                     0,  # 系统操作
                     action_type,
                     json.dumps(details, ensure_ascii=False),
-                    merchant_id,
-                    datetime.now()
+                    merchant_id
                 )
             )
             
@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+"""
+迁移执行引擎（database/migrations/*.sql）
+
+使用方式（database.db_init 调用）：
+    from database.db_migrations import migration_engine, Migration
+
+    migrations = migration_engine.order([Migration.load(path) for path in paths], applied)
+    for migration in migrations:
+        await migration_engine.apply(migration)
+
+特性：
+    - 每个迁移文件在一个 BEGIN IMMEDIATE 事务内执行（外键检查在事务外关闭），失败整体回滚；
+      文件里自带的 BEGIN/COMMIT 与 PRAGMA foreign_keys 由引擎接管
+    - 语句按 sqlite3.complete_statement 切分（触发器体、字符串里的分号不会被拆开）；
+      "列/表/索引已存在" 视为已应用的结构而跳过，其余错误导致回滚。
+      strict_since 之前的历史迁移沿用原有的逐条容错：失败语句回滚到各自的保存点并记录，
+      全部语句失败时才整体回滚
+    - migration_history 记录 SHA-256 校验和与耗时；已执行的文件被修改时告警（不会重复执行）
+    - 按文件名中的版本号数值排序，文件头可用 "-- 依赖: <迁移文件名>" 声明依赖；
+      改名的文件用 "-- 原文件名: <旧文件名>" 声明，已按旧名执行过的库只改登记名、不重复执行
+    - 小表上的 CREATE INDEX 在迁移事务内原地创建；大表（MAX(rowid) 达到 online_min_rows）上的 CREATE INDEX，
+      以及以 "-- @online_rebuild: <表名>" 标注的 CREATE TABLE（新表结构），在迁移事务提交后在线执行：
+        影子表 + 触发器同步增量 → 分批复制（每批 batch_rows 行一个短写事务，批间让出 step_sleep）→ 短事务内原子替换；
+      新索引以正式名建在影子表上、随复制分批维护；原有索引随原表删除，在替换事务内按原定义重建
+      （均为普通 DDL，不改写 schema 表；替换事务的耗时与原有索引的数量和大小成正比）。
+      待执行的在线操作记录在 system_config，中断后下次启动继续
+    - schema_sync 的结构自修复（按 schema*.sql 补齐缺失列）经 apply(record=False) 同样在单个事务内执行
+"""
+
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from config import MIGRATION_CONFIG
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 在线重建使用的影子表/同步触发器前缀
+SHADOW_PREFIX = "_osc_"
+PENDING_KEY = "pending_online_ddl"
+
+_NAME = r'(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)'
+_LEADING_COMMENTS = re.compile(r'^(?:\s*(?:--[^\n]*(?:\n|$)|/\*.*?\*/))*', re.S)
+_TX_CONTROL = re.compile(
+    r'^(?:BEGIN(?:\s+(?:DEFERRED|IMMEDIATE|EXCLUSIVE))?(?:\s+TRANSACTION)?|(?:COMMIT|END)(?:\s+TRANSACTION)?)\s*;?$',
+    re.I
+)
+_FK_PRAGMA = re.compile(r'^PRAGMA\s+foreign_keys\s*=', re.I)
+_CREATE_INDEX = re.compile(
+    rf'^CREATE\s+(?P<unique>UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(?P<name>{_NAME})\s+ON\s+(?P<table>{_NAME})',
+    re.I
+)
+_CREATE_TABLE = re.compile(rf'^CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{_NAME}', re.I)
+_ONLINE_REBUILD = re.compile(r'--\s*@online_rebuild\s*[:：]?\s*(\w+)', re.I)
+_DEPENDS = re.compile(r'^--\s*(?:依赖|depends)\s*[:：]\s*(.+)$', re.I | re.M)
+_RENAMED_FROM = re.compile(r'^--\s*(?:原文件名|renamed from)\s*[:：]\s*(.+)$', re.I | re.M)
+_VERSION = re.compile(r'migration_(\d{4})_(\d{2})_(\d{2})_(\d+)_')
+_BENIGN_ERRORS = ('duplicate column name', 'already exists')
+
+
+class MigrationError(Exception):
+    """迁移执行失败"""
+
+
+def _unquote(name: str) -> str:
+    if name[:1] in ('"', '`', '[') and len(name) >= 2:
+        return name[1:-1]
+    return name
+
+
+def _migration_key(name: str) -> str:
+    return name[:-4] if name.endswith('.sql') else name
+
+
+def split_leading_comments(statement: str) -> Tuple[str, str]:
+    """拆出语句前的注释，返回 (注释, 语句体)"""
+    match = _LEADING_COMMENTS.match(statement)
+    return statement[:match.end()], statement[match.end():].strip()
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    把 SQL 脚本切分为单条语句（以 sqlite3.complete_statement 判断语句结束）
+
+    Returns:
+        语句列表（含各自前导注释，不含空语句）
+    """
+    statements = []
+    buffer = ''
+    for piece in re.split(r'(;)', sql):
+        buffer += piece
+        if piece == ';' and sqlite3.complete_statement(buffer):
+            if split_leading_comments(buffer)[1].rstrip(';').strip():
+                statements.append(buffer.strip())
+            buffer = ''
+    if split_leading_comments(buffer)[1].strip():
+        statements.append(buffer.strip())
+    return statements
+
+
+class Migration:
+    """一个迁移文件"""
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.checksum = hashlib.sha256(sql.replace('\r\n', '\n').encode('utf-8')).hexdigest()
+        match = _VERSION.match(name)
+        self.version = tuple(int(part) for part in match.groups()) if match else (0,)
+        self.depends = [
+            _migration_key(dep)
+            for line in _DEPENDS.findall(sql)
+            for dep in re.split(r'[,，\s]+', line.strip())
+            if dep
+        ]
+        self.previous_names = [name.strip() for name in _RENAMED_FROM.findall(sql)]
+
+    @property
+    def key(self) -> str:
+        return _migration_key(self.name)
+
+    @classmethod
+    def load(cls, path: str) -> 'Migration':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(os.path.basename(path), f.read())
+
+
+class MigrationEngine:
+    """迁移执行引擎：事务化执行、校验和记录、依赖排序与在线 DDL"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or MIGRATION_CONFIG
+        self.online_min_rows = int(config.get('online_min_rows', 50000))
+        self.batch_rows = max(1, int(config.get('batch_rows', 2000)))
+        self.step_sleep = float(config.get('step_sleep', 0.05))
+        self.strict_since = tuple(int(part) for part in str(config.get('strict_since', '0')).split('.'))
+        self._history_ready_for: Optional[str] = None
+
+    # ---------- 排序 ---------- #
+
+    def order(self, migrations: Sequence[Migration], applied: Iterable[str] = ()) -> List[Migration]:
+        """
+        按依赖关系排序（无依赖约束时按版本号从小到大）
+
+        Args:
+            migrations: 待执行的迁移
+            applied: 已执行的迁移名（依赖已执行的迁移视为已满足）
+
+        Returns:
+            执行顺序
+        """
+        done = {_migration_key(name) for name in applied}
+        by_key = {m.key: m for m in migrations}
+        waiting: Dict[str, Set[str]] = {}
+        dependents: Dict[str, List[str]] = {}
+        for m in migrations:
+            deps = {dep for dep in m.depends if dep not in done}
+            unknown = deps - set(by_key)
+            if unknown:
+                raise MigrationError(f"迁移 {m.name} 依赖的迁移不存在或未执行: {sorted(unknown)}")
+            waiting[m.key] = deps
+            for dep in deps:
+                dependents.setdefault(dep, []).append(m.key)
+
+        heap = [(by_key[k].version, k) for k, deps in waiting.items() if not deps]
+        heapq.heapify(heap)
+        ordered = []
+        while heap:
+            _, key = heapq.heappop(heap)
+            ordered.append(by_key[key])
+            for child in dependents.get(key, []):
+                waiting[child].discard(key)
+                if not waiting[child]:
+                    heapq.heappush(heap, (by_key[child].version, child))
+        if len(ordered) != len(migrations):
+            cyclic = sorted(k for k, deps in waiting.items() if deps)
+            raise MigrationError(f"迁移依赖存在循环: {cyclic}")
+        return ordered
+
+    # ---------- 历史记录 ---------- #
+
+    async def _ensure_history(self) -> None:
+        if self._history_ready_for == db_manager.db_path:
+            return
+        await db_manager.execute_query("""
+            CREATE TABLE IF NOT EXISTS migration_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                migration_name TEXT UNIQUE NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        columns = {row[1] for row in await db_manager.fetch_all("PRAGMA table_info(migration_history)")}
+        for column, definition in (('checksum', 'TEXT'), ('duration_ms', 'INTEGER')):
+            if column not in columns:
+                await db_manager.execute_query(f"ALTER TABLE migration_history ADD COLUMN {column} {definition}")
+        self._history_ready_for = db_manager.db_path
+
+    async def applied(self) -> Dict[str, Optional[str]]:
+        """已执行的迁移 {migration_name: checksum}"""
+        await self._ensure_history()
+        rows = await db_manager.fetch_all("SELECT migration_name, checksum FROM migration_history")
+        return {row[0]: row[1] for row in rows or []}
+
+    async def record(self, migration: Migration, duration_ms: int = 0) -> None:
+        """登记迁移为已执行（前置检查判定无需执行时使用）"""
+        await self._ensure_history()
+        await db_manager.execute_query(
+            "INSERT OR REPLACE INTO migration_history (migration_name, checksum, duration_ms) VALUES (?, ?, ?)",
+            (migration.name, migration.checksum, duration_ms)
+        )
+
+    async def _check_recorded(self, migration: Migration) -> bool:
+        """已执行则校验（或补记）校验和并返回 True"""
+        row = await db_manager.fetch_one(
+            "SELECT checksum FROM migration_history WHERE migration_name = ?", (migration.name,)
+        )
+        if row is None:
+            for previous in migration.previous_names:
+                if await db_manager.fetch_one(
+                    "SELECT 1 FROM migration_history WHERE migration_name = ?", (previous,)
+                ):
+                    await db_manager.execute_query(
+                        "UPDATE migration_history SET migration_name = ?, checksum = ? WHERE migration_name = ?",
+                        (migration.name, migration.checksum, previous)
+                    )
+                    logger.info(f"迁移 {previous} 已改名为 {migration.name}，更新执行记录")
+                    return True
+            return False
+        if row[0] is None:
+            await db_manager.execute_query(
+                "UPDATE migration_history SET checksum = ? WHERE migration_name = ?",
+                (migration.checksum, migration.name)
+            )
+        elif row[0] != migration.checksum:
+            logger.warning(f"⚠️ 已执行的迁移文件被修改（校验和不一致，不会重复执行）: {migration.name}")
+        return True
+
+    # ---------- 执行 ---------- #
+
+    async def apply(self, migration: Migration, record: bool = True, strict: Optional[bool] = None) -> bool:
+        """
+        在一个事务内执行迁移文件，提交后执行其中的在线 DDL
+
+        Args:
+            migration: 迁移
+            record: 是否登记到 migration_history（结构自修复等非版本化脚本传 False，每次按需执行）
+            strict: 任一语句失败即整体回滚（默认按版本号与 strict_since 判断）
+
+        Returns:
+            迁移是否成功（失败时事务已回滚）
+        """
+        await self._ensure_history()
+        if record and await self._check_recorded(migration):
+            logger.info(f"迁移 {migration.name} 已经执行过，跳过")
+            return True
+
+        started = time.perf_counter()
+        executed = skipped = errors = 0
+        if strict is None:
+            strict = migration.version >= self.strict_since
+        deferred: List[Dict[str, Any]] = []
+        try:
+            async with db_manager.get_connection() as conn:
+                # foreign_keys 在事务内设置无效，需在 BEGIN 之前关闭
+                await conn.execute("PRAGMA foreign_keys=OFF")
+                try:
+                    await conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        for statement in split_statements(migration.sql):
+                            comments, body = split_leading_comments(statement)
+                            if _TX_CONTROL.match(body) or _FK_PRAGMA.match(body):
+                                continue
+                            if await self._defer(conn, comments, body, deferred):
+                                continue
+                            await conn.execute("SAVEPOINT migration_statement")
+                            try:
+                                await conn.execute(body)
+                                executed += 1
+                            except Exception as e:
+                                await conn.execute("ROLLBACK TO migration_statement")
+                                if any(phrase in str(e).lower() for phrase in _BENIGN_ERRORS):
+                                    logger.info(f"SQL语句跳过（结构已存在）: {body[:50]}...")
+                                    skipped += 1
+                                elif strict:
+                                    raise MigrationError(f"{body[:80]}... | {e}") from e
+                                else:
+                                    logger.warning(f"历史迁移语句执行失败（已跳过）: {body[:50]}... | 错误: {e}")
+                                    errors += 1
+                            finally:
+                                await conn.execute("RELEASE migration_statement")
+                        if errors and not executed and not skipped:
+                            raise MigrationError("所有语句都失败了")
+                        if record:
+                            duration_ms = int((time.perf_counter() - started) * 1000)
+                            await conn.execute(
+                                "INSERT OR REPLACE INTO migration_history (migration_name, checksum, duration_ms) "
+                                "VALUES (?, ?, ?)",
+                                (migration.name, migration.checksum, duration_ms)
+                            )
+                        if deferred:
+                            pending = await self._load_pending(conn) + [
+                                {**item, 'migration': migration.name} for item in deferred
+                            ]
+                            await self._save_pending(conn, pending)
+                        await conn.commit()
+                    except BaseException:
+                        await conn.rollback()
+                        raise
+                finally:
+                    await conn.execute("PRAGMA foreign_keys=ON")
+        except Exception as e:
+            logger.error(f"❌ 迁移 {migration.name} 执行失败，已回滚: {e}")
+            return False
+
+        logger.info(
+            f"✅ 迁移 {migration.name} 执行成功 (执行:{executed}, 跳过:{skipped}, 错误:{errors}, 在线:{len(deferred)}, "
+            f"耗时:{int((time.perf_counter() - started) * 1000)}ms)"
+        )
+        # 在线 DDL 失败不影响迁移本身（已提交），待执行项保留到下次启动继续
+        await self.run_pending()
+        return True
+
+    async def _defer(self, conn, comments: str, body: str, deferred: List[Dict[str, Any]]) -> bool:
+        """需在线执行的语句加入 deferred 并返回 True"""
+        rebuild = _ONLINE_REBUILD.search(comments)
+        if rebuild and _CREATE_TABLE.match(body):
+            deferred.append({'op': 'rebuild', 'table': rebuild.group(1), 'sql': body, 'indexes': []})
+            return True
+        # 待在线重建的表上的新索引随影子表构建；大表上的索引提交后分批构建；其余在迁移事务内直接创建
+        index = _CREATE_INDEX.match(body)
+        if not index:
+            return False
+        table = _unquote(index.group('table'))
+        for item in deferred:
+            if item['op'] == 'rebuild' and item['table'] == table:
+                item['indexes'].append(body)
+                return True
+        if await self._is_large(conn, table):
+            deferred.append({'op': 'index', 'table': table, 'sql': body})
+            return True
+        return False
+
+    async def _is_large(self, conn, table: str) -> bool:
+        """按 MAX(rowid) 估计行数（O(log n)，不做全表 COUNT）"""
+        try:
+            cursor = await conn.execute(f'SELECT MAX(rowid) FROM "{table}"')
+            row = await cursor.fetchone()
+        except Exception:
+            return False
+        return bool(row and row[0] and row[0] >= self.online_min_rows)
+
+    # ---------- 在线 DDL ---------- #
+
+    async def _load_pending(self, conn=None) -> List[Dict[str, Any]]:
+        query = "SELECT config_value FROM system_config WHERE config_key = ?"
+        if conn is not None:
+            row = await (await conn.execute(query, (PENDING_KEY,))).fetchone()
+        else:
+            row = await db_manager.fetch_one(query, (PENDING_KEY,))
+        return json.loads(row[0]) if row and row[0] else []
+
+    async def _save_pending(self, conn, pending: List[Dict[str, Any]]) -> None:
+        query = "INSERT OR REPLACE INTO system_config (config_key, config_value, description) VALUES (?, ?, ?)"
+        params = (PENDING_KEY, json.dumps(pending, ensure_ascii=False), '待执行的在线 DDL（迁移提交后执行）')
+        if conn is not None:
+            await conn.execute(query, params)
+        else:
+            await db_manager.execute_query(query, params)
+
+    async def run_pending(self) -> bool:
+        """
+        依次执行待执行的在线 DDL（每完成一项即从记录中移除）
+
+        Returns:
+            是否全部完成
+        """
+        try:
+            pending = await self._load_pending()
+        except Exception as e:
+            logger.debug(f"读取待执行在线 DDL 失败: {e}")
+            return True
+        while pending:
+            item = pending[0]
+            try:
+                if item['op'] == 'rebuild':
+                    await self.rebuild_table_online(item['table'], item['sql'], item.get('indexes', []))
+                else:
+                    await self.create_index_online(item['sql'])
+            except Exception as e:
+                logger.error(f"❌ 在线 DDL 执行失败（下次启动重试）: {item.get('migration')} {item['op']} {item['table']}: {e}")
+                return False
+            pending.pop(0)
+            await self._save_pending(None, pending)
+        return True
+
+    async def create_index_online(self, index_sql: str) -> None:
+        """
+        创建索引：小表直接创建；大表经影子表分批复制构建后替换，构建期间不长时间持有写锁
+
+        Args:
+            index_sql: CREATE [UNIQUE] INDEX 语句
+        """
+        match = _CREATE_INDEX.match(index_sql.strip())
+        if not match:
+            raise MigrationError(f"无法解析索引语句: {index_sql[:80]}")
+        name, table = _unquote(match.group('name')), _unquote(match.group('table'))
+        if await db_manager.fetch_one("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)):
+            return
+        async with db_manager.transaction() as conn:
+            if not await self._is_large(conn, table):
+                await conn.execute(index_sql)
+                return
+        await self.rebuild_table_online(table, extra_indexes=[index_sql])
+
+    async def rebuild_table_online(
+        self, table: str, create_sql: Optional[str] = None, extra_indexes: Sequence[str] = ()
+    ) -> int:
+        """
+        在线重建表：影子表 + 同步触发器 + 分批复制 + 原子替换
+
+        Args:
+            table: 表名（需有 rowid）
+            create_sql: 新表结构的 CREATE TABLE 语句（默认沿用原结构）；同名列复制，新增列取默认值
+            extra_indexes: 需新建的索引（随影子表分批构建；原有索引在替换时按原定义重建）
+
+        Returns:
+            复制的行数
+        """
+        row = await db_manager.fetch_one("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        if row is None:
+            if not create_sql:
+                raise MigrationError(f"表不存在: {table}")
+            # 新表：直接创建
+            async with db_manager.transaction() as conn:
+                await conn.execute(create_sql)
+                for index_sql in extra_indexes:
+                    await conn.execute(index_sql)
+            return 0
+        if 'WITHOUT ROWID' in row[0].upper():
+            raise MigrationError(f"在线重建不支持 WITHOUT ROWID 表: {table}")
+
+        started = time.perf_counter()
+        await self._drop_shadow(table)
+        try:
+            columns, index_names, existing_indexes = await self._create_shadow(
+                table, create_sql or row[0], extra_indexes
+            )
+            copied = await self._copy_batches(table, columns)
+            index_names += await self._swap(table, existing_indexes)
+        except BaseException:
+            await self._drop_shadow(table)
+            raise
+        logger.info(
+            f"✅ 在线重建 {table} 完成: {copied} 行，索引 {index_names}，"
+            f"耗时 {time.perf_counter() - started:.1f}s"
+        )
+        return copied
+
+    async def _drop_shadow(self, table: str) -> None:
+        shadow = f"{SHADOW_PREFIX}{table}"
+        async with db_manager.transaction() as conn:
+            for suffix in ('ai', 'au', 'ad'):
+                await conn.execute(f'DROP TRIGGER IF EXISTS "{shadow}_{suffix}"')
+            await conn.execute(f'DROP TABLE IF EXISTS "{shadow}"')
+
+    async def _create_shadow(
+        self, table: str, create_sql: str, extra_indexes: Sequence[str]
+    ) -> Tuple[List[str], List[str], List[str]]:
+        """
+        建影子表、新索引（正式名）并安装同步触发器
+
+        Returns:
+            (复制的列, 已建在影子表上的新索引名, 替换时需按原定义重建的原有索引语句)
+        """
+        shadow = f"{SHADOW_PREFIX}{table}"
+        async with db_manager.transaction() as conn:
+            await conn.execute(_CREATE_TABLE.sub(f'CREATE TABLE "{shadow}"', create_sql.strip(), count=1))
+            old_columns = [r[1] for r in await (await conn.execute(f'PRAGMA table_info("{table}")')).fetchall()]
+            new_columns = [r[1] for r in await (await conn.execute(f'PRAGMA table_info("{shadow}")')).fetchall()]
+            columns = [c for c in new_columns if c in old_columns]
+
+            existing = [r[0] for r in await (await conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+            )).fetchall()]
+            existing_names = {_unquote(_CREATE_INDEX.match(sql.strip()).group('name')) for sql in existing}
+            index_names = []
+            for index_sql in extra_indexes:
+                match = _CREATE_INDEX.match(index_sql.strip())
+                name = _unquote(match.group('name'))
+                if name in existing_names or name in index_names:
+                    continue
+                # 新索引名尚未被占用，直接以正式名建在影子表上，改名后随表生效
+                unique = 'UNIQUE ' if match.group('unique') else ''
+                await conn.execute(f'CREATE {unique}INDEX "{name}" ON "{shadow}"' + index_sql.strip()[match.end():])
+                index_names.append(name)
+
+            column_list = ', '.join(f'"{c}"' for c in columns)
+            select = f'SELECT rowid, {column_list} FROM "{table}" WHERE rowid = NEW.rowid'
+            upsert = f'INSERT OR REPLACE INTO "{shadow}" (rowid, {column_list}) {select};'
+            delete = f'DELETE FROM "{shadow}" WHERE rowid = OLD.rowid;'
+            await conn.execute(f'CREATE TRIGGER "{shadow}_ai" AFTER INSERT ON "{table}" BEGIN {upsert} END')
+            await conn.execute(f'CREATE TRIGGER "{shadow}_au" AFTER UPDATE ON "{table}" BEGIN {delete} {upsert} END')
+            await conn.execute(f'CREATE TRIGGER "{shadow}_ad" AFTER DELETE ON "{table}" BEGIN {delete} END')
+        return columns, index_names, existing
+
+    async def _copy_batches(self, table: str, columns: List[str]) -> int:
+        """按 rowid 分批复制（触发器已同步的行跳过），每批一个短写事务"""
+        shadow = f"{SHADOW_PREFIX}{table}"
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        last = -(2 ** 63)
+        copied = 0
+        while True:
+            async with db_manager.transaction() as conn:
+                cursor = await conn.execute(
+                    f'SELECT MAX(rowid), COUNT(*) FROM '
+                    f'(SELECT rowid FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?)',
+                    (last, self.batch_rows)
+                )
+                high, count = await cursor.fetchone()
+                if high is None:
+                    break
+                await conn.execute(
+                    f'INSERT INTO "{shadow}" (rowid, {column_list}) SELECT rowid, {column_list} FROM "{table}" AS t '
+                    f'WHERE t.rowid > ? AND t.rowid <= ? '
+                    f'AND NOT EXISTS (SELECT 1 FROM "{shadow}" AS s WHERE s.rowid = t.rowid)',
+                    (last, high)
+                )
+            copied += count
+            last = high
+            await asyncio.sleep(self.step_sleep)
+        return copied
+
+    async def _swap(self, table: str, index_sqls: Sequence[str]) -> List[str]:
+        """
+        短事务内：核对行数 → 删除原表（连同其索引）→ 影子表改名 → 按原定义重建原有索引 → 恢复原表触发器
+
+        Returns:
+            重建的原有索引名
+        """
+        shadow = f"{SHADOW_PREFIX}{table}"
+        rebuilt = []
+        async with db_manager.get_connection() as conn:
+            await conn.execute("PRAGMA foreign_keys=OFF")
+            # 原表删除后视图/触发器暂时引用不到表，改名时不做全库引用校验
+            await conn.execute("PRAGMA legacy_alter_table=ON")
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                try:
+                    triggers = await (await conn.execute(
+                        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name NOT LIKE ?",
+                        (table, f"{SHADOW_PREFIX}%")
+                    )).fetchall()
+                    source = (await (await conn.execute(f'SELECT COUNT(*) FROM "{table}"')).fetchone())[0]
+                    target = (await (await conn.execute(f'SELECT COUNT(*) FROM "{shadow}"')).fetchone())[0]
+                    if source != target:
+                        raise MigrationError(f"影子表行数不一致: {table}={source}, {shadow}={target}")
+
+                    await conn.execute(f'DROP TABLE "{table}"')
+                    await conn.execute(f'ALTER TABLE "{shadow}" RENAME TO "{table}"')
+                    for index_sql in index_sqls:
+                        name = _unquote(_CREATE_INDEX.match(index_sql.strip()).group('name'))
+                        await conn.execute("SAVEPOINT rebuild_index")
+                        try:
+                            await conn.execute(index_sql)
+                            rebuilt.append(name)
+                        except Exception as e:
+                            await conn.execute("ROLLBACK TO rebuild_index")
+                            if 'no such column' not in str(e).lower():
+                                raise
+                            logger.warning(f"索引 {name} 引用的列在新表结构中不存在，重建后不再保留: {e}")
+                        finally:
+                            await conn.execute("RELEASE rebuild_index")
+                    for (trigger_sql,) in triggers:
+                        await conn.execute(trigger_sql)
+                    violations = await (await conn.execute(f'PRAGMA foreign_key_check("{table}")')).fetchall()
+                    if violations:
+                        raise MigrationError(f"重建后 {table} 存在 {len(violations)} 条外键违规")
+                    await conn.commit()
+                except BaseException:
+                    await conn.rollback()
+                    raise
+            finally:
+                await conn.execute("PRAGMA legacy_alter_table=OFF")
+                await conn.execute("PRAGMA foreign_keys=ON")
+        return rebuilt
+
+
+migration_engine = MigrationEngine()
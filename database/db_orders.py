@@ -5,12 +5,16 @@
 """
 
 import logging
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Sequence, Tuple, Union
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
 
 from database.db_connection import db_manager
+from database.db_pagination import keyset_condition, keyset_order
+from database.db_counters import row_counters
+from database.db_log_partitions import log_partitions
+from database.db_logs import ActionType
 
 logger = logging.getLogger(__name__)
 
@@ -84,7 +88,8 @@ class OrderManager:
                 status
             )
             
-            order_id = await db_manager.get_last_insert_id(insert_query, params)
+            db = await db_manager.for_merchant(order_data['merchant_id'])
+            order_id = await db.get_last_insert_id(insert_query, params)
             
             logger.info(f"成功创建订单，ID: {order_id}, 用户: {order_data['customer_user_id']}, 商户: {order_data['merchant_id']}, 状态: {status}")
             return order_id
@@ -96,6 +101,130 @@ class OrderManager:
             logger.error(f"创建订单失败: {e}")
             raise
 
+    @staticmethod
+    async def create_order_idempotent(
+        order_data: Dict[str, Any], idempotency_keys: Sequence[str]
+    ) -> Tuple[int, bool]:
+        """
+        单事务创建订单：用户 upsert、订单插入、活动日志在同一个写事务内完成，并按幂等键去重
+
+        启用城市分片时，订单在商户所在城市的分片事务内查重并插入（只锁该分片），
+        新建成功后用户与活动日志再以一个主库事务写入。
+
+        Args:
+            order_data: 订单数据字典，字段同 create_order
+            idempotency_keys: 幂等键；第一个写入新订单，全部用于查找已有订单（相邻时间窗）
+
+        Returns:
+            (订单ID, 是否新建)；命中幂等键时返回已有订单且不再写日志
+        """
+        for field in ('customer_user_id', 'merchant_id', 'price'):
+            if order_data.get(field) is None:
+                raise ValueError(f"缺少必需字段: {field}")
+        if not idempotency_keys:
+            raise ValueError("缺少幂等键")
+        status = order_data.get('status', '尝试预约')
+        user_id = order_data['customer_user_id']
+
+        # 分区表名可能触发建表，须在事务外取得
+        log_table = await log_partitions.table_for_write()
+        shard = await db_manager.for_merchant(order_data['merchant_id'])
+        if shard is db_manager:
+            async with db_manager.transaction() as conn:
+                await OrderManager._upsert_order_user(conn, order_data)
+                order_id, created = await OrderManager._insert_order_once(conn, order_data, idempotency_keys, status)
+                if not created:
+                    return order_id, False
+                await OrderManager._log_order_created(conn, log_table, order_id, order_data)
+        else:
+            async with shard.transaction() as conn:
+                order_id, created = await OrderManager._insert_order_once(conn, order_data, idempotency_keys, status)
+            if not created:
+                return order_id, False
+            async with db_manager.transaction() as conn:
+                await OrderManager._upsert_order_user(conn, order_data)
+                await OrderManager._log_order_created(conn, log_table, order_id, order_data)
+        logger.info(f"成功创建订单，ID: {order_id}, 用户: {user_id}, 商户: {order_data['merchant_id']}, 状态: {status}")
+        return order_id, True
+
+    @staticmethod
+    async def _upsert_order_user(conn, order_data: Dict[str, Any]) -> None:
+        user_id = order_data['customer_user_id']
+        await conn.execute(
+            "INSERT INTO users (user_id, username) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET username = COALESCE(excluded.username, users.username)",
+            (user_id, order_data.get('customer_username') or f"user_{user_id}"),
+        )
+
+    @staticmethod
+    async def _insert_order_once(
+        conn, order_data: Dict[str, Any], idempotency_keys: Sequence[str], status: str
+    ) -> Tuple[int, bool]:
+        """按幂等键查重，未命中时插入订单；返回 (订单ID, 是否新建)"""
+        key_marks = ','.join('?' for _ in idempotency_keys)
+        cursor = await conn.execute(
+            f"SELECT id FROM orders WHERE idempotency_key IN ({key_marks}) ORDER BY id LIMIT 1",
+            tuple(idempotency_keys),
+        )
+        row = await cursor.fetchone()
+        if row:
+            return row['id'], False
+
+        cursor = await conn.execute(
+            """
+            INSERT INTO orders (
+                merchant_id, customer_user_id, customer_username, course_type, price,
+                appointment_time, status, idempotency_key, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (
+                order_data['merchant_id'], order_data['customer_user_id'], order_data.get('customer_username'),
+                order_data.get('course_type'), order_data['price'], order_data.get('appointment_time'),
+                status, idempotency_keys[0],
+            ),
+        )
+        return cursor.lastrowid, True
+
+    @staticmethod
+    async def _log_order_created(conn, log_table: str, order_id: int, order_data: Dict[str, Any]) -> None:
+        details = {
+            'order_id': order_id,
+            'event_type': 'created',
+            'event_timestamp': datetime.now().isoformat(),
+            'course_type': order_data.get('course_type'),
+            'price': order_data['price'],
+        }
+        await conn.execute(
+            f"INSERT INTO {log_table} (user_id, action_type, details, button_id, merchant_id) VALUES (?, ?, ?, ?, ?)",
+            (
+                order_data['customer_user_id'], ActionType.ORDER_CREATED.value,
+                json.dumps(details, ensure_ascii=False), None, order_data['merchant_id'],
+            ),
+        )
+
+    @staticmethod
+    async def set_order_course(order_id: int, customer_user_id: int, course_type: str, price: int) -> bool:
+        """
+        写入用户选择的课程与价格（仅限下单用户本人，且值有变化时才更新）
+
+        Args:
+            order_id: 订单ID
+            customer_user_id: 下单用户ID
+            course_type: 课程类型（P/PP）
+            price: 价格
+
+        Returns:
+            是否发生了更新；重复点击同一选项返回 False
+        """
+        result = await db_manager.for_id(order_id).execute_query(
+            """
+            UPDATE orders SET course_type = ?, price = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND customer_user_id = ? AND (course_type IS NOT ? OR price IS NOT ?)
+            """,
+            (course_type, price, order_id, customer_user_id, course_type, price),
+        )
+        return result > 0
+
     @staticmethod
     async def get_order(order_id: int) -> Optional[Dict[str, Any]]:
         """
@@ -315,7 +444,7 @@ class OrderManager:
             """
             params = (status, completion_time, order_id)
             
-            result = await db_manager.execute_query(query, params)
+            result = await db_manager.for_id(order_id).execute_query(query, params)
             
             if result > 0:
                 logger.info(f"订单状态更新成功，ID: {order_id}, 新状态: {status}")
@@ -379,7 +508,7 @@ class OrderManager:
             query = f"UPDATE orders SET {', '.join(update_fields)} WHERE id = ?"
             params.append(order_id)
             
-            result = await db_manager.execute_query(query, tuple(params))
+            result = await db_manager.for_id(order_id).execute_query(query, tuple(params))
             
             if result > 0:
                 logger.info(f"订单更新成功，ID: {order_id}")
@@ -405,7 +534,7 @@ class OrderManager:
         """
         try:
             query = "DELETE FROM orders WHERE id = ?"
-            result = await db_manager.execute_query(query, (order_id,))
+            result = await db_manager.for_id(order_id).execute_query(query, (order_id,))
             
             if result > 0:
                 logger.info(f"订单删除成功，ID: {order_id}")
@@ -641,11 +770,12 @@ class OrderManager:
         date_to: Optional[str] = None,
         search: Optional[str] = None,
         limit: int = 20,
-        offset: int = 0
+        offset: int = 0,
+        cursor: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
         获取订单列表（Web界面专用）
-        支持高级筛选和分页
+        支持高级筛选和分页；传入 cursor（上一页末行游标）时使用键集分页，忽略 offset
         """
         try:
             conditions = []
@@ -680,16 +810,29 @@ class OrderManager:
                 params.append(date_to)
             
             if search:
-                conditions.append("(o.customer_username LIKE ? OR m.name LIKE ? OR o.id LIKE ?)")
+                # 订单号按主键精确匹配（LIKE 会让 o.id 无法走索引）
                 search_param = f"%{search}%"
-                params.extend([search_param, search_param, search_param])
+                if str(search).strip().isdigit():
+                    conditions.append("(o.id = ? OR o.customer_username LIKE ? OR m.name LIKE ?)")
+                    params.extend([int(search), search_param, search_param])
+                else:
+                    conditions.append("(o.customer_username LIKE ? OR m.name LIKE ?)")
+                    params.extend([search_param, search_param])
+
+            keyset_cond, keyset_params = keyset_condition(cursor, "o.created_at", "o.id")
+            if keyset_cond:
+                conditions.append(keyset_cond)
+                params.extend(keyset_params)
             
             # 构建完整查询
             if conditions:
                 base_query += " WHERE " + " AND ".join(conditions)
             
-            base_query += " ORDER BY o.created_at DESC LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+            base_query += f" ORDER BY {keyset_order('o.created_at', 'o.id')} LIMIT ?"
+            params.append(limit)
+            if not keyset_cond:
+                base_query += " OFFSET ?"
+                params.append(offset)
             
             results = await db_manager.fetch_all(base_query, tuple(params))
             orders = [dict(row) for row in results]
@@ -709,8 +852,11 @@ class OrderManager:
         date_from: Optional[str] = None,
         date_to: Optional[str] = None
     ) -> int:
-        """统计符合条件的订单数量"""
+        """统计符合条件的订单数量（仅按状态或不筛选时读取计数器）"""
         try:
+            if not (merchant_id or user_id or date_from or date_to):
+                return await row_counters.get(f"orders:status:{status}" if status else "orders")
+
             conditions = []
             params = []
             
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+键集（keyset/游标）分页工具
+
+后台列表统一按 (created_at DESC, id DESC) 排序。翻到下一页时，不再使用
+OFFSET（深页需要先扫描并丢弃前面所有行），而是携带上一页最后一行的
+(created_at, id) 作为游标，用行值比较直接从索引定位：
+
+    cond, cond_params = keyset_condition(cursor, "o.created_at", "o.id")
+    if cond:
+        conditions.append(cond)
+        params.extend(cond_params)
+    sql += f" ORDER BY {keyset_order('o.created_at', 'o.id')} LIMIT ?"
+
+    next_cursor = cursor_after(rows, limit)   # 交给前端的“下一页”链接
+
+游标对外是不透明字符串（urlsafe base64 编码的 JSON），解析失败时视为首页。
+
+created_at 为 NULL 的行在 DESC 排序中排在最后（SQLite 中 NULL 最小）：非 NULL 游标之后
+还包括全部 NULL 行，NULL 游标之后只按 id 继续，这些行同样能翻到且不会回到首页。
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+def encode_cursor(created_at: Any, row_id: Any) -> str:
+    """把 (created_at, id) 编码为不透明游标"""
+    payload = json.dumps([None if created_at is None else str(created_at), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Optional[str], Any]]:
+    """解析游标为 (created_at 或 None, id)，无效返回None"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if not isinstance(row_id, int) or isinstance(row_id, bool):
+        return None
+    return (None if created_at is None else str(created_at)), row_id
+
+
+def keyset_condition(cursor: Optional[str], created_col: str, id_col: str) -> Tuple[Optional[str], List[Any]]:
+    """
+    生成“排在游标之后”的 WHERE 条件
+
+    Args:
+        cursor: 上一页返回的游标
+        created_col: 排序时间列（如 'o.created_at'）
+        id_col: 唯一的次排序列（如 'o.id'）
+
+    Returns:
+        (条件SQL, 参数)；游标无效时返回 (None, [])
+    """
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        return None, []
+    created_at, row_id = decoded
+    if created_at is None:
+        return f"({created_col} IS NULL AND {id_col} < ?)", [row_id]
+    return f"(({created_col}, {id_col}) < (?, ?) OR {created_col} IS NULL)", [created_at, row_id]
+
+
+def keyset_order(created_col: str, id_col: str) -> str:
+    return f"{created_col} DESC, {id_col} DESC"
+
+
+def cursor_after(rows: Sequence[Any], limit: int, created_key: str = 'created_at', id_key: str = 'id') -> Optional[str]:
+    """满页时返回指向最后一行之后的游标，不满页说明已到末页"""
+    if not rows or len(rows) < int(limit):
+        return None
+    last = rows[-1]
+    return encode_cursor(last[created_key], last[id_key])
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+慢查询日志与执行计划采集
+
+表：slow_queries（新增表）
+
+说明：
+- DatabaseManager 的每条语句执行后调用 query_profiler.record()，按 SQL 指纹累计次数与耗时；
+  超过阈值（SLOW_QUERY_CONFIG.threshold_ms）的记为慢查询，连同参数形态（类型与长度，不含取值）写日志。
+- 每个指纹首次出现时在后台线程用独立的只读连接执行一次 EXPLAIN QUERY PLAN，
+  不占用连接池；计划中对行数超过 large_table_rows 的表做全表扫描（SCAN 且未使用索引）的语句被标记。
+- 有慢查询或被标记的指纹定期以增量方式汇总进 slow_queries 表，多个进程（机器人、Web、调度器）
+  写入同一张表，调试页 /debug/queries 按总耗时与执行次数列出。
+"""
+
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from config import SLOW_QUERY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+_EXPLAINABLE = re.compile(r"^\s*(?:SELECT|WITH|UPDATE|DELETE)\b", re.I)
+_INSERT_SELECT = re.compile(r"^\s*(?:INSERT|REPLACE)\b.*\bSELECT\b", re.I | re.S)
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?", re.I)
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(.*)$")
+_NOT_ALIAS = {
+    'WHERE', 'ON', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'CROSS', 'FULL', 'OUTER', 'NATURAL', 'ORDER',
+    'GROUP', 'LIMIT', 'SET', 'USING', 'UNION', 'HAVING', 'WINDOW', 'INDEXED', 'NOT', 'EXCEPT',
+    'INTERSECT', 'VALUES', 'OFFSET', 'RETURNING',
+}
+
+
+def _value_shape(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        # 前导通配符的 LIKE 参数无法使用索引，单独标出
+        return f"str[{len(value)}{',前导%' if value.startswith('%') else ''}]"
+    if isinstance(value, (bytes, bytearray)):
+        return f"bytes[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shape(params: Any, limit: int = 20) -> str:
+    """
+    参数形态（只记录类型与长度，不记录取值）
+
+    Args:
+        params: 语句参数（元组/列表/字典）
+        limit: 最多列出的参数个数
+
+    Returns:
+        如 "(int, str[12], NULL)"
+    """
+    if not params:
+        return ""
+    if isinstance(params, dict):
+        items = [f"{key}: {_value_shape(value)}" for key, value in list(params.items())[:limit]]
+        more = len(params) - limit
+        return "{" + ", ".join(items) + (f", …+{more}" if more > 0 else "") + "}"
+    values = list(params)
+    items = [_value_shape(value) for value in values[:limit]]
+    more = len(values) - limit
+    return "(" + ", ".join(items) + (f", …+{more}" if more > 0 else "") + ")"
+
+
+def table_aliases(query: str) -> Dict[str, str]:
+    """从 SQL 中解析 {别名或表名: 表名}，用于把计划中的 "SCAN m" 还原为表名"""
+    aliases: Dict[str, str] = {}
+    for table, alias in _TABLE_REF.findall(query):
+        aliases[table] = table
+        if alias and alias.upper() not in _NOT_ALIAS:
+            aliases[alias] = table
+    return aliases
+
+
+def format_plan(rows: List[Tuple]) -> str:
+    """EXPLAIN QUERY PLAN 结果按父子关系缩进为多行文本"""
+    depth: Dict[int, int] = {}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        level = depth.get(parent, -1) + 1 if parent else 0
+        depth[node_id] = level
+        lines.append("  " * level + detail)
+    return "\n".join(lines)
+
+
+def scanned_tables(rows: List[Tuple], query: str) -> List[str]:
+    """计划中做全表扫描（未使用索引）的表名"""
+    aliases = table_aliases(query)
+    tables = []
+    for row in rows:
+        match = _SCAN.match(row[3])
+        if not match or "INDEX" in match.group(2):
+            continue
+        name = aliases.get(match.group(1), match.group(1))
+        if name not in tables:
+            tables.append(name)
+    return tables
+
+
+class QueryStats:
+    """单个 SQL 指纹的累计统计"""
+
+    __slots__ = (
+        'fingerprint', 'op', 'count', 'total_ms', 'slow_count', 'slow_ms', 'max_ms',
+        'param_shape', 'plan', 'scans', 'flushed',
+    )
+
+    def __init__(self, fingerprint: str, op: str):
+        self.fingerprint = fingerprint
+        self.op = op
+        self.count = 0
+        self.total_ms = 0.0
+        self.slow_count = 0
+        self.slow_ms = 0.0
+        self.max_ms = 0.0
+        self.param_shape = ""
+        self.plan: Optional[str] = None
+        # 全表扫描的大表：[(表名, 行数)]
+        self.scans: List[Tuple[str, int]] = []
+        # 已写入 slow_queries 的 (count, total_ms, slow_count, slow_ms)
+        self.flushed = (0, 0.0, 0, 0.0)
+
+    @property
+    def flagged(self) -> bool:
+        return self.slow_count > 0 or bool(self.scans)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "fingerprint": self.fingerprint,
+            "op": self.op,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "slow_count": self.slow_count,
+            "slow_ms": round(self.slow_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+            "param_shape": self.param_shape,
+            "plan": self.plan,
+            "scans": ", ".join(f"{table}({rows})" for table, rows in self.scans),
+        }
+
+
+class QueryProfiler:
+    """按 SQL 指纹统计语句耗时、记录慢查询并采集执行计划"""
+
+    _UPSERT = """
+        INSERT INTO slow_queries (
+            fingerprint, op, param_shape, exec_count, total_ms, slow_count, slow_total_ms,
+            max_ms, query_plan, scan_tables, first_seen, last_seen
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT(fingerprint) DO UPDATE SET
+            exec_count = exec_count + excluded.exec_count,
+            total_ms = total_ms + excluded.total_ms,
+            slow_count = slow_count + excluded.slow_count,
+            slow_total_ms = slow_total_ms + excluded.slow_total_ms,
+            max_ms = MAX(max_ms, excluded.max_ms),
+            param_shape = COALESCE(NULLIF(excluded.param_shape, ''), param_shape),
+            query_plan = COALESCE(excluded.query_plan, query_plan),
+            scan_tables = COALESCE(excluded.scan_tables, scan_tables),
+            last_seen = CURRENT_TIMESTAMP
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config: 配置（默认 SLOW_QUERY_CONFIG）
+        """
+        config = config or SLOW_QUERY_CONFIG
+        self.enabled = config.get("enabled", True)
+        self.threshold_ms = config.get("threshold_ms", 100.0)
+        self.explain = config.get("explain", True)
+        self.large_table_rows = config.get("large_table_rows", 1000)
+        self.max_fingerprints = config.get("max_fingerprints", 2000)
+        self.flush_interval = config.get("flush_interval", 60)
+        self.stats: Dict[str, QueryStats] = {}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=config.get("recent_size", 200))
+        self.untracked = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        # EXPLAIN 使用的独立只读连接（后台线程）与表行数缓存
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_path: Optional[str] = None
+        self._conn_lock = threading.Lock()
+        self._table_rows: Dict[str, Tuple[int, float]] = {}
+
+    def record(self, op: str, query: str, fingerprint: str, params: Any, elapsed_ms: float):
+        """
+        记录一次语句执行（由 DatabaseManager 在每条语句结束时调用）
+
+        Args:
+            op: 操作类型（execute / fetch_one / fetch_all / insert / transaction）
+            query: 原始 SQL
+            fingerprint: SQL 指纹
+            params: 语句参数
+            elapsed_ms: 耗时（毫秒）
+        """
+        if not self.enabled:
+            return
+        stats = self.stats.get(fingerprint)
+        if stats is None:
+            if len(self.stats) >= self.max_fingerprints:
+                self.untracked += 1
+                return
+            stats = self.stats[fingerprint] = QueryStats(fingerprint, op)
+            if self.explain and (_EXPLAINABLE.match(query) or _INSERT_SELECT.match(query)):
+                self._spawn(self._capture_plan(stats, query, params))
+
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+        if elapsed_ms > stats.max_ms:
+            stats.max_ms = elapsed_ms
+        if elapsed_ms >= self.threshold_ms:
+            shape = param_shape(params)
+            stats.slow_count += 1
+            stats.slow_ms += elapsed_ms
+            stats.param_shape = shape
+            self.recent.append({
+                "at": datetime.now(), "op": op, "ms": round(elapsed_ms, 2),
+                "fingerprint": fingerprint, "param_shape": shape,
+            })
+            logger.warning(f"慢查询 {elapsed_ms:.1f}ms [{op}] {fingerprint} 参数: {shape or '无'}")
+
+        if not self._flushing and time.monotonic() - self._last_flush >= self.flush_interval:
+            self._spawn(self.flush())
+
+    def _spawn(self, coro):
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # ------------------------------------------------------------------
+    # 执行计划
+    # ------------------------------------------------------------------
+
+    async def _capture_plan(self, stats: QueryStats, query: str, params: Any):
+        from database.db_connection import db_manager
+
+        try:
+            rows, scans = await asyncio.to_thread(self._explain, db_manager.db_path, query, params)
+        except Exception as e:
+            logger.debug(f"获取执行计划失败: {e}, SQL: {stats.fingerprint}")
+            return
+        stats.plan = format_plan(rows)
+        stats.scans = scans
+        if scans:
+            tables = ", ".join(f"{table}({count}行)" for table, count in scans)
+            logger.warning(f"全表扫描: {tables} [{stats.op}] {stats.fingerprint}")
+
+    def _explain(self, path: str, query: str, params: Any) -> Tuple[List[Tuple], List[Tuple[str, int]]]:
+        with self._conn_lock:
+            if self._conn is None or self._conn_path != path:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = sqlite3.connect(path, timeout=1, check_same_thread=False)
+                self._conn.execute("PRAGMA query_only = 1")
+                self._conn_path = path
+                self._table_rows.clear()
+            rows = self._conn.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+            scans = []
+            for table in scanned_tables(rows, query):
+                count = self._row_count(table)
+                if count is not None and count >= self.large_table_rows:
+                    scans.append((table, count))
+            return rows, scans
+
+    def _row_count(self, table: str) -> Optional[int]:
+        """表的大致行数（MAX(rowid)，每 10 分钟刷新）；非普通表返回 None"""
+        cached = self._table_rows.get(table)
+        if cached and time.monotonic() - cached[1] < 600:
+            return cached[0]
+        is_table = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if not is_table:
+            return None
+        try:
+            count = self._conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID 表
+            count = self._conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        self._table_rows[table] = (count, time.monotonic())
+        return count
+
+    # ------------------------------------------------------------------
+    # 汇总与查询
+    # ------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """
+        把慢查询与被标记指纹的增量写入 slow_queries 表
+
+        Returns:
+            写入的指纹数
+        """
+        from database.db_connection import db_manager
+
+        if self._flushing:
+            return 0
+        self._flushing = True
+        self._last_flush = time.monotonic()
+        try:
+            pending = []
+            for stats in list(self.stats.values()):
+                current = (stats.count, stats.total_ms, stats.slow_count, stats.slow_ms)
+                if not stats.flagged or current == stats.flushed:
+                    continue
+                pending.append((stats, current))
+            if not pending:
+                return 0
+
+            queries = []
+            for stats, current in pending:
+                count, total_ms, slow_count, slow_ms = current
+                base = stats.flushed
+                scans = ",".join(f"{table}:{rows}" for table, rows in stats.scans) or None
+                queries.append((self._UPSERT, (
+                    stats.fingerprint, stats.op, stats.param_shape,
+                    count - base[0], round(total_ms - base[1], 3),
+                    slow_count - base[2], round(slow_ms - base[3], 3),
+                    round(stats.max_ms, 3), stats.plan, scans,
+                )))
+            if not await db_manager.execute_transaction(queries):
+                return 0
+            for stats, current in pending:
+                stats.flushed = current
+            return len(pending)
+        except Exception as e:
+            logger.debug(f"写入慢查询汇总失败: {e}")
+            return 0
+        finally:
+            self._flushing = False
+
+    def get_top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """本进程被标记的指纹，按慢查询总耗时、扫描语句的执行次数排序"""
+        flagged = [s for s in self.stats.values() if s.flagged]
+        flagged.sort(key=lambda s: (s.slow_ms, s.count if s.scans else 0), reverse=True)
+        return [s.as_dict() for s in flagged[:limit]]
+
+    async def load_top(self, order: str = "slow", limit: int = 30) -> List[Dict[str, Any]]:
+        """
+        读取 slow_queries 表（全部进程的汇总）
+
+        Args:
+            order: "slow" 按慢查询总耗时；"scan" 只看全表扫描大表的语句，按执行次数
+            limit: 返回条数
+        """
+        from database.db_connection import db_manager
+
+        if order == "scan":
+            sql = ("SELECT * FROM slow_queries WHERE scan_tables IS NOT NULL "
+                   "ORDER BY exec_count DESC LIMIT ?")
+        else:
+            sql = "SELECT * FROM slow_queries WHERE slow_count > 0 ORDER BY slow_total_ms DESC LIMIT ?"
+        rows = await db_manager.fetch_all(sql, (limit,))
+        return [dict(row) for row in rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold_ms,
+            "large_table_rows": self.large_table_rows,
+            "tracked": len(self.stats),
+            "untracked": self.untracked,
+            "slow": sum(s.slow_count for s in self.stats.values()),
+            "flagged": sum(1 for s in self.stats.values() if s.flagged),
+        }
+
+    async def reset(self):
+        """清空本进程统计与 slow_queries 表"""
+        from database.db_connection import db_manager
+
+        self.stats.clear()
+        self.recent.clear()
+        self.untracked = 0
+        await db_manager.execute_query("DELETE FROM slow_queries")
+
+    @staticmethod
+    async def cleanup(days: int = 30) -> int:
+        """删除超过保留天数未再出现的指纹"""
+        from database.db_connection import db_manager
+
+        return await db_manager.execute_query(
+            "DELETE FROM slow_queries WHERE last_seen < ?",
+            (datetime.now() - timedelta(days=days),)
+        )
+
+
+# 全局慢查询分析器实例
+query_profiler = QueryProfiler()
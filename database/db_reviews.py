@@ -14,6 +14,8 @@ from datetime import datetime
 # 评价系统数据库管理模块
 
 from database.db_connection import db_manager
+from database.db_pagination import keyset_condition, keyset_order
+from database.db_counters import row_counters
 
 logger = logging.getLogger(__name__)
 
@@ -69,7 +71,7 @@ class ReviewManager:
             'pending_merchant_review', False
         )
         try:
-            return await db_manager.get_last_insert_id(query, params)
+            return await db_manager.for_id(order_id).get_last_insert_id(query, params)
         except Exception as e:
             logger.error(f"创建评价时出错: {e}")
             return None
@@ -106,7 +108,7 @@ class ReviewManager:
                 SET is_confirmed_by_admin = TRUE, status = 'completed' 
                 WHERE id = ? AND is_confirmed_by_admin = FALSE
             """
-            result = await db_manager.execute_query(query, (review_id,))
+            result = await db_manager.for_id(review_id).execute_query(query, (review_id,))
             
             if not result:
                 logger.error(f"评价确认更新失败: review_id={review_id}")
@@ -246,7 +248,8 @@ class ReviewManager:
                 datetime.now()
             )
             
-            await db_manager.execute_query(upsert_query, params)
+            db = await db_manager.for_merchant(merchant_id)
+            await db.execute_query(upsert_query, params)
             logger.info(f"商家 {merchant_id} 的平均分已更新，有效评价数: {result['total_reviews_count']}")
             return True
             
@@ -382,8 +385,9 @@ class ReviewManager:
     @staticmethod
     async def get_reviews_with_details(status: str = None, merchant_id: int = None, 
                                      is_confirmed: bool = None, date_from: str = None, 
-                                     date_to: str = None, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
-        """获取评价列表，支持多种筛选条件和分页"""
+                                     date_to: str = None, limit: int = 20, offset: int = 0,
+                                     cursor: str = None) -> List[Dict[str, Any]]:
+        """获取评价列表，支持多种筛选条件和分页（提供 cursor 时使用键集分页，忽略offset）"""
         try:
             where_conditions = []
             params = []
@@ -401,13 +405,19 @@ class ReviewManager:
                 where_conditions.append("r.is_confirmed_by_admin = ?")
                 params.append(is_confirmed)
             
+            # 区间比较保持可走 created_at 索引（DATE() 包裹列会导致全表扫描）
             if date_from:
-                where_conditions.append("DATE(r.created_at) >= ?")
+                where_conditions.append("r.created_at >= ?")
                 params.append(date_from)
             
             if date_to:
-                where_conditions.append("DATE(r.created_at) <= ?")
+                where_conditions.append("r.created_at < date(?, '+1 day')")
                 params.append(date_to)
+
+            keyset_cond, keyset_params = keyset_condition(cursor, "r.created_at", "r.id")
+            if keyset_cond:
+                where_conditions.append(keyset_cond)
+                params.extend(keyset_params)
             
             where_clause = ""
             if where_conditions:
@@ -422,11 +432,13 @@ class ReviewManager:
                 LEFT JOIN merchants m ON r.merchant_id = m.id
                 LEFT JOIN users u ON r.customer_user_id = u.user_id
                 {where_clause}
-                ORDER BY r.created_at DESC
-                LIMIT ? OFFSET ?
+                ORDER BY {keyset_order('r.created_at', 'r.id')}
+                LIMIT ?{'' if keyset_cond else ' OFFSET ?'}
             """
             
-            params.extend([limit, offset])
+            params.append(limit)
+            if not keyset_cond:
+                params.append(offset)
             results = await db_manager.fetch_all(query, tuple(params))
             
             return [dict(row) for row in results]
@@ -439,8 +451,11 @@ class ReviewManager:
     async def count_reviews(status: str = None, merchant_id: int = None, 
                           is_confirmed: bool = None, date_from: str = None, 
                           date_to: str = None) -> int:
-        """统计评价总数，支持筛选条件"""
+        """统计评价总数，支持筛选条件（仅按状态筛选或不筛选时读取 row_counters）"""
         try:
+            if not merchant_id and is_confirmed is None and not (date_from or date_to):
+                return await row_counters.get(f"reviews:status:{status}" if status else "reviews")
+
             where_conditions = []
             params = []
             
@@ -457,11 +472,11 @@ class ReviewManager:
                 params.append(is_confirmed)
             
             if date_from:
-                where_conditions.append("DATE(created_at) >= ?")
+                where_conditions.append("created_at >= ?")
                 params.append(date_from)
             
             if date_to:
-                where_conditions.append("DATE(created_at) <= ?")
+                where_conditions.append("created_at < date(?, '+1 day')")
                 params.append(date_to)
             
             where_clause = ""
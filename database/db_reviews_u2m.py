@@ -84,7 +84,7 @@ class U2MReviewsManager:
             1 if is_anonymous else 0,
         )
         try:
-            new_id = await db_manager.get_last_insert_id(sql, params)
+            new_id = await db_manager.for_id(order_id).get_last_insert_id(sql, params)
             return new_id
         except Exception as e:
             logger.error(f"insert review failed: {e}")
@@ -147,7 +147,7 @@ class U2MReviewsManager:
             review_id,
         )
         try:
-            rc = await db_manager.execute_query(sql, params)
+            rc = await db_manager.for_id(review_id).execute_query(sql, params)
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"update_scores failed: {e}")
@@ -157,7 +157,7 @@ class U2MReviewsManager:
     async def update_text(review_id: int, text: Optional[str]) -> bool:
         sql = "UPDATE reviews SET text_review_by_user=?, updated_at=CURRENT_TIMESTAMP WHERE id=?"
         try:
-            rc = await db_manager.execute_query(sql, (text, review_id))
+            rc = await db_manager.for_id(review_id).execute_query(sql, (text, review_id))
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"update_text failed: {e}")
@@ -171,7 +171,7 @@ class U2MReviewsManager:
             "WHERE id=? AND is_deleted=0"
         )
         try:
-            rc = await db_manager.execute_query(sql, (admin_id, review_id))
+            rc = await db_manager.for_id(review_id).execute_query(sql, (admin_id, review_id))
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"confirm_by_admin failed: {e}")
@@ -181,7 +181,7 @@ class U2MReviewsManager:
     async def toggle_active(review_id: int, is_active: bool) -> bool:
         sql = "UPDATE reviews SET is_active=?, updated_at=CURRENT_TIMESTAMP WHERE id=?"
         try:
-            rc = await db_manager.execute_query(sql, (1 if is_active else 0, review_id))
+            rc = await db_manager.for_id(review_id).execute_query(sql, (1 if is_active else 0, review_id))
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"toggle_active failed: {e}")
@@ -191,7 +191,7 @@ class U2MReviewsManager:
     async def soft_delete(review_id: int) -> bool:
         sql = "UPDATE reviews SET is_deleted=1, updated_at=CURRENT_TIMESTAMP WHERE id=?"
         try:
-            rc = await db_manager.execute_query(sql, (review_id,))
+            rc = await db_manager.for_id(review_id).execute_query(sql, (review_id,))
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"soft_delete failed: {e}")
@@ -201,7 +201,7 @@ class U2MReviewsManager:
     async def set_anonymous_flag(review_id: int, is_anonymous: bool) -> bool:
         sql = "UPDATE reviews SET is_anonymous=?, updated_at=CURRENT_TIMESTAMP WHERE id=?"
         try:
-            rc = await db_manager.execute_query(sql, (1 if is_anonymous else 0, review_id))
+            rc = await db_manager.for_id(review_id).execute_query(sql, (1 if is_anonymous else 0, review_id))
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"set_anonymous_flag failed: {e}")
@@ -216,7 +216,7 @@ class U2MReviewsManager:
             sql = "UPDATE reviews SET report_post_url=?, published_at=?, updated_at=CURRENT_TIMESTAMP WHERE id=?"
             params = (url, published_at, review_id)
         try:
-            rc = await db_manager.execute_query(sql, params)
+            rc = await db_manager.for_id(review_id).execute_query(sql, params)
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"set_report_link failed: {e}")
@@ -238,7 +238,7 @@ class U2MReviewsManager:
         params.append(review_id)
         sql = f"UPDATE reviews SET {', '.join(fields)} WHERE id=?"
         try:
-            rc = await db_manager.execute_query(sql, tuple(params))
+            rc = await db_manager.for_id(review_id).execute_query(sql, tuple(params))
             return bool(rc and rc >= 0)
         except Exception as e:
             logger.error(f"set_report_meta failed: {e}")
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+评分累计表数据访问层
+
+表：merchant_score_totals / user_score_totals（新增表）
+
+说明：
+- 累计和/次数由评价表上的触发器在同一事务内增量维护，平均分表
+  （merchant_scores / user_scores）随累计表的触发器同步刷新。
+- 本模块只负责读取与对账：用一次 GROUP BY 与累计表比对，仅修正漂移的行。
+- 启用城市分片时，评价与累计表在同一文件内由触发器维护，对账按文件分别进行。
+"""
+
+from typing import Any, Dict, List, Optional
+import logging
+
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+def _visible(alias: str = "") -> str:
+    """有效口径：已确认 + 启用 + 未删除"""
+    p = f"{alias}." if alias else ""
+    return f"{p}is_confirmed_by_admin = 1 AND {p}is_active = 1 AND {p}is_deleted = 0"
+
+
+SCORE_TOTALS_SPECS = {
+    'merchant': {
+        'source': 'reviews',
+        'key': 'merchant_id',
+        'totals': 'merchant_score_totals',
+        'dims': ['appearance', 'figure', 'service', 'attitude', 'environment'],
+    },
+    'user': {
+        'source': 'merchant_reviews',
+        'key': 'user_id',
+        'totals': 'user_score_totals',
+        'dims': ['attack_quality', 'length', 'hardness', 'duration', 'user_temperament'],
+    },
+}
+
+
+class ScoreTotalsManager:
+    """评分累计表管理器"""
+
+    @staticmethod
+    async def get_totals(kind: str, owner_id: int) -> Optional[Dict[str, Any]]:
+        """
+        读取单个商户/用户的累计和与次数
+
+        Args:
+            kind: 'merchant' 或 'user'
+            owner_id: 商户ID或用户ID
+
+        Returns:
+            累计记录字典，不存在返回None
+        """
+        spec = SCORE_TOTALS_SPECS[kind]
+        sql = f"SELECT * FROM {spec['totals']} WHERE {spec['key']} = ?"
+        row = await db_manager.fetch_one(sql, (owner_id,))
+        return dict(row) if row else None
+
+    @staticmethod
+    async def find_drift(kind: str) -> List[Dict[str, Any]]:
+        """
+        找出累计表与评价表实际聚合不一致的行
+
+        Args:
+            kind: 'merchant' 或 'user'
+
+        Returns:
+            需要修正的行（包含正确的累计和与次数）
+        """
+        drift = []
+        for db in db_manager.databases_for(SCORE_TOTALS_SPECS[kind]['source']):
+            drift.extend(await ScoreTotalsManager._find_drift(kind, db))
+        return drift
+
+    @staticmethod
+    async def _find_drift(kind: str, db) -> List[Dict[str, Any]]:
+        """单个数据库文件内的漂移行（评价与累计表须在同一文件）"""
+        spec = SCORE_TOTALS_SPECS[kind]
+        key, dims = spec['key'], spec['dims']
+        sums = ", ".join(f"SUM(rating_{d}) AS sum_{d}" for d in dims)
+        mismatch = " OR ".join(f"t.sum_{d} != a.sum_{d}" for d in dims)
+        a_cols = ", ".join(f"a.sum_{d}" for d in dims)
+        zeros = ", ".join(f"0 AS sum_{d}" for d in dims)
+        sql = f"""
+            SELECT a.{key} AS owner_id, {a_cols}, a.reviews_count
+            FROM (
+                SELECT {key}, {sums}, COUNT(*) AS reviews_count
+                FROM {spec['source']}
+                WHERE {_visible()}
+                GROUP BY {key}
+            ) a
+            LEFT JOIN {spec['totals']} t ON t.{key} = a.{key}
+            WHERE t.{key} IS NULL OR t.reviews_count != a.reviews_count OR {mismatch}
+            UNION ALL
+            SELECT t.{key} AS owner_id, {zeros}, 0 AS reviews_count
+            FROM {spec['totals']} t
+            WHERE t.reviews_count != 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM {spec['source']} s
+                  WHERE s.{key} = t.{key} AND {_visible('s')}
+              )
+        """
+        with db_manager.local_reads():
+            rows = await db.fetch_all(sql)
+        return [dict(r) for r in rows] if rows else []
+
+    @staticmethod
+    async def reconcile(kind: str) -> int:
+        """
+        对账：修正漂移的累计行（更新会触发平均分表同步）
+
+        Args:
+            kind: 'merchant' 或 'user'
+
+        Returns:
+            修正的行数
+        """
+        spec = SCORE_TOTALS_SPECS[kind]
+        key, dims, totals = spec['key'], spec['dims'], spec['totals']
+        sets = ", ".join(f"sum_{d} = ?" for d in dims)
+        update_sql = (
+            f"UPDATE {totals} SET {sets}, reviews_count = ?, "
+            f"updated_at = datetime('now', 'localtime') WHERE {key} = ?"
+        )
+        fixed = []
+        for db in db_manager.databases_for(spec['source']):
+            drift = await ScoreTotalsManager._find_drift(kind, db)
+            if not drift:
+                continue
+            queries = []
+            for row in drift:
+                owner_id = int(row['owner_id'])
+                queries.append((f"INSERT OR IGNORE INTO {totals} ({key}) VALUES (?)", (owner_id,)))
+                params = tuple(int(row[f"sum_{d}"] or 0) for d in dims) + (int(row['reviews_count'] or 0), owner_id)
+                queries.append((update_sql, params))
+            if not await db.execute_transaction(queries):
+                raise RuntimeError(f"{totals} 对账写入失败")
+            fixed.extend(int(r['owner_id']) for r in drift)
+
+        if fixed:
+            logger.warning(f"{totals} 对账修正 {len(fixed)} 行: {fixed[:20]}")
+        return len(fixed)
+
+
+score_totals_manager = ScoreTotalsManager()
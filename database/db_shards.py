@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+"""
+按城市分库（可选，SHARDING_CONFIG.enabled）
+
+所有城市共用一个 SQLite 文件时，写入共用一把写锁。启用分片后，订单、评价及其评分累计
+等城市维度的表写入各城市的分片文件（shards/shard_<分片号>.db），各分片各自一把写锁；
+用户、商户、地区、配置与模板留在主库。
+
+使用方式：
+    from database.db_connection import db_manager
+
+    db = await db_manager.for_merchant(merchant_id)   # 新订单：按商户所在城市
+    await db.get_last_insert_id("INSERT INTO orders ...", params)
+
+    db = db_manager.for_id(order_id)                  # 已有订单/评价：按ID定位分片
+    await db.execute_query("UPDATE orders SET ... WHERE id = ?", params)
+
+    await db_manager.fetch_all("SELECT ... FROM orders ...")   # 跨城市读取：自动汇总各分片
+
+特性：
+    - 分片号：(city_id - 1) % buckets + 1；主库为 0 号。buckets 默认取 SQLite 附加库上限（默认 10），
+      配置更大时按上限收敛，汇总连接附加的分片数不会超过上限
+    - 自增ID区间：分片 N 的 AUTOINCREMENT 从 N × id_span 开始，ID 本身即可定位分片；
+      启用分片前写入的数据留在主库（0 号区间），照常可读写
+    - 分片表结构取自主库（迁移后启动时同步新增的列/索引/触发器）；
+      指向主库表的外键在分片中去掉（SQLite 不能跨文件校验），ON DELETE CASCADE 由 cascade_delete 补做
+    - 分片的写连接不附加主库，写事务只锁本分片；读连接以 global_db 附加主库，
+      分片内的查询可直接关联 users/merchants/cities 等主库表
+    - 主库的 fetch_one/fetch_all 使用汇总连接：ATTACH 全部分片，并以同名 TEMP VIEW
+      （主库 + 各分片 UNION ALL；row_counters、评分累计按键合并，平均分由合并后的累计计算）覆盖分片表，已有的跨城市查询无需改写；
+      分片目录中的分片文件数超过附加库上限时（如调大过 buckets 后遗留的文件）启动即报错
+    - 分片表集合须包含其触发器写入的表（默认集合中评价 → 评分累计 → 平均分、订单 → 行计数）
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from config import SHARDING_CONFIG
+from database.db_connection import DatabaseManager, db_manager
+
+logger = logging.getLogger(__name__)
+
+_SCORE_DIMS = ('appearance', 'figure', 'service', 'attitude', 'environment')
+
+# 汇总视图中按键合并的表：{表名: (键列, 来源表, {列: 聚合表达式})}
+# 同一商户的评分累计可能分布在多个文件（启用前的主库数据、城市变更），平均分由合并后的累计重新计算
+AGGREGATED_TABLES = {
+    'row_counters': ('counter_key', 'row_counters', {'value': 'SUM("value")'}),
+    'merchant_score_totals': ('merchant_id', 'merchant_score_totals', {
+        **{f'sum_{d}': f'SUM("sum_{d}")' for d in _SCORE_DIMS},
+        'reviews_count': 'SUM("reviews_count")',
+        'updated_at': 'MAX("updated_at")',
+    }),
+    'merchant_scores': ('merchant_id', 'merchant_score_totals', {
+        **{
+            f'avg_{d}': f'CASE WHEN SUM("reviews_count") > 0 '
+                        f'THEN ROUND(SUM("sum_{d}") * 1.0 / SUM("reviews_count"), 2) END'
+            for d in _SCORE_DIMS
+        },
+        'total_reviews_count': 'SUM("reviews_count")',
+        'updated_at': 'MAX("updated_at")',
+    }),
+}
+
+_ON_CLAUSE = r'(?:\s+ON\s+(?:DELETE|UPDATE)\s+(?:SET\s+NULL|SET\s+DEFAULT|CASCADE|RESTRICT|NO\s+ACTION))*'
+_DEFERRABLE = r'(?:\s+(?:NOT\s+)?DEFERRABLE(?:\s+INITIALLY\s+(?:DEFERRED|IMMEDIATE))?)?'
+_TABLE_FK = re.compile(
+    r',\s*(?:CONSTRAINT\s+\w+\s+)?FOREIGN\s+KEY\s*\(\s*"?(?P<column>\w+)"?\s*\)\s*REFERENCES\s+"?(?P<parent>\w+)"?'
+    r'\s*(?:\([^)]*\))?(?P<on>' + _ON_CLAUSE + r')' + _DEFERRABLE,
+    re.I
+)
+_COLUMN_FK = re.compile(
+    r'\s+REFERENCES\s+"?(?P<parent>\w+)"?\s*(?:\([^)]*\))?(?P<on>' + _ON_CLAUSE + r')' + _DEFERRABLE,
+    re.I
+)
+_COLUMN_NAME = re.compile(r'(?:^|[(,])\s*"?(\w+)"?[^,(]*$', re.S)
+
+
+class ShardError(Exception):
+    """分片配置或路由错误"""
+
+
+def attach_limit() -> int:
+    """SQLite 单个连接可附加的数据库数（SQLITE_LIMIT_ATTACHED，编译默认 10）"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    finally:
+        conn.close()
+
+
+def strip_foreign_keys(create_sql: str, keep: set) -> Tuple[str, List[Tuple[str, str, bool]]]:
+    """
+    去掉 CREATE TABLE 中指向 keep 之外表的外键
+
+    Args:
+        create_sql: 建表语句
+        keep: 与该表同在分片中的表名（其外键保留）
+
+    Returns:
+        (新的建表语句, [(列名, 父表, 是否 ON DELETE CASCADE)])
+    """
+    removed: List[Tuple[str, str, bool]] = []
+
+    def table_fk(match):
+        if match.group('parent') in keep:
+            return match.group(0)
+        removed.append((match.group('column'), match.group('parent'), 'CASCADE' in match.group('on').upper()))
+        return ''
+
+    def column_fk(match):
+        if match.group('parent') in keep:
+            return match.group(0)
+        column = _COLUMN_NAME.search(match.string[:match.start()])
+        removed.append((column.group(1) if column else '', match.group('parent'),
+                        'DELETE CASCADE' in ' '.join(match.group('on').upper().split())))
+        return ''
+
+    sql = _TABLE_FK.sub(table_fk, create_sql)
+    sql = _COLUMN_FK.sub(column_fk, sql)
+    return sql, removed
+
+
+class ShardDatabase(DatabaseManager):
+    """单个分片的数据库管理器（查询接口与主库相同，连接池各自独立）"""
+
+    def __new__(cls, *args, **kwargs):
+        # 主库管理器是单例，分片每个实例独立
+        return object.__new__(cls)
+
+    def __init__(self, router: 'ShardRouter', shard_id: int, db_path: str):
+        self.router = router
+        self.shard_id = shard_id
+        self.db_path = db_path
+        self.connection_pool = []
+        self.read_pool: List[aiosqlite.Connection] = []
+        self.max_connections = 10
+        self.read_replica = None
+        self.shards = None
+        self._lock = asyncio.Lock()
+        self.initialized = True
+
+    def __repr__(self) -> str:
+        return f"<ShardDatabase {self.shard_id} {self.db_path}>"
+
+    async def _create_connection(self) -> aiosqlite.Connection:
+        await self.router.ensure_shard(self.shard_id)
+        return await super()._create_connection()
+
+    @asynccontextmanager
+    async def _attached_connection(self):
+        """分片读连接：以 global_db 附加主库，查询可关联主库表"""
+        async with self._lock:
+            conn = self.read_pool.pop() if self.read_pool else None
+            if conn is None:
+                conn = await self._create_connection()
+                await conn.execute("ATTACH DATABASE ? AS global_db", (self.router.global_db.db_path,))
+        try:
+            yield conn
+        except Exception:
+            await conn.close()
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                async with self._lock:
+                    if len(self.read_pool) < self.max_connections:
+                        self.read_pool.append(conn)
+                    else:
+                        await conn.close()
+
+    def _read_connection(self, span):
+        span.set("db.shard", self.shard_id)
+        return self._attached_connection()
+
+    async def close_all_connections(self):
+        """关闭分片的读写连接"""
+        async with self._lock:
+            for conn in self.connection_pool + self.read_pool:
+                try:
+                    await conn.close()
+                except Exception:
+                    pass
+            self.connection_pool.clear()
+            self.read_pool.clear()
+
+
+class ShardRouter:
+    """城市分片路由：分片文件管理、按城市/ID 路由与跨分片汇总读取"""
+
+    # 分片目录的复查间隔（秒），其它进程新建的分片在此间隔内对汇总读取可见
+    SCAN_INTERVAL = 1.0
+
+    def __init__(self, global_db: DatabaseManager, config: Optional[Dict[str, Any]] = None):
+        config = config or SHARDING_CONFIG
+        self.global_db = global_db
+        self.enabled = bool(config.get('enabled', False))
+        self.configured_dir = config.get('dir') or ''
+        self.tables: List[str] = list(config.get('tables') or [])
+        limit = attach_limit()
+        self.buckets = int(config.get('buckets') or 0) or limit
+        if not 0 < self.buckets <= limit:
+            logger.warning(f"分片数 {self.buckets} 超出范围（SQLite 附加库上限 {limit}），按 {limit} 个分片合并")
+            self.buckets = limit
+        self.id_span = int(config.get('id_span', 1_000_000_000))
+        self.max_connections = 4
+        self._shards: Dict[int, ShardDatabase] = {}
+        self._ready: set = set()
+        self._ensure_lock = asyncio.Lock()
+        self._merchant_cities: Dict[int, Optional[int]] = {}
+        self._cascades: Dict[str, List[Tuple[str, str]]] = {}
+        self._fan_out_pool: List[Tuple[Tuple[int, ...], aiosqlite.Connection]] = []
+        self._on_disk: Tuple[int, ...] = ()
+        self._scanned_at = 0.0
+
+    @property
+    def directory(self) -> str:
+        """分片文件目录（默认为主库目录下的 shards/）"""
+        if self.configured_dir:
+            return self.configured_dir
+        return os.path.join(os.path.dirname(os.path.abspath(self.global_db.db_path)), 'shards')
+
+    def path_for(self, shard_id: int) -> str:
+        return os.path.join(self.directory, f"shard_{shard_id}.db")
+
+    # ---------- 路由 ---------- #
+
+    def shard_id_for_city(self, city_id: int) -> int:
+        """城市对应的分片号（1..buckets，超出的城市按取模合并）"""
+        city_id = int(city_id)
+        if city_id <= 0:
+            raise ShardError(f"无效的城市ID: {city_id}")
+        return (city_id - 1) % self.buckets + 1
+
+    def shard(self, shard_id: int) -> DatabaseManager:
+        """分片号对应的数据库管理器（0 为主库）"""
+        if shard_id == 0:
+            return self.global_db
+        db = self._shards.get(shard_id)
+        if db is None:
+            db = self._shards[shard_id] = ShardDatabase(self, shard_id, self.path_for(shard_id))
+        return db
+
+    def for_city(self, city_id: int) -> DatabaseManager:
+        return self.shard(self.shard_id_for_city(city_id))
+
+    def for_id(self, row_id: int) -> DatabaseManager:
+        return self.shard(int(row_id) // self.id_span)
+
+    async def for_merchant(self, merchant_id: int) -> DatabaseManager:
+        """按商户当前所在城市定位分片（商户无城市时为主库）"""
+        merchant_id = int(merchant_id)
+        if merchant_id not in self._merchant_cities:
+            async with self.global_db.get_connection() as conn:
+                cursor = await conn.execute("SELECT city_id FROM merchants WHERE id = ?", (merchant_id,))
+                row = await cursor.fetchone()
+            self._merchant_cities[merchant_id] = row[0] if row else None
+        city_id = self._merchant_cities[merchant_id]
+        return self.for_city(city_id) if city_id else self.global_db
+
+    def forget_merchant(self, merchant_id: int) -> None:
+        """商户城市变更后清除路由缓存（此前的订单仍按ID留在原分片）"""
+        self._merchant_cities.pop(int(merchant_id), None)
+
+    def databases_for(self, table: str) -> List[DatabaseManager]:
+        """持有该表数据的数据库管理器：主库，以及（分片表时）磁盘上已有的全部分片"""
+        if table not in self.tables:
+            return [self.global_db]
+        return self.all_databases()
+
+    def all_databases(self) -> List[DatabaseManager]:
+        """主库与磁盘上已有的全部分片（备份、检查点、VACUUM 等按文件维护的任务使用）"""
+        return [self.global_db] + [self.shard(shard_id) for shard_id in self._scan()]
+
+    async def cascade_delete(self, parent: str, parent_id: int) -> int:
+        """
+        补做分片中去掉的 ON DELETE CASCADE（主库删除父行后调用）
+
+        Returns:
+            删除的分片行数
+        """
+        deleted = 0
+        for table, column in self._cascades_for(parent):
+            for shard_id in self._scan():
+                deleted += await self.shard(shard_id).execute_query(
+                    f'DELETE FROM "{table}" WHERE "{column}" = ?', (parent_id,)
+                ) or 0
+        return deleted
+
+    def _cascades_for(self, parent: str) -> List[Tuple[str, str]]:
+        if not self._cascades:
+            conn = sqlite3.connect(self.global_db.db_path)
+            try:
+                self._global_objects(conn)
+            finally:
+                conn.close()
+        return self._cascades.get(parent, [])
+
+    # ---------- 分片文件与表结构 ---------- #
+
+    def _scan(self) -> Tuple[int, ...]:
+        """磁盘上已有的分片号（按间隔复查目录）"""
+        now = time.monotonic()
+        if now - self._scanned_at >= self.SCAN_INTERVAL:
+            found = []
+            try:
+                for name in os.listdir(self.directory):
+                    match = re.fullmatch(r'shard_(\d+)\.db', name)
+                    if match:
+                        found.append(int(match.group(1)))
+            except FileNotFoundError:
+                pass
+            self._on_disk = tuple(sorted(found))
+            self._scanned_at = now
+        return self._on_disk
+
+    async def prepare(self) -> Dict[int, str]:
+        """
+        启动时调用：校验配置，同步已有分片的表结构（迁移新增的列/索引/触发器）
+
+        Returns:
+            {分片号: 文件路径}
+        """
+        with self.global_db.local_reads():
+            for table in self.tables:
+                row = await self.global_db.fetch_one(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+                )
+                if row is None:
+                    raise ShardError(f"分片表在主库中不存在: {table}")
+        self._ready.clear()
+        self._cascades.clear()
+        self._scanned_at = 0.0
+        shard_ids = self._scan()
+        limit = attach_limit()
+        if len(shard_ids) > limit:
+            raise ShardError(
+                f"分片目录中有 {len(shard_ids)} 个分片文件，超过 SQLite 附加库上限 {limit}，跨城市汇总读取无法附加全部分片"
+            )
+        for shard_id in shard_ids:
+            await self.ensure_shard(shard_id)
+        await self.close_fan_out()
+        logger.info(f"城市分片就绪: {len(shard_ids)} 个分片，分片表 {self.tables}")
+        return {shard_id: self.path_for(shard_id) for shard_id in shard_ids}
+
+    async def ensure_shard(self, shard_id: int) -> None:
+        """确保分片文件存在且表结构与主库一致（每个进程每个分片检查一次）"""
+        if shard_id in self._ready:
+            return
+        async with self._ensure_lock:
+            if shard_id in self._ready:
+                return
+            await asyncio.to_thread(self._sync_shard_file, shard_id)
+            self._ready.add(shard_id)
+            self._scanned_at = 0.0
+
+    def _global_objects(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        """主库中分片表的建表语句、列、索引与触发器（外键已按分片改写）"""
+        keep = set(self.tables)
+        tables: Dict[str, Tuple[str, list]] = {}
+        cascades: Dict[str, List[Tuple[str, str]]] = {}
+        for table in self.tables:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if row is None:
+                raise ShardError(f"分片表在主库中不存在: {table}")
+            sql, removed = strip_foreign_keys(row[0], keep)
+            for column, parent, cascade in removed:
+                if cascade:
+                    cascades.setdefault(parent, []).append((table, column))
+            tables[table] = (sql, conn.execute(f'PRAGMA table_info("{table}")').fetchall())
+        marks = ','.join('?' * len(self.tables))
+        indexes = dict(conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({marks})",
+            tuple(self.tables)
+        ).fetchall())
+        triggers = dict(conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ({marks})",
+            tuple(self.tables)
+        ).fetchall())
+        self._cascades = cascades
+        return {'tables': tables, 'indexes': indexes, 'triggers': triggers}
+
+    def _sync_shard_file(self, shard_id: int) -> None:
+        """新建（先写临时文件再原子改名）或同步分片文件的表结构"""
+        path = self.path_for(shard_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        source = sqlite3.connect(self.global_db.db_path, timeout=30.0)
+        try:
+            objects = self._global_objects(source)
+        finally:
+            source.close()
+
+        fresh = not os.path.exists(path)
+        target = f"{path}.tmp" if fresh else path
+        if fresh and os.path.exists(target):
+            os.remove(target)
+        conn = sqlite3.connect(target, timeout=30.0, isolation_level=None)
+        try:
+            if fresh:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                changes = self._apply_schema(conn, shard_id, objects)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        if fresh:
+            os.replace(target, path)
+            logger.info(f"新建城市分片 {shard_id}: {path}")
+        elif changes:
+            logger.info(f"城市分片 {shard_id} 表结构已同步: {changes}")
+
+    def _apply_schema(self, conn: sqlite3.Connection, shard_id: int, objects: Dict[str, Any]) -> List[str]:
+        changes = []
+        existing = {
+            (row[0], row[1]): row[2]
+            for row in conn.execute("SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL")
+        }
+        for table, (create_sql, columns) in objects['tables'].items():
+            if ('table', table) not in existing:
+                conn.execute(create_sql)
+                if 'AUTOINCREMENT' in create_sql.upper():
+                    # 分片的自增ID从 分片号 × id_span 起
+                    conn.execute(
+                        "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, shard_id * self.id_span)
+                    )
+                changes.append(f"+{table}")
+                continue
+            present = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+            for _, name, col_type, notnull, default, _pk in columns:
+                if name in present:
+                    continue
+                definition = f'"{name}" {col_type or ""}'
+                if notnull and default is not None:
+                    definition += " NOT NULL"
+                if default is not None:
+                    definition += f" DEFAULT {default}"
+                conn.execute(f'ALTER TABLE "{table}" ADD COLUMN {definition}')
+                changes.append(f"+{table}.{name}")
+        for kind in ('index', 'trigger'):
+            for name, sql in objects[f'{kind}es' if kind == 'index' else 'triggers'].items():
+                current = existing.get((kind, name))
+                if current == sql:
+                    continue
+                if current is not None:
+                    conn.execute(f'DROP {kind.upper()} "{name}"')
+                conn.execute(sql)
+                changes.append(f"{kind}:{name}")
+        return changes
+
+    # ---------- 跨分片汇总读取 ---------- #
+
+    async def _fan_out_connect(self, shard_ids: Tuple[int, ...]) -> aiosqlite.Connection:
+        for shard_id in shard_ids:
+            await self.ensure_shard(shard_id)
+        conn = await self.global_db._create_connection()
+        try:
+            for shard_id in shard_ids:
+                await conn.execute(f"ATTACH DATABASE ? AS shard_{shard_id}", (self.path_for(shard_id),))
+            for table in self.tables:
+                key, source, aggregates = AGGREGATED_TABLES.get(table, (None, table, None))
+                if source not in self.tables:
+                    key, source, aggregates = None, table, None
+                cursor = await conn.execute(f'PRAGMA main.table_info("{source}")')
+                columns = ', '.join(f'"{row[1]}"' for row in await cursor.fetchall())
+                union = ' UNION ALL '.join(
+                    [f'SELECT {columns} FROM main."{source}"']
+                    + [f'SELECT {columns} FROM shard_{shard_id}."{source}"' for shard_id in shard_ids]
+                )
+                if aggregates:
+                    merged = ', '.join(f'{expr} AS "{column}"' for column, expr in aggregates.items())
+                    union = f'SELECT "{key}", {merged} FROM ({union}) GROUP BY "{key}"'
+                await conn.execute(f'CREATE TEMP VIEW "{table}" AS {union}')
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    @asynccontextmanager
+    async def fan_out_connection(self):
+        """汇总读连接：主库 + 附加的全部分片，分片表以同名临时视图汇总（分片集合变化后旧连接归还时关闭）"""
+        shard_ids = self._scan()
+        conn = None
+        while self._fan_out_pool and conn is None:
+            pooled_ids, pooled = self._fan_out_pool.pop()
+            if pooled_ids == shard_ids:
+                conn = pooled
+            else:
+                await pooled.close()
+        if conn is None:
+            conn = await self._fan_out_connect(shard_ids)
+        try:
+            yield conn
+        except Exception:
+            await conn.close()
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                if shard_ids == self._scan() and len(self._fan_out_pool) < self.max_connections:
+                    self._fan_out_pool.append((shard_ids, conn))
+                else:
+                    await conn.close()
+
+    async def close_fan_out(self) -> None:
+        while self._fan_out_pool:
+            _, conn = self._fan_out_pool.pop()
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        """关闭汇总连接与全部分片连接（主库路径变更时分片随之重新定位）"""
+        await self.close_fan_out()
+        for db in self._shards.values():
+            await db.close_all_connections()
+        self._shards.clear()
+        self._ready.clear()
+        self._merchant_cities.clear()
+        self._cascades.clear()
+        self._scanned_at = 0.0
+
+
+shard_router = ShardRouter(db_manager)
+if shard_router.enabled:
+    db_manager.shards = shard_router
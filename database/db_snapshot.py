@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+分析只读快照（后台报表与统计的读副本）
+
+使用方式：
+    from database.db_snapshot import analytics_snapshot, reads_from_snapshot
+
+    await analytics_snapshot.refresh()        # 调度器定时调用
+
+    @reads_from_snapshot                      # 该函数内的 fetch_one/fetch_all 读快照
+    async def heavy_report(): ...
+
+    analytics_snapshot.age()                  # 快照距今秒数，界面展示用
+
+特性：
+    - 使用 SQLite 在线备份 API 分页复制（每步 pages_per_step 页，步间让出），
+      每步只短暂持有主库读事务，不阻塞写入，也不长时间钉住 WAL 检查点
+    - 主库写入频繁导致备份反复重来时，退化为单步复制（WAL 下读不阻塞写）；
+      复制过程封装为 online_backup()
+    - 先写临时文件再原子替换，读方看到的始终是完整快照；副本转为 DELETE 日志模式以只读打开
+    - 快照不存在、未启用或超过 max_age 时，路由自动回退到主库
+    - 文件级共享：调度器进程生成，web/机器人进程按文件变化自动切换到新快照
+    - 启用城市分片（SHARDING_CONFIG.enabled）时停用：快照只复制主库文件，不含分片数据，
+      报表读取照常走汇总各分片的连接
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from config import ANALYTICS_SNAPSHOT_CONFIG
+from database.db_connection import db_manager
+from utils.metrics import ANALYTICS_SNAPSHOT_AGE, ANALYTICS_SNAPSHOT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _BackupRestarted(Exception):
+    """分页备份因主库写入重来次数过多"""
+
+
+def online_backup(
+    source_path: str, target_path: str, *, pages_per_step: int = 1024, step_sleep: float = 0.01,
+    max_restarts: int = 3,
+) -> Dict[str, Any]:
+    """
+    用 SQLite 在线备份 API 把主库复制为一致的镜像（同步执行，应在线程中调用）
+
+    每步复制 pages_per_step 页后释放主库读锁并休眠 step_sleep；主库写入导致备份
+    重来超过 max_restarts 次时改为单步复制。完成后目标库转为 DELETE 日志模式。
+
+    Args:
+        source_path: 主库路径
+        target_path: 目标文件路径（已存在时覆盖）
+
+    Returns:
+        {'pages', 'restarts', 'mode'}，mode 为 paged 或 single
+    """
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    state = {'remaining': None, 'restarts': 0, 'pages': 0}
+
+    def progress(status, remaining, total):
+        # 剩余页数回升说明主库在步间被其他连接修改，备份从头开始
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+        state['pages'] = total
+
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    mode = 'paged'
+    try:
+        try:
+            source.backup(target, pages=max(1, pages_per_step), progress=progress, sleep=step_sleep)
+        except _BackupRestarted:
+            mode = 'single'
+            source.backup(target)
+        state['pages'] = target.execute("PRAGMA page_count").fetchone()[0]
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    return {'pages': state['pages'], 'restarts': state['restarts'], 'mode': mode}
+
+
+class AnalyticsSnapshot:
+    """分析只读快照：生成（在线备份）与只读连接池"""
+
+    # 快照文件状态的复查间隔（秒），避免每次查询都 stat
+    STAT_INTERVAL = 1.0
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or ANALYTICS_SNAPSHOT_CONFIG
+        self.enabled = bool(config.get('enabled', True))
+        self.configured_path = config.get('path') or ''
+        self.interval = int(config.get('interval', 300))
+        self.max_age = float(config.get('max_age', 1800))
+        self.pages_per_step = max(1, int(config.get('pages_per_step', 1024)))
+        self.step_sleep = float(config.get('step_sleep', 0.01))
+        self.max_restarts = int(config.get('max_restarts', 3))
+        self.max_connections = 4
+        self._pool: List[Tuple[Tuple[int, int], aiosqlite.Connection]] = []
+        self._stat: Optional[os.stat_result] = None
+        self._stat_checked_at = 0.0
+        self._refreshing = False
+        self._sharding_logged = False
+
+    @property
+    def path(self) -> str:
+        """快照文件路径（默认跟随主库路径）"""
+        if self.configured_path:
+            return self.configured_path
+        base, _ = os.path.splitext(db_manager.db_path)
+        return f"{base}.analytics.db"
+
+    # ---------- 状态 ---------- #
+
+    def _snapshot_stat(self) -> Optional[os.stat_result]:
+        now = time.monotonic()
+        if now - self._stat_checked_at >= self.STAT_INTERVAL:
+            try:
+                self._stat = os.stat(self.path)
+            except OSError:
+                self._stat = None
+            self._stat_checked_at = now
+        return self._stat
+
+    def age(self) -> Optional[float]:
+        """快照距今秒数；无快照时返回 None"""
+        stat = self._snapshot_stat()
+        if stat is None:
+            return None
+        return max(0.0, time.time() - stat.st_mtime)
+
+    def available(self) -> bool:
+        """快照是否可用于读取（已启用、未分片、存在且未过期）"""
+        if not self.enabled or db_manager.shards is not None:
+            return False
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    def status(self) -> Dict[str, Any]:
+        """界面展示用的快照状态（taken_at 为快照完成时间戳，无快照时为 None）"""
+        stat = self._snapshot_stat()
+        return {
+            'enabled': self.enabled,
+            'available': self.available(),
+            'taken_at': None if stat is None else stat.st_mtime,
+            'max_age': int(self.max_age),
+        }
+
+    # ---------- 生成 ---------- #
+
+    async def refresh(self) -> Optional[Dict[str, Any]]:
+        """
+        生成新快照（在线备份在线程中执行，不占用事件循环）
+
+        Returns:
+            统计信息 {'pages', 'restarts', 'mode', 'seconds'}；未启用、已分片或已有刷新在进行时返回 None
+        """
+        if not self.enabled or self._refreshing:
+            return None
+        if db_manager.shards is not None:
+            if not self._sharding_logged:
+                logger.warning("已启用城市分片，分析快照停用（快照只含主库文件），报表读取改走分片汇总连接")
+                self._sharding_logged = True
+            return None
+        self._refreshing = True
+        started = time.perf_counter()
+        try:
+            stats = await asyncio.to_thread(self._backup, db_manager.db_path, self.path)
+        finally:
+            self._refreshing = False
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        ANALYTICS_SNAPSHOT_SECONDS.observe(stats['seconds'])
+        self._stat_checked_at = 0.0
+        logger.info(
+            f"分析快照已更新: {stats['pages']} 页，模式 {stats['mode']}，重来 {stats['restarts']} 次，"
+            f"耗时 {stats['seconds']}s"
+        )
+        return stats
+
+    def _backup(self, source_path: str, target_path: str) -> Dict[str, Any]:
+        tmp_path = f"{target_path}.tmp"
+        Path(target_path).parent.mkdir(parents=True, exist_ok=True)
+        stats = online_backup(
+            source_path, tmp_path,
+            pages_per_step=self.pages_per_step, step_sleep=self.step_sleep, max_restarts=self.max_restarts,
+        )
+        os.replace(tmp_path, target_path)
+        return stats
+
+    # ---------- 读取 ---------- #
+
+    def _generation(self) -> Tuple[int, int]:
+        stat = self._snapshot_stat()
+        return (stat.st_ino, stat.st_mtime_ns) if stat is not None else (0, 0)
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(f"{Path(self.path).resolve().as_uri()}?mode=ro", uri=True, timeout=30.0)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA query_only=ON")
+        await conn.execute("PRAGMA cache_size=10000")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @asynccontextmanager
+    async def connection(self):
+        """获取快照只读连接（快照文件替换后旧连接在归还时关闭）"""
+        generation = self._generation()
+        conn = None
+        while self._pool and conn is None:
+            pooled_generation, pooled = self._pool.pop()
+            if pooled_generation == generation:
+                conn = pooled
+            else:
+                await pooled.close()
+        if conn is None:
+            conn = await self._connect()
+        try:
+            yield conn
+        except Exception:
+            await conn.close()
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                if generation == self._generation() and len(self._pool) < self.max_connections:
+                    self._pool.append((generation, conn))
+                else:
+                    await conn.close()
+
+    async def close(self) -> None:
+        """关闭快照连接池"""
+        while self._pool:
+            _, conn = self._pool.pop()
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+
+def reads_from_snapshot(func):
+    """装饰异步函数：函数内的 fetch_one/fetch_all 读取分析快照（不可用时读主库）"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with db_manager.snapshot_reads():
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def _age_metric() -> float:
+    age = analytics_snapshot.age()
+    return -1 if age is None else age
+
+
+analytics_snapshot = AnalyticsSnapshot()
+db_manager.read_replica = analytics_snapshot
+ANALYTICS_SNAPSHOT_AGE.set_function(_age_metric)
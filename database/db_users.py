@@ -10,6 +10,8 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 
 from database.db_connection import db_manager
+from database.db_pagination import keyset_condition, keyset_order
+from database.db_counters import row_counters
 
 logger = logging.getLogger(__name__)
 
@@ -123,8 +125,13 @@ class UserManager:
     @staticmethod
     async def get_users_with_pagination(limit: int = 20, offset: int = 0, 
                                       level_filter: str = None, search: str = None, 
-                                      user_id_filter: int = None) -> List[Dict[str, Any]]:
-        """分页获取用户列表，支持筛选和搜索"""
+                                      user_id_filter: int = None, cursor: str = None) -> List[Dict[str, Any]]:
+        """
+        分页获取用户列表，支持筛选和搜索
+
+        提供 cursor（上一页末行游标，键为 created_at/user_id）时使用键集分页，忽略offset。
+        订单数/评价数按当前页用户逐个走索引统计，不再 JOIN 全表后 GROUP BY。
+        """
         try:
             where_conditions = []
             params = []
@@ -142,6 +149,11 @@ class UserManager:
             if user_id_filter:
                 where_conditions.append("u.user_id = ?")
                 params.append(user_id_filter)
+
+            keyset_cond, keyset_params = keyset_condition(cursor, "u.created_at", "u.user_id")
+            if keyset_cond:
+                where_conditions.append(keyset_cond)
+                params.extend(keyset_params)
             
             where_clause = ""
             if where_conditions:
@@ -151,18 +163,17 @@ class UserManager:
                 SELECT 
                     u.user_id, u.username, u.xp, u.points, u.level_name, u.badges,
                     u.created_at, u.updated_at,
-                    COUNT(o.id) as order_count,
-                    COUNT(r.id) as review_count
+                    (SELECT COUNT(*) FROM orders o WHERE o.customer_user_id = u.user_id) as order_count,
+                    (SELECT COUNT(*) FROM reviews r WHERE r.customer_user_id = u.user_id) as review_count
                 FROM users u
-                LEFT JOIN orders o ON u.user_id = o.customer_user_id
-                LEFT JOIN reviews r ON u.user_id = r.customer_user_id
                 {where_clause}
-                GROUP BY u.user_id
-                ORDER BY u.created_at DESC
-                LIMIT ? OFFSET ?
+                ORDER BY {keyset_order('u.created_at', 'u.user_id')}
+                LIMIT ?{'' if keyset_cond else ' OFFSET ?'}
             """
             
-            params.extend([limit, offset])
+            params.append(limit)
+            if not keyset_cond:
+                params.append(offset)
             results = await db_manager.fetch_all(query, tuple(params))
             
             users = []
@@ -184,8 +195,11 @@ class UserManager:
     
     @staticmethod
     async def count_users(level_filter: str = None, search: str = None, user_id_filter: int = None) -> int:
-        """统计用户总数，支持筛选"""
+        """统计用户总数，支持筛选（仅按等级筛选或不筛选时读取 row_counters）"""
         try:
+            if not (search or user_id_filter):
+                return await row_counters.get(f"users:level:{level_filter}" if level_filter else "users")
+
             where_conditions = []
             params = []
             
@@ -0,0 +1,16 @@
+-- 媒体缩略图/封面帧记录表：后台生成的 WebP 预览（每个媒体每种规格一行）
+CREATE TABLE IF NOT EXISTS media_thumbnails (
+    media_id INTEGER NOT NULL,
+    variant TEXT NOT NULL,              -- 'sm' / 'md' / 'poster'
+    file_path TEXT NOT NULL,            -- 本地缓存文件路径
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (media_id, variant),
+    FOREIGN KEY (media_id) REFERENCES media(id) ON DELETE CASCADE
+);
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.1', '新增 media_thumbnails 表，记录媒体缩略图与视频封面帧');
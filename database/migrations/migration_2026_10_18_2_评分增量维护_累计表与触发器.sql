@@ -0,0 +1,273 @@
+-- 评分增量维护：为 U2M(reviews→merchant_scores) 与 M2U(merchant_reviews→user_scores)
+-- 建立按维度的累计和/次数表，并用触发器在评价写入的同一事务内增量更新平均分。
+-- 有效口径：is_confirmed_by_admin=1 AND is_active=1 AND is_deleted=0
+-- 夜间任务改为对账（只修正漂移的行）。
+
+PRAGMA foreign_keys=OFF;
+BEGIN TRANSACTION;
+
+/* 1) 累计表 */
+CREATE TABLE IF NOT EXISTS merchant_score_totals (
+    merchant_id INTEGER PRIMARY KEY,
+    sum_appearance INTEGER NOT NULL DEFAULT 0,
+    sum_figure INTEGER NOT NULL DEFAULT 0,
+    sum_service INTEGER NOT NULL DEFAULT 0,
+    sum_attitude INTEGER NOT NULL DEFAULT 0,
+    sum_environment INTEGER NOT NULL DEFAULT 0,
+    reviews_count INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME,
+    FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS user_score_totals (
+    user_id BIGINT PRIMARY KEY,
+    sum_attack_quality INTEGER NOT NULL DEFAULT 0,
+    sum_length INTEGER NOT NULL DEFAULT 0,
+    sum_hardness INTEGER NOT NULL DEFAULT 0,
+    sum_duration INTEGER NOT NULL DEFAULT 0,
+    sum_user_temperament INTEGER NOT NULL DEFAULT 0,
+    reviews_count INTEGER NOT NULL DEFAULT 0,
+    updated_at DATETIME
+);
+
+
+/* 2) 用现有数据初始化累计表与平均分 */
+INSERT OR REPLACE INTO merchant_score_totals (merchant_id, sum_appearance, sum_figure, sum_service, sum_attitude, sum_environment, reviews_count, updated_at)
+SELECT merchant_id, SUM(rating_appearance), SUM(rating_figure), SUM(rating_service), SUM(rating_attitude), SUM(rating_environment), COUNT(*), datetime('now', 'localtime')
+FROM reviews
+WHERE reviews.is_confirmed_by_admin = 1 AND reviews.is_active = 1 AND reviews.is_deleted = 0
+GROUP BY merchant_id;
+
+INSERT INTO merchant_scores (merchant_id, avg_appearance, avg_figure, avg_service, avg_attitude, avg_environment, total_reviews_count, updated_at)
+SELECT
+    merchant_id,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_appearance * 1.0 / reviews_count, 2) ELSE NULL END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_figure * 1.0 / reviews_count, 2) ELSE NULL END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_service * 1.0 / reviews_count, 2) ELSE NULL END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_attitude * 1.0 / reviews_count, 2) ELSE NULL END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_environment * 1.0 / reviews_count, 2) ELSE NULL END,
+    reviews_count,
+    updated_at
+FROM merchant_score_totals
+WHERE 1
+ON CONFLICT(merchant_id) DO UPDATE SET
+    avg_appearance = excluded.avg_appearance,
+    avg_figure = excluded.avg_figure,
+    avg_service = excluded.avg_service,
+    avg_attitude = excluded.avg_attitude,
+    avg_environment = excluded.avg_environment,
+    total_reviews_count = excluded.total_reviews_count,
+    updated_at = excluded.updated_at;
+
+INSERT OR REPLACE INTO user_score_totals (user_id, sum_attack_quality, sum_length, sum_hardness, sum_duration, sum_user_temperament, reviews_count, updated_at)
+SELECT user_id, SUM(rating_attack_quality), SUM(rating_length), SUM(rating_hardness), SUM(rating_duration), SUM(rating_user_temperament), COUNT(*), datetime('now', 'localtime')
+FROM merchant_reviews
+WHERE merchant_reviews.is_confirmed_by_admin = 1 AND merchant_reviews.is_active = 1 AND merchant_reviews.is_deleted = 0
+GROUP BY user_id;
+
+INSERT INTO user_scores (user_id, avg_attack_quality, avg_length, avg_hardness, avg_duration, avg_user_temperament, total_reviews_count, updated_at)
+SELECT
+    user_id,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_attack_quality * 1.0 / reviews_count, 2) ELSE 0.0 END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_length * 1.0 / reviews_count, 2) ELSE 0.0 END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_hardness * 1.0 / reviews_count, 2) ELSE 0.0 END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_duration * 1.0 / reviews_count, 2) ELSE 0.0 END,
+    CASE WHEN reviews_count > 0 THEN ROUND(sum_user_temperament * 1.0 / reviews_count, 2) ELSE 0.0 END,
+    reviews_count,
+    updated_at
+FROM user_score_totals
+WHERE 1
+ON CONFLICT(user_id) DO UPDATE SET
+    avg_attack_quality = excluded.avg_attack_quality,
+    avg_length = excluded.avg_length,
+    avg_hardness = excluded.avg_hardness,
+    avg_duration = excluded.avg_duration,
+    avg_user_temperament = excluded.avg_user_temperament,
+    total_reviews_count = excluded.total_reviews_count,
+    updated_at = excluded.updated_at;
+
+
+/* 3) 累计表变化时同步平均分表 */
+CREATE TRIGGER IF NOT EXISTS trg_merchant_score_totals_sync
+AFTER UPDATE ON merchant_score_totals
+BEGIN
+    INSERT INTO merchant_scores (merchant_id, avg_appearance, avg_figure, avg_service, avg_attitude, avg_environment, total_reviews_count, updated_at)
+    VALUES (
+        NEW.merchant_id,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_appearance * 1.0 / NEW.reviews_count, 2) ELSE NULL END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_figure * 1.0 / NEW.reviews_count, 2) ELSE NULL END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_service * 1.0 / NEW.reviews_count, 2) ELSE NULL END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_attitude * 1.0 / NEW.reviews_count, 2) ELSE NULL END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_environment * 1.0 / NEW.reviews_count, 2) ELSE NULL END,
+        NEW.reviews_count,
+        NEW.updated_at
+    )
+    ON CONFLICT(merchant_id) DO UPDATE SET
+        avg_appearance = excluded.avg_appearance,
+        avg_figure = excluded.avg_figure,
+        avg_service = excluded.avg_service,
+        avg_attitude = excluded.avg_attitude,
+        avg_environment = excluded.avg_environment,
+        total_reviews_count = excluded.total_reviews_count,
+        updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_user_score_totals_sync
+AFTER UPDATE ON user_score_totals
+BEGIN
+    INSERT INTO user_scores (user_id, avg_attack_quality, avg_length, avg_hardness, avg_duration, avg_user_temperament, total_reviews_count, updated_at)
+    VALUES (
+        NEW.user_id,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_attack_quality * 1.0 / NEW.reviews_count, 2) ELSE 0.0 END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_length * 1.0 / NEW.reviews_count, 2) ELSE 0.0 END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_hardness * 1.0 / NEW.reviews_count, 2) ELSE 0.0 END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_duration * 1.0 / NEW.reviews_count, 2) ELSE 0.0 END,
+        CASE WHEN NEW.reviews_count > 0 THEN ROUND(NEW.sum_user_temperament * 1.0 / NEW.reviews_count, 2) ELSE 0.0 END,
+        NEW.reviews_count,
+        NEW.updated_at
+    )
+    ON CONFLICT(user_id) DO UPDATE SET
+        avg_attack_quality = excluded.avg_attack_quality,
+        avg_length = excluded.avg_length,
+        avg_hardness = excluded.avg_hardness,
+        avg_duration = excluded.avg_duration,
+        avg_user_temperament = excluded.avg_user_temperament,
+        total_reviews_count = excluded.total_reviews_count,
+        updated_at = excluded.updated_at;
+END;
+
+
+/* 4) U2M 评价 → 商户累计 */
+CREATE TRIGGER IF NOT EXISTS trg_reviews_totals_insert
+AFTER INSERT ON reviews
+WHEN NEW.is_confirmed_by_admin = 1 AND NEW.is_active = 1 AND NEW.is_deleted = 0
+BEGIN
+    INSERT OR IGNORE INTO merchant_score_totals (merchant_id) VALUES (NEW.merchant_id);
+    UPDATE merchant_score_totals SET
+        sum_appearance = sum_appearance + NEW.rating_appearance,
+        sum_figure = sum_figure + NEW.rating_figure,
+        sum_service = sum_service + NEW.rating_service,
+        sum_attitude = sum_attitude + NEW.rating_attitude,
+        sum_environment = sum_environment + NEW.rating_environment,
+        reviews_count = reviews_count + 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE merchant_id = NEW.merchant_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_totals_retract
+AFTER UPDATE OF rating_appearance, rating_figure, rating_service, rating_attitude, rating_environment, is_confirmed_by_admin, is_active, is_deleted, merchant_id ON reviews
+WHEN OLD.is_confirmed_by_admin = 1 AND OLD.is_active = 1 AND OLD.is_deleted = 0
+BEGIN
+    UPDATE merchant_score_totals SET
+        sum_appearance = sum_appearance - OLD.rating_appearance,
+        sum_figure = sum_figure - OLD.rating_figure,
+        sum_service = sum_service - OLD.rating_service,
+        sum_attitude = sum_attitude - OLD.rating_attitude,
+        sum_environment = sum_environment - OLD.rating_environment,
+        reviews_count = reviews_count - 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE merchant_id = OLD.merchant_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_totals_apply
+AFTER UPDATE OF rating_appearance, rating_figure, rating_service, rating_attitude, rating_environment, is_confirmed_by_admin, is_active, is_deleted, merchant_id ON reviews
+WHEN NEW.is_confirmed_by_admin = 1 AND NEW.is_active = 1 AND NEW.is_deleted = 0
+BEGIN
+    INSERT OR IGNORE INTO merchant_score_totals (merchant_id) VALUES (NEW.merchant_id);
+    UPDATE merchant_score_totals SET
+        sum_appearance = sum_appearance + NEW.rating_appearance,
+        sum_figure = sum_figure + NEW.rating_figure,
+        sum_service = sum_service + NEW.rating_service,
+        sum_attitude = sum_attitude + NEW.rating_attitude,
+        sum_environment = sum_environment + NEW.rating_environment,
+        reviews_count = reviews_count + 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE merchant_id = NEW.merchant_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reviews_totals_delete
+AFTER DELETE ON reviews
+WHEN OLD.is_confirmed_by_admin = 1 AND OLD.is_active = 1 AND OLD.is_deleted = 0
+BEGIN
+    UPDATE merchant_score_totals SET
+        sum_appearance = sum_appearance - OLD.rating_appearance,
+        sum_figure = sum_figure - OLD.rating_figure,
+        sum_service = sum_service - OLD.rating_service,
+        sum_attitude = sum_attitude - OLD.rating_attitude,
+        sum_environment = sum_environment - OLD.rating_environment,
+        reviews_count = reviews_count - 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE merchant_id = OLD.merchant_id;
+END;
+
+
+/* 5) M2U 评价 → 用户累计 */
+CREATE TRIGGER IF NOT EXISTS trg_merchant_reviews_totals_insert
+AFTER INSERT ON merchant_reviews
+WHEN NEW.is_confirmed_by_admin = 1 AND NEW.is_active = 1 AND NEW.is_deleted = 0
+BEGIN
+    INSERT OR IGNORE INTO user_score_totals (user_id) VALUES (NEW.user_id);
+    UPDATE user_score_totals SET
+        sum_attack_quality = sum_attack_quality + NEW.rating_attack_quality,
+        sum_length = sum_length + NEW.rating_length,
+        sum_hardness = sum_hardness + NEW.rating_hardness,
+        sum_duration = sum_duration + NEW.rating_duration,
+        sum_user_temperament = sum_user_temperament + NEW.rating_user_temperament,
+        reviews_count = reviews_count + 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE user_id = NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_merchant_reviews_totals_retract
+AFTER UPDATE OF rating_attack_quality, rating_length, rating_hardness, rating_duration, rating_user_temperament, is_confirmed_by_admin, is_active, is_deleted, user_id ON merchant_reviews
+WHEN OLD.is_confirmed_by_admin = 1 AND OLD.is_active = 1 AND OLD.is_deleted = 0
+BEGIN
+    UPDATE user_score_totals SET
+        sum_attack_quality = sum_attack_quality - OLD.rating_attack_quality,
+        sum_length = sum_length - OLD.rating_length,
+        sum_hardness = sum_hardness - OLD.rating_hardness,
+        sum_duration = sum_duration - OLD.rating_duration,
+        sum_user_temperament = sum_user_temperament - OLD.rating_user_temperament,
+        reviews_count = reviews_count - 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE user_id = OLD.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_merchant_reviews_totals_apply
+AFTER UPDATE OF rating_attack_quality, rating_length, rating_hardness, rating_duration, rating_user_temperament, is_confirmed_by_admin, is_active, is_deleted, user_id ON merchant_reviews
+WHEN NEW.is_confirmed_by_admin = 1 AND NEW.is_active = 1 AND NEW.is_deleted = 0
+BEGIN
+    INSERT OR IGNORE INTO user_score_totals (user_id) VALUES (NEW.user_id);
+    UPDATE user_score_totals SET
+        sum_attack_quality = sum_attack_quality + NEW.rating_attack_quality,
+        sum_length = sum_length + NEW.rating_length,
+        sum_hardness = sum_hardness + NEW.rating_hardness,
+        sum_duration = sum_duration + NEW.rating_duration,
+        sum_user_temperament = sum_user_temperament + NEW.rating_user_temperament,
+        reviews_count = reviews_count + 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE user_id = NEW.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_merchant_reviews_totals_delete
+AFTER DELETE ON merchant_reviews
+WHEN OLD.is_confirmed_by_admin = 1 AND OLD.is_active = 1 AND OLD.is_deleted = 0
+BEGIN
+    UPDATE user_score_totals SET
+        sum_attack_quality = sum_attack_quality - OLD.rating_attack_quality,
+        sum_length = sum_length - OLD.rating_length,
+        sum_hardness = sum_hardness - OLD.rating_hardness,
+        sum_duration = sum_duration - OLD.rating_duration,
+        sum_user_temperament = sum_user_temperament - OLD.rating_user_temperament,
+        reviews_count = reviews_count - 1,
+        updated_at = datetime('now', 'localtime')
+    WHERE user_id = OLD.user_id;
+END;
+
+
+/* 6) 同步 schema_version */
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.2', '评分增量维护：累计表与评价触发器');
+
+COMMIT;
+PRAGMA foreign_keys=ON;
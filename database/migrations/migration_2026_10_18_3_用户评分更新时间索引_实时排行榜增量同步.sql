@@ -0,0 +1,6 @@
+-- 实时排行榜按 user_scores.updated_at 水位增量拉取变更行
+CREATE INDEX IF NOT EXISTS idx_user_scores_updated_at ON user_scores(updated_at);
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.3', '新增 user_scores.updated_at 索引，用于实时排行榜增量同步');
@@ -0,0 +1,174 @@
+-- 后台列表键集分页：为各筛选组合补充 (筛选列, created_at) 复合索引（id 为 rowid，已隐含在索引中）；
+-- users 主键不是 rowid，索引显式带上 user_id 作为次排序列。
+-- 新增 row_counters 计数器表，由触发器维护全部/按状态/按等级的行数，替代每页一次的 COUNT(*)。
+
+PRAGMA foreign_keys=OFF;
+BEGIN TRANSACTION;
+
+/* 1) 复合索引 */
+CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_merchant_created ON orders(merchant_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders(customer_user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_merchants_created_at ON merchants(created_at);
+CREATE INDEX IF NOT EXISTS idx_merchants_status_created ON merchants(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_merchants_district_created ON merchants(district_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_users_created_keyset ON users(created_at, user_id);
+CREATE INDEX IF NOT EXISTS idx_users_level_created ON users(level_name, created_at, user_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_status_created ON reviews(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_reviews_confirmed_created ON reviews(is_confirmed_by_admin, created_at);
+
+/* 2) 计数器表 */
+CREATE TABLE IF NOT EXISTS row_counters (
+    counter_key TEXT PRIMARY KEY NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0
+);
+
+DELETE FROM row_counters;
+
+INSERT INTO row_counters (counter_key, value) SELECT 'orders', COUNT(*) FROM orders;
+INSERT INTO row_counters (counter_key, value)
+SELECT 'orders:status:' || COALESCE(status, ''), COUNT(*) FROM orders GROUP BY COALESCE(status, '');
+
+INSERT INTO row_counters (counter_key, value) SELECT 'merchants', COUNT(*) FROM merchants;
+INSERT INTO row_counters (counter_key, value)
+SELECT 'merchants:status:' || COALESCE(status, ''), COUNT(*) FROM merchants GROUP BY COALESCE(status, '');
+
+INSERT INTO row_counters (counter_key, value) SELECT 'reviews', COUNT(*) FROM reviews;
+INSERT INTO row_counters (counter_key, value)
+SELECT 'reviews:status:' || COALESCE(status, ''), COUNT(*) FROM reviews GROUP BY COALESCE(status, '');
+
+INSERT INTO row_counters (counter_key, value) SELECT 'users', COUNT(*) FROM users;
+INSERT INTO row_counters (counter_key, value)
+SELECT 'users:level:' || COALESCE(level_name, ''), COUNT(*) FROM users GROUP BY COALESCE(level_name, '');
+
+/* 3) 触发器 */
+DROP TRIGGER IF EXISTS trg_orders_counters_insert;
+CREATE TRIGGER trg_orders_counters_insert
+AFTER INSERT ON orders
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('orders', 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('orders:status:' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_orders_counters_delete;
+CREATE TRIGGER trg_orders_counters_delete
+AFTER DELETE ON orders
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('orders', -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('orders:status:' || COALESCE(OLD.status, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+END;
+
+DROP TRIGGER IF EXISTS trg_orders_counters_status;
+CREATE TRIGGER trg_orders_counters_status
+AFTER UPDATE OF status ON orders
+WHEN COALESCE(OLD.status, '') != COALESCE(NEW.status, '')
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('orders:status:' || COALESCE(OLD.status, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('orders:status:' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_merchants_counters_insert;
+CREATE TRIGGER trg_merchants_counters_insert
+AFTER INSERT ON merchants
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('merchants', 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('merchants:status:' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_merchants_counters_delete;
+CREATE TRIGGER trg_merchants_counters_delete
+AFTER DELETE ON merchants
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('merchants', -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('merchants:status:' || COALESCE(OLD.status, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+END;
+
+DROP TRIGGER IF EXISTS trg_merchants_counters_status;
+CREATE TRIGGER trg_merchants_counters_status
+AFTER UPDATE OF status ON merchants
+WHEN COALESCE(OLD.status, '') != COALESCE(NEW.status, '')
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('merchants:status:' || COALESCE(OLD.status, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('merchants:status:' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_reviews_counters_insert;
+CREATE TRIGGER trg_reviews_counters_insert
+AFTER INSERT ON reviews
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('reviews', 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('reviews:status:' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_reviews_counters_delete;
+CREATE TRIGGER trg_reviews_counters_delete
+AFTER DELETE ON reviews
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('reviews', -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('reviews:status:' || COALESCE(OLD.status, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+END;
+
+DROP TRIGGER IF EXISTS trg_reviews_counters_status;
+CREATE TRIGGER trg_reviews_counters_status
+AFTER UPDATE OF status ON reviews
+WHEN COALESCE(OLD.status, '') != COALESCE(NEW.status, '')
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('reviews:status:' || COALESCE(OLD.status, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('reviews:status:' || COALESCE(NEW.status, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_users_counters_insert;
+CREATE TRIGGER trg_users_counters_insert
+AFTER INSERT ON users
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('users', 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('users:level:' || COALESCE(NEW.level_name, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+DROP TRIGGER IF EXISTS trg_users_counters_delete;
+CREATE TRIGGER trg_users_counters_delete
+AFTER DELETE ON users
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('users', -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('users:level:' || COALESCE(OLD.level_name, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+END;
+
+DROP TRIGGER IF EXISTS trg_users_counters_level;
+CREATE TRIGGER trg_users_counters_level
+AFTER UPDATE OF level_name ON users
+WHEN COALESCE(OLD.level_name, '') != COALESCE(NEW.level_name, '')
+BEGIN
+    INSERT INTO row_counters (counter_key, value) VALUES ('users:level:' || COALESCE(OLD.level_name, ''), -1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (-1);
+    INSERT INTO row_counters (counter_key, value) VALUES ('users:level:' || COALESCE(NEW.level_name, ''), 1)
+    ON CONFLICT(counter_key) DO UPDATE SET value = value + (1);
+END;
+
+/* 4) 同步架构版本 */
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.4', '后台列表键集分页复合索引与 row_counters 计数器');
+
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,23 @@
+-- 活动日志按月分区
+-- 原表改名为 activity_logs_unpartitioned，activity_logs 改为视图（UNION ALL 各月分区）。
+-- 启动时由 database.db_log_partitions 把旧表按月拆分到 activity_logs_YYYYMM 后删除旧表，
+-- 并重建视图与写入触发器；在此之前视图只覆盖旧表，原有读写语句不受影响。
+
+ALTER TABLE activity_logs RENAME TO activity_logs_unpartitioned;
+
+CREATE VIEW IF NOT EXISTS activity_logs AS
+    SELECT id, user_id, action_type, details, button_id, merchant_id, timestamp
+    FROM activity_logs_unpartitioned;
+
+-- 兼容直接写视图的旧语句（INSERT INTO activity_logs ...）
+CREATE TRIGGER IF NOT EXISTS trg_activity_logs_insert
+INSTEAD OF INSERT ON activity_logs
+BEGIN
+    INSERT INTO activity_logs_unpartitioned (user_id, action_type, details, button_id, merchant_id, timestamp)
+    VALUES (NEW.user_id, NEW.action_type, NEW.details, NEW.button_id, NEW.merchant_id,
+            COALESCE(NEW.timestamp, CURRENT_TIMESTAMP));
+END;
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.5', '活动日志改为按月分区表 + 视图，过期分区归档为 NDJSON 后整表删除');
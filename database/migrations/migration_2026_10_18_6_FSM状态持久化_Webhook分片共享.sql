@@ -0,0 +1,16 @@
+-- FSM 对话状态持久化
+-- Webhook 更新按 chat_id 分片到多个 worker 进程后，对话状态需要跨进程共享，
+-- 由 database.db_fsm_storage.SQLiteFSMStorage 读写。
+
+CREATE TABLE IF NOT EXISTS fsm_storage (
+    storage_key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at);
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.6', '新增 fsm_storage 表，FSM 对话状态持久化并在 Webhook 分片 worker 间共享');
@@ -0,0 +1,24 @@
+-- 慢查询日志
+-- database.db_query_profiler 按 SQL 指纹累计耗时，把慢查询与全表扫描大表的语句
+-- 以增量方式汇总到本表；机器人、Web、调度器进程共用，调试页 /debug/queries 查看。
+
+CREATE TABLE IF NOT EXISTS slow_queries (
+    fingerprint TEXT PRIMARY KEY,
+    op TEXT NOT NULL,
+    param_shape TEXT,
+    exec_count INTEGER NOT NULL DEFAULT 0,
+    total_ms REAL NOT NULL DEFAULT 0,
+    slow_count INTEGER NOT NULL DEFAULT 0,
+    slow_total_ms REAL NOT NULL DEFAULT 0,
+    max_ms REAL NOT NULL DEFAULT 0,
+    query_plan TEXT,
+    scan_tables TEXT,
+    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_slow_queries_last_seen ON slow_queries(last_seen);
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.7', '新增 slow_queries 表，慢查询与全表扫描语句汇总');
@@ -0,0 +1,11 @@
+-- 用户资料缓存
+-- services.profile_cache 把 Telegram 网名（first_name/last_name）与确认时间持久化到 users，
+-- 来自更新的 from_user 免费刷新；渲染评价、排行榜等用户列表时不再逐个调用 getChat。
+
+ALTER TABLE users ADD COLUMN first_name TEXT;
+ALTER TABLE users ADD COLUMN last_name TEXT;
+ALTER TABLE users ADD COLUMN profile_fetched_at TIMESTAMP;
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.8', 'users 新增 first_name/last_name/profile_fetched_at，Telegram 网名缓存');
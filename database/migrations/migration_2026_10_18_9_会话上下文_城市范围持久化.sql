@@ -0,0 +1,17 @@
+-- 会话上下文
+-- services.session_context 保存按用户的短期上下文（当前城市、最近深链等），
+-- 进程内 LRU 为主、本表为后备；写入批量落库，重启与多 worker 间保持一致。
+
+CREATE TABLE IF NOT EXISTS session_context (
+    user_id BIGINT NOT NULL,
+    ctx_key TEXT NOT NULL,
+    value TEXT NOT NULL,                      -- JSON
+    expires_at INTEGER NOT NULL,              -- 过期时间（Unix 秒）
+    PRIMARY KEY (user_id, ctx_key)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_session_context_expires_at ON session_context(expires_at);
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.18.9', '新增 session_context 表，用户会话上下文（城市范围等）持久化并在 worker 间共享');
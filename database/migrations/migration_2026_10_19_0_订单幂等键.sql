@@ -0,0 +1,12 @@
+-- 订单幂等键
+-- services.order_service 以 (用户, 商户, 课程, 时间窗) 生成幂等键，
+-- 用户连点“立即预约”或重复投递的回调只会得到同一张订单。
+-- 原文件名: migration_2026_10_18_10_订单幂等键.sql
+
+ALTER TABLE orders ADD COLUMN idempotency_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency_key ON orders(idempotency_key);
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.19.0', 'orders 新增 idempotency_key 及唯一索引，预约下单去重');
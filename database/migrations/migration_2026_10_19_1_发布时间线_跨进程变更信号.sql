@@ -0,0 +1,34 @@
+-- 发布时间线跨进程变更信号
+-- merchants 的 status / publish_time / expiration_time 变化时由触发器记下商户ID，
+-- 调度器按自增ID水位轮询本表（主键范围查询），机器人/Web 等其它进程的写入也能及时进入时间线。
+
+CREATE TABLE IF NOT EXISTS merchant_schedule_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    merchant_id INTEGER NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_merchants_schedule_insert
+AFTER INSERT ON merchants
+BEGIN
+    INSERT INTO merchant_schedule_changes (merchant_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_merchants_schedule_update
+AFTER UPDATE OF status, publish_time, expiration_time ON merchants
+WHEN OLD.status IS NOT NEW.status
+  OR OLD.publish_time IS NOT NEW.publish_time
+  OR OLD.expiration_time IS NOT NEW.expiration_time
+BEGIN
+    INSERT INTO merchant_schedule_changes (merchant_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_merchants_schedule_delete
+AFTER DELETE ON merchants
+BEGIN
+    INSERT INTO merchant_schedule_changes (merchant_id) VALUES (OLD.id);
+END;
+
+-- 同步架构版本
+INSERT OR REPLACE INTO system_config (config_key, config_value, description)
+VALUES ('schema_version', '2026.10.19.1', '新增 merchant_schedule_changes 及 merchants 触发器，发布时间线跨进程变更信号');
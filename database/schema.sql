@@ -47,6 +47,7 @@ CREATE TABLE IF NOT EXISTS orders (
     status TEXT NOT NULL DEFAULT '尝试预约' CHECK (status IN ('尝试预约', '已完成', '已评价', '双方评价', '单方评价')),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    idempotency_key TEXT,                     -- 下单幂等键（services.order_service 生成，唯一）
     FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE CASCADE
 );
 
@@ -60,7 +61,10 @@ CREATE TABLE IF NOT EXISTS users (
     level_name TEXT DEFAULT '新手',
     badges TEXT DEFAULT '[]',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    first_name TEXT,                          -- Telegram 网名缓存（services.profile_cache 维护）
+    last_name TEXT,
+    profile_fetched_at TIMESTAMP              -- 网名最近一次确认的时间
 );
 
 -- 双向评价系统表
@@ -236,6 +240,19 @@ CREATE TABLE IF NOT EXISTS media (
     FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE CASCADE
 );
 
+-- 媒体缩略图/封面帧（后台生成的 WebP 预览，每种规格一行）
+CREATE TABLE IF NOT EXISTS media_thumbnails (
+    media_id INTEGER NOT NULL,
+    variant TEXT NOT NULL,              -- 'sm' / 'md' / 'poster'
+    file_path TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    file_size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (media_id, variant),
+    FOREIGN KEY (media_id) REFERENCES media(id) ON DELETE CASCADE
+);
+
 -- ==========================================
 -- 自动回复与关键词模块（V2.0）
 -- ==========================================
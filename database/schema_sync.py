@@ -6,6 +6,7 @@ import logging
 import os
 import re
 from .db_connection import db_manager
+from .db_migrations import migration_engine, Migration
 
 logger = logging.getLogger(__name__)
 
@@ -76,7 +77,7 @@ class SchemaSynchronizer:
                 logger.info("✅ 无需同步的Schema差异")
                 return True
             
-            success_count = 0
+            missing = []
             skip_count = 0
             
             # 检查每个期望的表和列
@@ -90,23 +91,18 @@ class SchemaSynchronizer:
                 for column_name, column_def in columns.items():
                     if column_name not in actual_columns:
                         # 需要添加此列
-                        alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}"
-                        
-                        try:
-                            await db_manager.execute_query(alter_sql)
-                            logger.info(f"✅ 添加列: {table_name}.{column_name}")
-                            success_count += 1
-                        except Exception as e:
-                            if 'duplicate column name' in str(e).lower():
-                                logger.info(f"⚠️ 列已存在: {table_name}.{column_name}")
-                                skip_count += 1
-                            else:
-                                logger.error(f"❌ 添加列失败: {table_name}.{column_name} - {e}")
-                                return False
+                        missing.append(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def};")
                     else:
                         skip_count += 1
             
-            logger.info(f"🎉 Schema同步完成: 新增={success_count}, 跳过={skip_count}")
+            # 缺失列经迁移引擎在一个事务内补齐（任一失败整体回滚，不登记迁移历史）
+            if missing and not await migration_engine.apply(
+                Migration("schema_sync.sql", "\n".join(missing)), record=False, strict=True
+            ):
+                logger.error(f"❌ 添加列失败，已回滚: {len(missing)} 列")
+                return False
+            
+            logger.info(f"🎉 Schema同步完成: 新增={len(missing)}, 跳过={skip_count}")
             return True
             
         except Exception as e:
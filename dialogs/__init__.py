@@ -15,11 +15,22 @@ from .states import (
     is_admin_configuration_state
 )
 
-from .dialog_manager import (
-    register_all_dialogs
-)
+# dialog_manager / binding_flow_new 依赖较重（含 python-telegram-bot 对话），
+# 处理器只需要 dialogs.states，故这两项在首次访问时才导入
+_LAZY_EXPORTS = {
+    'register_all_dialogs': ('.dialog_manager', 'register_all_dialogs'),
+    'binding_flow_router': ('.binding_flow_new', 'router'),
+}
+
 
-from .binding_flow_new import router as binding_flow_router
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        import importlib
+        module, attr = _LAZY_EXPORTS[name]
+        value = getattr(importlib.import_module(module, __name__), attr)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     # 状态相关
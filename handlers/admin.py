@@ -964,6 +964,32 @@ async def copy_code_callback(callback: CallbackQuery):
         await callback.answer("复制失败，请手动长按消息复制", show_alert=True)
 
 
+@admin_router.message(Command("publish_reviews"))
+async def publish_reviews_command(message: Message):
+    """
+    补发评价命令处理器
+    将已确认但尚未发布到频道的评价批量发布（按频道限速）
+    """
+    if not await AdminHandler.verify_admin_permission(message):
+        return
+
+    from services.review_publish_service import review_publish_service
+
+    await message.reply("📣 正在补发已确认的评价，请稍候…")
+    try:
+        stats = await review_publish_service.publish_backlog(message.bot)
+        u2m, m2u = stats["u2m"], stats["m2u"]
+        await message.reply(
+            f"📣 补发完成\n"
+            f"用户评价：{u2m['published']}/{u2m['total']}\n"
+            f"商家评价：{m2u['published']}/{m2u['total']}"
+        )
+        logger.info(f"管理员 {message.from_user.id} 补发评价: {stats}")
+    except Exception as e:
+        logger.error(f"补发评价失败: {e}")
+        await message.reply("❌ 补发失败，请查看日志")
+
+
 @admin_router.message(Command("manage_regions"))
 async def manage_regions_command(message: Message):
     """功能已删除 - 地区管理"""
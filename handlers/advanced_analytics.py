@@ -15,6 +15,7 @@ from database.db_logs import activity_logs_db
 from database.db_binding_codes import binding_codes_db
 from database.db_merchants import merchant_manager
 from database.db_orders import order_manager
+from database.db_snapshot import reads_from_snapshot
 from .statistics import StatisticsEngine, StatsResult, TimeRange, StatsPeriod
 
 # 配置日志
@@ -60,6 +61,7 @@ class AdvancedAnalyticsEngine:
     """
     
     @staticmethod
+    @reads_from_snapshot
     async def generate_cohort_analysis(time_range: TimeRange) -> Dict[str, Any]:
         """
         生成用户群组分析
@@ -139,6 +141,7 @@ class AdvancedAnalyticsEngine:
             raise
     
     @staticmethod
+    @reads_from_snapshot
     async def generate_funnel_analysis(time_range: TimeRange) -> Dict[str, Any]:
         """
         生成漏斗分析
@@ -233,6 +236,7 @@ class AdvancedAnalyticsEngine:
             raise
     
     @staticmethod
+    @reads_from_snapshot
     async def generate_user_segmentation_analysis(time_range: TimeRange) -> Dict[str, Any]:
         """
         生成用户分群分析
@@ -347,6 +351,7 @@ class AdvancedAnalyticsEngine:
             raise
     
     @staticmethod
+    @reads_from_snapshot
     async def generate_business_insights(time_range: TimeRange) -> List[AnalyticsInsight]:
         """
         生成业务洞察
@@ -468,6 +473,7 @@ class AdvancedAnalyticsEngine:
             raise
     
     @staticmethod
+    @reads_from_snapshot
     async def generate_performance_forecast(time_range: TimeRange, forecast_days: int = 30) -> Dict[str, Any]:
         """
         生成性能预测
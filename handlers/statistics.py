@@ -18,6 +18,7 @@ from database.db_binding_codes import BindingCodesDatabase, binding_codes_db
 from database.db_merchants import MerchantManager, merchant_manager
 from database.db_orders import OrderManager, order_manager
 from database.db_templates import template_manager
+from database.db_snapshot import reads_from_snapshot
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -175,6 +176,7 @@ class StatisticsEngine:
         return TimeRange(start_date, end_date, period_name)
 
     @staticmethod
+    @reads_from_snapshot
     async def generate_button_click_analytics(
         time_range: TimeRange,
         button_filter: Optional[str] = None,
@@ -213,6 +215,7 @@ class StatisticsEngine:
             raise
 
     @staticmethod
+    @reads_from_snapshot
     async def generate_user_activity_analytics(
         time_range: TimeRange, user_filter: Optional[int] = None
     ) -> Dict[str, Any]:
@@ -272,6 +275,7 @@ class StatisticsEngine:
             raise
 
     @staticmethod
+    @reads_from_snapshot
     async def generate_merchant_performance_analytics(
         time_range: TimeRange, merchant_filter: Optional[int] = None
     ) -> Dict[str, Any]:
@@ -304,6 +308,7 @@ class StatisticsEngine:
             raise
 
     @staticmethod
+    @reads_from_snapshot
     async def generate_order_analytics(
         time_range: TimeRange, merchant_filter: Optional[int] = None
     ) -> Dict[str, Any]:
@@ -386,6 +391,7 @@ class StatisticsEngine:
             raise
 
     @staticmethod
+    @reads_from_snapshot
     async def generate_binding_code_analytics(time_range: TimeRange) -> Dict[str, Any]:
         """
         生成绑定码分析数据
@@ -471,6 +477,7 @@ class StatisticsEngine:
             raise
 
     @staticmethod
+    @reads_from_snapshot
     async def generate_system_health_analytics(time_range: TimeRange) -> Dict[str, Any]:
         """
         生成系统健康度分析数据
@@ -17,13 +17,16 @@ from aiogram.fsm.context import FSMContext
 from database.db_users import user_manager
 from database.db_regions import region_manager
 from database.db_merchants import merchant_manager
-from database.db_orders import order_manager
 from database.db_connection import db_manager
 from database.db_fsm import create_fsm_db_manager
 from database.db_media import media_db
 from handlers.reviews import build_start_review_button
 from database.db_logs import ActivityLogsDatabase
 from services.notification_service import NotificationService
+from services.live_leaderboard import DIM_COLUMNS, live_leaderboard
+from services.profile_cache import profile_cache
+from services.session_context import session_context, CTX_CITY, CTX_LAST_DEEPLINK
+from services.order_service import order_service
 from database.db_templates import template_manager
 from database.db_connection import db_manager
 from utils.template_utils import get_template_async
@@ -50,41 +53,19 @@ DIM_LABELS = {
     'user_temperament': '用户气质',
 }
 
-async def _get_display_name(bot, uid: int) -> str:
-    try:
-        chat = await bot.get_chat(int(uid))
-        parts = []
-        fn = getattr(chat, 'first_name', None)
-        ln = getattr(chat, 'last_name', None)
-        if isinstance(fn, str) and fn.strip():
-            parts.append(fn.strip())
-        if isinstance(ln, str) and ln.strip():
-            parts.append(ln.strip())
-        return " ".join(parts) or str(uid)
-    except Exception:
-        return str(uid)
 _fsm_db_profile = create_fsm_db_manager(db_manager)
 
-# 会话级“当前城市”上下文（内存态）。
+# 会话级“当前城市”上下文（services.session_context：内存 LRU + session_context 表）。
 # 作用：当用户通过城市深链/callback选择了城市后，后续列表型深链（价格/标签）仅返回该城市的商家。
-# 注意：该上下文仅保存在内存，进程重启会清空；若需持久化可后续扩展到 users 表。
-USER_CITY_CTX: dict[int, int] = {}
-
 def _set_user_city_ctx(user_id: int, city_id: int) -> None:
-    try:
-        USER_CITY_CTX[user_id] = int(city_id)
-    except Exception:
-        USER_CITY_CTX[user_id] = city_id
+    session_context.set(user_id, CTX_CITY, int(city_id))
 
-def _get_user_city_ctx(user_id: int) -> int | None:
-    return USER_CITY_CTX.get(user_id)
+async def _get_user_city_ctx(user_id: int) -> int | None:
+    city_id = await session_context.get(user_id, CTX_CITY)
+    return int(city_id) if city_id else None
 
 def _clear_user_city_ctx(user_id: int) -> None:
-    try:
-        if user_id in USER_CITY_CTX:
-            del USER_CITY_CTX[user_id]
-    except Exception:
-        pass
+    session_context.delete(user_id, CTX_CITY)
 
 def get_user_router() -> Router:
     """获取用户路由器"""
@@ -264,16 +245,8 @@ async def order_now_callback(callback: CallbackQuery):
             await callback.message.answer("商户不存在或已删除")
             return
 
-        user = callback.from_user
-        price = merchant.get('p_price') or 0
-        order_id = await order_manager.create_order({
-            'customer_user_id': user.id,
-            'customer_username': user.username,
-            'merchant_id': merchant_id,
-            'price': int(price) if str(price).isdigit() else 0,
-            'course_type': None,
-            'status': '尝试预约'
-        })
+        # 单事务幂等下单：连点/重复投递复用同一订单
+        order_id, _created = await order_service.create_attempt_order(callback.from_user, merchant)
 
         # UX：不再重复发送商家预览，直接确认，并将当前消息键盘替换为“返回列表”
         try:
@@ -327,10 +300,12 @@ async def order_choose_callback(callback: CallbackQuery):
         # 选择价格并写入订单
         selected_is_p = (parts[2] == 'p')
         sel_price = int(merchant.get('p_price') or 0) if selected_is_p else int(merchant.get('pp_price') or 0)
+        course_type = 'P' if selected_is_p else 'PP'
         try:
-            await order_manager.update_order(order_id, {'price': sel_price, 'course_type': ('P' if selected_is_p else 'PP')})
-        except Exception:
-            pass
+            changed = await order_service.choose_course(order_id, callback.from_user.id, course_type, sel_price)
+        except Exception as e:
+            logger.warning(f"写入订单课程失败（忽略）：{e}")
+            changed = False
 
         # 生成用户可读信息（不包含 https 链接；@username 后面加一个空格）
         if raw_contact.startswith('@') and len(raw_contact) > 1:
@@ -358,30 +333,15 @@ async def order_choose_callback(callback: CallbackQuery):
         except Exception as e:
             logger.warning(f"发送用户评价入口失败（忽略）：{e}")
 
-        # 选择了 P/PP 后再通知商户（后台任务，不阻塞主流程）
-        try:
-            _t3 = asyncio.create_task(
-                NotificationService.notify_new_order(
-                    bot=callback.bot,
-                    merchant=merchant,
-                    user=callback.from_user,
-                    order_id=order_id,
-                    course_type=('P' if selected_is_p else 'PP'),
-                    price=sel_price,
-                )
-            )
-            _t3.add_done_callback(lambda t: logger.warning(f"通知商户失败: {t.exception()}") if t.exception() else None)
-        except Exception:
-            pass
-
-        # 发送“完成后评价”入口（商户/老师端）
-        try:
-            m_chat_id = merchant.get('telegram_chat_id')
-            if m_chat_id:
+        # 选择了 P/PP 后再通知商户并发送商户端评价入口（后台队列；重复点击同一选项不再通知）
+        if changed:
+            try:
                 m2u_kb = build_start_review_button('m2u', order_id, text='❗️完成后评价狼友')
-                await callback.bot.send_message(int(m_chat_id), '上完课后点击按钮进行评价：', reply_markup=m2u_kb)
-        except Exception as e:
-            logger.warning(f"发送商户评价入口失败（忽略）：{e}")
+                order_service.notify_merchant(
+                    callback.bot, merchant, callback.from_user, order_id, course_type, sel_price, m2u_kb
+                )
+            except Exception as e:
+                logger.warning(f"商户通知入队失败（忽略）：{e}")
     except Exception as e:
         logger.error(f"处理预约课程回调失败: {e}")
         await callback.message.answer("处理失败，请重试")
@@ -416,6 +376,8 @@ async def start_command(message: Message, state: FSMContext):
         await message.answer(welcome_text, reply_markup=create_main_menu_keyboard())
         return
 
+    session_context.set(message.from_user.id, CTX_LAST_DEEPLINK, payload)
+
     # c_{city_id}: 设置“当前城市”上下文（不输出多余文案）
     if payload.startswith('c_'):
         try:
@@ -504,7 +466,7 @@ async def start_command(message: Message, state: FSMContext):
             else:
                 items = await merchant_manager.list_active_by_price('pp_price', val, limit=20)
             # 若已有“当前城市”上下文，仅展示该城市商家
-            ctx_city_id = city_id_from_link or _get_user_city_ctx(message.from_user.id)
+            ctx_city_id = city_id_from_link or await _get_user_city_ctx(message.from_user.id)
             if ctx_city_id:
                 try:
                     city = await region_manager.get_city_by_id(ctx_city_id)
@@ -533,7 +495,7 @@ async def start_command(message: Message, state: FSMContext):
             kid = int(payload.split('_',1)[1])
             items = await merchant_manager.list_active_by_keyword(kid, limit=20)
             # 若已有“当前城市”上下文，仅展示该城市商家
-            ctx_city_id = _get_user_city_ctx(message.from_user.id)
+            ctx_city_id = await _get_user_city_ctx(message.from_user.id)
             if ctx_city_id:
                 try:
                     city = await region_manager.get_city_by_id(ctx_city_id)
@@ -867,31 +829,36 @@ async def user_rank_menu(callback: CallbackQuery):
 async def user_rank_show(callback: CallbackQuery):
     try:
         dim = callback.data.split(':')[-1]
+        if dim not in DIM_COLUMNS:
+            await callback.answer("该排行榜已失效，请重新选择", show_alert=True)
+            return
         label = DIM_LABELS.get(dim, dim)
-        # Top50
-        rows = await db_manager.fetch_all(
-            "SELECT user_id, avg_score, reviews_count, rank FROM user_score_leaderboards WHERE dimension=? ORDER BY rank LIMIT 50",
-            (dim,)
+        # Top50（实时榜单）
+        rows = await live_leaderboard.top(dim, 50)
+        uid = int(callback.from_user.id)
+        md = await live_leaderboard.rank(dim, uid)
+        nearby = await live_leaderboard.around(dim, uid, 2) if md and int(md['rank']) > len(rows) else []
+        # 一次取齐榜单涉及的网名（缓存命中时不调用 Bot API）
+        names = await profile_cache.display_names(
+            callback.message.bot, [int(d['user_id']) for d in list(rows) + list(nearby)]
         )
         lines = [f"🏆 {label} 排行榜 Top50:\n"]
         if rows:
-            for r in rows:
-                d = dict(r)
-                name = await _get_display_name(callback.message.bot, int(d['user_id']))
+            for d in rows:
+                name = names.get(int(d['user_id'])) or str(d['user_id'])
                 lines.append(f"{d['rank']:>2}. {name}  {float(d['avg_score']):.2f} 分｜被{int(d['reviews_count'])}位老师/商家评价")
         else:
             lines.append("暂无数据")
 
         # 我的名次
-        uid = int(callback.from_user.id)
-        my_row = await db_manager.fetch_one(
-            "SELECT user_id, avg_score, reviews_count, rank FROM user_score_leaderboards WHERE dimension=? AND user_id=?",
-            (dim, uid)
-        )
         lines.append("")
-        if my_row:
-            md = dict(my_row)
+        if md:
             lines.append(f"你在“{label}”的均分 {float(md['avg_score']):.2f} 分，当前第 {int(md['rank'])} 名（被{int(md['reviews_count'])}位老师/商家评价）。")
+            if nearby:
+                lines.append("你附近的名次：")
+                for d in nearby:
+                    name = "你" if int(d['user_id']) == uid else (names.get(int(d['user_id'])) or str(d['user_id']))
+                    lines.append(f"{d['rank']:>2}. {name}  {float(d['avg_score']):.2f} 分")
         else:
             us = await db_manager.fetch_one("SELECT * FROM user_scores WHERE user_id=?", (uid,))
             score = None
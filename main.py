@@ -21,8 +21,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 启动耗时统计（以此处为起点）
+from utils.startup_timer import startup_timer
+
 # 导入数据库初始化器
-from database.db_init import DatabaseInitializer
+with startup_timer.stage("import_database"):
+    from database.db_init import DatabaseInitializer
 
 async def initialize_database():
     """初始化数据库 - 执行必要的schema迁移"""
@@ -107,14 +111,18 @@ def main():
         logger.info("🚀 生产环境启动序列...")
         
         # 执行数据库初始化
-        database_success = asyncio.run(initialize_database())
+        with startup_timer.stage("database_init"):
+            database_success = asyncio.run(initialize_database())
         if not database_success:
             logger.error("❌ 数据库初始化失败，停止启动")
             raise RuntimeError("Database initialization failed")
         
         # 数据库初始化成功后，再导入ASGI应用
         logger.info("📱 导入ASGI应用...")
-        from asgi_app import app
+        with startup_timer.stage("import_app"):
+            from asgi_app import app
+        # 服务器开始接收请求时输出启动耗时报告
+        app.add_event_handler("startup", startup_timer.report)
         
         # 获取端口号（Railway会设置PORT环境变量）
         port = int(os.getenv("PORT", 8080))
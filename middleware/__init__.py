@@ -1,14 +1,20 @@
 """
 中间件模块
-包含限流、日志记录、错误处理等中间件
+包含接入调度、限流、日志记录、错误处理、指标、用户资料缓存等中间件
 """
 
 from .throttling import ThrottlingMiddleware
 from .logging import LoggingMiddleware
 from .error_handler import ErrorHandlerMiddleware
+from .ingestion import IngestionMiddleware
+from .metrics import HandlerMetricsMiddleware
+from .profile_cache import ProfileCacheMiddleware
 
 __all__ = [
     'ThrottlingMiddleware',
     'LoggingMiddleware', 
-    'ErrorHandlerMiddleware'
+    'ErrorHandlerMiddleware',
+    'IngestionMiddleware',
+    'HandlerMetricsMiddleware',
+    'ProfileCacheMiddleware'
 ]
\ No newline at end of file
@@ -14,6 +14,7 @@ from aiogram.types import Message, CallbackQuery, TelegramObject
 from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter, TelegramServerError
 
 from config import MESSAGE_TEMPLATES, ADMIN_IDS
+from utils.metrics import BOT_ERRORS
 
 logger = logging.getLogger(__name__)
 
@@ -223,6 +224,7 @@ class ErrorHandlerMiddleware(BaseMiddleware):
             except TelegramRetryAfter as e:
                 # 处理速率限制
                 logger.warning(f"用户 {user_id} 触发速率限制: {e}")
+                BOT_ERRORS.inc(type="retry_after")
                 
                 # 尝试自动处理
                 should_retry = await self._handle_retry_after(e, event)
@@ -235,6 +237,7 @@ class ErrorHandlerMiddleware(BaseMiddleware):
             except TelegramBadRequest as e:
                 # 客户端请求错误，通常不需要重试
                 logger.warning(f"用户 {user_id} 发送了无效请求: {e}")
+                BOT_ERRORS.inc(type="bad_request")
                 await self._send_error_response(
                     event, 
                     self._get_user_friendly_message("bad_request", e)
@@ -244,6 +247,7 @@ class ErrorHandlerMiddleware(BaseMiddleware):
             except TelegramServerError as e:
                 # 服务器错误，可以重试
                 logger.error(f"Telegram服务器错误: {e}")
+                BOT_ERRORS.inc(type="server_error")
                 
                 if retry_count < self.max_retries:
                     retry_count += 1
@@ -266,6 +270,7 @@ class ErrorHandlerMiddleware(BaseMiddleware):
                 
                 # 统计错误
                 self.error_counts[error_type] = self.error_counts.get(error_type, 0) + 1
+                BOT_ERRORS.inc(type=error_type)
                 
                 # 发送用户友好消息
                 await self._send_error_response(
@@ -0,0 +1,261 @@
+"""
+更新接入调度中间件
+在路由与其余中间件之前，按优先级通道限制同时处理的更新数
+
+通道（优先级从高到低）:
+- admin: 管理员的全部更新
+- flow: 下单、商户入驻/编辑、评价等流程，以及处于 FSM 状态中的输入
+- browse: 命令、地区浏览、个人中心等其它交互
+- auto_reply: 无状态的普通文本（自动回复）
+
+过载时:
+- 空闲并发按优先级分配，同一通道内先到先得
+- 低优先级通道只能占用部分并发（max_share），为下单等流程预留余量
+- 排队超过上限（max_queue）或等待超时（max_wait）的更新被丢弃；回调会收到“繁忙”提示
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import ADMIN_IDS, INGESTION_CONFIG
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "当前使用人数较多，请稍后再试"
+
+
+class LaneStats:
+    """单个通道的计数与延迟样本"""
+
+    __slots__ = ('active', 'admitted', 'shed', 'expired', 'wait_samples', 'handle_samples')
+
+    def __init__(self, samples: int = 512):
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+        self.expired = 0
+        self.wait_samples: Deque[float] = deque(maxlen=samples)
+        self.handle_samples: Deque[float] = deque(maxlen=samples)
+
+
+def _percentile(samples: Deque[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class PriorityGate:
+    """按优先级通道分配并发名额"""
+
+    def __init__(self, max_concurrency: int, lanes: Dict[str, Dict[str, Any]]):
+        """
+        Args:
+            max_concurrency: 同时处理的更新总数上限
+            lanes: {通道: {"priority", "max_share", "max_queue", "max_wait"}}
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.lanes = {name: dict(cfg) for name, cfg in lanes.items()}
+        self._order: List[str] = sorted(self.lanes, key=lambda n: self.lanes[n].get("priority", 0))
+        self._waiters: Dict[str, Deque[list]] = {name: deque() for name in self.lanes}
+        self.stats: Dict[str, LaneStats] = {name: LaneStats() for name in self.lanes}
+        self.active = 0
+
+    def _limit(self, lane: str) -> int:
+        share = self.lanes[lane].get("max_share", 1.0)
+        return max(1, int(self.max_concurrency * share))
+
+    def _blocked_by_waiters(self, lane: str) -> bool:
+        """同级或更高优先级通道是否已有排队的更新"""
+        priority = self.lanes[lane].get("priority", 0)
+        return any(
+            self._waiters[name] for name in self._order
+            if self.lanes[name].get("priority", 0) <= priority
+        )
+
+    def _admit(self, lane: str, waited: float):
+        self.active += 1
+        stats = self.stats[lane]
+        stats.active += 1
+        stats.admitted += 1
+        stats.wait_samples.append(waited)
+
+    def _wake(self):
+        now = time.monotonic()
+        for lane in self._order:
+            waiters = self._waiters[lane]
+            while waiters and self.active < self._limit(lane):
+                future, queued_at = waiters.popleft()
+                if future.done():
+                    continue
+                self._admit(lane, now - queued_at)
+                future.set_result(True)
+            if waiters:
+                # 高优先级仍在排队时不把名额让给低优先级
+                return
+
+    async def acquire(self, lane: str) -> bool:
+        """
+        取得一个处理名额
+
+        Returns:
+            False 表示该更新被丢弃（排队已满或等待超时）
+        """
+        if not self._blocked_by_waiters(lane) and self.active < self._limit(lane):
+            self._admit(lane, 0.0)
+            return True
+
+        config = self.lanes[lane]
+        waiters = self._waiters[lane]
+        max_queue = config.get("max_queue")
+        if max_queue is not None and len(waiters) >= max_queue:
+            self.stats[lane].shed += 1
+            return False
+
+        entry = [asyncio.get_running_loop().create_future(), time.monotonic()]
+        waiters.append(entry)
+        future = entry[0]
+        try:
+            await asyncio.wait({future}, timeout=config.get("max_wait"))
+        except asyncio.CancelledError:
+            if future.done():
+                self.release(lane)
+            else:
+                future.cancel()
+                waiters.remove(entry)
+            raise
+        if future.done():
+            return True
+        future.cancel()
+        waiters.remove(entry)
+        self.stats[lane].expired += 1
+        return False
+
+    def release(self, lane: str, handle_time: Optional[float] = None):
+        """归还名额并唤醒排队中的最高优先级更新"""
+        self.active -= 1
+        stats = self.stats[lane]
+        stats.active -= 1
+        if handle_time is not None:
+            stats.handle_samples.append(handle_time)
+        self._wake()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各通道排队深度、处理中数量与延迟（毫秒）"""
+        lanes = {}
+        for name in self._order:
+            stats = self.stats[name]
+            lanes[name] = {
+                "queued": len(self._waiters[name]),
+                "active": stats.active,
+                "admitted": stats.admitted,
+                "shed": stats.shed,
+                "expired": stats.expired,
+                "wait_p50_ms": round(_percentile(stats.wait_samples, 0.5) * 1000, 1),
+                "wait_p95_ms": round(_percentile(stats.wait_samples, 0.95) * 1000, 1),
+                "handle_p50_ms": round(_percentile(stats.handle_samples, 0.5) * 1000, 1),
+                "handle_p95_ms": round(_percentile(stats.handle_samples, 0.95) * 1000, 1),
+            }
+        return {"max_concurrency": self.max_concurrency, "active": self.active, "lanes": lanes}
+
+
+class IngestionMiddleware(BaseMiddleware):
+    """
+    更新接入调度中间件（注册在 dp.update 的 outer middleware 上）
+
+    依赖 aiogram 内置的 UserContextMiddleware / FSMContextMiddleware 先行填充
+    event_from_user 与 raw_state，分类本身不产生额外查询。
+    """
+
+    def __init__(self, gate: Optional[PriorityGate] = None, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化接入调度中间件
+
+        Args:
+            gate: 并发分配器（默认使用全局 ingestion_gate）
+            config: 分类配置（默认 INGESTION_CONFIG）
+        """
+        config = config or INGESTION_CONFIG
+        self.gate = gate or ingestion_gate
+        self.flow_callback_prefixes = tuple(config.get("flow_callback_prefixes", ()))
+        self.flow_text_keywords = tuple(config.get("flow_text_keywords", ()))
+
+    def classify(self, event: Update, data: Dict[str, Any]) -> str:
+        """
+        判定更新所属通道
+
+        Args:
+            event: 原始更新
+            data: 中间件上下文
+
+        Returns:
+            通道名称
+        """
+        user = data.get("event_from_user")
+        if user is not None and user.id in ADMIN_IDS:
+            return "admin"
+
+        callback = event.callback_query
+        if callback is not None:
+            if (callback.data or "").startswith(self.flow_callback_prefixes):
+                return "flow"
+            return "browse"
+
+        message = event.message
+        if message is None:
+            return "browse"
+        if data.get("raw_state"):
+            return "flow"
+        text = message.text or ""
+        if text.startswith("/"):
+            return "browse"
+        if text and any(keyword in text for keyword in self.flow_text_keywords):
+            return "flow"
+        if not text:
+            # 图片、视频等非文本消息不属于自动回复
+            return "browse"
+        return "auto_reply"
+
+    async def _reject(self, event: Update, lane: str):
+        logger.warning(f"接入调度过载，丢弃更新 {event.update_id}（通道: {lane}）")
+        if event.callback_query is not None:
+            try:
+                await event.callback_query.answer(BUSY_TEXT)
+            except Exception as e:
+                logger.debug(f"发送繁忙提示失败: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        lane = self.classify(event, data)
+        queued_at = time.monotonic()
+        admitted = await self.gate.acquire(lane)
+        started = time.monotonic()
+        tracer.set_attribute("ingestion.lane", lane)
+        tracer.set_attribute("ingestion.wait_ms", round((started - queued_at) * 1000, 2))
+        if not admitted:
+            tracer.set_attribute("ingestion.shed", True)
+            await self._reject(event, lane)
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            self.gate.release(lane, time.monotonic() - started)
+
+
+# 全局接入调度器实例（每个处理更新的进程一个）
+ingestion_gate = PriorityGate(INGESTION_CONFIG["max_concurrency"], INGESTION_CONFIG["lanes"])
@@ -14,6 +14,7 @@ from aiogram.types import Message, CallbackQuery, TelegramObject
 
 from database.db_logs import ActivityLogsDatabase
 from config import ADMIN_IDS
+from utils.metrics import BOT_REQUESTS, BOT_REQUEST_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -223,6 +224,8 @@ class LoggingMiddleware(BaseMiddleware):
         finally:
             # 计算处理时间
             processing_time = time.time() - start_time
+            BOT_REQUESTS.inc(event_type=event_details["event_type"])
+            BOT_REQUEST_SECONDS.observe(processing_time, event_type=event_details["event_type"])
             
             # 异步记录交互（不阻塞主流程）
             if user_info["user_id"]:
@@ -0,0 +1,26 @@
+"""
+用户资料缓存中间件
+把每个更新自带的 from_user 写入 services.profile_cache（纯内存操作，变更由缓存批量落库）
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.profile_cache import profile_cache
+
+
+class ProfileCacheMiddleware(BaseMiddleware):
+    """注册在 dp.update 的 outer middleware 上（依赖内置 UserContextMiddleware 填充 event_from_user）"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None:
+            profile_cache.remember(user)
+        return await handler(event, data)
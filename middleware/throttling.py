@@ -3,16 +3,15 @@
 防止用户频繁操作，避免触发Telegram API限制
 """
 
-import asyncio
 import logging
-import time
-from typing import Any, Awaitable, Callable, Dict, Optional
-from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
 
-from config import ADMIN_IDS
+from config import ADMIN_IDS, RATE_LIMIT_CONFIG
+from utils.metrics import BOT_THROTTLED
+from utils.rate_limiter import RateLimiter, rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +20,11 @@ class ThrottlingMiddleware(BaseMiddleware):
     限流中间件
     
     特性:
-    - 按用户ID限制操作频率
-    - 管理员免疫限流
+    - 按用户ID限制操作频率（令牌桶，见 utils.rate_limiter）
+    - 消息 / 回调分桶，创建订单等回调额外计入独立的动作桶
+    - 管理员使用更宽松的限额
     - 可配置的限流规则
-    - 自动清理过期记录
+    - 闲置状态按 LRU 淘汰，无需定期清理
     """
     
     def __init__(
@@ -32,7 +32,9 @@ class ThrottlingMiddleware(BaseMiddleware):
         default_rate: float = 1.0,  # 默认每秒允许的操作次数
         default_burst: int = 3,      # 默认突发请求数
         admin_rate: float = 10.0,    # 管理员限制（更宽松）
-        cleanup_interval: int = 300   # 清理间隔（秒）
+        cleanup_interval: int = 300,  # 兼容旧参数（LRU 淘汰后不再需要定期清理）
+        limiter: Optional[RateLimiter] = None,
+        callback_actions: Optional[Dict[str, str]] = None
     ):
         """
         初始化限流中间件
@@ -41,18 +43,17 @@ class ThrottlingMiddleware(BaseMiddleware):
             default_rate: 普通用户每秒允许的操作次数
             default_burst: 普通用户允许的突发请求数
             admin_rate: 管理员每秒允许的操作次数
-            cleanup_interval: 清理过期记录的间隔
+            cleanup_interval: 已废弃，保留以兼容旧调用
+            limiter: 限流器（默认使用全局 rate_limiter，可配置 SQLite 共享存储）
+            callback_actions: 回调数据前缀 -> 额外计入的动作桶（默认取 RATE_LIMIT_CONFIG）
         """
         self.default_rate = default_rate
         self.default_burst = default_burst
         self.admin_rate = admin_rate
-        self.cleanup_interval = cleanup_interval
-        
-        # 用户操作记录: {user_id: [timestamp1, timestamp2, ...]}
-        self.user_requests: Dict[int, list] = defaultdict(list)
-        
-        # 最后清理时间
-        self.last_cleanup = time.time()
+        self.limiter = limiter or rate_limiter
+        self.callback_actions = dict(
+            RATE_LIMIT_CONFIG.get("callback_actions", {}) if callback_actions is None else callback_actions
+        )
         
         # 自定义限流规则: {user_id: (rate, burst)}
         self.custom_rules: Dict[int, tuple] = {}
@@ -103,76 +104,48 @@ class ThrottlingMiddleware(BaseMiddleware):
             del self.custom_rules[user_id]
             logger.info(f"移除用户 {user_id} 的自定义限流规则")
     
-    def is_rate_limited(self, user_id: int) -> tuple[bool, Optional[float]]:
+    def resolve_actions(self, event: TelegramObject, user_id: int) -> List[Tuple[str, Optional[float], Optional[float]]]:
+        """
+        事件需要计入的动作桶
+        
+        Returns:
+            [(动作, rate, burst)]，rate/burst 为 None 时使用动作桶配置
+        """
+        rate, burst = self.get_user_limits(user_id)
+        if not isinstance(event, CallbackQuery):
+            return [('message', rate, burst)]
+        actions = [('callback', rate, burst)]
+        if user_id not in ADMIN_IDS:
+            data = event.data or ''
+            for prefix, action in self.callback_actions.items():
+                if data.startswith(prefix):
+                    actions.append((action, None, None))
+                    break
+        return actions
+    
+    def is_rate_limited(self, user_id: int, action: str = 'message') -> tuple[bool, Optional[float]]:
         """
-        检查用户是否被限流
+        检查用户是否被限流（进程内状态）
         
         Args:
             user_id: 用户ID
+            action: 动作桶
             
         Returns:
             (是否被限流, 建议等待时间)
         """
-        current_time = time.time()
         rate, burst = self.get_user_limits(user_id)
-        
-        # 获取用户请求记录
-        user_requests = self.user_requests[user_id]
-        
-        # 清理过期请求（超过1秒的请求）
-        cutoff_time = current_time - 1.0
-        user_requests[:] = [req_time for req_time in user_requests if req_time > cutoff_time]
-        
-        # 检查突发限制
-        if len(user_requests) >= burst:
-            # 计算需要等待的时间
-            oldest_request = min(user_requests)
-            wait_time = 1.0 - (current_time - oldest_request)
-            return True, max(0, wait_time)
-        
-        # 检查频率限制
-        if len(user_requests) > 0:
-            time_since_last = current_time - user_requests[-1]
-            min_interval = 1.0 / rate
-            
-            if time_since_last < min_interval:
-                wait_time = min_interval - time_since_last
+        allowed, wait_time = self.limiter.try_acquire(user_id, action, rate=rate, burst=burst)
+        return (False, None) if allowed else (True, wait_time)
+    
+    async def check_event(self, event: TelegramObject, user_id: int) -> tuple[bool, Optional[float]]:
+        """按事件的全部动作桶依次判定，任一桶不足即限流"""
+        for action, rate, burst in self.resolve_actions(event, user_id):
+            allowed, wait_time = await self.limiter.acquire(user_id, action, rate=rate, burst=burst)
+            if not allowed:
                 return True, wait_time
-        
-        # 记录此次请求
-        user_requests.append(current_time)
-        
         return False, None
     
-    def cleanup_old_records(self):
-        """清理过期的用户请求记录"""
-        current_time = time.time()
-        
-        # 只有达到清理间隔才执行
-        if current_time - self.last_cleanup < self.cleanup_interval:
-            return
-        
-        # 清理超过5分钟的记录
-        cutoff_time = current_time - 300
-        users_to_remove = []
-        
-        for user_id, requests in self.user_requests.items():
-            # 过滤掉过期请求
-            requests[:] = [req_time for req_time in requests if req_time > cutoff_time]
-            
-            # 如果用户没有任何请求记录，标记删除
-            if not requests:
-                users_to_remove.append(user_id)
-        
-        # 删除空记录
-        for user_id in users_to_remove:
-            del self.user_requests[user_id]
-        
-        self.last_cleanup = current_time
-        
-        if users_to_remove:
-            logger.debug(f"清理了 {len(users_to_remove)} 个过期用户记录")
-    
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -190,9 +163,6 @@ class ThrottlingMiddleware(BaseMiddleware):
         if user_id is None:
             return await handler(event, data)
         
-        # 定期清理过期记录
-        self.cleanup_old_records()
-        
         # 对媒体上传（photo/video/相册）放行，不进行限流，避免一次性发送多媒体被提示过快
         if isinstance(event, Message):
             try:
@@ -204,11 +174,12 @@ class ThrottlingMiddleware(BaseMiddleware):
                 pass
 
         # 检查限流
-        is_limited, wait_time = self.is_rate_limited(user_id)
+        is_limited, wait_time = await self.check_event(event, user_id)
         
         if is_limited:
             # 记录限流事件
             logger.warning(f"用户 {user_id} 被限流，建议等待 {wait_time:.2f}s")
+            BOT_THROTTLED.inc(event_type=type(event).__name__)
             
             # 根据事件类型回复限流消息
             if isinstance(event, Message):
@@ -245,23 +216,14 @@ class ThrottlingMiddleware(BaseMiddleware):
         Returns:
             统计信息字典
         """
-        current_time = time.time()
-        active_users = 0
-        total_requests = 0
-        
-        # 统计活跃用户和总请求数
-        for user_id, requests in self.user_requests.items():
-            if requests:
-                active_users += 1
-                total_requests += len(requests)
-        
+        limiter_stats = self.limiter.get_stats()
         return {
-            "active_users": active_users,
-            "total_requests": total_requests,
+            "active_users": limiter_stats["tracked_keys"],
+            "total_requests": limiter_stats["allowed"] + limiter_stats["limited"],
+            "limited_requests": limiter_stats["limited"],
             "custom_rules_count": len(self.custom_rules),
             "default_rate": self.default_rate,
             "default_burst": self.default_burst,
             "admin_rate": self.admin_rate,
-            "last_cleanup": self.last_cleanup,
-            "cleanup_interval": self.cleanup_interval
+            "shared_store": limiter_stats["shared_store"],
         }
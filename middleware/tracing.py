@@ -0,0 +1,144 @@
+"""
+追踪中间件
+为每个更新创建 trace，并记录中间件各阶段、处理器与 Bot API 调用的 span（见 utils.tracing）
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from utils.tracing import KIND_CLIENT, NOOP_SPAN, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    """根 span：注册在 dp.update 的 outer middleware 最前面，覆盖排队与全部处理时间"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not tracer.enabled or not isinstance(event, Update):
+            return await handler(event, data)
+
+        user = data.get("event_from_user")
+        root = tracer.start_trace(
+            "telegram.update",
+            **{
+                "update.id": event.update_id,
+                "update.type": event.event_type,
+                "user.id": user.id if user else 0,
+            }
+        )
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            root.set_error(e)
+            raise
+        finally:
+            tracer.finish_trace(root)
+
+
+class StageTracingMiddleware(BaseMiddleware):
+    """
+    包装一个中间件，记录其自身耗时（进入中间件到它调用下一环节为止，
+    不含后续中间件与处理器；中间件拦截未放行时即为全部耗时）
+    """
+
+    def __init__(self, inner: BaseMiddleware, stage: str):
+        self.inner = inner
+        self.stage = stage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not tracer.active():
+            return await self.inner(handler, event, data)
+
+        span = tracer.start_span(f"middleware.{self.stage}")
+
+        async def next_handler(next_event: TelegramObject, next_data: Dict[str, Any]) -> Any:
+            span.end()
+            return await handler(next_event, next_data)
+
+        try:
+            return await self.inner(next_handler, event, data)
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            span.set("middleware.passed", span.end_ns is not None)
+            span.end()
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    """命中的处理器名称（内层中间件才能取到 data["handler"]）"""
+    callback = getattr(data.get("handler"), "callback", None)
+    return getattr(callback, "__qualname__", None) or "unknown"
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """处理器 span：作为最内层中间件注册，记录命中的处理器名称"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not tracer.active():
+            return await handler(event, data)
+
+        with tracer.start_span("handler", **{"handler.name": handler_name(data)}):
+            return await handler(event, data)
+
+
+class BotApiTracingMiddleware(BaseRequestMiddleware):
+    """Bot API 请求 span（注册在 bot.session.middleware 上）"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Any,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        span = tracer.start_span(
+            f"bot_api.{method.__api_method__}", KIND_CLIENT,
+            **{"bot_api.method": method.__api_method__}
+        ) if tracer.active() else NOOP_SPAN
+        try:
+            response = await make_request(bot, method)
+            span.set("bot_api.status", "ok")
+            return response
+        except TelegramRetryAfter as e:
+            span.set("bot_api.status", "retry_after")
+            span.set("bot_api.retry_after", e.retry_after)
+            span.set_error(e)
+            raise
+        except TelegramAPIError as e:
+            span.set("bot_api.status", type(e).__name__)
+            span.set_error(e)
+            raise
+        except Exception as e:
+            span.set("bot_api.status", "network_error")
+            span.set_error(e)
+            raise
+        finally:
+            span.end()
+
+
+def traced(middleware: BaseMiddleware, stage: str) -> BaseMiddleware:
+    """为中间件加上阶段 span"""
+    return StageTracingMiddleware(middleware, stage)
@@ -7,15 +7,16 @@ APScheduler定时任务Worker
 独立Worker进程，与主ASGI应用解耦，提高系统稳定性和可靠性
 
 核心定时任务:
-1. 商家平均分计算 (每日3:00)
-2. 帖子自动发布 (每分钟)
-3. 服务到期处理 (每日1:00)
+1. 商家评分对账 (每日3:00，评分本身由触发器实时维护)
+2. 帖子自动发布 (发布时间线到点唤醒)
+3. 服务到期处理 (发布时间线到点唤醒)
 """
 
 import asyncio
 import logging
 import sys
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional, List
 
@@ -26,22 +27,29 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.jobstores.memory import MemoryJobStore
-from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_SUBMITTED
 
 # 项目数据库管理器导入
 from database.db_connection import db_manager
-from database.db_reviews import ReviewManager
 from database.db_orders import OrderManager
 from database.db_merchants import MerchantManager
 from database.db_system_config import system_config_manager
 from database.db_channels import posting_channels_db
 from database.db_scheduling import posting_time_slots_db
 from database.db_media import media_db
-from config import BOT_TOKEN
+from database.db_score_totals import score_totals_manager
+from database.db_logs import ActivityLogsDatabase
+from database.db_snapshot import analytics_snapshot
+from database.db_maintenance import db_maintenance
+from config import BOT_TOKEN, PUBLISH_TIMELINE_CONFIG
 import aiohttp
 from services.user_scores_service import user_scores_service
+from services.publish_timeline import publish_timeline
+from utils.metrics import SCHEDULER_JOB_RUNS, SCHEDULER_JOB_SECONDS, metrics
 
 # 配置日志
 logging.basicConfig(
@@ -58,7 +66,7 @@ class SchedulerWorker:
     """APScheduler调度器Worker
     
     负责执行所有定时任务，包括:
-    - 商家评分计算
+    - 商家评分对账
     - 帖子自动发布
     - 服务到期处理
     """
@@ -85,17 +93,27 @@ class SchedulerWorker:
             timezone='Asia/Shanghai'
         )
         
-        # 添加事件监听器
-        self.scheduler.add_listener(self._job_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        # 添加事件监听器（提交事件用于计算任务耗时）
+        self._job_started: dict = {}
+        self.scheduler.add_listener(
+            self._job_listener, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
+        )
         
-        # 动态时间槽调度相关
-        self._slot_job_ids = set()
+        # 发布/到期时间线：单个 date 任务始终指向堆顶的到期时间
         self._time_slot_signature = None
+        self._wakeup_at = None
 
         logger.info("APScheduler调度器Worker初始化完成")
     
     def _job_listener(self, event):
         """任务执行事件监听器"""
+        if event.code == EVENT_JOB_SUBMITTED:
+            self._job_started[event.job_id] = time.monotonic()
+            return
+        started = self._job_started.pop(event.job_id, None)
+        if started is not None:
+            SCHEDULER_JOB_SECONDS.observe(time.monotonic() - started, job=event.job_id)
+        SCHEDULER_JOB_RUNS.inc(job=event.job_id, status="error" if event.exception else "ok")
         if event.exception:
             logger.error(f"任务执行失败: {event.job_id}, 异常: {event.exception}")
         else:
@@ -103,95 +121,85 @@ class SchedulerWorker:
     
     async def update_all_merchant_scores(self):
         """
-        定时任务1: 更新所有商家的平均评分
+        定时任务1: 商家评分对账
         执行时间: 每日 3:00 AM
-        
-        逻辑:
-        1. 获取所有有评价的商家列表
-        2. 为每个商家计算各维度平均分
-        3. 更新merchant_scores表
-        4. 记录处理结果
+
+        评分由评价表触发器实时增量维护（merchant_score_totals → merchant_scores），
+        这里只做一次聚合比对，修正累计表中漂移的商家。
         """
         start_time = datetime.now()
-        logger.info("开始执行商家平均分计算任务")
-        
+        logger.info("开始执行商家评分对账任务")
+
         try:
-            # 1. 获取所有有评价的商家ID列表
-            query_merchants = """
-                SELECT DISTINCT merchant_id 
-                FROM reviews 
-                WHERE is_confirmed_by_admin = 1 AND is_active = 1 AND is_deleted = 0
-            """
-            
-            merchant_results = await db_manager.fetch_all(query_merchants)
-            merchant_ids = [row['merchant_id'] for row in merchant_results]
-            
-            if not merchant_ids:
-                logger.info("没有找到有评价的商家，跳过计算")
-                return
-            
-            logger.info(f"找到 {len(merchant_ids)} 个需要计算平均分的商家")
-            
-            # 2. 为每个商家计算并更新平均分
-            success_count = 0
-            error_count = 0
-            
-            for merchant_id in merchant_ids:
-                try:
-                    # 使用ReviewManager的方法计算并更新平均分
-                    if await ReviewManager.calculate_and_update_merchant_scores(merchant_id):
-                        success_count += 1
-                    else:
-                        error_count += 1
-                        logger.warning(f"商家 {merchant_id} 平均分计算失败")
-                        
-                except Exception as e:
-                    error_count += 1
-                    logger.error(f"商家 {merchant_id} 平均分计算异常: {e}")
-            
-            # 3. 记录处理结果
-            logger.info(f"商家平均分计算任务完成: 成功 {success_count}, 失败 {error_count}")
-            
-            # 4. 清理过期数据(可选)
-            # 可以在这里添加清理长时间未更新的merchant_scores记录的逻辑
-            
+            fixed = await score_totals_manager.reconcile('merchant')
+            if fixed:
+                logger.warning(f"商家评分对账完成: 修正 {fixed} 个商家")
+            else:
+                logger.info("商家评分对账完成: 无漂移")
+            await self._optimize_database()
         except Exception as e:
-            logger.error(f"商家平均分计算任务执行失败: {e}", exc_info=True)
+            logger.error(f"商家评分对账任务执行失败: {e}", exc_info=True)
             raise
         finally:
             execution_time = (datetime.now() - start_time).total_seconds()
-            logger.info(f"商家平均分计算任务执行完毕，耗时: {execution_time:.2f}秒")
+            logger.info(f"商家评分对账任务执行完毕，耗时: {execution_time:.2f}秒")
 
     async def update_all_user_scores(self):
-        """定时任务: 聚合 M2U 评分至 user_scores（每日3:05）。"""
+        """定时任务: 用户评分(user_scores)对账（每日3:05）。"""
         start_time = datetime.now()
-        logger.info("开始执行用户评分聚合任务(user_scores)")
+        logger.info("开始执行用户评分对账任务(user_scores)")
         try:
-            updated = await user_scores_service.recalculate_all_user_scores()
-            logger.info(f"user_scores 聚合完成：更新 {updated} 个用户")
+            fixed = await user_scores_service.reconcile_user_scores()
+            logger.info(f"user_scores 对账完成：修正 {fixed} 个用户")
+            await self._optimize_database()
         except Exception as e:
-            logger.error(f"用户评分聚合任务失败: {e}", exc_info=True)
+            logger.error(f"用户评分对账任务失败: {e}", exc_info=True)
         finally:
             execution_time = (datetime.now() - start_time).total_seconds()
-            logger.info(f"用户评分聚合任务执行完毕，耗时: {execution_time:.2f}秒")
+            logger.info(f"用户评分对账任务执行完毕，耗时: {execution_time:.2f}秒")
 
-    async def build_user_leaderboards(self):
-        """定时任务: 生成排行榜缓存（每日3:10）。"""
-        start_time = datetime.now()
-        logger.info("开始执行用户排行榜生成任务")
+    async def cleanup_activity_logs(self):
+        """定时任务: 活动日志保留期清理（每日4:30，过期月分区归档后整表删除）。"""
         try:
-            res = await user_scores_service.build_leaderboards(min_reviews=6)
-            logger.info(f"用户排行榜生成完成：{res}")
+            removed = await ActivityLogsDatabase.cleanup_old_logs()
+            logger.info(f"活动日志清理完成：归档并删除 {removed} 条")
+            await self._optimize_database()
         except Exception as e:
-            logger.error(f"用户排行榜生成失败: {e}", exc_info=True)
-        finally:
-            execution_time = (datetime.now() - start_time).total_seconds()
-            logger.info(f"用户排行榜生成任务执行完毕，耗时: {execution_time:.2f}秒")
-    
+            logger.error(f"活动日志清理任务失败: {e}", exc_info=True)
+
+    async def _optimize_database(self):
+        """批量任务结束后更新查询规划统计（PRAGMA optimize），失败不影响任务结果"""
+        try:
+            await db_maintenance.optimize()
+        except Exception as e:
+            logger.warning(f"PRAGMA optimize 失败: {e}")
+
+    async def run_db_maintenance(self):
+        """定时任务: 数据库维护（按 WAL 大小执行检查点，静默时段内增量 VACUUM）。"""
+        result = await db_maintenance.run_cycle()
+        if not result:
+            return
+        # 主库与各城市分片逐个维护，分别记录
+        for name, item in [('主库', result)] + list(result.get('shards', {}).items()):
+            if item.get('checkpoint') or item.get('vacuumed'):
+                stats = item['stats']
+                logger.info(
+                    f"数据库维护: 检查点 {item['checkpoint'] or '-'}，回收 {item['vacuumed']} 页，"
+                    f"{name} {stats['db_bytes'] // 1024}KB，WAL {stats['wal_bytes'] // 1024}KB"
+                )
+
+    async def refresh_analytics_snapshot(self):
+        """定时任务: 刷新后台报表读取的分析只读快照（在线备份，不阻塞写入）。"""
+        try:
+            await analytics_snapshot.refresh()
+        except Exception as e:
+            logger.error(f"分析快照刷新失败: {e}", exc_info=True)
+            raise
+
     async def publish_pending_posts(self):
         """
         定时任务2: 发布待发布的帖子
-        执行时间: 每分钟
+        执行时间: 发布时间线到点唤醒（run_due_events）
         
         逻辑:
         1. 查询状态为'approved'且publish_time <= 当前时间的帖子
@@ -452,7 +460,7 @@ class SchedulerWorker:
     async def handle_expired_services(self):
         """
         定时任务3: 处理到期的服务
-        执行时间: 每日 1:00 AM
+        执行时间: 发布时间线到点唤醒（run_due_events）
         
         逻辑:
         1. 查询到期的商家服务(expiration_time <= 当前时间)
@@ -535,6 +543,8 @@ class SchedulerWorker:
                                     async with aiohttp.ClientSession() as session:
                                         async with session.post(api_url, json={'chat_id': chat_id_val, 'message_id': message_id_val}, timeout=aiohttp.ClientTimeout(total=15)) as resp:
                                             _ = await resp.json()
+                        except Exception as _e:
+                            logger.warning(f"删除频道帖子失败: {_e}")
                         
                         # 3. 可选：发送到期通知
                         # 这里可以根据系统配置决定是否发送通知
@@ -637,49 +647,63 @@ class SchedulerWorker:
         """注册所有定时任务到调度器"""
         logger.info("开始注册定时任务")
         
-        # 任务1: 商家平均分计算 - 每日3:00
+        # 任务1: 商家评分对账 - 每日3:00
         self.scheduler.add_job(
             func=self.update_all_merchant_scores,
             trigger=CronTrigger(hour=3, minute=0),
             id='update_merchant_scores',
-            name='更新商家平均评分',
+            name='商家评分对账',
             replace_existing=True
         )
-        logger.info("已注册任务: 商家平均分计算 (每日3:00)")
+        logger.info("已注册任务: 商家评分对账 (每日3:00)")
         
-        # 任务2: 帖子自动发布 - 按时间槽动态注册（在 start() 中首次加载，并定时热更新）
-        # 注意：这里不再固定每分钟触发，改为读取DB的 posting_time_slots
-        logger.info("帖子自动发布将按‘时间槽配置’动态注册")
-
-        # 任务3: 服务到期处理 - 每日1:00
-        self.scheduler.add_job(
-            func=self.handle_expired_services,
-            trigger=CronTrigger(hour=1, minute=0),
-            id='handle_expired_services',
-            name='服务到期处理',
-            replace_existing=True
-        )
-        logger.info("已注册任务: 服务到期处理 (每日1:00)")
+        # 任务2/3: 帖子自动发布与服务到期处理 - 由发布时间线在到点时唤醒（在 start() 中加载）
+        logger.info("帖子自动发布/服务到期处理将按‘发布时间线’精确唤醒")
 
         # 任务4: 用户评分聚合 - 每日3:05
         self.scheduler.add_job(
             func=self.update_all_user_scores,
             trigger=CronTrigger(hour=3, minute=5),
             id='update_user_scores',
-            name='聚合用户M2U评分(user_scores)',
+            name='用户M2U评分对账(user_scores)',
             replace_existing=True
         )
-        logger.info("已注册任务: 用户评分聚合 (每日3:05)")
+        logger.info("已注册任务: 用户评分对账 (每日3:05)")
 
-        # 任务5: 用户排行榜缓存 - 每日3:10
+        # 任务5: 活动日志分区归档与删除 - 每日4:30
         self.scheduler.add_job(
-            func=self.build_user_leaderboards,
-            trigger=CronTrigger(hour=3, minute=10),
-            id='build_user_leaderboards',
-            name='生成用户排行榜缓存',
+            func=self.cleanup_activity_logs,
+            trigger=CronTrigger(hour=4, minute=30),
+            id='cleanup_activity_logs',
+            name='活动日志分区归档',
             replace_existing=True
         )
-        logger.info("已注册任务: 用户排行榜缓存 (每日3:10)")
+        logger.info("已注册任务: 活动日志分区归档 (每日4:30)")
+
+        # 任务6: 分析只读快照 - 按间隔刷新，启动时立即生成一次
+        if analytics_snapshot.enabled:
+            self.scheduler.add_job(
+                func=self.refresh_analytics_snapshot,
+                trigger=IntervalTrigger(seconds=analytics_snapshot.interval),
+                id='refresh_analytics_snapshot',
+                name='分析只读快照',
+                next_run_time=datetime.now(),
+                replace_existing=True
+            )
+            logger.info(f"已注册任务: 分析只读快照 (每{analytics_snapshot.interval}秒)")
+
+        # 任务7: 数据库维护 - WAL 检查点 / 增量 VACUUM
+        if db_maintenance.enabled:
+            self.scheduler.add_job(
+                func=self.run_db_maintenance,
+                trigger=IntervalTrigger(seconds=db_maintenance.check_interval),
+                id='db_maintenance',
+                name='数据库维护',
+                replace_existing=True
+            )
+            logger.info(f"已注册任务: 数据库维护 (每{db_maintenance.check_interval}秒)")
+
+        # 用户排行榜由 services.live_leaderboard 实时维护，不再定时重建
         
         logger.info("所有定时任务注册完成")
 
@@ -713,41 +737,82 @@ class SchedulerWorker:
         except Exception:
             return ''
 
-    def _clear_slot_jobs(self):
-        for jid in list(self._slot_job_ids):
-            try:
-                self.scheduler.remove_job(jid)
-            except Exception:
-                pass
-        self._slot_job_ids.clear()
+    def _reschedule_wakeup(self):
+        """时间线堆顶变化时，把唯一的唤醒任务重排到下一个到期时间"""
+        next_due = publish_timeline.next_due()
+        if next_due is None:
+            if self._wakeup_at is not None:
+                try:
+                    self.scheduler.remove_job('timeline_wakeup')
+                except JobLookupError:
+                    pass
+                self._wakeup_at = None
+            return
+        run_at = max(next_due, datetime.now().replace(microsecond=0))
+        if run_at == self._wakeup_at and self.scheduler.get_job('timeline_wakeup'):
+            return
+        self.scheduler.add_job(
+            func=self.run_due_events,
+            trigger=DateTrigger(run_date=run_at.astimezone()),
+            id='timeline_wakeup',
+            name='发布/到期时间线唤醒',
+            replace_existing=True,
+            misfire_grace_time=None,
+            coalesce=True
+        )
+        self._wakeup_at = run_at
+        logger.debug(f"时间线下次唤醒: {run_at}")
+
+    async def run_due_events(self):
+        """到点执行：取出所有已到期条目，分别触发发布与到期处理"""
+        self._wakeup_at = None
+        now = datetime.now()
+        due = publish_timeline.pop_due(now)
+        try:
+            if not due:
+                return
+            publish_ids = sorted({mid for kind, mid in due if kind == 'publish'})
+            expire_ids = sorted({mid for kind, mid in due if kind == 'expire'})
+            logger.info(f"时间线到点: 发布 {publish_ids}, 到期 {expire_ids}")
 
-    def _schedule_slot_jobs(self, slots: list[tuple[int, int]]):
-        for hour, minute in slots:
-            job_id = f"publish_posts_{hour:02d}{minute:02d}"
-            try:
-                self.scheduler.add_job(
-                    func=self.publish_pending_posts,
-                    trigger=CronTrigger(hour=hour, minute=minute),
-                    id=job_id,
-                    name=f"帖子自动发布 {hour:02d}:{minute:02d}",
-                    replace_existing=True
-                )
-                self._slot_job_ids.add(job_id)
-                logger.info(f"已注册时间槽任务: {hour:02d}:{minute:02d}")
-            except Exception as e:
-                logger.error(f"注册时间槽任务失败 {hour:02d}:{minute:02d}: {e}")
+            if publish_ids:
+                try:
+                    await self.publish_pending_posts()
+                except Exception as e:
+                    logger.error(f"时间线触发发布失败: {e}")
+            if expire_ids:
+                try:
+                    await self.handle_expired_services()
+                except Exception as e:
+                    logger.error(f"时间线触发到期处理失败: {e}")
+
+            # 重新计算涉及的商户；处理后仍到期的（发布失败/跳过）延后重试
+            retry_at = datetime.now() + timedelta(seconds=PUBLISH_TIMELINE_CONFIG["retry_delay"])
+            for mid in set(publish_ids) | set(expire_ids):
+                await publish_timeline.refresh_merchant(mid)
+            for key in due:
+                due_at = publish_timeline.timeline.get(key)
+                if due_at is not None and due_at <= datetime.now():
+                    publish_timeline.defer(key, retry_at)
+        finally:
+            self._reschedule_wakeup()
 
-    async def refresh_time_slot_jobs(self):
-        """热更新时间槽任务：当DB配置变化时，重载Cron任务"""
+    async def reconcile_timeline(self):
+        """低频对账：重新读取时间槽与 merchants，修正通知遗漏（如其它进程的写入）"""
         slots = await self._load_active_time_slots()
         signature = self._compute_slots_signature(slots)
         if signature != self._time_slot_signature:
-            logger.info(f"检测到时间槽变更，重载任务: {self._time_slot_signature} -> {signature}")
-            self._clear_slot_jobs()
-            self._schedule_slot_jobs(slots)
+            logger.info(f"时间槽配置: {self._time_slot_signature} -> {signature}")
             self._time_slot_signature = signature
-        else:
-            logger.debug("时间槽未变化，无需重载")
+        count = await publish_timeline.reload(slots)
+        await publish_timeline.prune_changes()
+        logger.debug(f"发布时间线对账完成: {count} 个条目，下次唤醒 {publish_timeline.next_due()}")
+
+    async def poll_timeline_changes(self):
+        """轮询其它进程写入的商户发布/到期变更信号"""
+        refreshed = await publish_timeline.poll_changes()
+        if refreshed:
+            logger.debug(f"发布时间线变更信号: 刷新 {refreshed} 个商户，下次唤醒 {publish_timeline.next_due()}")
     
     async def start(self):
         """启动调度器Worker"""
@@ -762,25 +827,39 @@ class SchedulerWorker:
             # 注册定时任务（静态任务）
             self.register_jobs()
             
-            # 首次加载“时间槽”并注册动态任务
-            await self.refresh_time_slot_jobs()
+            # 加载发布时间线，并接收本进程内的变更通知
+            publish_timeline.attach(self._reschedule_wakeup)
+            await self.reconcile_timeline()
 
-            # 定时刷新时间槽配置，支持热更新（每60秒检查一次）
+            # 变更信号轮询（其它进程的写入）与低频对账（兜底遗漏）
             try:
+                interval = PUBLISH_TIMELINE_CONFIG["reconcile_interval"]
                 self.scheduler.add_job(
-                    func=self.refresh_time_slot_jobs,
-                    trigger=IntervalTrigger(seconds=60),
-                    id='refresh_time_slot_jobs',
-                    name='刷新时间槽配置',
+                    func=self.reconcile_timeline,
+                    trigger=IntervalTrigger(seconds=interval),
+                    id='reconcile_timeline',
+                    name='发布时间线对账',
                     replace_existing=True
                 )
-                logger.info("已注册时间槽热更新任务 (每60秒)")
+                logger.info(f"已注册发布时间线对账任务 (每{interval}秒)")
+                poll_interval = PUBLISH_TIMELINE_CONFIG["change_poll_interval"]
+                self.scheduler.add_job(
+                    func=self.poll_timeline_changes,
+                    trigger=IntervalTrigger(seconds=poll_interval),
+                    id='poll_timeline_changes',
+                    name='发布时间线变更信号轮询',
+                    replace_existing=True,
+                    coalesce=True,
+                    max_instances=1
+                )
+                logger.info(f"已注册发布时间线变更信号轮询任务 (每{poll_interval}秒)")
             except Exception as e:
-                logger.error(f"注册时间槽热更新任务失败: {e}")
+                logger.error(f"注册发布时间线对账任务失败: {e}")
             
             # 启动调度器
             self.scheduler.start()
             logger.info("APScheduler调度器启动成功")
+            metrics.start_exporter("scheduler")
             logger.info(f"已注册 {len(self.scheduler.get_jobs())} 个定时任务")
             
             # 显示已注册的任务
@@ -798,6 +877,8 @@ class SchedulerWorker:
         logger.info("停止APScheduler调度器Worker")
         
         try:
+            publish_timeline.detach()
+
             # 关闭调度器
             if self.scheduler.running:
                 self.scheduler.shutdown(wait=True)
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+用户评分实时排行榜（内存排序结构）
+
+使用方式：
+    from services.live_leaderboard import live_leaderboard
+    top = await live_leaderboard.top('length', 50)
+    me = await live_leaderboard.rank('length', user_id)
+    near = await live_leaderboard.around('length', user_id, 3)
+
+说明：
+- 每个维度一个有序列表，键为 (-均分, -次数, -更新时间, user_id)，与原先
+  "分数降序、次数降序、更新时间降序" 的排序口径一致；名次为竞赛排名（同分同名次）。
+- 首次读取时从 user_scores 全量加载，之后按 user_scores.updated_at 水位增量同步：
+  本进程写评价后立即同步（notify_changed），其它进程（Web/调度器）的写入在
+  读取时按 sync_interval 节流拉取。
+- user_score_leaderboards 只作为持久化快照：变更后延迟 persist_delay 秒，
+  仅写入名次/分数有变化的行，供工具脚本等直接查表的场景使用。
+  只有调用过 enable_persist() 的进程（机器人主进程）写快照，Web/调度器/分片 worker 只读，
+  避免多个进程各自整表重写同一张表。
+"""
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import LEADERBOARD_CONFIG
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+DIM_COLUMNS = {
+    'attack_quality': 'avg_attack_quality',
+    'length': 'avg_length',
+    'hardness': 'avg_hardness',
+    'duration': 'avg_duration',
+    'user_temperament': 'avg_user_temperament',
+}
+
+
+def _to_timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RankedBoard:
+    """单维度有序榜：二分查找定位，O(log n) 查询名次"""
+
+    def __init__(self):
+        self._keys: List[Tuple[float, int, float, int]] = []
+        self._by_user: Dict[int, Tuple[float, int, float, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._by_user
+
+    def upsert(self, user_id: int, score: float, count: int, ts: float) -> bool:
+        key = (-round(float(score), 2), -int(count), -ts, int(user_id))
+        old = self._by_user.get(user_id)
+        if old == key:
+            return False
+        if old is not None:
+            self._keys.pop(bisect_left(self._keys, old))
+        insort(self._keys, key)
+        self._by_user[user_id] = key
+        return True
+
+    def remove(self, user_id: int) -> bool:
+        old = self._by_user.pop(user_id, None)
+        if old is None:
+            return False
+        self._keys.pop(bisect_left(self._keys, old))
+        return True
+
+    def clear(self) -> None:
+        self._keys.clear()
+        self._by_user.clear()
+
+    def _entry(self, index: int) -> Dict[str, Any]:
+        key = self._keys[index]
+        # 竞赛排名：同分取该分数第一次出现的位置
+        rank = bisect_left(self._keys, (key[0],)) + 1
+        return {'user_id': key[3], 'avg_score': -key[0], 'reviews_count': -key[1], 'rank': rank}
+
+    def rank_of(self, user_id: int) -> Optional[Dict[str, Any]]:
+        key = self._by_user.get(user_id)
+        if key is None:
+            return None
+        return self._entry(bisect_left(self._keys, key))
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return [self._entry(i) for i in range(min(limit, len(self._keys)))]
+
+    def around(self, user_id: int, radius: int) -> List[Dict[str, Any]]:
+        key = self._by_user.get(user_id)
+        if key is None:
+            return []
+        idx = bisect_left(self._keys, key)
+        start = max(0, idx - radius)
+        end = min(len(self._keys), idx + radius + 1)
+        return [self._entry(i) for i in range(start, end)]
+
+    def snapshot(self) -> Dict[int, Tuple[int, float, int]]:
+        """user_id -> (rank, avg_score, reviews_count)"""
+        result = {}
+        rank = 0
+        last_score = None
+        for idx, key in enumerate(self._keys, start=1):
+            if last_score is None or key[0] != last_score:
+                rank = idx
+            last_score = key[0]
+            result[key[3]] = (rank, -key[0], -key[1])
+        return result
+
+
+class LiveLeaderboard:
+    """五个维度的实时排行榜"""
+
+    def __init__(self, min_reviews: int = None, sync_interval: float = None, persist_delay: float = None):
+        self.min_reviews = int(min_reviews if min_reviews is not None else LEADERBOARD_CONFIG['min_reviews'])
+        self.sync_interval = float(sync_interval if sync_interval is not None else LEADERBOARD_CONFIG['sync_interval'])
+        self.persist_delay = float(persist_delay if persist_delay is not None else LEADERBOARD_CONFIG['persist_delay'])
+        self._boards: Dict[str, RankedBoard] = {dim: RankedBoard() for dim in DIM_COLUMNS}
+        self._persisted: Dict[str, Dict[int, Tuple[int, float, int]]] = {dim: {} for dim in DIM_COLUMNS}
+        self._loaded = False
+        self._watermark: Optional[str] = None
+        self._last_sync = 0.0
+        self._lock = asyncio.Lock()
+        # 后台延迟持久化与显式 persist() 可能并发，串行执行以免较早的快照后写入覆盖
+        self._persist_lock = asyncio.Lock()
+        self._dirty: set = set()
+        self._full_persist = True
+        self._persist_enabled = False
+        self._persist_task: Optional[asyncio.Task] = None
+
+    # ---------- 读取 ---------- #
+
+    def _board(self, dimension: str) -> RankedBoard:
+        board = self._boards.get(dimension)
+        if board is None:
+            raise ValueError(f"未知的排行榜维度: {dimension}")
+        return board
+
+    async def top(self, dimension: str, limit: int = 50) -> List[Dict[str, Any]]:
+        board = self._board(dimension)
+        await self._maybe_sync()
+        return board.top(limit)
+
+    async def rank(self, dimension: str, user_id: int) -> Optional[Dict[str, Any]]:
+        board = self._board(dimension)
+        await self._maybe_sync()
+        return board.rank_of(int(user_id))
+
+    async def around(self, dimension: str, user_id: int, radius: int = 3) -> List[Dict[str, Any]]:
+        board = self._board(dimension)
+        await self._maybe_sync()
+        return board.around(int(user_id), radius)
+
+    async def ranks_for_user(self, user_id: int) -> List[Dict[str, Any]]:
+        """用户在各维度的名次（未上榜的维度不返回）"""
+        await self._maybe_sync()
+        result = []
+        for dim, board in self._boards.items():
+            entry = board.rank_of(int(user_id))
+            if entry:
+                result.append({'dimension': dim, **entry})
+        return result
+
+    def size(self, dimension: str) -> int:
+        return len(self._board(dimension))
+
+    # ---------- 同步 ---------- #
+
+    def notify_changed(self) -> None:
+        """本进程写入评价后调用：下一次读取前立即同步，并后台拉取变更"""
+        self._last_sync = 0.0
+        from services.task_queue import enqueue_task
+        enqueue_task(self.sync)
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            rows = await db_manager.fetch_all("SELECT * FROM user_scores")
+            for board in self._boards.values():
+                board.clear()
+            # 表中可能残留旧进程写入的行，加载后的首次持久化按维度整表重写
+            self._full_persist = True
+            self._apply_rows(rows or [])
+            self._loaded = True
+            self._last_sync = time.monotonic()
+            logger.info(f"实时排行榜加载完成：{len(rows or [])} 个用户，水位 {self._watermark}")
+
+    async def sync(self) -> int:
+        """按 updated_at 水位拉取 user_scores 的变更行，返回名次有变化的用户数"""
+        if not self._loaded:
+            await self.ensure_loaded()
+            return 0
+        async with self._lock:
+            if self._watermark is None:
+                rows = await db_manager.fetch_all("SELECT * FROM user_scores")
+            else:
+                # 同一秒内可能还有后续写入，用 >= 重新拉取边界行（应用是幂等的）
+                rows = await db_manager.fetch_all(
+                    "SELECT * FROM user_scores WHERE updated_at >= ?", (self._watermark,)
+                )
+            changed = self._apply_rows(rows or [])
+            self._last_sync = time.monotonic()
+        return changed
+
+    async def rebuild(self, min_reviews: int = None) -> Dict[str, int]:
+        """丢弃内存状态，从 user_scores 重新加载并完整写入持久化表。返回各维度人数。"""
+        if min_reviews is not None:
+            self.min_reviews = int(min_reviews)
+        async with self._lock:
+            self._loaded = False
+            self._watermark = None
+        await self.ensure_loaded()
+        await self.persist(full=True)
+        return {dim: len(board) for dim, board in self._boards.items()}
+
+    async def _maybe_sync(self) -> None:
+        if not self._loaded:
+            await self.ensure_loaded()
+        elif time.monotonic() - self._last_sync >= self.sync_interval:
+            await self.sync()
+
+    def _apply_rows(self, rows: Iterable[Any]) -> int:
+        changed = 0
+        for row in rows:
+            d = dict(row)
+            user_id = int(d['user_id'])
+            count = int(d.get('total_reviews_count') or 0)
+            ts = _to_timestamp(d.get('updated_at'))
+            row_changed = False
+            for dim, col in DIM_COLUMNS.items():
+                board = self._boards[dim]
+                score = d.get(col)
+                if count >= self.min_reviews and score is not None:
+                    moved = board.upsert(user_id, float(score), count, ts)
+                else:
+                    moved = board.remove(user_id)
+                if moved:
+                    self._dirty.add(dim)
+                    row_changed = True
+            updated_at = d.get('updated_at')
+            if updated_at is not None and (self._watermark is None or str(updated_at) > self._watermark):
+                self._watermark = str(updated_at)
+            changed += int(row_changed)
+        if self._dirty or self._full_persist:
+            self._schedule_persist()
+        return changed
+
+    # ---------- 持久化 ---------- #
+
+    def enable_persist(self) -> None:
+        """由负责写快照的进程（机器人主进程）调用；其它进程的榜单变更不写库"""
+        self._persist_enabled = True
+        if self._loaded and (self._dirty or self._full_persist):
+            self._schedule_persist()
+
+    def _schedule_persist(self) -> None:
+        if not self._persist_enabled:
+            return
+        if self._persist_task and not self._persist_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._persist_task = loop.create_task(self._persist_later())
+
+    async def _persist_later(self) -> None:
+        await asyncio.sleep(self.persist_delay)
+        try:
+            await self.persist()
+        except Exception as e:
+            logger.error(f"排行榜持久化失败: {e}")
+
+    async def persist(self, full: bool = False) -> int:
+        """
+        把内存榜单写入 user_score_leaderboards（只写有变化的行）
+
+        Args:
+            full: True 时按维度清空后整表写入（重建/首次落库用）
+
+        Returns:
+            写入/删除的行数
+        """
+        async with self._persist_lock:
+            full = full or self._full_persist
+            dims = list(DIM_COLUMNS) if full else [d for d in DIM_COLUMNS if d in self._dirty]
+            self._dirty.difference_update(dims)
+            if not dims:
+                return 0
+
+            now = datetime.now()
+            queries = []
+            new_snapshots = {}
+            for dim in dims:
+                snap = self._boards[dim].snapshot()
+                old = {} if full else self._persisted[dim]
+                if full:
+                    queries.append(("DELETE FROM user_score_leaderboards WHERE dimension=?", (dim,)))
+                for user_id in old.keys() - snap.keys():
+                    queries.append((
+                        "DELETE FROM user_score_leaderboards WHERE dimension=? AND user_id=?", (dim, user_id)
+                    ))
+                for user_id, (rank, score, count) in snap.items():
+                    if old.get(user_id) == (rank, score, count):
+                        continue
+                    queries.append((
+                        """
+                        INSERT OR REPLACE INTO user_score_leaderboards
+                        (dimension, user_id, avg_score, reviews_count, rank, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (dim, user_id, score, count, rank, now)
+                    ))
+                new_snapshots[dim] = snap
+
+            if queries and not await db_manager.execute_transaction(queries):
+                self._dirty.update(dims)
+                raise RuntimeError("user_score_leaderboards 写入失败")
+            self._persisted.update(new_snapshots)
+            if full:
+                self._full_persist = False
+            if queries:
+                logger.debug(f"排行榜持久化：{len(queries)} 行，维度 {dims}")
+            return len(queries)
+
+
+live_leaderboard = LiveLeaderboard()
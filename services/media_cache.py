@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+媒体缓存层：为 /media-proxy 提供 file_path 缓存与本地磁盘内容缓存。
+
+使用方式：
+    from services.media_cache import media_cache
+    cached = await media_cache.get(telegram_file_id)
+    # cached.path 为本地文件路径，可直接交给 FileResponse（零拷贝 + Range）
+
+特性：
+    - file_id → (file_path, file_unique_id) 映射带 TTL（Telegram 下载链接至少保证 1 小时有效）
+    - 下载内容按 file_unique_id 落盘，目录总大小受限，按 LRU 淘汰
+    - 同一 file_id 的并发请求合并为一次 getFile + 下载
+    - 复用单个 aiohttp.ClientSession，下载流式写盘，不在内存中整体缓冲
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import BOT_TOKEN, MEDIA_CACHE_CONFIG
+from pathmanager import PathManager
+from utils.metrics import CACHE_REQUESTS
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# 根据扩展名推断 MIME
+MIME_MAP = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png',
+    '.gif': 'image/gif', '.webp': 'image/webp', '.mp4': 'video/mp4'
+}
+
+
+@dataclass
+class CachedMedia:
+    """已落盘的媒体文件信息"""
+    path: str
+    unique_id: str
+    media_type: str
+    size: int
+
+    @property
+    def etag(self) -> str:
+        # file_unique_id 对同一文件恒定，天然适合作为强 ETag
+        return f'"{self.unique_id}"'
+
+
+class MediaCache:
+    """Telegram 媒体的两级缓存（file_path 映射 + 磁盘内容 LRU）"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        file_path_ttl: Optional[int] = None,
+    ):
+        self.cache_dir = Path(cache_dir or os.path.join(PathManager.get_cache_directory(), "media"))
+        self.max_bytes = max_bytes if max_bytes is not None else MEDIA_CACHE_CONFIG["max_bytes"]
+        self.file_path_ttl = file_path_ttl if file_path_ttl is not None else MEDIA_CACHE_CONFIG["file_path_ttl"]
+
+        # file_id -> (file_path, file_unique_id, expires_at)
+        self._file_paths: Dict[str, Tuple[str, str, float]] = {}
+        # 文件名 -> 字节数；顺序即 LRU 顺序（末尾为最近使用）
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._index_loaded = False
+        # file_id -> 进行中的获取任务（并发请求合并）
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._session = None
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    async def get(self, file_id: str) -> CachedMedia:
+        """
+        获取媒体的本地缓存文件，必要时从 Telegram 下载。
+
+        Args:
+            file_id: Telegram file_id
+
+        Returns:
+            CachedMedia 本地文件信息
+        """
+        self._ensure_index()
+
+        resolved = self._file_paths.get(file_id)
+        if resolved and resolved[2] > time.time():
+            cached = self._lookup(resolved[1], resolved[0])
+            if cached:
+                self.stats["hits"] += 1
+                tracer.add_event("cache.hit", cache="media")
+                CACHE_REQUESTS.inc(cache="media", result="hit")
+                return cached
+
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(file_id))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda _t, fid=file_id: self._inflight.pop(fid, None))
+        # shield：单个请求被取消时不影响其他等待同一文件的请求
+        return await asyncio.shield(task)
+
+    async def close(self) -> None:
+        """关闭共享的 HTTP 会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_stats(self) -> Dict[str, int]:
+        """返回缓存统计"""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+
+    async def _fetch(self, file_id: str) -> CachedMedia:
+        file_path, unique_id = await self._resolve_file_path(file_id)
+        self._file_paths[file_id] = (file_path, unique_id, time.time() + self.file_path_ttl)
+
+        cached = self._lookup(unique_id, file_path)
+        if cached:
+            self.stats["hits"] += 1
+            tracer.add_event("cache.hit", cache="media")
+            CACHE_REQUESTS.inc(cache="media", result="hit")
+            return cached
+
+        self.stats["misses"] += 1
+        tracer.add_event("cache.miss", cache="media")
+        CACHE_REQUESTS.inc(cache="media", result="miss")
+        filename = self._filename(unique_id, file_path)
+        dest = self.cache_dir / filename
+        tmp = dest.with_suffix(dest.suffix + ".part")
+        try:
+            await self._download(file_path, tmp)
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink(missing_ok=True)
+
+        size = dest.stat().st_size
+        self._entries[filename] = size
+        self._total_bytes += size
+        self._evict()
+        return CachedMedia(str(dest), unique_id, self._guess_type(file_path), size)
+
+    async def _get_session(self):
+        import aiohttp
+        if self._session is None or self._session.closed:
+            # 允许走系统代理（trust_env=True）
+            self._session = aiohttp.ClientSession(trust_env=True)
+        return self._session
+
+    @staticmethod
+    def _proxy_kwargs(total_timeout: int) -> dict:
+        import aiohttp
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=total_timeout)}
+        proxy_url = os.getenv('TG_PROXY') or os.getenv('HTTPS_PROXY') or os.getenv('HTTP_PROXY')
+        if proxy_url:
+            kwargs["proxy"] = proxy_url
+        return kwargs
+
+    async def _resolve_file_path(self, file_id: str) -> Tuple[str, str]:
+        """调用 getFile，返回 (file_path, file_unique_id)"""
+        session = await self._get_session()
+        api_base = f"https://api.telegram.org/bot{BOT_TOKEN}"
+        async with session.get(f"{api_base}/getFile", params={"file_id": file_id}, **self._proxy_kwargs(15)) as r:
+            data = await r.json()
+            if not data.get('ok'):
+                raise RuntimeError(f"getFile失败: {data}")
+            result = data['result']
+            return result['file_path'], result.get('file_unique_id') or file_id
+
+    async def _download(self, file_path: str, dest: Path) -> None:
+        """流式下载文件到 dest"""
+        session = await self._get_session()
+        file_base = f"https://api.telegram.org/file/bot{BOT_TOKEN}"
+        async with session.get(f"{file_base}/{file_path}", **self._proxy_kwargs(60)) as rf:
+            if rf.status != 200:
+                raise RuntimeError(f"下载文件失败: HTTP {rf.status}")
+            with open(dest, 'wb') as f:
+                async for chunk in rf.content.iter_chunked(64 * 1024):
+                    f.write(chunk)
+
+    def _ensure_index(self) -> None:
+        """首次使用时扫描缓存目录，按 mtime 重建 LRU 顺序"""
+        if self._index_loaded:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for p in self.cache_dir.iterdir():
+            if not p.is_file():
+                continue
+            if p.suffix == ".part":
+                p.unlink(missing_ok=True)
+                continue
+            st = p.stat()
+            files.append((st.st_mtime, p.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._index_loaded = True
+        self._evict()
+
+    def _lookup(self, unique_id: str, file_path: str) -> Optional[CachedMedia]:
+        filename = self._filename(unique_id, file_path)
+        size = self._entries.get(filename)
+        if size is None:
+            return None
+        path = self.cache_dir / filename
+        if not path.exists():
+            self._forget(filename)
+            return None
+        self._entries.move_to_end(filename)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return CachedMedia(str(path), unique_id, self._guess_type(file_path), size)
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            filename = next(iter(self._entries))
+            self._forget(filename)
+            (self.cache_dir / filename).unlink(missing_ok=True)
+            self.stats["evictions"] += 1
+            logger.debug(f"媒体缓存淘汰: {filename}")
+
+    def _forget(self, filename: str) -> None:
+        size = self._entries.pop(filename, 0)
+        self._total_bytes -= size
+
+    @staticmethod
+    def _filename(unique_id: str, file_path: str) -> str:
+        ext = os.path.splitext(file_path)[1].lower()
+        safe_id = "".join(c for c in unique_id if c.isalnum() or c in "-_")
+        return f"{safe_id}{ext}"
+
+    @staticmethod
+    def _guess_type(file_path: str) -> str:
+        ext = os.path.splitext(file_path)[1].lower()
+        return MIME_MAP.get(ext, 'application/octet-stream')
+
+
+# 全局实例
+media_cache = MediaCache()
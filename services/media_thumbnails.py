@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+商户媒体缩略图/封面帧生成流水线。
+
+使用方式：
+    from services.media_thumbnails import schedule_thumbnails
+    schedule_thumbnails(media_id, telegram_file_id, media_type)  # 媒体入库后调用
+
+流程：
+    1. 通过 media_cache 获取原始文件（只下载一次，与 /media-proxy 共享磁盘缓存）
+    2. 在进程池中解码并生成多种尺寸的 WebP 缩略图；视频先用 ffmpeg 截取封面帧
+    3. 记录尺寸与大小到 media_thumbnails 表
+
+依赖：
+    - Pillow：未安装时跳过生成，页面回退到原图
+    - ffmpeg：仅视频封面帧需要，未安装时视频不生成预览
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from config import MEDIA_THUMBNAIL_CONFIG
+from pathmanager import PathManager
+from services.task_queue import enqueue_task
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_thumbnail_directory() -> str:
+    """缩略图输出目录"""
+    return PathManager.ensure_directory(os.path.join(PathManager.get_cache_directory(), "thumbs"))
+
+
+def schedule_thumbnails(media_id: int, telegram_file_id: str, media_type: str) -> None:
+    """把缩略图生成任务提交到后台任务队列"""
+    enqueue_task(generate_thumbnails, int(media_id), telegram_file_id, media_type)
+
+
+async def generate_thumbnails(media_id: int, telegram_file_id: str, media_type: str) -> List[Dict[str, Any]]:
+    """
+    为单个媒体生成缩略图并写入 media_thumbnails。
+
+    Args:
+        media_id: 媒体ID
+        telegram_file_id: Telegram file_id
+        media_type: 'photo' 或 'video'
+
+    Returns:
+        生成的规格列表
+    """
+    from database.db_media import media_db
+    from services.media_cache import media_cache
+
+    cached = await media_cache.get(telegram_file_id)
+    loop = asyncio.get_running_loop()
+    variants = await loop.run_in_executor(
+        _get_executor(),
+        render_variants,
+        cached.path,
+        media_type,
+        get_thumbnail_directory(),
+        f"m{media_id}_{cached.unique_id}",
+        MEDIA_THUMBNAIL_CONFIG["sizes"],
+        MEDIA_THUMBNAIL_CONFIG["quality"],
+        MEDIA_THUMBNAIL_CONFIG["poster_offset"],
+    )
+    if variants:
+        await media_db.save_thumbnails(media_id, variants)
+        logger.info(f"媒体 {media_id} 缩略图生成完成: {[v['variant'] for v in variants]}")
+    return variants
+
+
+def shutdown_executor() -> None:
+    """关闭进程池（应用退出时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max(1, MEDIA_THUMBNAIL_CONFIG["workers"]))
+    return _executor
+
+
+# ---------- 以下函数在子进程中执行，只能使用可序列化参数 ---------- #
+
+def render_variants(
+    src_path: str,
+    media_type: str,
+    out_dir: str,
+    stem: str,
+    sizes: Dict[str, int],
+    quality: int,
+    poster_offset: float,
+) -> List[Dict[str, Any]]:
+    """
+    解码源文件并输出 WebP 缩略图（视频额外输出 poster）。
+
+    Returns:
+        [{variant, file_path, width, height, file_size}, ...]
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("未安装 Pillow，跳过缩略图生成")
+        return []
+
+    frame_path = src_path
+    tmp_frame = None
+    if media_type == 'video':
+        tmp_frame = _extract_poster_frame(src_path, poster_offset)
+        if not tmp_frame:
+            return []
+        frame_path = tmp_frame
+
+    results: List[Dict[str, Any]] = []
+    try:
+        with Image.open(frame_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGB")
+
+            if media_type == 'video':
+                results.append(_save_webp(img, out_dir, stem, "poster", quality))
+
+            for variant, max_side in sizes.items():
+                thumb = img.copy()
+                thumb.thumbnail((max_side, max_side), Image.LANCZOS)
+                results.append(_save_webp(thumb, out_dir, stem, variant, quality))
+    finally:
+        if tmp_frame and os.path.exists(tmp_frame):
+            os.unlink(tmp_frame)
+    return results
+
+
+def _save_webp(img, out_dir: str, stem: str, variant: str, quality: int) -> Dict[str, Any]:
+    path = os.path.join(out_dir, f"{stem}_{variant}.webp")
+    img.save(path, "WEBP", quality=quality, method=4)
+    return {
+        "variant": variant,
+        "file_path": path,
+        "width": img.width,
+        "height": img.height,
+        "file_size": os.path.getsize(path),
+    }
+
+
+def _extract_poster_frame(src_path: str, offset: float) -> Optional[str]:
+    """用 ffmpeg 截取视频封面帧，返回临时 PNG 路径"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        logger.warning("未找到 ffmpeg，跳过视频封面帧生成")
+        return None
+
+    fd, out_path = tempfile.mkstemp(suffix=".png")
+    os.close(fd)
+    # 先尝试指定时间点，过短的视频回退到第一帧
+    for seek in (offset, 0):
+        cmd = [ffmpeg, "-y", "-loglevel", "error", "-ss", str(seek), "-i", src_path, "-frames:v", "1", out_path]
+        try:
+            subprocess.run(cmd, check=True, timeout=30)
+            if os.path.getsize(out_path) > 0:
+                return out_path
+        except Exception as e:
+            logger.debug(f"ffmpeg 截帧失败(seek={seek}): {e}")
+    os.unlink(out_path)
+    return None
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+预约下单服务（“立即预约”/“选择 P/PP”快速路径）
+
+使用方式：
+    from services.order_service import order_service
+    order_id, created = await order_service.create_attempt_order(user, merchant)
+    if await order_service.choose_course(order_id, user.id, 'P', price):
+        order_service.notify_merchant(bot, merchant, user, order_id, 'P', price, review_markup)
+
+特性：
+    - 用户 upsert、订单插入、活动日志在一个写事务（BEGIN IMMEDIATE）内完成，一次往返
+    - 幂等键 = 用户:商户:课程:时间窗；同时查当前与上一个时间窗，跨窗边界的连点也只产生一张订单
+    - 选择课程为条件更新，重复点击同一选项不重复通知商户
+    - 商户通知与商户端评价入口交给后台任务队列（失败自动重试），不阻塞回调
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import ORDER_CONFIG
+from database.db_orders import order_manager
+from services.notification_service import NotificationService
+from services.task_queue import enqueue_task
+
+logger = logging.getLogger(__name__)
+
+
+async def _send_merchant_review_entry(bot, chat_id: int, markup) -> None:
+    """发送商户端“完成后评价”入口（失败抛出，由任务队列重试）"""
+    await bot.send_message(chat_id, '上完课后点击按钮进行评价：', reply_markup=markup)
+
+
+class OrderService:
+    """预约下单服务"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or ORDER_CONFIG
+        self.window = max(1, int(config.get('idempotency_window', 60)))
+
+    def idempotency_keys(
+        self, user_id: int, merchant_id: int, course_type: Optional[str] = None, now: Optional[float] = None
+    ) -> List[str]:
+        """
+        生成幂等键
+
+        Args:
+            user_id: 用户ID
+            merchant_id: 商户ID
+            course_type: 课程类型（未选择时为 None）
+            now: 当前时间戳（测试用）
+
+        Returns:
+            [当前时间窗的键, 上一个时间窗的键]
+        """
+        bucket = int((time.time() if now is None else now) // self.window)
+        prefix = f"{int(user_id)}:{int(merchant_id)}:{course_type or '-'}"
+        return [f"{prefix}:{bucket}", f"{prefix}:{bucket - 1}"]
+
+    async def create_attempt_order(
+        self, user, merchant: Dict[str, Any], course_type: Optional[str] = None, now: Optional[float] = None
+    ) -> Tuple[int, bool]:
+        """
+        创建“尝试预约”订单（幂等）
+
+        Args:
+            user: Telegram 用户（from_user）
+            merchant: 商户信息
+            course_type: 课程类型（未选择时为 None）
+            now: 当前时间戳（测试用）
+
+        Returns:
+            (订单ID, 是否新建)
+        """
+        price = merchant.get('p_price') or 0
+        keys = self.idempotency_keys(user.id, merchant['id'], course_type, now)
+        order_id, created = await order_manager.create_order_idempotent({
+            'customer_user_id': user.id,
+            'customer_username': user.username,
+            'merchant_id': merchant['id'],
+            'price': int(price) if str(price).isdigit() else 0,
+            'course_type': course_type,
+            'status': '尝试预约',
+        }, keys)
+        if not created:
+            logger.info(f"重复预约请求复用订单 {order_id}（用户 {user.id}，商户 {merchant['id']}）")
+        return order_id, created
+
+    async def choose_course(self, order_id: int, user_id: int, course_type: str, price: int) -> bool:
+        """
+        写入用户选择的课程与价格
+
+        Returns:
+            是否发生了更新（False 表示重复点击或非本人订单，不应再通知商户）
+        """
+        return await order_manager.set_order_course(order_id, user_id, course_type, price)
+
+    def notify_merchant(
+        self, bot, merchant: Dict[str, Any], user, order_id: int, course_type: str, price: int, review_markup=None
+    ) -> None:
+        """把新预约通知与商户端评价入口放入后台任务队列"""
+        enqueue_task(
+            NotificationService.notify_new_order,
+            bot=bot, merchant=merchant, user=user, order_id=order_id, course_type=course_type, price=price,
+        )
+        chat_id = merchant.get('telegram_chat_id')
+        if chat_id and review_markup is not None:
+            enqueue_task(_send_merchant_review_entry, bot, int(chat_id), review_markup)
+
+
+order_service = OrderService()
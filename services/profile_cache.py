@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+用户资料（Telegram 网名）缓存
+
+使用方式：
+    from services.profile_cache import profile_cache
+    name = await profile_cache.display_name(bot, user_id)
+    names = await profile_cache.display_names(bot, [uid1, uid2, ...])
+
+特性：
+    - 进程内 LRU（user_id → first_name / last_name / username / 确认时间），持久化在 users 表
+    - 每个更新的 from_user 自带资料，由 ProfileCacheMiddleware 免费写入缓存，变更批量落库
+    - 读取顺序：内存 → users 表（一次 IN 查询）→ getChat（仅缺失者，并发受限，同一用户合并）
+    - 过期资料先返回旧值，再在后台刷新（stale-while-revalidate）
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import PROFILE_CACHE_CONFIG
+from database.db_connection import db_manager
+from utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+_TS_FORMAT = '%Y-%m-%d %H:%M:%S'
+_LOAD_CHUNK = 500
+
+
+@dataclass
+class Profile:
+    """用户的 Telegram 资料"""
+    user_id: int
+    first_name: str = ''
+    last_name: str = ''
+    username: str = ''
+    fetched_at: float = 0.0
+
+    @property
+    def display_name(self) -> str:
+        # 只取网名：first_name [+ last_name]
+        return " ".join(p for p in (self.first_name, self.last_name) if p)
+
+    def same_as(self, other: 'Profile') -> bool:
+        return (self.first_name, self.last_name, self.username) == (other.first_name, other.last_name, other.username)
+
+
+def _clean(value: Any) -> str:
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _parse_ts(value: Any) -> float:
+    if not value:
+        return 0.0
+    try:
+        return time.mktime(datetime.strptime(str(value)[:19], _TS_FORMAT).timetuple())
+    except ValueError:
+        return 0.0
+
+
+class ProfileCache:
+    """Telegram 网名缓存（内存 LRU + users 表）"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or PROFILE_CACHE_CONFIG
+        self.max_entries = int(config.get('max_entries', 50000))
+        self.stale_after = float(config.get('stale_after', 86400))
+        self.flush_interval = float(config.get('flush_interval', 5))
+        self._fetch_limit = asyncio.Semaphore(max(1, int(config.get('fetch_concurrency', 8))))
+        self._entries: 'OrderedDict[int, Profile]' = OrderedDict()
+        self._dirty: Dict[int, Profile] = {}
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ---------- 写入 ---------- #
+
+    def remember(self, user: Any) -> None:
+        """
+        记录更新中的 from_user（同步、无 I/O；资料有变化或确认时间过旧时排入批量落库）
+
+        Args:
+            user: aiogram User 或具有 id/first_name/last_name/username 属性的对象
+        """
+        user_id = getattr(user, 'id', None)
+        if not user_id or getattr(user, 'is_bot', False):
+            return
+        profile = Profile(int(user_id), _clean(getattr(user, 'first_name', None)),
+                          _clean(getattr(user, 'last_name', None)), _clean(getattr(user, 'username', None)),
+                          time.time())
+        cached = self._entries.get(profile.user_id)
+        if (cached is not None and cached.same_as(profile)
+                and profile.fetched_at - cached.fetched_at < self.stale_after / 2):
+            self._entries.move_to_end(profile.user_id)
+            return
+        self._put(profile)
+        self._dirty[profile.user_id] = profile
+        self._schedule_flush()
+
+    def _put(self, profile: Profile) -> None:
+        self._entries[profile.user_id] = profile
+        self._entries.move_to_end(profile.user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+        except RuntimeError:
+            # 无事件循环（同步调用场景）：留待下次 flush()
+            pass
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """把待写入的资料批量更新到 users，返回写入条数"""
+        if not self._dirty:
+            return 0
+        pending, self._dirty = self._dirty, {}
+        queries = [
+            ("UPDATE users SET username = COALESCE(NULLIF(?, ''), username), first_name = ?, last_name = ?, "
+             "profile_fetched_at = ? WHERE user_id = ?",
+             (p.username, p.first_name, p.last_name, datetime.fromtimestamp(p.fetched_at).strftime(_TS_FORMAT),
+              p.user_id))
+            for p in pending.values()
+        ]
+        if not await db_manager.execute_transaction(queries):
+            logger.warning(f"用户资料缓存落库失败，{len(pending)} 条留待重试")
+            for user_id, profile in pending.items():
+                self._dirty.setdefault(user_id, profile)
+            return 0
+        return len(queries)
+
+    # ---------- 读取 ---------- #
+
+    async def get_many(self, bot: Any, user_ids: Iterable[int]) -> Dict[int, Profile]:
+        """
+        批量获取资料
+
+        Args:
+            bot: aiogram Bot（为 None 时只读缓存与数据库，不调用 getChat）
+            user_ids: 用户ID
+
+        Returns:
+            {user_id: Profile}；无法获取的用户不在结果中
+        """
+        ids = list(dict.fromkeys(int(u) for u in user_ids if u))
+        result: Dict[int, Profile] = {}
+        missing: List[int] = []
+        for user_id in ids:
+            cached = self._entries.get(user_id)
+            if cached is not None:
+                self._entries.move_to_end(user_id)
+                result[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        if missing:
+            for profile in await self._load(missing):
+                self._put(profile)
+                result[profile.user_id] = profile
+
+        now = time.time()
+        unknown = [u for u in ids if u not in result]
+        for user_id in ids:
+            if user_id in result:
+                CACHE_REQUESTS.inc(cache='profile', result='hit')
+                if bot is not None and now - result[user_id].fetched_at >= self.stale_after:
+                    self._refresh(bot, user_id)
+            else:
+                CACHE_REQUESTS.inc(cache='profile', result='miss')
+
+        if unknown and bot is not None:
+            fetched = await asyncio.gather(*(self._refresh(bot, u) for u in unknown))
+            result.update({p.user_id: p for p in fetched if p is not None})
+        return result
+
+    async def get(self, bot: Any, user_id: int) -> Optional[Profile]:
+        return (await self.get_many(bot, [user_id])).get(int(user_id)) if user_id else None
+
+    async def display_names(self, bot: Any, user_ids: Iterable[int]) -> Dict[int, str]:
+        """批量获取网名（无网名的用户值为空字符串）"""
+        ids = [int(u) for u in user_ids if u]
+        profiles = await self.get_many(bot, ids)
+        return {u: profiles[u].display_name if u in profiles else '' for u in ids}
+
+    async def display_name(self, bot: Any, user_id: Optional[int], default: str = '') -> str:
+        profile = await self.get(bot, user_id) if user_id else None
+        return (profile.display_name if profile else '') or default
+
+    async def _load(self, user_ids: List[int]) -> List[Profile]:
+        profiles = []
+        for start in range(0, len(user_ids), _LOAD_CHUNK):
+            chunk = user_ids[start:start + _LOAD_CHUNK]
+            rows = await db_manager.fetch_all(
+                "SELECT user_id, username, first_name, last_name, profile_fetched_at FROM users "
+                f"WHERE user_id IN ({','.join('?' * len(chunk))}) AND profile_fetched_at IS NOT NULL",
+                tuple(chunk),
+            )
+            for row in rows or []:
+                d = dict(row)
+                profiles.append(Profile(int(d['user_id']), _clean(d['first_name']), _clean(d['last_name']),
+                                        _clean(d['username']), _parse_ts(d['profile_fetched_at'])))
+        return profiles
+
+    def _refresh(self, bot: Any, user_id: int) -> 'asyncio.Task':
+        """通过 getChat 刷新资料；同一用户的并发请求共用一个任务"""
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(bot, user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return task
+
+    async def _fetch(self, bot: Any, user_id: int) -> Optional[Profile]:
+        async with self._fetch_limit:
+            try:
+                chat = await bot.get_chat(user_id)
+            except Exception as e:
+                logger.debug(f"获取用户 {user_id} 资料失败: {e}")
+                cached = self._entries.get(user_id)
+                if cached is None:
+                    # 无法获取（未与机器人对话、已注销等）：仅在内存记一条空资料，过期前不再重试
+                    cached = Profile(user_id, fetched_at=time.time())
+                    self._put(cached)
+                return cached
+        profile = Profile(user_id, _clean(getattr(chat, 'first_name', None)), _clean(getattr(chat, 'last_name', None)),
+                          _clean(getattr(chat, 'username', None)), time.time())
+        self._put(profile)
+        self._dirty[user_id] = profile
+        self._schedule_flush()
+        return profile
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._dirty.clear()
+
+
+profile_cache = ProfileCache()
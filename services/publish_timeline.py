@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+帖子发布/服务到期时间线（内存最小堆）
+
+使用方式：
+    # 调度器进程
+    publish_timeline.attach(on_change)          # on_change: 堆顶变化时回调（重排唤醒任务）
+    await publish_timeline.reload(slots)        # 启动与低频对账时从 merchants 全量加载
+    await publish_timeline.poll_changes()       # 高频轮询变更信号表（其它进程的写入）
+    due = publish_timeline.pop_due(now)         # 到点后取出到期的 (kind, merchant_id)
+
+    # 任意写入 publish_time / expiration_time / status 的地方
+    notify_merchant_schedule_changed(merchant_id)
+
+说明：
+- 'publish'：status='approved' 的商户，按 publish_time 到点；publish_time 为空时
+  取下一个发布时间槽（与原先"按时间槽批量发布"的口径一致）。
+- 'expire'：expiration_time 非空且 status != 'expired' 的商户，按 expiration_time 到点。
+- 通知只在调度器运行于本进程时立即生效；任何进程的写入都会由 merchants 上的触发器记入
+  merchant_schedule_changes，调度器按自增ID水位轮询（主键范围查询），低频全量对账只作兜底。
+"""
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from database.db_connection import db_manager
+
+logger = logging.getLogger(__name__)
+
+TimelineKey = Tuple[str, int]
+
+
+def parse_schedule_time(value: Any) -> Optional[datetime]:
+    """解析 merchants 中的时间字段（datetime / 'YYYY-MM-DD HH:MM[:SS]' / ISO）"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.fromisoformat(str(value).strip()).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def next_slot_time(slots: Sequence[Tuple[int, int]], now: datetime) -> Optional[datetime]:
+    """now 之后最近的一个时间槽（含当天与次日）"""
+    if not slots:
+        return None
+    today = now.replace(second=0, microsecond=0)
+    for day in (0, 1):
+        base = today + timedelta(days=day)
+        for hour, minute in sorted(slots):
+            candidate = base.replace(hour=hour, minute=minute)
+            if candidate > now:
+                return candidate
+    return None
+
+
+class DueTimeline:
+    """带惰性删除的最小堆：每个 key 只保留最新的到期时间"""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str, int]] = []
+        self._due: Dict[TimelineKey, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def get(self, key: TimelineKey) -> Optional[datetime]:
+        return self._due.get(key)
+
+    def set(self, key: TimelineKey, due_at: Optional[datetime]) -> None:
+        if due_at is None:
+            self._due.pop(key, None)
+            return
+        if self._due.get(key) == due_at:
+            return
+        self._due[key] = due_at
+        heapq.heappush(self._heap, (due_at, key[0], key[1]))
+        # 失效条目过多时重建，避免堆无限增长
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(d, k[0], k[1]) for k, d in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, key: TimelineKey) -> None:
+        self._due.pop(key, None)
+
+    def keys(self) -> Set[TimelineKey]:
+        return set(self._due)
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap:
+            due_at, kind, mid = self._heap[0]
+            if self._due.get((kind, mid)) == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: datetime) -> List[TimelineKey]:
+        result = []
+        while True:
+            head = self.next_due()
+            if head is None or head > now:
+                return result
+            _, kind, mid = heapq.heappop(self._heap)
+            self._due.pop((kind, mid), None)
+            result.append((kind, mid))
+
+
+class PublishTimeline:
+    """商户发布/到期时间线"""
+
+    _SELECT = (
+        "SELECT id, status, publish_time, expiration_time FROM merchants "
+        "WHERE status = 'approved' OR (expiration_time IS NOT NULL AND status != 'expired')"
+    )
+
+    def __init__(self):
+        self.timeline = DueTimeline()
+        self._slots: List[Tuple[int, int]] = []
+        self._on_change: Optional[Callable[[], None]] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._change_watermark: Optional[int] = None
+
+    @property
+    def attached(self) -> bool:
+        return self._on_change is not None
+
+    def attach(self, on_change: Callable[[], None]) -> None:
+        """由调度器调用：登记堆顶变化回调，启用本进程内的通知"""
+        self._on_change = on_change
+
+    def detach(self) -> None:
+        self._on_change = None
+
+    def next_due(self) -> Optional[datetime]:
+        return self.timeline.next_due()
+
+    def pop_due(self, now: datetime) -> List[TimelineKey]:
+        return self.timeline.pop_due(now)
+
+    def defer(self, key: TimelineKey, due_at: datetime) -> None:
+        """处理失败的条目延后重试"""
+        self.timeline.set(key, due_at)
+        self._changed()
+
+    def _entries_for(self, row: Dict[str, Any], now: datetime) -> Dict[TimelineKey, Optional[datetime]]:
+        mid = int(row['id'])
+        status = row.get('status')
+        publish_due = None
+        if status == 'approved':
+            publish_due = parse_schedule_time(row.get('publish_time')) or next_slot_time(self._slots, now) or now
+        expire_due = None
+        if status != 'expired':
+            expire_due = parse_schedule_time(row.get('expiration_time'))
+
+        entries = {('publish', mid): publish_due, ('expire', mid): expire_due}
+        for key, due_at in entries.items():
+            # 已到期但正处于延后重试中的条目，保留重试时间
+            current = self.timeline.get(key)
+            if due_at is not None and due_at <= now and current is not None and current > now:
+                entries[key] = current
+        return entries
+
+    async def reload(self, slots: Optional[Sequence[Tuple[int, int]]] = None) -> int:
+        """
+        从 merchants 全量对账（启动与低频兜底）
+
+        Args:
+            slots: 启用中的发布时间槽 [(hour, minute)]，None 表示沿用上次
+
+        Returns:
+            时间线中的条目数
+        """
+        if slots is not None:
+            self._slots = sorted(set(slots))
+        # 先取变更水位再全量读取：之后的变更由 poll_changes 处理
+        watermark = await self._max_change_id()
+        rows = await db_manager.fetch_all(self._SELECT)
+        now = datetime.now()
+        seen: Set[TimelineKey] = set()
+        for row in rows or []:
+            for key, due_at in self._entries_for(dict(row), now).items():
+                self.timeline.set(key, due_at)
+                if due_at is not None:
+                    seen.add(key)
+        for key in self.timeline.keys() - seen:
+            self.timeline.discard(key)
+        self._change_watermark = watermark
+        self._changed()
+        return len(self.timeline)
+
+    async def _max_change_id(self) -> int:
+        row = await db_manager.fetch_one("SELECT MAX(id) FROM merchant_schedule_changes")
+        return int(row[0] or 0) if row else 0
+
+    async def poll_changes(self) -> int:
+        """
+        读取水位之后的变更信号，逐个刷新涉及的商户（其它进程的写入）
+
+        Returns:
+            刷新的商户数
+        """
+        if self._change_watermark is None:
+            self._change_watermark = await self._max_change_id()
+            return 0
+        rows = await db_manager.fetch_all(
+            "SELECT id, merchant_id FROM merchant_schedule_changes WHERE id > ? ORDER BY id",
+            (self._change_watermark,)
+        )
+        if not rows:
+            return 0
+        merchant_ids = {int(row['merchant_id']) for row in rows}
+        for merchant_id in merchant_ids:
+            await self.refresh_merchant(merchant_id)
+        self._change_watermark = int(rows[-1]['id'])
+        return len(merchant_ids)
+
+    async def prune_changes(self, keep_seconds: int = 3600) -> int:
+        """删除已消费且超过保留时间的变更信号"""
+        if not self._change_watermark:
+            return 0
+        return await db_manager.execute_query(
+            "DELETE FROM merchant_schedule_changes WHERE id <= ? AND changed_at < datetime('now', ?)",
+            (self._change_watermark, f'-{int(keep_seconds)} seconds')
+        )
+
+    async def refresh_merchant(self, merchant_id: int) -> None:
+        """单个商户的发布/到期时间有变化时重新计算"""
+        row = await db_manager.fetch_one(
+            "SELECT id, status, publish_time, expiration_time FROM merchants WHERE id = ?",
+            (int(merchant_id),)
+        )
+        if row:
+            entries = self._entries_for(dict(row), datetime.now())
+        else:
+            entries = {('publish', int(merchant_id)): None, ('expire', int(merchant_id)): None}
+        for key, due_at in entries.items():
+            self.timeline.set(key, due_at)
+        self._changed()
+
+    def notify(self, merchant_id: int) -> None:
+        if not self.attached:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._refresh_safely(int(merchant_id)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh_safely(self, merchant_id: int) -> None:
+        try:
+            await self.refresh_merchant(merchant_id)
+        except Exception as e:
+            logger.warning(f"刷新商户 {merchant_id} 发布时间线失败: {e}")
+
+    def _changed(self) -> None:
+        if self._on_change is not None:
+            try:
+                self._on_change()
+            except Exception as e:
+                logger.error(f"重排时间线唤醒任务失败: {e}")
+
+
+publish_timeline = PublishTimeline()
+
+
+def notify_merchant_schedule_changed(merchant_id: int) -> None:
+    """商户的 status / publish_time / expiration_time 被修改后调用"""
+    publish_timeline.notify(merchant_id)
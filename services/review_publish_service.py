@@ -4,22 +4,33 @@
 
 职责：将已确认的评价发布到对应频道，并回填链接。
 频道配置来源：web 端“频道配置”页面（posting_channels.role = review_u2m / review_m2u）。
+
+发布路径：
+    - 评价、订单、商户、区县一次联表取齐（批量发布时每 500 条一次 IN 查询）
+    - 频道配置走 posting_channels_db 的 TTL 缓存，留名经 services.profile_cache 批量获取
+    - 报告正文由加载时预解析的模板渲染
+    - 按频道令牌桶限速（REVIEW_PUBLISH_CONFIG），商户主帖评价区每批只刷新一次
 """
 
+import asyncio
 import logging
-from typing import Optional, Dict, Tuple, List
-import json
+from dataclasses import dataclass
+from datetime import datetime
+from string import Formatter
+from typing import Any, Optional, Dict, Iterable, Tuple, List
 import html
 
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
 import aiohttp
 
+from database.db_connection import db_manager
 from database.db_channels import posting_channels_db
 from database.db_reviews_u2m import u2m_reviews_manager
 from database.db_merchant_reviews import merchant_reviews_manager
-from database.db_orders import OrderManager
-from database.db_merchants import MerchantManager
-from config import DEEPLINK_BOT_USERNAME
+from config import DEEPLINK_BOT_USERNAME, REVIEW_PUBLISH_CONFIG
+from services.profile_cache import profile_cache
+from utils.rate_limiter import RateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -78,288 +89,322 @@ def _esc(v: Optional[str]) -> str:
         return ''
 
 
+# 0-10 分的评分单元格预先生成
+_SCORE_CELLS = tuple(f"{s:02d} | {_score_bar(s)}" for s in range(11))
+
+
+def _score_cell(value: Any) -> str:
+    s = int(value or 0)
+    return _SCORE_CELLS[s] if 0 <= s <= 10 else f"{s:02d} | {_score_bar(s)}"
+
+
+class ReportTemplate:
+    """预解析的报告模板：str.format 风格的 {字段}，加载时拆成（文本, 字段）片段，渲染只做拼接"""
+
+    def __init__(self, source: str):
+        self.parts: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if field == '' or spec or conversion:
+                raise ValueError(f"报告模板只支持具名字段: {{{field}}}")
+            self.parts.append((literal, field))
+        self.fields = frozenset(field for _, field in self.parts if field)
+
+    def render(self, values: Dict[str, str]) -> str:
+        return "".join([literal + values[field] if field else literal for literal, field in self.parts])
+
+
+# 报告正文模板：加载时预解析，渲染时只做拼接；{字段} 的值均已转义
+_U2M_TEMPLATE = ReportTemplate(
+    "🔖 报告{report}\n🔆 艺名 {merchant}\n📌 位置 {district}\n✨ 费用{fee}\n\n"
+    "🌟 总体评分：\n"
+    "<pre>▫️ 外貌 {r1}\n▫️ 身材 {r2}\n▫️ 服务 {r3}\n▫️ 态度 {r4}\n▫️ 环境 {r5}</pre>\n\n"
+    "{details}🙋🏻 留名 {signer} ｜ 🗓️ 时间{date}\n\n"
+)
+_M2U_TEMPLATE = ReportTemplate(
+    "报告{report}\n艺名 {merchant}\n位置 {district}\n费用{fee}\n\n"
+    "<pre>素质 {r1}\n长度 {r2}\n硬度 {r3}\n时间 {r4}\n气质 {r5}</pre>"
+    "{details}\n\n留名 {signer} ｜ 时间{date}"
+)
+
+# 评价 + 订单 + 商户 + 区县，一次联表取齐
+_CONTEXT_QUERY = (
+    "SELECT r.*, o.merchant_id AS order_merchant_id, o.customer_user_id AS order_customer_user_id, "
+    "o.course_type AS order_course_type, o.price AS order_price, o.created_at AS order_created_at, "
+    "m.name AS merchant_name, m.city_id AS merchant_city_id, m.district_id AS merchant_district_id, "
+    "d.name AS district_name "
+    "FROM {table} r "
+    "LEFT JOIN orders o ON o.id = r.order_id "
+    "LEFT JOIN merchants m ON m.id = o.merchant_id "
+    "LEFT JOIN districts d ON d.id = m.district_id "
+    "WHERE r.id IN ({placeholders})"
+)
+_CONTEXT_CHUNK = 500
+
+
+@dataclass(frozen=True)
+class _Direction:
+    """评价方向的发布参数"""
+    table: str
+    role: str
+    template: ReportTemplate
+    ratings: Tuple[str, ...]
+    text_column: str
+    details_format: str
+    refresh_merchant_post: bool
+
+
+_DIRECTIONS: Dict[str, _Direction] = {
+    'u2m': _Direction(
+        table='reviews', role='review_u2m', template=_U2M_TEMPLATE,
+        ratings=('rating_appearance', 'rating_figure', 'rating_service', 'rating_attitude', 'rating_environment'),
+        text_column='text_review_by_user', details_format="📜 文字详情：\n{}\n\n", refresh_merchant_post=True,
+    ),
+    'm2u': _Direction(
+        table='merchant_reviews', role='review_m2u', template=_M2U_TEMPLATE,
+        ratings=('rating_attack_quality', 'rating_length', 'rating_hardness', 'rating_duration',
+                 'rating_user_temperament'),
+        text_column='text_review_by_merchant', details_format="\n\n文字详情：\n{}", refresh_merchant_post=False,
+    ),
+}
+
+# 按频道限速：Telegram 对单个频道的发帖频率有限额，批量补发时超出会收到 429
+_channel_limiter = RateLimiter(
+    {'default': (REVIEW_PUBLISH_CONFIG['channel_per_minute'] / 60, REVIEW_PUBLISH_CONFIG['channel_burst'])},
+    max_keys=1000,
+)
+
+
+def _linked(text: str, url: str) -> str:
+    return f"<a href=\"{url}\">{text}</a>" if url else text
+
+
+def _order_date(value: Any) -> str:
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '')) if isinstance(value, str) else value
+        return dt.strftime('%Y.%m.%d') if dt else ''
+    except Exception:
+        return ''
+
+
+def _fee(ctx: Dict[str, Any], bot_u: str, city_suffix: str) -> str:
+    """费用：仅展示本订单课程与价格，带城市上下文 deeplink"""
+    ct = (ctx.get('order_course_type') or '').upper()
+    price = ctx.get('order_price')
+    price_str = str(price) if price is not None else ''
+    if ct not in ('P', 'PP') or not price_str:
+        return ''
+    link = f"https://t.me/{bot_u}?start=price_{ct.lower()}_{price_str}{city_suffix}" if bot_u else ''
+    return " " + _linked(f"{_esc(price_str)}{ct}", link)
+
+
+def _customer_id(ctx: Dict[str, Any]) -> Optional[int]:
+    uid = ctx.get('customer_user_id') or ctx.get('order_customer_user_id')
+    return int(uid) if uid else None
+
+
+def render_report(direction: str, ctx: Dict[str, Any], channel_url: str = '', user_name: str = '') -> str:
+    """
+    渲染评价报告（HTML）
+
+    Args:
+        direction: 'u2m' 或 'm2u'
+        ctx: ReviewPublishService.load_contexts 返回的单条上下文
+        channel_url: “贴文发布”频道（role=post）链接
+        user_name: 用户网名（仅 u2m 非匿名时使用）
+
+    Returns:
+        报告正文
+    """
+    spec = _DIRECTIONS[direction]
+    bot_u = (DEEPLINK_BOT_USERNAME or '').lstrip('@')
+    mid = ctx.get('order_merchant_id')
+    did = ctx.get('merchant_district_id')
+    city_id = ctx.get('merchant_city_id')
+    merchant_name = _esc((ctx.get('merchant_name') or '').strip() or '—')
+    text = ctx.get(spec.text_column)
+    if direction == 'u2m':
+        signer = '匿名' if ctx.get('is_anonymous') else _esc(user_name or '')
+    else:
+        signer = merchant_name  # M2U 留名为商户名
+    date = _order_date(ctx.get('order_created_at'))
+
+    values = {
+        'report': f" {html.escape(channel_url)}" if channel_url else '',
+        'merchant': _linked(merchant_name, f"https://t.me/{bot_u}?start=m_{mid}" if bot_u and mid else ''),
+        'district': _linked(_esc((ctx.get('district_name') or '').strip()),
+                            f"https://t.me/{bot_u}?start=d_{did}" if bot_u and did else ''),
+        'fee': _fee(ctx, bot_u, f"_c_{city_id}" if city_id else ''),
+        'details': spec.details_format.format(_esc(text)) if text else '',
+        'signer': signer,
+        'date': f" {date}" if date else '',
+    }
+    for i, column in enumerate(spec.ratings, 1):
+        values[f"r{i}"] = _score_cell(ctx.get(column))
+    return spec.template.render(values)
+
+
+async def _send_report(bot: Bot, chat_id: Any, text: str):
+    """按频道限速发送；遇到 429 按 retry_after 等待后重试一次"""
+    while True:
+        allowed, wait = _channel_limiter.try_acquire(str(chat_id))
+        if allowed:
+            break
+        await asyncio.sleep(wait)
+    try:
+        return await bot.send_message(chat_id, text, parse_mode='HTML')
+    except TelegramRetryAfter as e:
+        logger.warning(f"频道 {chat_id} 发布触发限流，{e.retry_after} 秒后重试")
+        await asyncio.sleep(e.retry_after)
+        return await bot.send_message(chat_id, text, parse_mode='HTML')
+
+
 class ReviewPublishService:
     @staticmethod
-    async def _get_user_display_name(user_id: Optional[int], bot: Optional[Bot] = None) -> str:
-        if not user_id or bot is None:
-            return ''
-        # 只取 Telegram 网名：first_name [+ last_name]；不读数据库、不退回用户名/ID
-        try:
-            chat = await bot.get_chat(int(user_id))
-            parts = []
-            fn = getattr(chat, 'first_name', None)
-            ln = getattr(chat, 'last_name', None)
-            if isinstance(fn, str) and fn.strip():
-                parts.append(fn.strip())
-            if isinstance(ln, str) and ln.strip():
-                parts.append(ln.strip())
-            return " ".join(parts)
-        except Exception:
-            return ''
+    async def load_contexts(direction: str, review_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        一次联表查询加载评价发布所需的全部数据
+
+        Args:
+            direction: 'u2m' 或 'm2u'
+            review_ids: 评价ID
+
+        Returns:
+            {review_id: 评价行 + order_* / merchant_* / district_name}
+        """
+        table = _DIRECTIONS[direction].table
+        ids = list(dict.fromkeys(int(i) for i in review_ids))
+        contexts: Dict[int, Dict[str, Any]] = {}
+        for start in range(0, len(ids), _CONTEXT_CHUNK):
+            chunk = ids[start:start + _CONTEXT_CHUNK]
+            query = _CONTEXT_QUERY.format(table=table, placeholders=','.join('?' * len(chunk)))
+            for row in await db_manager.fetch_all(query, tuple(chunk)) or []:
+                ctx = dict(row)
+                contexts[int(ctx['id'])] = ctx
+        return contexts
 
     @staticmethod
-    async def _get_merchant_display_name(merchant: Optional[Dict], bot: Optional[Bot] = None) -> str:
+    async def publish_many(direction: str, review_ids: Iterable[int], bot: Bot,
+                           re_publish: bool = False) -> Dict[int, bool]:
+        """
+        批量发布同一方向的评价
+
+        同一频道的发送按令牌桶限速；u2m 发布后每个商户的主帖评价区只刷新一次。
+
+        Args:
+            direction: 'u2m' 或 'm2u'
+            review_ids: 评价ID
+            bot: 机器人实例
+            re_publish: 已发布过的评价是否重新发布
+
+        Returns:
+            {review_id: 是否已发布}
+        """
+        spec = _DIRECTIONS[direction]
+        ids = list(dict.fromkeys(int(i) for i in review_ids))
+        results = {rid: False for rid in ids}
+        if not ids:
+            return results
         try:
-            if not merchant:
-                return '—'
-            # 仅使用商户资料中的名称（非用户名）
-            name = (merchant.get('name') or '').strip()
-            return name or '—'
-        except Exception:
-            return '—'
-    @staticmethod
-    async def publish_u2m(review_id: int, bot: Bot, re_publish: bool = False) -> bool:
+            contexts = await ReviewPublishService.load_contexts(direction, ids)
+        except Exception as e:
+            logger.error(f"publish_{direction} failed: 加载评价失败: {e}")
+            return results
+
+        pending = []
+        for rid in ids:
+            ctx = contexts.get(rid)
+            if ctx is None:
+                continue
+            if ctx.get('report_post_url') and not re_publish:
+                results[rid] = True
+            else:
+                pending.append(ctx)
+        if not pending:
+            return results
+
+        channel = await posting_channels_db.get_active_channel_cached(spec.role)
+        if not channel:
+            logger.warning(f'未配置 {spec.role} 频道')
+            return results
+        # 报告链接：严格使用“贴文发布”频道（role=post）的链接
         try:
-            # 直接查询 u2m 单条记录
-            from database.db_connection import db_manager
-            row = await db_manager.fetch_one("SELECT * FROM reviews WHERE id=?", (review_id,))
-            if not row:
-                return False
-            review = dict(row)
-            if review.get('report_post_url') and not re_publish:
-                return True
-
-            channel = await posting_channels_db.get_active_channel_by_role('review_u2m')
-            if not channel:
-                logger.warning('未配置 review_u2m 频道')
-                return False
-
-            order = await OrderManager.get_order(review.get('order_id'))
-            # 商户显示名：优先 Telegram 网名
-            merchant_obj = None
-            try:
-                if order and order.get('merchant_id'):
-                    merchant_obj = await MerchantManager.get_merchant(order.get('merchant_id'))
-            except Exception:
-                merchant_obj = None
-            merchant_name = await ReviewPublishService._get_merchant_display_name(merchant_obj, bot)
-
-            # 用户显示名：匿名则“匿名”；否则用 users.display_name / first+last
-            user_disp = '匿名'
-            if not review.get('is_anonymous'):
-                uid = review.get('customer_user_id') or (order.get('customer_user_id') if order else None)
-                user_disp = await ReviewPublishService._get_user_display_name(uid, bot)
-
-            # 构建 deeplink 与商户频道链接
-            mid = (order.get('merchant_id') if order else None) or (merchant_obj.get('id') if merchant_obj else None)
-            did = merchant_obj.get('district_id') if merchant_obj else None
-            district_name = (merchant_obj.get('district_name') or '').strip() if merchant_obj else ''
-            p_price = str(merchant_obj.get('p_price') or '').strip() if merchant_obj else ''
-            bot_u = (DEEPLINK_BOT_USERNAME or '').lstrip('@')
-            link_merchant = f"https://t.me/{bot_u}?start=m_{mid}" if bot_u and mid else ''
-            link_district = f"https://t.me/{bot_u}?start=d_{did}" if bot_u and did else ''
-            city_id = merchant_obj.get('city_id') if merchant_obj else None
-            city_suffix = f"_c_{city_id}" if city_id else ''
-            link_price_p = f"https://t.me/{bot_u}?start=price_p_{p_price}{city_suffix}" if bot_u and p_price else ''
-
-            # 报告链接：严格使用“贴文发布”频道（role=post）的链接
-            try:
-                post_channel = await posting_channels_db.get_active_channel()  # role='post'
-            except Exception:
-                post_channel = None
-            channel_url = (post_channel.get('channel_link') or '').strip() if post_channel else ''
-
-            # 顶部信息（按指定模板，不带 deeplink）
-            report_line = f"🔖 报告 {html.escape(channel_url)}" if channel_url else "🔖 报告"
-            name_line = (
-                f"🔆 艺名 <a href=\"{link_merchant}\">{_esc(merchant_name)}</a>"
-                if link_merchant else f"🔆 艺名 {_esc(merchant_name)}"
-            )
-            loc_line = (
-                f"📌 位置 <a href=\"{link_district}\">{_esc(district_name)}</a>"
-                if link_district else f"📌 位置 {_esc(district_name)}"
-            )
+            post_channel = await posting_channels_db.get_active_channel_cached('post')
+        except Exception:
+            post_channel = None
+        channel_url = (post_channel.get('channel_link') or '').strip() if post_channel else ''
 
-            # 费用：仅展示本订单课程与价格，带城市上下文 deeplink
-            ct = (order.get('course_type') or '').upper() if order else ''
-            price_val = order.get('price') if order else None
-            price_str = str(price_val) if (price_val is not None) else ''
-            fee_line = "✨ 费用"
-            if ct == 'P' and price_str:
-                link_price = f"https://t.me/{bot_u}?start=price_p_{price_str}{city_suffix}" if bot_u else ''
-                fee_disp = f"{_esc(price_str)}P"
-                fee_line = f"✨ 费用 <a href=\"{link_price}\">{fee_disp}</a>" if link_price else f"✨ 费用 {fee_disp}"
-            elif ct == 'PP' and price_str:
-                link_price = f"https://t.me/{bot_u}?start=price_pp_{price_str}{city_suffix}" if bot_u else ''
-                fee_disp = f"{_esc(price_str)}PP"
-                fee_line = f"✨ 费用 <a href=\"{link_price}\">{fee_disp}</a>" if link_price else f"✨ 费用 {fee_disp}"
-
-            # 文字详情：标题单独一行，正文从下一行开始
-            detail_header = "📜 文字详情："
-            details_body = None
-            if review.get('text_review_by_user'):
-                details_body = _esc(review.get('text_review_by_user'))
-
-            # 留名与时间（同一行）
-            from datetime import datetime
-            date_disp = ''
+        # 留名只取 Telegram 网名（仅 u2m 非匿名需要），批量经资料缓存获取
+        names: Dict[int, str] = {}
+        if direction == 'u2m' and bot is not None:
             try:
-                cts = order.get('created_at') if order else None
-                if isinstance(cts, str):
-                    dt = datetime.fromisoformat(cts.replace('Z',''))
-                else:
-                    dt = cts
-                if dt:
-                    date_disp = dt.strftime('%Y.%m.%d')
+                names = await profile_cache.display_names(
+                    bot, [_customer_id(ctx) for ctx in pending if not ctx.get('is_anonymous')]
+                )
             except Exception:
-                date_disp = ''
-            footer_line = f"🙋🏻 留名 {_esc(user_disp or '')} ｜ 🗓️ 时间 {date_disp}".strip()
-
-            # 评分块（使用 <pre>）
-            rating_head = "🌟 总体评分："
-            rating_block = (
-                "<pre>"
-                f"▫️ 外貌 {int(review.get('rating_appearance') or 0):02d} | {_score_bar(review.get('rating_appearance'))}\n"
-                f"▫️ 身材 {int(review.get('rating_figure') or 0):02d} | {_score_bar(review.get('rating_figure'))}\n"
-                f"▫️ 服务 {int(review.get('rating_service') or 0):02d} | {_score_bar(review.get('rating_service'))}\n"
-                f"▫️ 态度 {int(review.get('rating_attitude') or 0):02d} | {_score_bar(review.get('rating_attitude'))}\n"
-                f"▫️ 环境 {int(review.get('rating_environment') or 0):02d} | {_score_bar(review.get('rating_environment'))}"
-                "</pre>"
-            )
-
-            # 组装：单行费用 → 空行 → 评分区；其后文字详情与留名
-            header_lines = [report_line, name_line, loc_line, fee_line, "", rating_head]
-            text = "\n".join(header_lines) + "\n" + rating_block + "\n\n"
-            if details_body:
-                text += detail_header + "\n" + details_body + "\n\n"
-            text += footer_line + "\n\n"
-
-            chat_id = channel.get('channel_chat_id')
-            sent = await bot.send_message(chat_id, text, parse_mode='HTML')
-            link = _build_channel_post_link(str(chat_id), sent.message_id)
-            await u2m_reviews_manager.set_report_meta(review_id, message_id=sent.message_id, url=link, published_at=sent.date)
-            # 发布成功后，刷新商户主帖的“评价”区（累积所有U2M链接）
-            if mid:
-                try:
-                    await refresh_merchant_post_reviews(int(mid))
-                except Exception:
-                    pass
-            return True
-        except Exception as e:
-            logger.error(f"publish_u2m failed: {e}")
-            return False
+                names = {}
 
-    @staticmethod
-    async def publish_m2u(review_id: int, bot: Bot, re_publish: bool = False) -> bool:
-        try:
-            # 需要 m2u 详情（含 is_user_anonymous）
-            from database.db_connection import db_manager
-            row = await db_manager.fetch_one("SELECT * FROM merchant_reviews WHERE id=?", (review_id,))
-            review = dict(row) if row else None
-            if not review:
-                return False
-            if review.get('report_post_url') and not re_publish:
-                return True
-
-            channel = await posting_channels_db.get_active_channel_by_role('review_m2u')
-            if not channel:
-                logger.warning('未配置 review_m2u 频道')
-                return False
-
-            order = await OrderManager.get_order(review.get('order_id'))
-            # 商户显示名
-            merchant_obj = None
+        chat_id = channel.get('channel_chat_id')
+        manager = u2m_reviews_manager if direction == 'u2m' else merchant_reviews_manager
+        merchant_ids: List[int] = []
+        for ctx in pending:
+            rid = int(ctx['id'])
             try:
-                if order and order.get('merchant_id'):
-                    merchant_obj = await MerchantManager.get_merchant(order.get('merchant_id'))
-            except Exception:
-                merchant_obj = None
-            merchant_name = await ReviewPublishService._get_merchant_display_name(merchant_obj, bot)
-
-            # 用户匿名策略：读取同订单 U2M 的 reviews.is_anonymous；如不存在U2M，默认匿名
-            user_disp = '匿名'
+                text = render_report(direction, ctx, channel_url, names.get(_customer_id(ctx), ''))
+                sent = await _send_report(bot, chat_id, text)
+                link = _build_channel_post_link(str(chat_id), sent.message_id)
+                await manager.set_report_meta(rid, message_id=sent.message_id, url=link, published_at=sent.date)
+                results[rid] = True
+                if spec.refresh_merchant_post and ctx.get('order_merchant_id'):
+                    merchant_ids.append(int(ctx['order_merchant_id']))
+            except Exception as e:
+                logger.error(f"publish_{direction} failed: review_id={rid}, {e}")
+
+        # 发布成功后，刷新商户主帖的“评价”区（累积所有U2M链接）
+        for mid in dict.fromkeys(merchant_ids):
             try:
-                u2m_row = await db_manager.fetch_one("SELECT is_anonymous FROM reviews WHERE order_id=? LIMIT 1", (review.get('order_id'),))
-                is_anon = True
-                if u2m_row is not None:
-                    is_anon = bool(dict(u2m_row).get('is_anonymous'))
-                if not is_anon:
-                    uid = review.get('user_id') or (order.get('customer_user_id') if order else None)
-                    user_disp = await ReviewPublishService._get_user_display_name(uid, bot)
+                await refresh_merchant_post_reviews(mid)
             except Exception:
                 pass
+        return results
 
-            # 顶部信息
-            bot_u = (DEEPLINK_BOT_USERNAME or '').lstrip('@')
-            mid = (order.get('merchant_id') if order else None) or (merchant_obj.get('id') if merchant_obj else None)
-            did = merchant_obj.get('district_id') if merchant_obj else None
-            district_name = (merchant_obj.get('district_name') or '').strip() if merchant_obj else ''
-            link_merchant = f"https://t.me/{bot_u}?start=m_{mid}" if bot_u and mid else ''
-            link_district = f"https://t.me/{bot_u}?start=d_{did}" if bot_u and did else ''
-
-            # 费用（按订单课程类型与价格）
-            ct = (order.get('course_type') or '').upper() if order else ''
-            price_val = order.get('price') if order else None
-            price_str = str(price_val) if (price_val is not None) else ''
-            city_id = merchant_obj.get('city_id') if merchant_obj else None
-            city_suffix = f"_c_{city_id}" if city_id else ''
-            if ct == 'P' and price_str:
-                link_price = f"https://t.me/{bot_u}?start=price_p_{price_str}{city_suffix}" if bot_u else ''
-                fee_disp = f"{_esc(price_str)}P"
-                fee_line = f"费用 <a href=\"{link_price}\">{fee_disp}</a>" if link_price else f"费用 {fee_disp}"
-            elif ct == 'PP' and price_str:
-                link_price = f"https://t.me/{bot_u}?start=price_pp_{price_str}{city_suffix}" if bot_u else ''
-                fee_disp = f"{_esc(price_str)}PP"
-                fee_line = f"费用 <a href=\"{link_price}\">{fee_disp}</a>" if link_price else f"费用 {fee_disp}"
-            else:
-                fee_line = "费用"
+    @staticmethod
+    async def publish_u2m(review_id: int, bot: Bot, re_publish: bool = False) -> bool:
+        results = await ReviewPublishService.publish_many('u2m', [review_id], bot, re_publish)
+        return results.get(int(review_id), False)
 
-            # 报告链接：严格使用“贴文发布”频道（role=post）
-            try:
-                post_channel = await posting_channels_db.get_active_channel()  # role='post'
-            except Exception:
-                post_channel = None
-            channel_url = (post_channel.get('channel_link') or '').strip() if post_channel else ''
-
-            report_line = f"报告 {html.escape(channel_url)}" if channel_url else "报告"
-            name_line = (f"艺名 <a href=\"{link_merchant}\">{_esc(merchant_name)}</a>" if link_merchant else f"艺名 {_esc(merchant_name)}")
-            loc_line = (f"位置 <a href=\"{link_district}\">{_esc(district_name)}</a>" if link_district else f"位置 {_esc(district_name)}")
-
-            # 评分块改为 <pre>（使用真实换行）
-            rating_block = (
-                "<pre>"
-                f"素质 {int(review.get('rating_attack_quality') or 0):02d} | {_score_bar(review.get('rating_attack_quality'))}\n"
-                f"长度 {int(review.get('rating_length') or 0):02d} | {_score_bar(review.get('rating_length'))}\n"
-                f"硬度 {int(review.get('rating_hardness') or 0):02d} | {_score_bar(review.get('rating_hardness'))}\n"
-                f"时间 {int(review.get('rating_duration') or 0):02d} | {_score_bar(review.get('rating_duration'))}\n"
-                f"气质 {int(review.get('rating_user_temperament') or 0):02d} | {_score_bar(review.get('rating_user_temperament'))}"
-                "</pre>"
-            )
+    @staticmethod
+    async def publish_m2u(review_id: int, bot: Bot, re_publish: bool = False) -> bool:
+        results = await ReviewPublishService.publish_many('m2u', [review_id], bot, re_publish)
+        return results.get(int(review_id), False)
 
-            # 文字详情
-            body_lines = []
-            if review.get('text_review_by_merchant'):
-                body_lines.append(f"文字详情：\n{_esc(review.get('text_review_by_merchant'))}")
+    @staticmethod
+    async def publish_backlog(bot: Bot, limit: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+        """
+        补发已确认但尚未发布的评价（按确认时间先后，两个方向并行）
+
+        Args:
+            bot: 机器人实例
+            limit: 每个方向最多处理的条数，默认 REVIEW_PUBLISH_CONFIG['batch_limit']
+
+        Returns:
+            {'u2m': {'total': n, 'published': m}, 'm2u': {...}}
+        """
+        limit = int(limit or REVIEW_PUBLISH_CONFIG['batch_limit'])
+
+        async def _run(direction: str) -> Dict[str, int]:
+            rows = await db_manager.fetch_all(
+                f"SELECT id FROM {_DIRECTIONS[direction].table} "
+                "WHERE is_confirmed_by_admin = 1 AND is_deleted = 0 "
+                "AND (report_post_url IS NULL OR report_post_url = '') "
+                "ORDER BY confirmed_at, id LIMIT ?",
+                (limit,),
+            )
+            ids = [int(r['id']) for r in rows or []]
+            results = await ReviewPublishService.publish_many(direction, ids, bot)
+            return {'total': len(ids), 'published': sum(1 for ok in results.values() if ok)}
 
-            # 留名（商户名）+ 时间
-            from datetime import datetime
-            date_disp = ''
-            try:
-                cts = order.get('created_at') if order else None
-                if isinstance(cts, str):
-                    dt = datetime.fromisoformat(cts.replace('Z',''))
-                else:
-                    dt = cts
-                if dt:
-                    date_disp = dt.strftime('%Y.%m.%d')
-            except Exception:
-                date_disp = ''
-            footer_line = f"留名 { _esc(merchant_name or '') } ｜ 时间 {date_disp}".strip()
-
-            text = "\n".join([report_line, name_line, loc_line, fee_line]) + "\n\n" + rating_block
-            if body_lines:
-                text += "\n\n" + "\n".join(body_lines)
-            if footer_line:
-                text += "\n\n" + footer_line
-
-            chat_id = channel.get('channel_chat_id')
-            sent = await bot.send_message(chat_id, text, parse_mode='HTML')
-            link = _build_channel_post_link(str(chat_id), sent.message_id)
-            await merchant_reviews_manager.set_report_meta(review_id, message_id=sent.message_id, url=link, published_at=sent.date)
-            return True
-        except Exception as e:
-            logger.error(f"publish_m2u failed: {e}")
-            return False
+        u2m, m2u = await asyncio.gather(_run('u2m'), _run('m2u'))
+        return {'u2m': u2m, 'm2u': m2u}
 
 
 review_publish_service = ReviewPublishService()
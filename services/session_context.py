@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+用户会话上下文（按用户的短期键值）
+
+使用方式：
+    from services.session_context import session_context, CTX_CITY
+    session_context.set(user_id, CTX_CITY, city_id)
+    city_id = await session_context.get(user_id, CTX_CITY)
+    session_context.delete(user_id, CTX_CITY)
+
+特性：
+    - 进程内 LRU（(user_id, 键) → 值 / 过期时间），条目数受 max_entries 限制
+    - 持久化在 session_context 表；写入/删除同步更新内存，批量落库（write-behind）
+    - 读取顺序：内存 → 表（单条主键查询）；“不存在”同样缓存，未设置上下文的用户不重复查表
+    - 内存条目超过 recheck_after 后重新读表，其他 worker 的修改在该时长内生效
+    - 值为 JSON 可序列化对象；过期条目由每日数据清理（db_init.cleanup_old_data）删除
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from config import SESSION_CONTEXT_CONFIG
+from database.db_connection import db_manager
+from utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# 已使用的上下文键
+CTX_CITY = 'city'  # 当前城市：价格/标签深链只返回该城市的商家
+CTX_LAST_DEEPLINK = 'last_deeplink'  # 最近一次 /start 深链参数
+
+_MISSING = object()
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    checked_at: float
+
+
+class SessionContextStore:
+    """会话上下文存储（内存 LRU + session_context 表）"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or SESSION_CONTEXT_CONFIG
+        self.max_entries = int(config.get('max_entries', 20000))
+        self.ttl = int(config.get('ttl', 604800))
+        self.recheck_after = float(config.get('recheck_after', 300))
+        self.flush_interval = float(config.get('flush_interval', 2))
+        self._entries: 'OrderedDict[Tuple[int, str], _Entry]' = OrderedDict()
+        # (user_id, 键) -> (JSON 值，None 表示删除, 过期时间)
+        self._dirty: Dict[Tuple[int, str], Tuple[Optional[str], int]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- 读取 ---------- #
+
+    async def get(self, user_id: int, key: str, default: Any = None) -> Any:
+        """
+        读取上下文
+
+        Args:
+            user_id: 用户ID
+            key: 上下文键
+            default: 不存在或已过期时的返回值
+
+        Returns:
+            上下文值
+        """
+        ident = (int(user_id), key)
+        now = time.time()
+        entry = self._entries.get(ident)
+        if entry is None and ident in self._dirty:
+            # 已被 LRU 淘汰但尚未落库：以待写入的值为准
+            value, expires_at = self._dirty[ident]
+            entry = _Entry(_MISSING if value is None else json.loads(value), float(expires_at), now)
+            self._put(ident, entry)
+        if entry is not None and (ident in self._dirty or now - entry.checked_at < self.recheck_after):
+            self._entries.move_to_end(ident)
+            CACHE_REQUESTS.inc(cache='session_context', result='hit')
+        else:
+            CACHE_REQUESTS.inc(cache='session_context', result='miss')
+            entry = await self._load(ident, now)
+        if entry.value is _MISSING or entry.expires_at <= now:
+            return default
+        return entry.value
+
+    async def _load(self, ident: Tuple[int, str], now: float) -> _Entry:
+        value, expires_at = _MISSING, 0.0
+        try:
+            row = await db_manager.fetch_one(
+                "SELECT value, expires_at FROM session_context WHERE user_id = ? AND ctx_key = ?", ident
+            )
+            if row and int(row['expires_at']) > now:
+                value, expires_at = json.loads(row['value']), float(row['expires_at'])
+        except Exception as e:
+            # 读表失败时按“不存在”处理，不写入内存以便下次重试
+            logger.warning(f"读取会话上下文失败 {ident}: {e}")
+            return _Entry(_MISSING, 0.0, now)
+        entry = _Entry(value, expires_at, now)
+        self._put(ident, entry)
+        return entry
+
+    # ---------- 写入 ---------- #
+
+    def set(self, user_id: int, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """
+        设置上下文（同步更新内存，批量落库）
+
+        Args:
+            user_id: 用户ID
+            key: 上下文键
+            value: JSON 可序列化的值
+            ttl: 有效期（秒），默认使用配置的 ttl
+        """
+        ident = (int(user_id), key)
+        now = time.time()
+        expires_at = int(now + (ttl if ttl is not None else self.ttl))
+        self._put(ident, _Entry(value, float(expires_at), now))
+        self._dirty[ident] = (json.dumps(value, ensure_ascii=False), expires_at)
+        self._schedule_flush()
+
+    def delete(self, user_id: int, key: str) -> None:
+        """删除上下文（同步更新内存，批量落库）"""
+        ident = (int(user_id), key)
+        self._put(ident, _Entry(_MISSING, 0.0, time.time()))
+        self._dirty[ident] = (None, 0)
+        self._schedule_flush()
+
+    def _put(self, ident: Tuple[int, str], entry: _Entry) -> None:
+        self._entries[ident] = entry
+        self._entries.move_to_end(ident)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+        except RuntimeError:
+            # 无事件循环（同步调用场景）：留待下次 flush()
+            pass
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self) -> int:
+        """把待写入的上下文批量写入 session_context，返回写入条数"""
+        if not self._dirty:
+            return 0
+        pending, self._dirty = self._dirty, {}
+        queries = []
+        for (user_id, key), (value, expires_at) in pending.items():
+            if value is None:
+                queries.append(("DELETE FROM session_context WHERE user_id = ? AND ctx_key = ?", (user_id, key)))
+            else:
+                queries.append((
+                    "INSERT INTO session_context (user_id, ctx_key, value, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(user_id, ctx_key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                    (user_id, key, value, expires_at),
+                ))
+        if not await db_manager.execute_transaction(queries):
+            logger.warning(f"会话上下文落库失败，{len(pending)} 条留待重试")
+            for ident, change in pending.items():
+                self._dirty.setdefault(ident, change)
+            return 0
+        return len(queries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._dirty.clear()
+
+
+session_context = SessionContextStore()
@@ -17,12 +17,17 @@ import asyncio
 import logging
 from typing import Awaitable, Callable, Any, Tuple
 
+from utils.metrics import TASK_QUEUE_DEPTH, TASK_QUEUE_TASKS
+
 logger = logging.getLogger(__name__)
 
 _queue: asyncio.Queue | None = None
 _workers_started: bool = False
 _worker_tasks: list[asyncio.Task] = []
 
+# 队列深度在采集指标时读取
+TASK_QUEUE_DEPTH.set_function(lambda: _queue.qsize() if _queue is not None else 0)
+
 
 async def start_task_workers(worker_count: int = 3) -> None:
     """启动后台 worker（幂等）。"""
@@ -61,13 +66,16 @@ async def _worker_loop(worker_id: int):
         func, args, kwargs, retry = await _queue.get()
         try:
             await func(*args, **kwargs)
+            TASK_QUEUE_TASKS.inc(result="ok")
         except Exception as e:
             if retry < 3:
+                TASK_QUEUE_TASKS.inc(result="retry")
                 backoff = 2 ** retry
                 logger.warning(f"任务执行失败，重试{retry+1}/3，backoff={backoff}s: {e}")
                 await asyncio.sleep(backoff)
                 await _queue.put((func, args, kwargs, retry + 1))
             else:
+                TASK_QUEUE_TASKS.inc(result="failed")
                 logger.error(f"任务执行失败（已达最大重试）: {e}")
         finally:
             _queue.task_done()
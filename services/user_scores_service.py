@@ -3,30 +3,30 @@
 用户评分聚合与排行榜服务
 
 职责：
-- 从 merchant_reviews 聚合 M2U 五维平均分与次数，写入 user_scores（有效口径）
-- 依据 user_scores 生成各维度排行榜缓存 user_score_leaderboards（阈值：次数>=6）
+- user_scores 由 merchant_reviews 上的触发器实时增量维护（user_score_totals）；
+  本服务提供对账与全量重算（工具脚本/修复用）
+- 各维度排行榜由 live_leaderboard 在内存中实时维护（阈值：次数>=6），
+  user_score_leaderboards 为其持久化快照；此处保留全量重建入口
 """
 
 import logging
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from database.db_connection import db_manager
 from database.db_user_scores import user_scores_manager
+from database.db_score_totals import score_totals_manager
+from services.live_leaderboard import live_leaderboard
 
 logger = logging.getLogger(__name__)
 
 
-DIM_COLUMNS = {
-    'attack_quality': 'avg_attack_quality',
-    'length': 'avg_length',
-    'hardness': 'avg_hardness',
-    'duration': 'avg_duration',
-    'user_temperament': 'avg_user_temperament',
-}
-
-
 class UserScoresService:
+    @staticmethod
+    async def reconcile_user_scores() -> int:
+        """对账 user_score_totals，仅修正漂移的用户。返回修正用户数。"""
+        return await score_totals_manager.reconcile('user')
+
     @staticmethod
     async def recalculate_all_user_scores() -> int:
         """全量聚合 M2U 有效评价到 user_scores。返回更新用户数。"""
@@ -64,43 +64,15 @@ class UserScoresService:
         return updated
 
     @staticmethod
-    async def build_leaderboards(min_reviews: int = 6) -> Dict[str, int]:
-        """基于 user_scores 生成五个维度的排行榜缓存。返回各维度写入数量。"""
-        results = {}
-        now = datetime.now()
-        for dim, col in DIM_COLUMNS.items():
-            # 读取候选，按分数降序、次数降序、更新时间降序
-            sql = f"""
-                SELECT user_id, {col} AS avg_score, total_reviews_count
-                FROM user_scores
-                WHERE total_reviews_count >= ?
-                ORDER BY {col} DESC, total_reviews_count DESC, updated_at DESC
-            """
-            rows = await db_manager.fetch_all(sql, (int(min_reviews),))
-            # 计算竞赛排名
-            rank = 0
-            last_score = None
-            emitted = 0
-            # 清理旧缓存（按维度）
-            await db_manager.execute_query("DELETE FROM user_score_leaderboards WHERE dimension=?", (dim,))
-            for idx, row in enumerate(rows or [], start=1):
-                d = dict(row)
-                score = float(d['avg_score'] or 0.0)
-                if last_score is None or score < last_score:
-                    rank = idx
-                last_score = score
-                # 写入缓存
-                await db_manager.execute_query(
-                    """
-                    INSERT OR REPLACE INTO user_score_leaderboards
-                    (dimension, user_id, avg_score, reviews_count, rank, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (dim, int(d['user_id']), round(score, 2), int(d['total_reviews_count'] or 0), int(rank), now)
-                )
-                emitted += 1
-            results[dim] = emitted
-            logger.info(f"leaderboard[{dim}] 生成完成：{emitted} 条")
+    async def build_leaderboards(min_reviews: Optional[int] = None) -> Dict[str, int]:
+        """
+        从 user_scores 重建实时排行榜并整表写入 user_score_leaderboards（工具脚本/修复用）。
+
+        日常名次由 live_leaderboard 实时维护，无需定时重建。返回各维度上榜人数。
+        """
+        results = await live_leaderboard.rebuild(min_reviews=min_reviews)
+        for dim, cnt in results.items():
+            logger.info(f"leaderboard[{dim}] 重建完成：{cnt} 条")
         return results
 
 
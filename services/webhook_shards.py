@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook 更新分片分发
+
+Web 进程只负责接收 Telegram Webhook 更新，按 chat_id 取模分发到 N 个机器人 worker 进程，
+每个 worker 运行完整的 Dispatcher（中间件 + 路由），对话状态存入共享的 fsm_storage 表。
+
+顺序保证：
+- 同一 chat 的更新总是进入同一个 worker 的同一个队列（私聊 chat_id 即 user_id，
+  回调按其消息所在 chat 分片，与该用户的消息落在同一 worker）；
+- worker 内同一 chat 串行处理、不同 chat 并发处理（ChatSequencer）。
+
+背压：
+- 每个 worker 的队列有上限；worker 在处理中的更新达到上限时不再取队列，队列随之积满，
+  Web 端对新更新返回 503，由 Telegram 稍后重投。
+
+启用方式：WEBHOOK_WORKERS=N（N > 1），见 config.WEBHOOK_SHARD_CONFIG。
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 以 chat 为维度的更新类型
+_CHAT_FIELDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'my_chat_member', 'chat_member', 'chat_join_request',
+    'message_reaction', 'message_reaction_count', 'chat_boost', 'removed_chat_boost',
+)
+# 只有用户维度的更新类型
+_USER_FIELDS = (
+    'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query', 'poll_answer',
+)
+
+
+def update_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """从原始 Update JSON 中取分片键（chat_id，缺失时取用户ID）"""
+    for field in _CHAT_FIELDS:
+        obj = update.get(field)
+        if obj and obj.get('chat'):
+            return obj['chat'].get('id')
+    callback = update.get('callback_query')
+    if callback:
+        message = callback.get('message') or {}
+        if message.get('chat'):
+            return message['chat'].get('id')
+        return (callback.get('from') or {}).get('id')
+    for field in _USER_FIELDS:
+        obj = update.get(field)
+        if obj:
+            user = obj.get('from') or obj.get('user') or {}
+            return user.get('id')
+    return None
+
+
+def shard_for(update: Dict[str, Any], workers: int) -> int:
+    """更新应进入的 worker 序号"""
+    chat_id = update_chat_id(update)
+    if chat_id is None:
+        return int(update.get('update_id') or 0) % workers
+    return abs(int(chat_id)) % workers
+
+
+class ChatSequencer:
+    """worker 内的调度：同一 chat 串行，不同 chat 并发，总并发受限"""
+
+    def __init__(self, max_concurrency: int = 64):
+        self._tails: Dict[Any, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    def __len__(self) -> int:
+        return len(self._tails)
+
+    async def drain(self, timeout: float = 10.0):
+        """等待已提交的更新处理完（每个 chat 的最后一个任务完成即代表其前序已完成）"""
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()), timeout=timeout)
+
+    def submit(self, chat_id: Any, job: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """排在该 chat 上一个更新之后执行 job"""
+        previous = self._tails.get(chat_id)
+        task = asyncio.create_task(self._run(previous, job))
+        self._tails[chat_id] = task
+
+        def _release(done: asyncio.Task):
+            if self._tails.get(chat_id) is done:
+                del self._tails[chat_id]
+
+        task.add_done_callback(_release)
+        return task
+
+    async def _run(self, previous: Optional[asyncio.Task], job: Callable[[], Awaitable[Any]]):
+        if previous is not None:
+            # 只等待完成，不传播上一个更新的异常
+            await asyncio.wait([previous])
+        async with self._semaphore:
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"分片更新处理失败: {e}")
+
+
+class WebhookShardPool:
+    """Web 进程侧：管理 worker 进程并按 chat_id 分发更新"""
+
+    def __init__(self, workers: int, queue_size: int = 1000, max_concurrency: int = 64):
+        """
+        Args:
+            workers: worker 进程数
+            queue_size: 每个 worker 的待处理更新上限
+            max_concurrency: 单个 worker 同时处理的更新数
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_concurrency = max_concurrency
+        self._ctx = multiprocessing.get_context('spawn')
+        self._queues: List[Any] = []
+        self._processes: List[Any] = []
+        self.submitted = [0] * workers
+        self.rejected = [0] * workers
+
+    @property
+    def started(self) -> bool:
+        return bool(self._processes)
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=run_shard_worker,
+            args=(index, self._queues[index], self.max_concurrency),
+            name=f"bot-shard-{index}",
+        )
+        process.start()
+        if index < len(self._processes):
+            self._processes[index] = process
+        else:
+            self._processes.append(process)
+        logger.info(f"Webhook 分片 worker #{index} 已启动，PID={process.pid}")
+
+    def start(self):
+        """启动全部 worker 进程（幂等）"""
+        if self.started:
+            return
+        self._queues = [self._ctx.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def submit(self, update: Dict[str, Any]) -> bool:
+        """
+        把原始 Update JSON 放入对应 worker 的队列
+
+        Returns:
+            False 表示队列已满（调用方应返回 503 让 Telegram 重投）
+        """
+        index = shard_for(update, self.workers)
+        if not self._processes[index].is_alive():
+            logger.warning(f"Webhook 分片 worker #{index} 已退出，正在重启")
+            self._spawn(index)
+        try:
+            self._queues[index].put_nowait(update)
+        except queue.Full:
+            self.rejected[index] += 1
+            return False
+        self.submitted[index] += 1
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """通知 worker 处理完已入队的更新后退出，超时则强制结束"""
+        for q in self._queues:
+            try:
+                q.put(None, timeout=1)
+            except queue.Full:
+                pass
+        for index, process in enumerate(self._processes):
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Webhook 分片 worker #{index} 未在 {timeout}s 内退出，强制结束")
+                process.terminate()
+                process.join(1)
+        self._processes = []
+        self._queues = []
+
+    def get_stats(self) -> Dict[str, Any]:
+        shards = []
+        for index, process in enumerate(self._processes):
+            try:
+                depth = self._queues[index].qsize()
+            except NotImplementedError:  # macOS 不支持 qsize
+                depth = None
+            shards.append({
+                "index": index,
+                "pid": process.pid,
+                "alive": process.is_alive(),
+                "queue_depth": depth,
+                "submitted": self.submitted[index],
+                "rejected": self.rejected[index],
+            })
+        return {"workers": self.workers, "queue_size": self.queue_size, "shards": shards}
+
+
+def run_shard_worker(index: int, updates: Any, max_concurrency: int):
+    """worker 进程入口（spawn 启动，模块级函数以便序列化）"""
+    try:
+        asyncio.run(_shard_worker_main(index, updates, max_concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _shard_worker_main(index: int, updates: Any, max_concurrency: int):
+    from bot import TelegramMerchantBot
+
+    bot_instance = TelegramMerchantBot()
+    # 关闭由 Web 进程通过队列哨兵统一协调，worker 不单独响应 Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    await bot_instance._on_worker_startup()
+
+    sequencer = ChatSequencer(max_concurrency)
+    # 处理中的更新上限：达到后不再取队列，让背压传回 Web 进程
+    slots = asyncio.Semaphore(max(1, max_concurrency) * 4)
+    loop = asyncio.get_running_loop()
+    logger.info(f"Webhook 分片 worker #{index} 就绪")
+    try:
+        while True:
+            await slots.acquire()
+            update = await loop.run_in_executor(None, updates.get)
+            if update is None:
+                slots.release()
+                break
+
+            async def job(payload=update):
+                await bot_instance.dp.feed_raw_update(bot_instance.bot, payload)
+
+            task = sequencer.submit(update_chat_id(update), job)
+            task.add_done_callback(lambda _t: slots.release())
+    finally:
+        await sequencer.drain(10)
+        await bot_instance._on_worker_shutdown()
+        logger.info(f"Webhook 分片 worker #{index} 已退出")
+
+
+def create_shard_pool() -> Optional[WebhookShardPool]:
+    """按配置创建分片池；workers <= 1 时返回 None（在 Web 进程内直接处理）"""
+    from config import WEBHOOK_SHARD_CONFIG
+
+    workers = WEBHOOK_SHARD_CONFIG.get("workers", 0)
+    if workers <= 1:
+        return None
+    return WebhookShardPool(
+        workers,
+        queue_size=WEBHOOK_SHARD_CONFIG.get("queue_size", 1000),
+        max_concurrency=WEBHOOK_SHARD_CONFIG.get("max_concurrency", 64),
+    )
@@ -3,6 +3,7 @@ Pytest配置和共享fixtures
 """
 
 import pytest
+import pytest_asyncio
 import asyncio
 import tempfile
 import os
@@ -138,6 +139,26 @@ async def db_manager(temp_db):
     await manager.close()
 
 
+@pytest_asyncio.fixture
+async def v2_db(tmp_path):
+    """完整初始化（schema + 全部迁移）的临时数据库，替换全局 db_manager 的路径"""
+    from database.db_connection import db_manager as global_db
+    from database.db_init import DatabaseInitializer
+
+    original = global_db.db_path
+    await global_db.close_all_connections()
+    # 连接锁是类属性，首次争用时绑定事件循环；每个测试换一把，避免跨测试的事件循环冲突
+    global_db._lock = asyncio.Lock()
+    global_db.set_db_path(str(tmp_path / "v2.db"))
+    assert await DatabaseInitializer().initialize_database()
+
+    yield global_db
+
+    await global_db.close_all_connections()
+    del global_db._lock
+    global_db.set_db_path(original)
+
+
 @pytest.fixture
 def mock_bot():
     """创建模拟Bot实例"""
@@ -0,0 +1,90 @@
+"""
+分析只读快照单元测试
+测试在线备份生成、只读路由、过期回退与快照替换后的连接切换
+"""
+
+import os
+import time
+
+import pytest
+import pytest_asyncio
+
+from database.db_snapshot import AnalyticsSnapshot, reads_from_snapshot
+
+
+@pytest_asyncio.fixture
+async def snapshot(v2_db, monkeypatch):
+    snap = AnalyticsSnapshot({'enabled': True, 'max_age': 600, 'pages_per_step': 4, 'step_sleep': 0})
+    snap.STAT_INTERVAL = 0
+    monkeypatch.setattr(v2_db, "read_replica", snap)
+    await v2_db.execute_query("INSERT INTO users (user_id, username) VALUES (1, 'a')")
+    yield snap
+    await snap.close()
+
+
+async def _user_count(db):
+    row = await db.fetch_one("SELECT COUNT(*) FROM users")
+    return row[0]
+
+
+@pytest.mark.asyncio
+async def test_reads_route_to_snapshot(v2_db, snapshot):
+    stats = await snapshot.refresh()
+    assert stats['mode'] == 'paged' and stats['pages'] > 0
+    assert snapshot.path.endswith('v2.analytics.db') and snapshot.available()
+
+    await v2_db.execute_query("INSERT INTO users (user_id, username) VALUES (2, 'b')")
+    assert await _user_count(v2_db) == 2
+    with v2_db.snapshot_reads():
+        assert await _user_count(v2_db) == 1
+        # 写入始终走主库
+        await v2_db.execute_query("INSERT INTO users (user_id, username) VALUES (3, 'c')")
+
+    @reads_from_snapshot
+    async def report():
+        return await _user_count(v2_db)
+
+    assert await report() == 1
+    assert await _user_count(v2_db) == 3
+
+    # 新快照生成后，读连接切换到新文件
+    await snapshot.refresh()
+    assert await report() == 3
+
+
+@pytest.mark.asyncio
+async def test_missing_or_stale_snapshot_falls_back(v2_db, snapshot):
+    assert snapshot.age() is None and not snapshot.available()
+    with v2_db.snapshot_reads():
+        assert await _user_count(v2_db) == 1
+
+    await snapshot.refresh()
+    old = time.time() - 3600
+    os.utime(snapshot.path, (old, old))
+    assert not snapshot.available()
+    await v2_db.execute_query("INSERT INTO users (user_id, username) VALUES (2, 'b')")
+    with v2_db.snapshot_reads():
+        assert await _user_count(v2_db) == 2
+    assert snapshot.status()['taken_at'] == pytest.approx(old)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_read_only(v2_db, snapshot):
+    await snapshot.refresh()
+    async with snapshot.connection() as conn:
+        row = await (await conn.execute("PRAGMA journal_mode")).fetchone()
+        assert row[0] == 'delete'
+        with pytest.raises(Exception):
+            await conn.execute("INSERT INTO users (user_id, username) VALUES (9, 'x')")
+
+
+@pytest.mark.asyncio
+async def test_snapshot_disabled_when_sharded(v2_db, snapshot, monkeypatch, caplog):
+    await snapshot.refresh()
+    assert snapshot.available()
+
+    # 快照只含主库文件：分片时不再生成，也不参与读路由
+    monkeypatch.setattr(v2_db, "shards", object())
+    assert not snapshot.available()
+    assert await snapshot.refresh() is None
+    assert "分析快照停用" in caplog.text
@@ -0,0 +1,169 @@
+"""
+备份管理器单元测试
+测试全量/增量备份、沿链恢复、城市分片备份、按链清理与篡改检测
+"""
+
+import gzip
+import sqlite3
+
+import pytest
+import pytest_asyncio
+
+from database.db_orders import order_manager
+from database.db_shards import ShardRouter
+from utils.backup_manager import BackupManager, PageSnapshot
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return BackupManager(str(tmp_path / "backups"), {
+        'max_chains': 2, 'full_every': 7, 'full_change_ratio': 0.5, 'pages_per_step': 4,
+    })
+
+
+async def _insert_users(db, start, count):
+    await db.execute_transaction([
+        ("INSERT INTO users (user_id, username) VALUES (?, ?)", (i, f"user_{i}"))
+        for i in range(start, start + count)
+    ])
+
+
+async def _user_count(db):
+    row = await db.fetch_one("SELECT COUNT(*) FROM users")
+    return row[0]
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_and_restore(v2_db, manager):
+    await _insert_users(v2_db, 1, 50)
+    full = await manager.create_backup("b1")
+    assert full['status'] == 'success' and full['type'] == 'full'
+    assert full['changed_pages'] == full['page_count']
+
+    await _insert_users(v2_db, 100, 5)
+    inc = await manager.create_backup("b2")
+    assert (inc['type'], inc['base'], inc['chain_length']) == ('incremental', 'b1', 1)
+    assert 0 < inc['changed_pages'] < inc['page_count'] // 2
+
+    await v2_db.execute_query("DELETE FROM users")
+    result = await manager.restore_backup("b2")
+    assert result['status'] == 'success' and result['chain'] == ['b1', 'b2']
+    assert await _user_count(v2_db) == 55
+
+    assert (await manager.restore_backup("b1"))['status'] == 'success'
+    assert await _user_count(v2_db) == 50
+
+
+@pytest_asyncio.fixture
+async def sharded(v2_db, tmp_path, monkeypatch):
+    """两个城市分片，各一个商户"""
+    router = ShardRouter(v2_db, {
+        "enabled": True, "dir": str(tmp_path / "shards"), "tables": ["orders", "row_counters"],
+        "buckets": 0, "id_span": 1000,
+    })
+    router.SCAN_INTERVAL = 0
+    monkeypatch.setattr(v2_db, "shards", router)
+    await v2_db.execute_query("INSERT INTO cities (id, name) VALUES (1, '城一'), (2, '城二')")
+    for merchant_id in (1, 2):
+        await v2_db.execute_query(
+            "INSERT INTO merchants (id, telegram_chat_id, name, city_id) VALUES (?, ?, ?, ?)",
+            (merchant_id, 1000 + merchant_id, f"商户{merchant_id}", merchant_id),
+        )
+    await router.prepare()
+    yield router
+    await router.close()
+
+
+async def _add_orders(merchant_id, count):
+    for _ in range(count):
+        await order_manager.create_order(
+            {"merchant_id": merchant_id, "customer_user_id": 2001, "price": 500, "status": "尝试预约"}
+        )
+
+
+async def _shard_order_counts(router):
+    return [(await router.shard(i).fetch_one("SELECT COUNT(*) FROM orders"))[0] for i in (1, 2)]
+
+
+@pytest.mark.asyncio
+async def test_sharded_backup_and_restore(v2_db, manager, sharded):
+    manager.full_change_ratio = 1.0  # 分片文件只有几页，避免一次写入即改做全量
+    await _add_orders(1, 3)
+    await _add_orders(2, 2)
+    full = await manager.create_backup("b1")
+    assert full['status'] == 'success'
+    assert {k: v['type'] for k, v in full['shards'].items()} == {'1': 'full', '2': 'full'}
+
+    await _add_orders(1, 1)
+    inc = await manager.create_backup("b2")
+    assert inc['type'] == 'incremental'
+    assert {k: v['type'] for k, v in inc['shards'].items()} == {'1': 'incremental', '2': 'incremental'}
+    assert 0 < inc['shards']['1']['changed_pages'] and inc['shards']['2']['changed_pages'] == 0
+
+    for shard_id in (1, 2):
+        await sharded.shard(shard_id).execute_query("DELETE FROM orders")
+    result = await manager.restore_backup("b2")
+    assert result['status'] == 'success'
+    assert await _shard_order_counts(sharded) == [4, 2]
+
+    assert (await manager.restore_backup("b1"))['status'] == 'success'
+    assert await _shard_order_counts(sharded) == [3, 2]
+    assert (await v2_db.fetch_one("SELECT COUNT(*) FROM orders"))[0] == 5
+
+
+@pytest.mark.asyncio
+async def test_snapshot_pages_ignore_later_writes(v2_db, tmp_path):
+    await _insert_users(v2_db, 1, 30)
+    snapshot = PageSnapshot(v2_db.db_path, batch_pages=4)
+    try:
+        # 快照开启后的写入（含新增页）不进入本次读出的页
+        await _insert_users(v2_db, 100, 500)
+        image = tmp_path / "image.db"
+        with open(image, 'wb') as f:
+            for page in snapshot.pages():
+                f.write(page)
+        assert image.stat().st_size == snapshot.page_count * snapshot.page_size
+    finally:
+        snapshot.close()
+
+    conn = sqlite3.connect(image)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 30
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_backup_writes_no_staging_copy(v2_db, manager):
+    await _insert_users(v2_db, 1, 50)
+    result = await manager.create_backup("b1")
+    assert result['status'] == 'success' and result['source']['pages'] == result['page_count']
+    assert sorted(p.name for p in manager.backup_dir.iterdir()) == ["b1"]
+
+
+@pytest.mark.asyncio
+async def test_cleanup_keeps_whole_chains(v2_db, manager):
+    manager.full_every = 1
+    for i, name in enumerate(("a1", "a2", "b1", "b2", "c1")):
+        await _insert_users(v2_db, i + 1, 1)
+        assert (await manager.create_backup(name))['status'] == 'success'
+
+    backups = await manager.list_backups()
+    assert [b['name'] for b in backups] == ["c1", "b2", "b1"]
+    assert [b['type'] for b in backups] == ["full", "incremental", "full"]
+    stats = await manager.get_backup_statistics()
+    assert (stats['full_backups'], stats['incremental_backups']) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_tampered_backup_is_rejected(v2_db, manager):
+    await _insert_users(v2_db, 1, 10)
+    await manager.create_backup("b1")
+    with gzip.open(manager.backup_dir / "b1" / "database.db.gz", 'wb') as f:
+        f.write(b"corrupted")
+
+    await v2_db.execute_query("DELETE FROM users")
+    result = await manager.restore_backup("b1")
+    assert result['status'] == 'failed' and '校验和' in result['error']
+    assert await _user_count(v2_db) == 0
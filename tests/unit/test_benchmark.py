@@ -0,0 +1,58 @@
+"""
+基准测试工具单元测试
+测试数据集确定性、用例执行与结果对比
+"""
+
+import sqlite3
+
+import pytest
+
+from tools.bench_dataset import build_dataset, read_meta
+from tools.benchmark import compare, run_benchmark, summarize
+
+TINY = {'cities': 2, 'districts_per_city': 3, 'users': 60, 'merchants': 12, 'keywords': 5,
+        'orders': 300, 'logs': 200, 'triggers': 6}
+
+
+def _dump(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_dataset_is_deterministic(tmp_path):
+    first, second = str(tmp_path / "a.db"), str(tmp_path / "b.db")
+    counts = await build_dataset(first, TINY, seed=7)
+    await build_dataset(second, TINY, seed=7)
+
+    assert counts['orders'] == 300 and counts['activity_logs'] == 200
+    assert 0 < counts['merchant_reviews'] <= counts['reviews'] < 300
+    for table in ('merchants', 'orders', 'reviews', 'merchant_reviews', 'user_scores'):
+        assert _dump(first, table) == _dump(second, table)
+    assert read_meta(first)['counts'] == counts
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark(tmp_path):
+    path = str(tmp_path / "bench.db")
+    await build_dataset(path, TINY, seed=42)
+    report = await run_benchmark(path, scale='tiny', repeat=2, warmup=0,
+                                 only=['region_listing', 'auto_reply_match', 'leaderboard_build'])
+    assert set(report['results']) == {'region_listing', 'auto_reply_match', 'leaderboard_build'}
+    assert report['results']['leaderboard_build']['runs'] == 1
+    assert report['dataset']['orders'] == 300
+
+
+def test_summarize_and_compare():
+    stats = summarize([4.0, 1.0, 2.0, 3.0])
+    assert (stats['min_ms'], stats['median_ms'], stats['max_ms'], stats['runs']) == (1.0, 2.5, 4.0, 4)
+
+    baseline = {'results': {'a': {'median_ms': 10.0}, 'b': {'median_ms': 10.0}}}
+    current = {'results': {'a': {'median_ms': 13.0}, 'b': {'median_ms': 9.0}, 'c': {'median_ms': 1.0}}}
+    rows = {r['name']: r for r in compare(current, baseline, threshold=0.2)}
+    assert set(rows) == {'a', 'b'}
+    assert rows['a']['regression'] and not rows['b']['regression']
+    assert rows['a']['change'] == 0.3
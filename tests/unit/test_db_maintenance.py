@@ -0,0 +1,116 @@
+"""
+数据库维护单元测试
+测试静默时段判断、自适应 WAL 检查点、增量 VACUUM、旧库切换增量模式与分片文件维护
+"""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from database.db_maintenance import DatabaseMaintenance
+from database.db_shards import ShardRouter
+
+QUIET = datetime(2026, 10, 18, 4, 0)
+BUSY = datetime(2026, 10, 18, 12, 0)
+
+
+def _maintenance(**overrides):
+    config = {
+        'wal_passive_mb': 0, 'wal_truncate_mb': 1024, 'quiet_hours': '3-6',
+        'vacuum_min_free_pages': 10, 'vacuum_pages_per_step': 8, 'vacuum_max_steps': 1000,
+        'vacuum_step_sleep': 0,
+    }
+    config.update(overrides)
+    return DatabaseMaintenance(config)
+
+
+async def _make_free_pages(db):
+    payload = 'x' * 2000
+    await db.execute_transaction([
+        ("INSERT INTO system_config (config_key, config_value) VALUES (?, ?)", (f"bulk_{i}", payload))
+        for i in range(300)
+    ])
+    await db.execute_query("DELETE FROM system_config WHERE config_key LIKE 'bulk_%'")
+
+
+def test_quiet_hours_wrap_midnight():
+    assert _maintenance().in_quiet_hours(QUIET)
+    assert not _maintenance().in_quiet_hours(BUSY)
+    overnight = _maintenance(quiet_hours='23-5')
+    assert overnight.in_quiet_hours(datetime(2026, 1, 1, 23, 30))
+    assert overnight.in_quiet_hours(datetime(2026, 1, 1, 2, 0))
+    assert not overnight.in_quiet_hours(datetime(2026, 1, 1, 5, 0))
+
+
+@pytest.mark.asyncio
+async def test_adaptive_checkpoint(v2_db):
+    await _make_free_pages(v2_db)
+    wal = f"{v2_db.db_path}-wal"
+    assert os.path.getsize(wal) > 0
+
+    assert (await _maintenance(wal_passive_mb=1024).run_cycle(BUSY))['checkpoint'] is None
+    assert (await _maintenance().run_cycle(BUSY))['checkpoint'] == 'passive'
+    result = await _maintenance(wal_truncate_mb=0).run_cycle(BUSY)
+    assert result['checkpoint'] == 'truncate'
+    assert os.path.getsize(wal) == 0
+
+
+@pytest.mark.asyncio
+async def test_incremental_vacuum_only_in_quiet_hours(v2_db):
+    maintenance = _maintenance()
+    await _make_free_pages(v2_db)
+    stats = await maintenance.stats()
+    assert stats['auto_vacuum'] == 2 and stats['freelist_pages'] >= 100
+
+    assert (await maintenance.run_cycle(BUSY))['vacuumed'] == 0
+    result = await maintenance.run_cycle(QUIET)
+    assert result['vacuumed'] >= 100
+    assert (await maintenance.stats())['freelist_pages'] == 0
+
+
+@pytest.mark.asyncio
+async def test_legacy_database_switches_to_incremental(v2_db):
+    async with v2_db.get_connection() as conn:
+        await conn.execute("PRAGMA auto_vacuum=NONE")
+        await conn.execute("VACUUM")
+    await _make_free_pages(v2_db)
+    maintenance = _maintenance()
+    assert (await maintenance.stats())['auto_vacuum'] == 0
+
+    assert (await _maintenance(full_vacuum_max_mb=0).run_cycle(QUIET))['vacuumed'] == 0
+    assert (await maintenance.run_cycle(QUIET))['vacuumed'] > 0
+    stats = await maintenance.stats()
+    assert (stats['auto_vacuum'], stats['freelist_pages']) == (2, 0)
+
+
+@pytest.mark.asyncio
+async def test_shard_files_checkpointed_and_vacuumed(v2_db, tmp_path, monkeypatch):
+    router = ShardRouter(v2_db, {
+        "enabled": True, "dir": str(tmp_path / "shards"), "tables": ["orders", "row_counters"],
+        "buckets": 0, "id_span": 1000,
+    })
+    router.SCAN_INTERVAL = 0
+    monkeypatch.setattr(v2_db, "shards", router)
+    try:
+        await router.prepare()
+        await router.ensure_shard(1)
+        shard = router.shard(1)
+        payload = 'x' * 2000
+        await shard.execute_transaction([
+            ("INSERT INTO row_counters (counter_key, value) VALUES (?, ?)", (f"{payload}{i}", i))
+            for i in range(300)
+        ])
+        await shard.execute_query("DELETE FROM row_counters")
+        assert os.path.getsize(f"{shard.db_path}-wal") > 0
+
+        result = await _maintenance(wal_truncate_mb=0).run_cycle(BUSY)
+        assert set(result['shards']) == {'shard_1'}
+        assert result['shards']['shard_1']['checkpoint'] == 'truncate'
+        assert os.path.getsize(f"{shard.db_path}-wal") == 0
+
+        result = await _maintenance().run_cycle(QUIET)
+        assert result['shards']['shard_1']['vacuumed'] >= 100
+        assert (await _maintenance().stats(shard))['freelist_pages'] == 0
+    finally:
+        await router.close()
@@ -0,0 +1,116 @@
+"""
+模拟 Bot API 服务器与压测统计单元测试
+测试消息/键盘记录、编辑、媒体组、429/403 模拟及百分位计算
+"""
+
+import json
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from tools.fake_bot_api import FakeBotApi
+from tools.load_generator import FAKE_TOKEN, latency_summary, percentile
+
+
+@pytest_asyncio.fixture
+async def fake_api():
+    api = FakeBotApi()
+    await api.start()
+    yield api
+    await api.stop()
+
+
+def _bot(api):
+    return Bot(FAKE_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+
+
+@pytest.mark.asyncio
+async def test_messages_and_keyboards(fake_api):
+    bot = _bot(fake_api)
+    try:
+        kb = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="A", callback_data="city_1"),
+            InlineKeyboardButton(text="B", callback_data="city_2"),
+        ]])
+        sent = await bot.send_message(42, "选择城市", reply_markup=kb)
+        assert sent.chat.id == 42 and sent.text == "选择城市"
+        assert fake_api.last_buttons(42) == (sent.message_id, ["city_1", "city_2"])
+
+        edited = await bot.edit_message_text("选择区县", chat_id=42, message_id=sent.message_id,
+                                             reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+                                                 InlineKeyboardButton(text="C", callback_data="district_3")]]))
+        assert edited.text == "选择区县"
+        assert fake_api.last_buttons(42) == (sent.message_id, ["district_3"])
+
+        await bot.edit_message_reply_markup(chat_id=42, message_id=sent.message_id)
+        assert fake_api.last_buttons(42) == (None, [])
+
+        member = await bot.get_chat_member(-100123, 42)
+        assert member.status == "member"
+        file = await bot.get_file("abc")
+        assert file.file_path == "files/abc.bin"
+        assert (await bot.get_me()).username == "fake_load_bot"
+    finally:
+        await bot.session.close()
+    assert fake_api.calls["sendMessage"] == 1 and fake_api.calls["editMessageText"] == 1
+
+
+@pytest.mark.asyncio
+async def test_media_group(fake_api):
+    async with aiohttp.ClientSession() as session:
+        media = [{"type": "photo", "media": "x", "caption": "封面"}, {"type": "video", "media": "y"}]
+        async with session.post(f"{fake_api.url}/bot{FAKE_TOKEN}/sendMediaGroup",
+                                data={"chat_id": "-1001", "media": json.dumps(media)}) as resp:
+            payload = await resp.json()
+    messages = payload["result"]
+    assert [("photo" in m, "video" in m) for m in messages] == [(True, False), (False, True)]
+    assert messages[0]["caption"] == "封面" and messages[0]["media_group_id"] == messages[1]["media_group_id"]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_and_blocked_users():
+    api = FakeBotApi(rate_limit=1.0, retry_after=3)
+    await api.start()
+    bot = _bot(api)
+    try:
+        with pytest.raises(TelegramRetryAfter) as exc:
+            await bot.send_message(1, "hi")
+        assert exc.value.retry_after == 3
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+    api = FakeBotApi(blocked_users=[7])
+    await api.start()
+    bot = _bot(api)
+    try:
+        with pytest.raises(TelegramForbiddenError):
+            await bot.send_message(7, "hi")
+        # 编辑与回调应答不受拉黑影响
+        assert await bot.answer_callback_query("1")
+    finally:
+        await bot.session.close()
+        await api.stop()
+    assert api.errors == {"403": 1}
+
+
+def test_blocked_rate_is_deterministic():
+    api = FakeBotApi(blocked_rate=0.1)
+    blocked = [uid for uid in range(100000, 110000) if api.is_blocked(uid)]
+    assert 800 < len(blocked) < 1200
+    assert blocked == [uid for uid in range(100000, 110000) if FakeBotApi(blocked_rate=0.1).is_blocked(uid)]
+    assert not api.is_blocked(-1001)
+
+
+def test_percentiles():
+    ordered = [float(i) for i in range(1, 101)]
+    assert (percentile(ordered, 0.5), percentile(ordered, 0.95), percentile(ordered, 0.99)) == (50.0, 95.0, 99.0)
+    assert percentile([], 0.5) == 0.0
+    summary = latency_summary([3.0, 1.0, 2.0], elapsed=2.0)
+    assert (summary["count"], summary["p50_ms"], summary["max_ms"], summary["per_sec"]) == (3, 2.0, 3.0, 1.5)
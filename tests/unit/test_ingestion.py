@@ -0,0 +1,122 @@
+"""
+更新接入调度单元测试
+测试通道分类、优先级分配、并发份额与过载丢弃
+"""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from aiogram.types import Update, User
+
+from middleware.ingestion import IngestionMiddleware, PriorityGate
+
+LANES = {
+    "admin": {"priority": 0, "max_share": 1.0, "max_queue": None, "max_wait": None},
+    "flow": {"priority": 1, "max_share": 1.0, "max_queue": 10, "max_wait": None},
+    "browse": {"priority": 2, "max_share": 0.75, "max_queue": 10, "max_wait": None},
+    "auto_reply": {"priority": 3, "max_share": 0.5, "max_queue": 1, "max_wait": 0.05},
+}
+
+
+def make_update(user_id: int = 5, text: str = None, callback: str = None, photo: bool = False) -> Update:
+    sender = {'id': user_id, 'is_bot': False, 'first_name': 'u'}
+    message = {'message_id': 1, 'date': 0, 'chat': {'id': user_id, 'type': 'private'}, 'from': sender}
+    if callback is not None:
+        return Update.model_validate({
+            'update_id': 1,
+            'callback_query': {'id': 'c', 'from': sender, 'chat_instance': 'x', 'data': callback, 'message': message},
+        })
+    if photo:
+        message['photo'] = [{'file_id': 'f', 'file_unique_id': 'u', 'width': 1, 'height': 1}]
+    else:
+        message['text'] = text
+    return Update.model_validate({'update_id': 1, 'message': message})
+
+
+def context(update: Update, raw_state: str = None) -> dict:
+    user = update.callback_query.from_user if update.callback_query else update.message.from_user
+    return {'event_from_user': User(id=user.id, is_bot=False, first_name='u'), 'raw_state': raw_state}
+
+
+class TestClassify:
+    """通道分类测试"""
+
+    def test_lanes(self):
+        middleware = IngestionMiddleware(gate=PriorityGate(4, LANES))
+        cases = [
+            (make_update(callback='order_now_12'), None, 'flow'),
+            (make_update(callback='city_3'), None, 'browse'),
+            (make_update(text='/start'), None, 'browse'),
+            (make_update(text='你好'), None, 'auto_reply'),
+            (make_update(text='张三'), 'MerchantStates:entering_name', 'flow'),
+            (make_update(text='我要上榜流程'), None, 'flow'),
+            (make_update(photo=True), None, 'browse'),
+        ]
+        for update, raw_state, lane in cases:
+            assert middleware.classify(update, context(update, raw_state)) == lane
+
+        with patch('middleware.ingestion.ADMIN_IDS', [5]):
+            update = make_update(text='你好')
+            assert middleware.classify(update, context(update)) == 'admin'
+
+
+class TestPriorityGate:
+    """名额分配测试"""
+
+    @pytest.mark.asyncio
+    async def test_higher_priority_admitted_first(self):
+        gate = PriorityGate(1, LANES)
+        assert await gate.acquire('browse')
+        order = []
+
+        async def wait(lane):
+            if await gate.acquire(lane):
+                order.append(lane)
+                gate.release(lane)
+
+        tasks = [asyncio.create_task(wait('browse')), asyncio.create_task(wait('flow'))]
+        await asyncio.sleep(0)
+        assert gate.get_stats()['lanes']['flow']['queued'] == 1
+
+        gate.release('browse')
+        await asyncio.gather(*tasks)
+        assert order == ['flow', 'browse']
+
+    @pytest.mark.asyncio
+    async def test_low_priority_share_and_shedding(self):
+        gate = PriorityGate(4, LANES)
+        assert await gate.acquire('auto_reply')
+        assert await gate.acquire('auto_reply')
+
+        # auto_reply 最多占 2 个名额；第 3 个排队，第 4 个超出队列上限直接丢弃
+        waiting = asyncio.create_task(gate.acquire('auto_reply'))
+        await asyncio.sleep(0)
+        assert not await gate.acquire('auto_reply')
+        # 预留的名额仍可供下单流程使用
+        assert await gate.acquire('flow')
+
+        # 排队的 auto_reply 等待超时被丢弃
+        assert not await waiting
+        stats = gate.get_stats()['lanes']['auto_reply']
+        assert (stats['shed'], stats['expired'], stats['active'], stats['queued']) == (1, 1, 2, 0)
+
+    @pytest.mark.asyncio
+    async def test_middleware_rejects_when_overloaded(self):
+        gate = PriorityGate(1, LANES)
+        middleware = IngestionMiddleware(gate=gate)
+        handled = []
+
+        async def handler(event, data):
+            handled.append(event.update_id)
+
+        assert await gate.acquire('flow')
+        update = make_update(text='你好')
+        await middleware(handler, update, context(update))
+        assert handled == []
+        assert gate.get_stats()['lanes']['auto_reply']['expired'] == 1
+
+        gate.release('flow')
+        await middleware(handler, update, context(update))
+        assert handled == [1]
+        assert gate.active == 0
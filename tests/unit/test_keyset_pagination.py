@@ -0,0 +1,135 @@
+"""
+键集分页与行数计数器单元测试
+测试游标编解码、游标翻页与 OFFSET 结果一致，以及触发器维护的计数器
+"""
+
+import pytest
+
+from database.db_connection import db_manager
+from database.db_counters import row_counters
+from database.db_orders import OrderManager
+from database.db_pagination import cursor_after, decode_cursor, encode_cursor, keyset_condition
+from database.db_users import UserManager
+
+
+class TestCursor:
+    """游标编解码测试"""
+
+    def test_round_trip(self):
+        cursor = encode_cursor('2026-10-18 10:00:00', 42)
+        assert '=' not in cursor
+        assert decode_cursor(cursor) == ('2026-10-18 10:00:00', 42)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        assert decode_cursor(None) is None
+        assert decode_cursor('not-a-cursor') is None
+        assert decode_cursor(encode_cursor('a', 'x')) is None
+        assert keyset_condition('garbage', 'o.created_at', 'o.id') == (None, [])
+
+    def test_cursor_after_only_on_full_page(self):
+        rows = [{'created_at': 'a', 'id': 2}, {'created_at': 'a', 'id': 1}]
+        assert cursor_after(rows, 3) is None
+        assert decode_cursor(cursor_after(rows, 2)) == ('a', 1)
+
+    def test_null_created_at_cursor(self):
+        # created_at 为 NULL 的行（DESC 时排在最后）按 id 继续翻页
+        assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+        assert keyset_condition(encode_cursor(None, 7), 'o.created_at', 'o.id') == (
+            "(o.created_at IS NULL AND o.id < ?)", [7]
+        )
+
+
+async def seed_orders(count):
+    await db_manager.execute_query(
+        "INSERT INTO merchants (id, telegram_chat_id, name) VALUES (1, 1001, '商户A')"
+    )
+    for order_id in range(1, count + 1):
+        # 每三单共用一个创建时间，验证同一时间戳内按 id 稳定排序
+        await db_manager.execute_query(
+            "INSERT INTO orders (id, merchant_id, customer_user_id, price, status, created_at) "
+            "VALUES (?, 1, 2001, 500, ?, ?)",
+            (order_id, '已完成' if order_id % 2 else '尝试预约', f"2026-10-{1 + order_id // 3:02d} 12:00:00"),
+        )
+
+
+class TestKeysetPagination:
+    """游标翻页测试"""
+
+    @pytest.mark.asyncio
+    async def test_cursor_pages_match_offset_pages(self, v2_db):
+        await seed_orders(11)
+
+        by_offset = []
+        for offset in range(0, 11, 4):
+            by_offset.append([o['id'] for o in await OrderManager.get_orders(limit=4, offset=offset)])
+
+        by_cursor, cursor = [], None
+        while True:
+            rows = await OrderManager.get_orders(limit=4, cursor=cursor)
+            by_cursor.append([o['id'] for o in rows])
+            cursor = cursor_after(rows, 4)
+            if cursor is None:
+                break
+
+        assert by_cursor == by_offset
+        assert sum(by_cursor, []) == sorted(range(1, 12), key=lambda i: (1 + i // 3, i), reverse=True)
+
+    @pytest.mark.asyncio
+    async def test_rows_without_created_at_are_reachable(self, v2_db):
+        await seed_orders(5)
+        for order_id in range(6, 10):
+            await db_manager.execute_query(
+                "INSERT INTO orders (id, merchant_id, customer_user_id, price, created_at) VALUES (?, 1, 2001, 500, NULL)",
+                (order_id,),
+            )
+
+        by_cursor, cursor = [], None
+        for _ in range(10):
+            rows = await OrderManager.get_orders(limit=3, cursor=cursor)
+            by_cursor.extend(o['id'] for o in rows)
+            cursor = cursor_after(rows, 3)
+            if cursor is None:
+                break
+        by_offset = [o['id'] for o in await OrderManager.get_orders(limit=20, offset=0)]
+        assert by_cursor == by_offset and sorted(by_cursor) == list(range(1, 10))
+        assert by_cursor[-4:] == [9, 8, 7, 6]
+
+    @pytest.mark.asyncio
+    async def test_users_cursor_uses_user_id(self, v2_db):
+        for user_id in (10, 20, 30):
+            await db_manager.execute_query(
+                "INSERT INTO users (user_id, username, created_at) VALUES (?, ?, '2026-10-18 10:00:00')",
+                (user_id, f"u{user_id}"),
+            )
+        first = await UserManager.get_users_with_pagination(limit=2)
+        assert [u['user_id'] for u in first] == [30, 20]
+        rest = await UserManager.get_users_with_pagination(
+            limit=2, cursor=cursor_after(first, 2, id_key='user_id')
+        )
+        assert [u['user_id'] for u in rest] == [10]
+
+
+class TestRowCounters:
+    """触发器维护的计数器测试"""
+
+    @pytest.mark.asyncio
+    async def test_counters_follow_insert_update_delete(self, v2_db):
+        await seed_orders(5)
+        assert await OrderManager.count_orders() == 5
+        assert await OrderManager.count_orders(status='已完成') == 3
+
+        await db_manager.execute_query("UPDATE orders SET status = '尝试预约' WHERE id = 1")
+        await db_manager.execute_query("DELETE FROM orders WHERE id = 2")
+        counts = await row_counters.get_many(['orders', 'orders:status:已完成', 'orders:status:尝试预约'])
+        assert counts == {'orders': 4, 'orders:status:已完成': 2, 'orders:status:尝试预约': 2}
+
+        # 带其它筛选时仍走 COUNT(*)
+        assert await OrderManager.count_orders(merchant_id=1) == 4
+
+    @pytest.mark.asyncio
+    async def test_rebuild_matches_triggers(self, v2_db):
+        await seed_orders(4)
+        before = await row_counters.get_many(['orders', 'orders:status:已完成', 'merchants'])
+        await db_manager.execute_query("DELETE FROM row_counters")
+        assert await row_counters.rebuild() > 0
+        assert await row_counters.get_many(['orders', 'orders:status:已完成', 'merchants']) == before
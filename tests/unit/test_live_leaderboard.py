@@ -0,0 +1,119 @@
+"""
+实时排行榜单元测试
+测试有序榜的竞赛排名、增量同步与持久化快照
+"""
+
+import asyncio
+
+import pytest
+
+from database.db_connection import db_manager
+from services.live_leaderboard import LiveLeaderboard, RankedBoard
+
+
+class TestRankedBoard:
+    """单维度有序榜测试"""
+
+    def test_competition_rank_and_tiebreak(self):
+        board = RankedBoard()
+        board.upsert(1, 9.0, 6, 100.0)
+        board.upsert(2, 8.5, 10, 100.0)
+        board.upsert(3, 8.5, 7, 100.0)
+        board.upsert(4, 7.0, 6, 100.0)
+
+        assert [e['user_id'] for e in board.top(10)] == [1, 2, 3, 4]
+        assert [e['rank'] for e in board.top(10)] == [1, 2, 2, 4]
+        assert board.rank_of(3)['rank'] == 2
+        assert board.rank_of(99) is None
+
+    def test_upsert_moves_and_remove(self):
+        board = RankedBoard()
+        for uid, score in ((1, 9.0), (2, 8.0), (3, 7.0)):
+            board.upsert(uid, score, 6, 0.0)
+
+        assert board.upsert(3, 9.5, 6, 1.0)
+        assert not board.upsert(3, 9.5, 6, 1.0)
+        assert board.rank_of(3)['rank'] == 1
+
+        assert board.remove(1)
+        assert not board.remove(1)
+        assert [e['user_id'] for e in board.around(2, 1)] == [3, 2]
+        assert board.snapshot() == {3: (1, 9.5, 6), 2: (2, 8.0, 6)}
+
+
+async def put_scores(user_id, score, count, updated_at):
+    await db_manager.execute_query(
+        """
+        INSERT OR REPLACE INTO user_scores
+        (user_id, avg_attack_quality, avg_length, avg_hardness, avg_duration, avg_user_temperament,
+         total_reviews_count, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (user_id, score, score, score, score, score, count, updated_at),
+    )
+
+
+class TestLiveLeaderboard:
+    """实时排行榜（数据库）测试"""
+
+    @pytest.mark.asyncio
+    async def test_load_sync_and_persist(self, v2_db):
+        await put_scores(1, 8.0, 6, '2026-10-18 10:00:00')
+        await put_scores(2, 9.0, 7, '2026-10-18 10:00:00')
+        await put_scores(3, 9.9, 2, '2026-10-18 10:00:00')  # 样本不足，不上榜
+        await db_manager.execute_query(
+            "INSERT INTO user_score_leaderboards (dimension, user_id, avg_score, reviews_count, rank) "
+            "VALUES ('length', 42, 1.0, 6, 9)"
+        )
+
+        board = LiveLeaderboard(min_reviews=6, sync_interval=0, persist_delay=0)
+        assert [e['user_id'] for e in await board.top('length')] == [2, 1]
+        assert await board.rank('length', 3) is None
+
+        await put_scores(1, 9.5, 8, '2026-10-18 10:00:05')
+        assert (await board.rank('length', 1))['rank'] == 1
+
+        await board.persist()
+        rows = await db_manager.fetch_all(
+            "SELECT user_id, rank FROM user_score_leaderboards WHERE dimension='length' ORDER BY rank"
+        )
+        assert [(r['user_id'], r['rank']) for r in rows] == [(1, 1), (2, 2)]
+
+        # 后续持久化只写入有变化的行
+        await put_scores(2, 9.0, 7, '2026-10-18 10:00:05')
+        await board.sync()
+        assert await board.persist() == 0
+
+    @pytest.mark.asyncio
+    async def test_only_owner_process_persists(self, v2_db):
+        await put_scores(1, 8.0, 6, '2026-10-18 10:00:00')
+        board = LiveLeaderboard(min_reviews=6, sync_interval=0, persist_delay=0)
+        await board.ensure_loaded()
+        await asyncio.sleep(0.01)
+        assert board._persist_task is None
+        assert (await db_manager.fetch_one("SELECT COUNT(*) FROM user_score_leaderboards"))[0] == 0
+
+        board.enable_persist()
+        await board._persist_task
+        assert (await db_manager.fetch_one(
+            "SELECT COUNT(*) FROM user_score_leaderboards WHERE dimension='length'"
+        ))[0] == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_dimension_rejected(self, v2_db):
+        board = LiveLeaderboard(min_reviews=6, sync_interval=0, persist_delay=0)
+        with pytest.raises(ValueError):
+            await board.top('no_such_dim')
+
+    @pytest.mark.asyncio
+    async def test_rebuild_applies_threshold(self, v2_db):
+        await put_scores(1, 8.0, 3, '2026-10-18 10:00:00')
+        await put_scores(2, 7.0, 6, '2026-10-18 10:00:00')
+
+        board = LiveLeaderboard(min_reviews=6, sync_interval=60, persist_delay=60)
+        assert (await board.rebuild(min_reviews=3))['length'] == 2
+
+        row = await db_manager.fetch_one(
+            "SELECT COUNT(*) AS c FROM user_score_leaderboards WHERE dimension='hardness'"
+        )
+        assert row['c'] == 2
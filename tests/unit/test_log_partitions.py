@@ -0,0 +1,117 @@
+"""
+活动日志按月分区单元测试
+测试分区写入、旧表拆分与过期分区归档删除
+"""
+
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.db_connection import db_manager
+from database.db_log_partitions import ActivityLogPartitions, current_month_key, log_partitions, partition_name
+from database.db_logs import ActivityLogsDatabase
+
+
+async def table_names():
+    rows = await db_manager.fetch_all(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'activity_logs%'"
+    )
+    return {r['name'] for r in rows}
+
+
+class TestActivityLogPartitions:
+    """分区管理测试"""
+
+    @pytest.mark.asyncio
+    async def test_writes_land_in_current_partition(self, v2_db):
+        log_id = await ActivityLogsDatabase._create_log_entry(7, 'button_click', {'a': 1})
+        current = partition_name(current_month_key())
+
+        row = await db_manager.fetch_one(f"SELECT user_id FROM {current} WHERE id = ?", (log_id,))
+        assert row['user_id'] == 7
+
+        # 直接写视图的旧语句经触发器落入当月分区，ID 继续递增
+        await db_manager.execute_query(
+            "INSERT INTO activity_logs (user_id, action_type, details) VALUES (8, 'legacy', '{}')"
+        )
+        rows = await db_manager.fetch_all(f"SELECT id, user_id FROM {current} ORDER BY id")
+        assert rows[-1]['user_id'] == 8 and rows[-1]['id'] > log_id
+
+    @pytest.mark.asyncio
+    async def test_view_inserts_route_by_month(self, v2_db):
+        old = await log_partitions.ensure_partition('202401')
+        current = partition_name(current_month_key())
+        for user_id, ts in ((1, '2024-01-10 08:00:00'), (2, '2023-05-01 00:00:00'), (3, None)):
+            await db_manager.execute_query(
+                "INSERT INTO activity_logs (user_id, action_type, timestamp) VALUES (?, 'x', ?)", (user_id, ts)
+            )
+
+        # 有对应分区的月份落入该分区；没有的落入当月分区
+        assert [r['user_id'] for r in await db_manager.fetch_all(f"SELECT user_id FROM {old}")] == [1]
+        rows = await db_manager.fetch_all(f"SELECT user_id FROM {current} WHERE action_type = 'x' ORDER BY id")
+        assert [r['user_id'] for r in rows] == [2, 3]
+
+        # 旧分区的写入同样衔接全局最大ID
+        ids = [r['id'] for r in await db_manager.fetch_all("SELECT id FROM activity_logs")]
+        assert len(ids) == len(set(ids))
+        old_id = (await db_manager.fetch_one(f"SELECT id FROM {old}"))['id']
+        assert old_id < (await db_manager.fetch_one(f"SELECT MAX(id) AS m FROM {current}"))['m']
+
+    @pytest.mark.asyncio
+    async def test_split_legacy_table(self, v2_db):
+        await db_manager.execute_query("DROP VIEW activity_logs")
+        for name in await table_names():
+            await db_manager.execute_query(f"DROP TABLE {name}")
+        await db_manager.execute_query(
+            "CREATE TABLE activity_logs_unpartitioned (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, "
+            "action_type TEXT NOT NULL, details TEXT, button_id TEXT, merchant_id INTEGER, timestamp TIMESTAMP)"
+        )
+        await db_manager.execute_query(
+            "CREATE VIEW activity_logs AS SELECT id, user_id, action_type, details, button_id, merchant_id, "
+            "timestamp FROM activity_logs_unpartitioned"
+        )
+        for ts in ('2025-01-05 10:00:00', '2025-01-20 10:00:00', '2025-03-01 00:00:00', None):
+            await db_manager.execute_query(
+                "INSERT INTO activity_logs_unpartitioned (user_id, action_type, timestamp) VALUES (1, 'x', ?)", (ts,)
+            )
+
+        partitions = ActivityLogPartitions()
+        assert await partitions.prepare() == 4
+        current = current_month_key()
+        assert await partitions.list_partitions() == ['202501', '202503', current]
+        assert 'activity_logs_unpartitioned' not in await table_names()
+
+        rows = await db_manager.fetch_all("SELECT id FROM activity_logs ORDER BY id")
+        assert [r['id'] for r in rows] == [1, 2, 3, 4]
+        new_id = await db_manager.get_last_insert_id(
+            f"INSERT INTO {partition_name(current)} (user_id, action_type) VALUES (2, 'y')"
+        )
+        assert new_id == 5
+
+    @pytest.mark.asyncio
+    async def test_drop_expired_archives_whole_months(self, v2_db, tmp_path):
+        partitions = ActivityLogPartitions(archive_dir=str(tmp_path), batch_size=2)
+        await partitions.prepare()
+        old_table = await partitions.ensure_partition('202401')
+        for i in range(3):
+            await db_manager.execute_query(
+                f"INSERT INTO {old_table} (user_id, action_type, details, timestamp) VALUES (?, 'x', ?, ?)",
+                (i, json.dumps({'i': i}), '2024-01-15 08:00:00'),
+            )
+        recent = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        await db_manager.execute_query(
+            "INSERT INTO activity_logs (user_id, action_type, timestamp) VALUES (9, 'keep', ?)", (recent,)
+        )
+
+        assert await partitions.drop_expired(90) == 3
+        assert '202401' not in await partitions.list_partitions()
+        assert old_table not in await table_names()
+
+        with gzip.open(tmp_path / 'activity_logs_202401.ndjson.gz', 'rt', encoding='utf-8') as fh:
+            archived = [json.loads(line) for line in fh]
+        assert [a['user_id'] for a in archived] == [0, 1, 2]
+
+        row = await db_manager.fetch_one("SELECT COUNT(*) AS c FROM activity_logs WHERE action_type = 'keep'")
+        assert row['c'] == 1
@@ -0,0 +1,105 @@
+"""
+媒体缓存单元测试
+测试 file_path 缓存、磁盘LRU淘汰与并发请求合并
+"""
+
+import asyncio
+import pytest
+
+from services.media_cache import MediaCache
+
+
+class FakeTelegramMediaCache(MediaCache):
+    """用内存数据替代 Telegram getFile/下载 的缓存"""
+
+    def __init__(self, files, **kwargs):
+        super().__init__(**kwargs)
+        self.files = files  # file_id -> (file_path, unique_id, bytes)
+        self.resolve_calls = 0
+        self.download_calls = 0
+
+    async def _resolve_file_path(self, file_id):
+        self.resolve_calls += 1
+        await asyncio.sleep(0.01)
+        file_path, unique_id, _ = self.files[file_id]
+        return file_path, unique_id
+
+    async def _download(self, file_path, dest):
+        self.download_calls += 1
+        await asyncio.sleep(0.01)
+        data = next(v[2] for v in self.files.values() if v[0] == file_path)
+        with open(dest, 'wb') as f:
+            f.write(data)
+
+
+@pytest.fixture
+def files():
+    return {
+        "fid_a": ("photos/a.jpg", "UA", b"a" * 100),
+        "fid_b": ("photos/b.jpg", "UB", b"b" * 100),
+        "fid_c": ("videos/c.mp4", "UC", b"c" * 100),
+    }
+
+
+class TestMediaCache:
+    """媒体缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_second_request_served_from_disk(self, tmp_path, files):
+        cache = FakeTelegramMediaCache(files, cache_dir=str(tmp_path), max_bytes=10_000, file_path_ttl=60)
+
+        first = await cache.get("fid_a")
+        second = await cache.get("fid_a")
+
+        assert first.path == second.path
+        assert first.etag == '"UA"'
+        assert first.media_type == "image/jpeg"
+        assert cache.resolve_calls == 1
+        assert cache.download_calls == 1
+        assert cache.get_stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_are_collapsed(self, tmp_path, files):
+        cache = FakeTelegramMediaCache(files, cache_dir=str(tmp_path), max_bytes=10_000, file_path_ttl=60)
+
+        results = await asyncio.gather(*[cache.get("fid_b") for _ in range(10)])
+
+        assert len({r.path for r in results}) == 1
+        assert cache.resolve_calls == 1
+        assert cache.download_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_respects_size_bound(self, tmp_path, files):
+        cache = FakeTelegramMediaCache(files, cache_dir=str(tmp_path), max_bytes=250, file_path_ttl=60)
+
+        await cache.get("fid_a")
+        await cache.get("fid_b")
+        await cache.get("fid_a")  # a 变为最近使用
+        await cache.get("fid_c")  # 超出上限，淘汰最久未用的 b
+
+        names = sorted(p.name for p in tmp_path.iterdir())
+        assert names == ["UA.jpg", "UC.mp4"]
+        assert cache.get_stats()["total_bytes"] == 200
+        assert cache.get_stats()["evictions"] == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_file_path_reuses_disk_content(self, tmp_path, files):
+        cache = FakeTelegramMediaCache(files, cache_dir=str(tmp_path), max_bytes=10_000, file_path_ttl=0)
+
+        await cache.get("fid_a")
+        await cache.get("fid_a")
+
+        # 映射过期会重新 getFile，但内容按 file_unique_id 命中磁盘缓存
+        assert cache.resolve_calls == 2
+        assert cache.download_calls == 1
+
+    @pytest.mark.asyncio
+    async def test_index_rebuilt_from_existing_directory(self, tmp_path, files):
+        (tmp_path / "UA.jpg").write_bytes(b"a" * 100)
+        (tmp_path / "stale.jpg.part").write_bytes(b"x")
+        cache = FakeTelegramMediaCache(files, cache_dir=str(tmp_path), max_bytes=10_000, file_path_ttl=60)
+
+        await cache.get("fid_a")
+
+        assert cache.download_calls == 0
+        assert not (tmp_path / "stale.jpg.part").exists()
@@ -0,0 +1,73 @@
+"""
+媒体缩略图流水线单元测试
+测试 WebP 缩略图生成与任务入库
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from services import media_thumbnails
+from services.media_cache import CachedMedia
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "src.jpg"
+    Image.new("RGB", (1200, 800), (200, 30, 30)).save(path, "JPEG")
+    return str(path)
+
+
+class TestRenderVariants:
+    """缩略图渲染测试（同步，在子进程中执行的函数）"""
+
+    def test_photo_variants_are_bounded_webp(self, photo, tmp_path):
+        out_dir = tmp_path / "thumbs"
+        out_dir.mkdir()
+
+        results = media_thumbnails.render_variants(
+            photo, "photo", str(out_dir), "m1_U", {"sm": 160, "md": 480}, 80, 1.0
+        )
+
+        by_variant = {r["variant"]: r for r in results}
+        assert set(by_variant) == {"sm", "md"}
+        assert (by_variant["sm"]["width"], by_variant["sm"]["height"]) == (160, 107)
+        assert max(by_variant["md"]["width"], by_variant["md"]["height"]) == 480
+        for r in results:
+            assert r["file_path"].endswith(".webp")
+            assert r["file_size"] > 0
+            with Image.open(r["file_path"]) as img:
+                assert img.format == "WEBP"
+
+    def test_video_without_ffmpeg_is_skipped(self, photo, tmp_path):
+        with patch("services.media_thumbnails.shutil.which", return_value=None):
+            results = media_thumbnails.render_variants(
+                photo, "video", str(tmp_path), "m2_U", {"sm": 160}, 80, 1.0
+            )
+        assert results == []
+
+
+class TestGenerateThumbnails:
+    """缩略图任务测试"""
+
+    @pytest.mark.asyncio
+    async def test_generate_records_variants(self, photo, tmp_path):
+        cached = CachedMedia(photo, "UNIQ", "image/jpeg", 1)
+
+        class InlineExecutor:
+            def submit(self, fn, *args):
+                import concurrent.futures
+                fut = concurrent.futures.Future()
+                fut.set_result(fn(*args))
+                return fut
+
+        with patch("services.media_cache.media_cache.get", AsyncMock(return_value=cached)), \
+             patch("database.db_media.media_db.save_thumbnails", AsyncMock(return_value=True)) as save, \
+             patch.object(media_thumbnails, "_get_executor", return_value=InlineExecutor()), \
+             patch.object(media_thumbnails, "get_thumbnail_directory", return_value=str(tmp_path)):
+            variants = await media_thumbnails.generate_thumbnails(7, "FILE", "photo")
+
+        assert {v["variant"] for v in variants} == {"sm", "md"}
+        save.assert_awaited_once_with(7, variants)
@@ -0,0 +1,128 @@
+"""
+运行指标单元测试
+测试计数器/仪表/直方图、文本格式输出、多进程快照汇总及数据库埋点
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from database.db_connection import db_manager
+from utils.metrics import DB_QUERY_SECONDS, MetricsRegistry
+
+
+class TestRegistry:
+    """注册表测试"""
+
+    def test_counter_and_gauge(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("jobs_total", "任务数", ["result"])
+        counter.inc(result="ok")
+        counter.inc(2, result="ok")
+        counter.inc(result="failed")
+        assert counter.value(result="ok") == 3
+        assert counter.total() == 4
+        # 重复注册返回同一个指标
+        assert registry.counter("jobs_total", "任务数", ["result"]) is counter
+        with pytest.raises(ValueError):
+            registry.gauge("jobs_total", "任务数")
+
+        gauge = registry.gauge("depth", "队列深度")
+        gauge.set_function(lambda: 7)
+        assert registry.collect(aggregate=False)["depth"]["series"] == {(): 7.0}
+
+    def test_series_limit(self):
+        registry = MetricsRegistry(max_series=2)
+        counter = registry.counter("hits_total", "命中", ["key"])
+        for key in ("a", "b", "c", "d"):
+            counter.inc(key=key)
+        assert counter.value(key="other") == 2
+        assert len(counter._series) == 3
+
+    def test_histogram_render(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "耗时", ["handler"], buckets=(0.1, 1.0))
+        histogram.observe(0.05, handler='a"b')
+        histogram.observe(0.5, handler='a"b')
+        histogram.observe(3, handler='a"b')
+        text = registry.render(aggregate=False)
+        assert "# TYPE latency_seconds histogram" in text
+        assert 'latency_seconds_bucket{handler="a\\"b",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{handler="a\\"b",le="1"} 2' in text
+        assert 'latency_seconds_bucket{handler="a\\"b",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{handler="a\\"b"} 3' in text
+        assert 'latency_seconds_sum{handler="a\\"b"} 3.55' in text
+
+    def test_cache_hit_ratio(self):
+        registry = MetricsRegistry()
+        requests = registry.counter("cache_requests_total", "缓存查询", ["cache", "result"])
+        requests.inc(3, cache="media", result="hit")
+        requests.inc(cache="media", result="miss")
+        assert registry.cache_hit_ratio() == {"media": 0.75}
+
+
+class TestMultiprocess:
+    """多进程快照汇总测试"""
+
+    def _registry(self, directory, role):
+        registry = MetricsRegistry()
+        registry.counter("updates_total", "更新数")
+        registry.gauge("queue_depth", "队列深度")
+        registry.histogram("job_seconds", "耗时", buckets=(1.0,))
+        registry.role = role
+        registry.directory = str(directory)
+        registry._path = os.path.join(str(directory), f"{role}-{id(registry)}.json")
+        return registry
+
+    def test_aggregate_across_processes(self, tmp_path):
+        bot = self._registry(tmp_path, "bot")
+        bot.get("updates_total").inc(5)
+        bot.get("queue_depth").set(4)
+        bot.get("job_seconds").observe(0.5)
+        bot.flush()
+
+        web = self._registry(tmp_path, "web")
+        web.get("updates_total").inc(2)
+        web.get("queue_depth").set(1)
+        web.get("job_seconds").observe(2.0)
+
+        merged = web.collect()
+        assert merged["updates_total"]["series"] == {(): 7.0}
+        assert merged["queue_depth"]["series"] == {(): 5.0}
+        assert merged["job_seconds"]["series"][()] == [[1, 1], 2.5, 2]
+        assert merged["app_processes"]["series"] == {("bot",): 1.0, ("web",): 1.0}
+        assert "updates_total 7" in web.render()
+
+    def test_stale_and_expired_snapshots(self, tmp_path):
+        bot = self._registry(tmp_path, "bot")
+        bot.get("updates_total").inc(5)
+        bot.get("queue_depth").set(4)
+        bot.flush()
+        data = json.loads(open(bot._path, encoding="utf-8").read())
+
+        web = self._registry(tmp_path, "web")
+        web.retention_seconds = 3600
+
+        # 已停止写入的进程：累计值保留，仪表不再计入
+        data["updated_at"] = time.time() - 600
+        open(bot._path, "w", encoding="utf-8").write(json.dumps(data))
+        merged = web.collect()
+        assert merged["updates_total"]["series"] == {(): 5.0}
+        assert merged["queue_depth"]["series"] == {}
+
+        # 超过保留期的快照被删除
+        data["updated_at"] = time.time() - 7200
+        open(bot._path, "w", encoding="utf-8").write(json.dumps(data))
+        merged = web.collect()
+        assert merged["updates_total"]["series"] == {}
+        assert not os.path.exists(bot._path)
+
+
+@pytest.mark.asyncio
+async def test_db_queries_recorded(v2_db):
+    statement = "SELECT username FROM users WHERE user_id = ?"
+    before = DB_QUERY_SECONDS.count(op="fetch_one", statement=statement)
+    await db_manager.fetch_one("SELECT username FROM users WHERE user_id = 42")
+    assert DB_QUERY_SECONDS.count(op="fetch_one", statement=statement) == before + 1
@@ -0,0 +1,226 @@
+"""
+迁移执行引擎单元测试
+测试事务回滚、校验和记录、依赖排序与大表在线 DDL
+"""
+
+import asyncio
+
+import pytest
+
+from database.db_migrations import Migration, MigrationEngine, MigrationError, split_statements
+
+STRICT = "migration_2026_10_19_1_strict.sql"
+
+
+def make_engine(**overrides):
+    config = {"online_min_rows": 100, "batch_rows": 50, "step_sleep": 0, "strict_since": "2026.10.18.1"}
+    config.update(overrides)
+    return MigrationEngine(config)
+
+
+def test_split_statements_keeps_trigger_bodies():
+    sql = """
+    -- 注释; 里的分号
+    CREATE TABLE t (id INTEGER, note TEXT DEFAULT 'a;b');
+    CREATE TRIGGER t_ai AFTER INSERT ON t BEGIN
+        UPDATE t SET note = 'x;y' WHERE id = NEW.id;
+    END;
+    -- 结尾注释
+    """
+    statements = split_statements(sql)
+    assert len(statements) == 2
+    assert statements[1].rstrip(';').endswith("END")
+
+
+def test_order_by_version_and_dependencies():
+    a = Migration("migration_2026_10_19_2_a.sql", "SELECT 1;")
+    b = Migration("migration_2026_10_19_10_b.sql", "SELECT 1;")
+    c = Migration("migration_2026_10_19_3_c.sql", "-- 依赖: migration_2026_10_19_10_b.sql\nSELECT 1;")
+    engine = make_engine()
+    assert [m.name for m in engine.order([b, c, a])] == [a.name, b.name, c.name]
+
+    cyclic = Migration("migration_2026_10_19_4_d.sql", "-- depends: migration_2026_10_19_5_e\nSELECT 1;")
+    other = Migration("migration_2026_10_19_5_e.sql", "-- depends: migration_2026_10_19_4_d\nSELECT 1;")
+    with pytest.raises(MigrationError):
+        engine.order([cyclic, other])
+    # 已执行的依赖视为满足
+    assert engine.order([other], applied=["migration_2026_10_19_4_d.sql"]) == [other]
+
+
+@pytest.mark.asyncio
+async def test_failed_migration_rolls_back(v2_db):
+    engine = make_engine()
+    migration = Migration(STRICT, """
+        BEGIN TRANSACTION;
+        CREATE TABLE migration_probe (id INTEGER PRIMARY KEY);
+        INSERT INTO migration_probe (id) VALUES (1);
+        INSERT INTO no_such_table VALUES (1);
+        COMMIT;
+    """)
+    assert not await engine.apply(migration)
+    assert await v2_db.fetch_one("SELECT name FROM sqlite_master WHERE name = 'migration_probe'") is None
+    assert STRICT not in await engine.applied()
+
+    # 历史迁移：失败语句单独回滚，其余语句生效
+    legacy = Migration("migration_2025_09_01_9_legacy.sql", migration.sql)
+    assert await engine.apply(legacy)
+    assert (await v2_db.fetch_one("SELECT COUNT(*) FROM migration_probe"))[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_checksum_recorded_and_not_reapplied(v2_db, caplog):
+    engine = make_engine()
+    migration = Migration(STRICT, "ALTER TABLE users ADD COLUMN probe TEXT;")
+    assert await engine.apply(migration)
+    row = await v2_db.fetch_one(
+        "SELECT checksum, duration_ms FROM migration_history WHERE migration_name = ?", (STRICT,)
+    )
+    assert row[0] == migration.checksum and row[1] is not None
+
+    # 同名文件内容被修改：告警但不重复执行
+    assert await engine.apply(Migration(STRICT, "ALTER TABLE users ADD COLUMN probe2 TEXT;"))
+    assert "校验和不一致" in caplog.text
+    columns = {r[1] for r in await v2_db.fetch_all("PRAGMA table_info(users)")}
+    assert "probe" in columns and "probe2" not in columns
+
+
+@pytest.mark.asyncio
+async def test_renamed_migration_not_reapplied(v2_db):
+    engine = make_engine()
+    old = "migration_2026_11_01_10_probe.sql"
+    assert await engine.apply(Migration(old, "ALTER TABLE users ADD COLUMN probe TEXT;"))
+
+    # 改名（并修改了内容）的文件按旧名的执行记录跳过，登记名随之更新
+    renamed = Migration(
+        "migration_2026_11_02_0_probe.sql",
+        f"-- 原文件名: {old}\nALTER TABLE users ADD COLUMN probe TEXT;\nALTER TABLE users ADD COLUMN probe2 TEXT;"
+    )
+    assert renamed.previous_names == [old]
+    assert await engine.apply(renamed)
+    columns = {r[1] for r in await v2_db.fetch_all("PRAGMA table_info(users)")}
+    assert "probe2" not in columns
+    assert set(await engine.applied()) >= {renamed.name} and old not in await engine.applied()
+
+
+async def _large_table(db, rows):
+    await db.execute_query("CREATE TABLE osc_probe (id INTEGER PRIMARY KEY, owner INTEGER, note TEXT)")
+    await db.execute_query("CREATE INDEX idx_osc_probe_note ON osc_probe(note)")
+    await db.execute_query("""
+        CREATE TRIGGER osc_probe_touch AFTER UPDATE OF owner ON osc_probe
+        BEGIN UPDATE osc_probe SET note = 'touched' WHERE id = NEW.id; END
+    """)
+    await db.execute_transaction([
+        ("INSERT INTO osc_probe (id, owner, note) VALUES (?, ?, ?)", (i, i % 7, f"n{i}"))
+        for i in range(1, rows + 1)
+    ])
+
+
+@pytest.mark.asyncio
+async def test_unrecorded_apply_is_atomic(v2_db):
+    engine = make_engine()
+    repair = Migration("schema_sync.sql", "ALTER TABLE users ADD COLUMN probe TEXT;\nALTER TABLE no_such_table ADD COLUMN x TEXT;")
+    assert not await engine.apply(repair, record=False, strict=True)
+    assert "probe" not in {r[1] for r in await v2_db.fetch_all("PRAGMA table_info(users)")}
+
+    repair = Migration("schema_sync.sql", "ALTER TABLE users ADD COLUMN probe TEXT;")
+    assert await engine.apply(repair, record=False, strict=True)
+    assert "probe" in {r[1] for r in await v2_db.fetch_all("PRAGMA table_info(users)")}
+    assert "schema_sync.sql" not in await engine.applied()
+
+
+@pytest.mark.asyncio
+async def test_small_table_index_built_in_place(v2_db, monkeypatch):
+    await _large_table(v2_db, 50)
+    engine = make_engine()
+
+    async def no_rebuild(*args, **kwargs):
+        raise AssertionError("小表不应走影子表")
+
+    monkeypatch.setattr(engine, "rebuild_table_online", no_rebuild)
+    assert await engine.apply(Migration(STRICT, "CREATE INDEX idx_osc_probe_owner ON osc_probe(owner);"))
+    assert await v2_db.fetch_one("SELECT 1 FROM sqlite_master WHERE name = 'idx_osc_probe_owner'")
+
+
+@pytest.mark.asyncio
+async def test_online_index_with_concurrent_writes(v2_db, monkeypatch):
+    await _large_table(v2_db, 400)
+    engine = make_engine(step_sleep=0.001)
+    batches = []
+    original_sleep = asyncio.sleep
+
+    async def counting_sleep(delay):
+        if delay == engine.step_sleep:
+            batches.append(delay)
+        await original_sleep(delay)
+
+    monkeypatch.setattr("database.db_migrations.asyncio.sleep", counting_sleep)
+    migration = Migration(STRICT, "CREATE INDEX IF NOT EXISTS idx_osc_probe_owner ON osc_probe(owner);")
+
+    async def writer():
+        for i in range(20):
+            await v2_db.execute_query("INSERT INTO osc_probe (owner, note) VALUES (?, ?)", (99, f"w{i}"))
+            await v2_db.execute_query("UPDATE osc_probe SET owner = 98 WHERE id = ?", (i + 1,))
+            await v2_db.execute_query("DELETE FROM osc_probe WHERE id = ?", (300 + i,))
+            await asyncio.sleep(0)
+
+    applied, _ = await asyncio.gather(engine.apply(migration), writer())
+    assert applied
+    assert await engine._load_pending() == []
+    # 大表索引在迁移提交后经影子表分批构建（每批之间让出）
+    assert len(batches) >= 400 // 50
+
+    indexes = {r[0] for r in await v2_db.fetch_all(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'osc_probe'"
+    )}
+    assert {"idx_osc_probe_owner", "idx_osc_probe_note"} <= indexes
+    assert not [r for r in await v2_db.fetch_all("SELECT name FROM sqlite_master WHERE name LIKE '%osc_probe%osc%'")]
+    assert (await v2_db.fetch_one("SELECT COUNT(*) FROM osc_probe"))[0] == 400 + 20 - 20
+    assert (await v2_db.fetch_one("SELECT COUNT(*) FROM osc_probe WHERE owner = 98"))[0] == 20
+    assert (await v2_db.fetch_one("PRAGMA integrity_check"))[0] == "ok"
+
+    # 原表触发器保留
+    await v2_db.execute_query("UPDATE osc_probe SET owner = 1 WHERE id = 50")
+    assert (await v2_db.fetch_one("SELECT note FROM osc_probe WHERE id = 50"))[0] == "touched"
+
+
+@pytest.mark.asyncio
+async def test_online_rebuild_and_pending_resume(v2_db, monkeypatch):
+    await _large_table(v2_db, 300)
+    engine = make_engine()
+    migration = Migration(STRICT, """
+        -- @online_rebuild: osc_probe
+        CREATE TABLE osc_probe (
+            id INTEGER PRIMARY KEY,
+            owner INTEGER,
+            note TEXT,
+            flag INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_osc_probe_flag ON osc_probe(flag);
+    """)
+
+    # 第一次在线重建中断：迁移已提交，待执行项保留
+    async def interrupted(*args, **kwargs):
+        raise RuntimeError("中断")
+
+    monkeypatch.setattr(engine, "_swap", interrupted)
+    assert await engine.apply(migration)
+    assert STRICT in await engine.applied()
+    assert len(await engine._load_pending()) == 1
+    assert await v2_db.fetch_one("SELECT name FROM sqlite_master WHERE name = '_osc_osc_probe'") is None
+
+    monkeypatch.undo()
+    assert await engine.run_pending()
+    assert await engine._load_pending() == []
+    columns = [r[1] for r in await v2_db.fetch_all("PRAGMA table_info(osc_probe)")]
+    assert columns == ["id", "owner", "note", "flag"]
+    assert tuple(await v2_db.fetch_one("SELECT COUNT(*), SUM(flag) FROM osc_probe")) == (300, 0)
+    indexes = {r[0] for r in await v2_db.fetch_all(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'osc_probe'"
+    )}
+    assert {"idx_osc_probe_flag", "idx_osc_probe_note"} <= indexes
+    # 原有索引按原定义以普通 DDL 重建，没有残留的临时名
+    assert (await v2_db.fetch_one("SELECT sql FROM sqlite_master WHERE name = 'idx_osc_probe_note'"))[0] == \
+        "CREATE INDEX idx_osc_probe_note ON osc_probe(note)"
+    assert not [r for r in await v2_db.fetch_all("SELECT name FROM sqlite_master WHERE name LIKE '%osc_probe%osc%'")]
+    assert (await v2_db.fetch_one("PRAGMA integrity_check"))[0] == "ok"
+    assert (await v2_db.fetch_one("SELECT COUNT(*) FROM osc_probe INDEXED BY idx_osc_probe_note WHERE note = 'n7'"))[0] == 1
@@ -0,0 +1,98 @@
+"""
+预约下单服务单元测试
+测试单事务幂等下单、时间窗边界、课程选择去重与事务回滚
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+import services.order_service as order_module
+from services.order_service import OrderService
+
+NOW = 1_800_000_030.0  # 位于 60 秒时间窗中间
+
+
+@pytest_asyncio.fixture
+async def order_db(v2_db):
+    await v2_db.execute_query("INSERT INTO cities (id, name) VALUES (1, '北京')")
+    await v2_db.execute_query(
+        "INSERT INTO merchants (id, telegram_chat_id, name, city_id, status, p_price, pp_price) "
+        "VALUES (10, 9001, '老师', 1, 'approved', 500, 900)"
+    )
+    yield v2_db
+
+
+def _user(user_id=1001, username='wolf'):
+    return SimpleNamespace(id=user_id, username=username)
+
+
+async def _scalar(db, query, params=None):
+    row = await db.fetch_one(query, params)
+    return row[0]
+
+
+@pytest.mark.asyncio
+async def test_double_tap_creates_single_order(order_db):
+    service = OrderService({'idempotency_window': 60})
+    merchant = await order_db.fetch_one("SELECT * FROM merchants WHERE id = 10")
+    results = await asyncio.gather(*[
+        service.create_attempt_order(_user(), dict(merchant), now=NOW) for _ in range(3)
+    ])
+    assert len({order_id for order_id, _ in results}) == 1
+    assert sorted(created for _, created in results) == [False, False, True]
+
+    assert await _scalar(order_db, "SELECT COUNT(*) FROM orders") == 1
+    assert await _scalar(
+        order_db, "SELECT COUNT(*) FROM activity_logs WHERE action_type = 'order_created'"
+    ) == 1
+    user = await order_db.fetch_one("SELECT username FROM users WHERE user_id = 1001")
+    assert user['username'] == 'wolf'
+    order = await order_db.fetch_one("SELECT price, status, idempotency_key FROM orders")
+    assert (order['price'], order['status']) == (500, '尝试预约')
+    assert order['idempotency_key'] == service.idempotency_keys(1001, 10, now=NOW)[0]
+
+
+@pytest.mark.asyncio
+async def test_window_boundary_and_expiry(order_db):
+    service = OrderService({'idempotency_window': 60})
+    merchant = {'id': 10, 'p_price': 500}
+    first, _ = await service.create_attempt_order(_user(), merchant, now=NOW)
+    # 下一个时间窗仍查上一个窗的键：跨边界连点复用订单
+    assert await service.create_attempt_order(_user(), merchant, now=NOW + 60) == (first, False)
+    # 两个时间窗之后视为新的预约
+    second, created = await service.create_attempt_order(_user(), merchant, now=NOW + 120)
+    assert created and second != first
+    # 其他用户不受影响
+    _, created = await service.create_attempt_order(_user(1002, None), merchant, now=NOW)
+    assert created
+    assert await _scalar(order_db, "SELECT username FROM users WHERE user_id = 1002") == 'user_1002'
+
+
+@pytest.mark.asyncio
+async def test_choose_course_notifies_once(order_db, monkeypatch):
+    queued = []
+    monkeypatch.setattr(order_module, "enqueue_task", lambda func, *a, **kw: queued.append(func))
+    service = OrderService({'idempotency_window': 60})
+    merchant = {'id': 10, 'p_price': 500, 'telegram_chat_id': 9001}
+    order_id, _ = await service.create_attempt_order(_user(), merchant, now=NOW)
+
+    assert await service.choose_course(order_id, 1001, 'PP', 900)
+    assert not await service.choose_course(order_id, 1001, 'PP', 900)
+    assert not await service.choose_course(order_id, 2002, 'P', 500)  # 非本人订单
+    row = await order_db.fetch_one("SELECT course_type, price FROM orders WHERE id = ?", (order_id,))
+    assert (row['course_type'], row['price']) == ('PP', 900)
+
+    service.notify_merchant(object(), merchant, _user(), order_id, 'PP', 900, review_markup=object())
+    assert len(queued) == 2
+
+
+@pytest.mark.asyncio
+async def test_transaction_rolls_back_on_error(order_db):
+    with pytest.raises(RuntimeError):
+        async with order_db.transaction() as conn:
+            await conn.execute("INSERT INTO users (user_id, username) VALUES (5, 'x')")
+            raise RuntimeError("boom")
+    assert await _scalar(order_db, "SELECT COUNT(*) FROM users WHERE user_id = 5") == 0
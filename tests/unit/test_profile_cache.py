@@ -0,0 +1,113 @@
+"""
+用户资料缓存单元测试
+测试更新资料落库、数据库命中、getChat 合并、过期后台刷新与失败缓存
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.profile_cache import ProfileCache
+
+
+class FakeBot:
+    """记录 getChat 调用次数的 Bot 替身"""
+
+    def __init__(self, chats=None, fail=False):
+        self.chats = chats or {}
+        self.fail = fail
+        self.calls = []
+
+    async def get_chat(self, chat_id):
+        self.calls.append(chat_id)
+        await asyncio.sleep(0.01)
+        if self.fail or chat_id not in self.chats:
+            raise RuntimeError("chat not found")
+        first, last, username = self.chats[chat_id]
+        return SimpleNamespace(id=chat_id, first_name=first, last_name=last, username=username)
+
+
+def _user(user_id, first, last=None, username=None, is_bot=False):
+    return SimpleNamespace(id=user_id, first_name=first, last_name=last, username=username, is_bot=is_bot)
+
+
+def _cache(**overrides):
+    config = {'max_entries': 100, 'stale_after': 3600, 'fetch_concurrency': 4, 'flush_interval': 60}
+    config.update(overrides)
+    return ProfileCache(config)
+
+
+async def _add_users(db, *user_ids):
+    for user_id in user_ids:
+        await db.execute_query("INSERT INTO users (user_id, username) VALUES (?, ?)", (user_id, f"u{user_id}"))
+
+
+class TestProfileCache:
+    """用户资料缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_remember_and_flush_persist_names(self, v2_db):
+        await _add_users(v2_db, 1001, 1002)
+        cache = _cache()
+        cache.remember(_user(1001, " 张三 ", "李", "zs"))
+        cache.remember(_user(1002, "王五"))
+        cache.remember(_user(9, "bot", is_bot=True))
+
+        assert await cache.flush() == 2
+        assert await cache.flush() == 0
+        row = await v2_db.fetch_one("SELECT username, first_name, last_name, profile_fetched_at FROM users WHERE user_id = 1001")
+        assert (row['username'], row['first_name'], row['last_name']) == ("zs", "张三", "李")
+        assert row['profile_fetched_at'] is not None
+        # 无 username 的更新不覆盖已有用户名
+        row = await v2_db.fetch_one("SELECT username, first_name FROM users WHERE user_id = 1002")
+        assert (row['username'], row['first_name']) == ("u1002", "王五")
+
+        # 资料未变化时不重复落库
+        cache.remember(_user(1001, "张三", "李", "zs"))
+        assert await cache.flush() == 0
+
+    @pytest.mark.asyncio
+    async def test_database_hit_skips_get_chat(self, v2_db):
+        await _add_users(v2_db, 2001)
+        writer = _cache()
+        writer.remember(_user(2001, "小明"))
+        await writer.flush()
+
+        bot = FakeBot()
+        reader = _cache()
+        assert await reader.display_names(bot, [2001]) == {2001: "小明"}
+        assert bot.calls == []
+
+    @pytest.mark.asyncio
+    async def test_missing_users_fetched_once(self, v2_db):
+        bot = FakeBot({3001: ("阿花", None, None)})
+        cache = _cache()
+        names = await asyncio.gather(*(cache.display_name(bot, 3001) for _ in range(5)))
+        assert names == ["阿花"] * 5
+        assert bot.calls == [3001]
+        assert await cache.display_name(bot, 3001) == "阿花"
+        assert bot.calls == [3001]
+
+    @pytest.mark.asyncio
+    async def test_stale_entry_served_then_refreshed(self, v2_db):
+        bot = FakeBot({4001: ("新名字", None, None)})
+        cache = _cache(stale_after=60)
+        cache.remember(_user(4001, "旧名字"))
+        cache._entries[4001].fetched_at = time.time() - 120
+
+        assert await cache.display_name(bot, 4001) == "旧名字"
+        await asyncio.sleep(0.05)
+        assert bot.calls == [4001]
+        assert await cache.display_name(bot, 4001) == "新名字"
+
+    @pytest.mark.asyncio
+    async def test_failed_fetch_is_cached(self, v2_db):
+        bot = FakeBot(fail=True)
+        cache = _cache()
+        assert await cache.display_name(bot, 5001, default="5001") == "5001"
+        assert await cache.display_names(bot, [5001]) == {5001: ""}
+        assert bot.calls == [5001]
+        # 无 bot 时只读缓存与数据库
+        assert await cache.display_names(None, [5002]) == {5002: ""}
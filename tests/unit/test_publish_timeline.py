@@ -0,0 +1,119 @@
+"""
+发布时间线单元测试
+测试最小堆的惰性删除、时间槽推算与从 merchants 加载/刷新
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from database.db_connection import db_manager
+from services.publish_timeline import DueTimeline, PublishTimeline, next_slot_time, parse_schedule_time
+
+
+class TestDueTimeline:
+    """最小堆测试"""
+
+    def test_pop_due_in_order_and_latest_wins(self):
+        t0 = datetime(2026, 10, 18, 12, 0)
+        timeline = DueTimeline()
+        timeline.set(('publish', 1), t0 + timedelta(minutes=5))
+        timeline.set(('publish', 2), t0 + timedelta(minutes=1))
+        timeline.set(('expire', 3), t0 + timedelta(minutes=3))
+        timeline.set(('publish', 1), t0 + timedelta(minutes=2))  # 改期
+        timeline.discard(('expire', 3))
+
+        assert timeline.next_due() == t0 + timedelta(minutes=1)
+        assert timeline.pop_due(t0) == []
+        assert timeline.pop_due(t0 + timedelta(minutes=10)) == [('publish', 2), ('publish', 1)]
+        assert len(timeline) == 0
+        assert timeline.next_due() is None
+
+    def test_next_slot_time_rolls_over_to_tomorrow(self):
+        now = datetime(2026, 10, 18, 21, 30)
+        assert next_slot_time([(9, 0), (21, 0)], now) == datetime(2026, 10, 19, 9, 0)
+        assert next_slot_time([(9, 0), (22, 15)], now) == datetime(2026, 10, 18, 22, 15)
+        assert next_slot_time([], now) is None
+
+    def test_parse_schedule_time(self):
+        assert parse_schedule_time('2026-10-18 09:30:00') == datetime(2026, 10, 18, 9, 30)
+        assert parse_schedule_time('2026-10-18T09:30') == datetime(2026, 10, 18, 9, 30)
+        assert parse_schedule_time('') is None
+        assert parse_schedule_time('garbage') is None
+
+
+async def add_merchant(mid, status, publish_time=None, expiration_time=None):
+    await db_manager.execute_query(
+        "INSERT INTO merchants (id, telegram_chat_id, name, status, publish_time, expiration_time) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (mid, 1000 + mid, f"商户{mid}", status, publish_time, expiration_time),
+    )
+
+
+class TestPublishTimeline:
+    """时间线加载与刷新测试"""
+
+    @pytest.mark.asyncio
+    async def test_reload_and_refresh(self, v2_db):
+        future = (datetime.now() + timedelta(hours=1)).replace(microsecond=0)
+        await add_merchant(1, 'approved', future.isoformat(sep=' '))
+        await add_merchant(2, 'approved')  # 未指定时间 -> 下一个时间槽
+        await add_merchant(3, 'published', None, (future + timedelta(days=1)).isoformat(sep=' '))
+        await add_merchant(4, 'expired', None, future.isoformat(sep=' '))
+
+        changes = []
+        timeline = PublishTimeline()
+        timeline.attach(lambda: changes.append(timeline.next_due()))
+        assert await timeline.reload([(future.hour, future.minute)]) == 3
+        assert timeline.timeline.get(('publish', 1)) == future
+        assert timeline.timeline.get(('publish', 2)) == next_slot_time([(future.hour, future.minute)], datetime.now())
+        assert timeline.timeline.get(('expire', 4)) is None
+        assert changes
+
+        # 管理员改期后刷新单个商户
+        earlier = future - timedelta(minutes=30)
+        await db_manager.execute_query(
+            "UPDATE merchants SET publish_time = ? WHERE id = 1", (earlier.isoformat(sep=' '),)
+        )
+        await timeline.refresh_merchant(1)
+        assert timeline.next_due() == earlier
+
+        # 已发布（不再是 approved）后发布条目被移除
+        await db_manager.execute_query("UPDATE merchants SET status = 'published' WHERE id = 1")
+        await timeline.refresh_merchant(1)
+        assert timeline.timeline.get(('publish', 1)) is None
+
+    @pytest.mark.asyncio
+    async def test_deferred_retry_survives_reload(self, v2_db):
+        past = (datetime.now() - timedelta(minutes=5)).replace(microsecond=0)
+        await add_merchant(1, 'approved', past.isoformat(sep=' '))
+
+        timeline = PublishTimeline()
+        await timeline.reload([])
+        assert timeline.pop_due(datetime.now()) == [('publish', 1)]
+
+        retry_at = datetime.now() + timedelta(minutes=5)
+        timeline.defer(('publish', 1), retry_at)
+        await timeline.reload()
+        assert timeline.timeline.get(('publish', 1)) == retry_at
+
+    @pytest.mark.asyncio
+    async def test_changes_from_other_processes_are_polled(self, v2_db):
+        future = (datetime.now() + timedelta(hours=1)).replace(microsecond=0)
+        await add_merchant(1, 'approved', future.isoformat(sep=' '))
+
+        timeline = PublishTimeline()
+        await timeline.reload([])
+        assert await timeline.poll_changes() == 0
+
+        # 未调用 notify 的写入（如其它进程）经触发器记入变更信号表
+        later = future + timedelta(hours=2)
+        await db_manager.execute_query(
+            "UPDATE merchants SET publish_time = ? WHERE id = 1", (later.isoformat(sep=' '),)
+        )
+        await add_merchant(2, 'published', None, future.isoformat(sep=' '))
+        await db_manager.execute_query("UPDATE merchants SET name = '改名' WHERE id = 2")  # 非时间字段不记录
+        assert await timeline.poll_changes() == 2
+        assert timeline.timeline.get(('publish', 1)) == later
+        assert timeline.timeline.get(('expire', 2)) == future
+        assert await timeline.poll_changes() == 0
@@ -0,0 +1,110 @@
+"""
+慢查询分析器单元测试
+测试参数形态、执行计划解析、慢查询记录、全表扫描标记与汇总写入
+"""
+
+import asyncio
+
+import pytest
+
+from database.db_connection import db_manager
+from database.db_query_profiler import (
+    QueryProfiler, format_plan, param_shape, query_profiler, scanned_tables, table_aliases
+)
+
+
+def _profiler(**overrides):
+    config = {"enabled": True, "threshold_ms": 50.0, "explain": True, "large_table_rows": 10,
+              "max_fingerprints": 100, "recent_size": 10, "flush_interval": 3600}
+    config.update(overrides)
+    return QueryProfiler(config)
+
+
+async def _settle(profiler):
+    while profiler._tasks:
+        await asyncio.gather(*list(profiler._tasks))
+
+
+class TestHelpers:
+    """辅助函数测试"""
+
+    def test_param_shape(self):
+        assert param_shape(None) == ""
+        assert param_shape((1, "abc", None, "%x%")) == "(int, str[3], NULL, str[3,前导%])"
+        assert param_shape({"id": 1}) == "{id: int}"
+        assert param_shape(tuple(range(5)), limit=2) == "(int, int, …+3)"
+
+    def test_aliases_and_scans(self):
+        sql = ("SELECT p.* FROM merchant_posts p LEFT JOIN merchants AS m ON m.id = p.merchant_id "
+               "WHERE CAST(m.id AS TEXT) = ?")
+        assert table_aliases(sql) == {
+            "merchant_posts": "merchant_posts", "p": "merchant_posts", "merchants": "merchants", "m": "merchants"
+        }
+        plan = [
+            (3, 0, 0, "SCAN p"),
+            (5, 0, 0, "SEARCH m USING INTEGER PRIMARY KEY (rowid=?)"),
+            (8, 0, 0, "SCAN merchants USING COVERING INDEX idx_x"),
+            (12, 8, 0, "USE TEMP B-TREE FOR ORDER BY"),
+        ]
+        assert scanned_tables(plan, sql) == ["merchant_posts"]
+        assert format_plan(plan).splitlines()[-1] == "  USE TEMP B-TREE FOR ORDER BY"
+
+
+class TestProfiler:
+    """分析器测试"""
+
+    @pytest.mark.asyncio
+    async def test_slow_query_recorded(self):
+        profiler = _profiler(explain=False)
+        profiler.record("fetch_one", "SELECT 1 WHERE ? = ?", "SELECT ? WHERE ? = ?", (1, "ab"), 10.0)
+        profiler.record("fetch_one", "SELECT 1 WHERE ? = ?", "SELECT ? WHERE ? = ?", (2, "abc"), 80.0)
+        stats = profiler.stats["SELECT ? WHERE ? = ?"]
+        assert (stats.count, stats.slow_count, stats.max_ms) == (2, 1, 80.0)
+        assert stats.param_shape == "(int, str[3])"
+        assert profiler.recent[-1]["ms"] == 80.0
+        assert profiler.get_top()[0]["slow_count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_fingerprint_limit(self):
+        profiler = _profiler(explain=False, max_fingerprints=1)
+        profiler.record("execute", "A", "A", None, 1.0)
+        profiler.record("execute", "B", "B", None, 1.0)
+        assert list(profiler.stats) == ["A"] and profiler.untracked == 1
+
+    @pytest.mark.asyncio
+    async def test_scan_flagged_and_flushed(self, v2_db):
+        await db_manager.execute_transaction([
+            ("INSERT INTO users (user_id, username) VALUES (?, ?)", (i, f"u{i}")) for i in range(1, 21)
+        ])
+        profiler = _profiler()
+        sql = "SELECT u.user_id FROM users u WHERE u.username LIKE ?"
+        profiler.record("fetch_all", sql, sql, ("%u1%",), 1.0)
+        indexed = "SELECT username FROM users WHERE user_id = ?"
+        profiler.record("fetch_one", indexed, indexed, (1,), 1.0)
+        await _settle(profiler)
+
+        scan = profiler.stats[sql]
+        assert scan.scans == [("users", 20)]
+        assert "SCAN u" in scan.plan
+        assert profiler.stats[indexed].scans == [] and not profiler.stats[indexed].flagged
+
+        assert await profiler.flush() == 1
+        profiler.record("fetch_all", sql, sql, ("%u1%",), 120.0)
+        assert await profiler.flush() == 1
+        assert await profiler.flush() == 0
+
+        rows = await profiler.load_top("scan")
+        assert len(rows) == 1
+        assert (rows[0]["exec_count"], rows[0]["slow_count"], rows[0]["scan_tables"]) == (2, 1, "users:20")
+        assert (await profiler.load_top("slow"))[0]["max_ms"] == 120.0
+
+        await profiler.reset()
+        assert await profiler.load_top("scan") == []
+
+
+@pytest.mark.asyncio
+async def test_database_manager_feeds_profiler(v2_db):
+    sql = "SELECT username FROM users WHERE user_id = 7"
+    await db_manager.fetch_one(sql)
+    stats = query_profiler.stats["SELECT username FROM users WHERE user_id = ?"]
+    assert stats.count >= 1 and stats.op == "fetch_one"
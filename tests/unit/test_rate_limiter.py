@@ -0,0 +1,102 @@
+"""
+令牌桶限流器单元测试
+测试突发与补充、按动作分桶、LRU 淘汰、SQLite 共享存储及安全管理器接入
+"""
+
+from unittest.mock import patch
+
+import pytest
+
+from utils import rate_limiter as rl
+from utils.rate_limiter import RateLimiter, SQLiteBucketStore
+from utils.security_manager import SecurityManager
+
+
+class FakeClock:
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRateLimiter:
+    """进程内令牌桶测试"""
+
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        limiter = RateLimiter({'default': (2.0, 3)})
+        with patch.object(rl.time, 'monotonic', clock):
+            assert [limiter.try_acquire(1)[0] for _ in range(3)] == [True, True, True]
+            allowed, wait = limiter.try_acquire(1)
+            assert not allowed and abs(wait - 0.5) < 1e-9
+
+            clock.now += 0.5
+            assert limiter.try_acquire(1)[0]
+            assert not limiter.try_acquire(1)[0]
+        assert limiter.get_stats()['limited'] == 2
+
+    def test_actions_are_independent(self):
+        limiter = RateLimiter({'callback': (1.0, 5), 'order': (0.1, 1)})
+        assert limiter.try_acquire(7, 'order')[0]
+        assert not limiter.try_acquire(7, 'order')[0]
+        # 订单桶耗尽不影响普通回调
+        assert limiter.try_acquire(7, 'callback')[0]
+        # 调用方给出的限额优先于动作桶配置
+        assert limiter.try_acquire(8, 'order', rate=1.0, burst=2)[0]
+        assert limiter.try_acquire(8, 'order', rate=1.0, burst=2)[0]
+
+    def test_lru_eviction(self):
+        limiter = RateLimiter({'default': (0.0, 1)}, max_keys=2)
+        limiter.try_acquire('a')
+        limiter.try_acquire('b')
+        limiter.try_acquire('a')
+        limiter.try_acquire('c')
+        assert len(limiter) == 2
+        # 'b' 最久未访问被淘汰；'a' 仍保持耗尽状态，'b' 重新获得满桶
+        assert not limiter.try_acquire('a')[0]
+        assert limiter.try_acquire('b')[0]
+
+
+class TestSharedStore:
+    """SQLite 共享存储测试"""
+
+    @pytest.mark.asyncio
+    async def test_limit_shared_between_instances(self, tmp_path):
+        path = str(tmp_path / 'buckets.db')
+        first = RateLimiter({'order': (0.001, 2)}, store=SQLiteBucketStore(path))
+        second = RateLimiter({'order': (0.001, 2)}, store=SQLiteBucketStore(path))
+        try:
+            results = [
+                (await first.acquire(42, 'order'))[0],
+                (await second.acquire(42, 'order'))[0],
+                (await first.acquire(42, 'order'))[0],
+                (await second.acquire(43, 'order'))[0],
+            ]
+            assert results == [True, True, False, True]
+        finally:
+            first.store.close()
+            second.store.close()
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_store_unavailable(self, tmp_path):
+        store = SQLiteBucketStore(str(tmp_path / 'missing' / 'buckets.db'))
+        limiter = RateLimiter({'default': (0.0, 1)}, store=store)
+        assert (await limiter.acquire(1))[0]
+        assert not (await limiter.acquire(1))[0]
+        assert limiter.get_stats()['shared_store'] is None
+
+
+class TestSecurityRateLimit:
+    """安全管理器接入测试"""
+
+    def test_check_rate_limit_blocks_after_limit(self):
+        manager = SecurityManager()
+        manager.rate_limiter = RateLimiter({'default': (1.0, 3)})
+        manager.max_requests_per_minute = 3
+
+        results = [manager.check_rate_limit(5) for _ in range(4)]
+        assert [r['allowed'] for r in results] == [True, True, True, False]
+        assert results[0]['remaining'] == 2
+        assert results[-1]['blocked_until'] is not None
+        assert manager.suspicious_activity[5][-1]['type'] == 'rate_limit_exceeded'
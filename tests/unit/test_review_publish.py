@@ -0,0 +1,132 @@
+"""
+评价发布服务单元测试
+测试联表上下文加载、模板渲染、频道配置缓存与批量补发
+"""
+
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+import services.review_publish_service as rps
+from database.db_channels import posting_channels_db
+from services.profile_cache import profile_cache
+from services.review_publish_service import ReportTemplate, review_publish_service
+
+
+class FakeBot:
+    """记录发送内容的 Bot 替身"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=100 + len(self.sent), date=datetime(2026, 10, 18, 12, 0))
+
+    async def get_chat(self, chat_id):
+        return SimpleNamespace(first_name=f"用户{chat_id}", last_name=None, username=None)
+
+
+@pytest_asyncio.fixture
+async def publish_db(v2_db, monkeypatch):
+    posting_channels_db.invalidate_cache()
+    profile_cache.clear()
+    refreshed = []
+
+    async def fake_refresh(merchant_id):
+        refreshed.append(merchant_id)
+        return True
+
+    monkeypatch.setattr(rps, "DEEPLINK_BOT_USERNAME", "@demo_bot")
+    monkeypatch.setattr(rps, "refresh_merchant_post_reviews", fake_refresh)
+
+    q = v2_db.execute_query
+    await q("INSERT INTO cities (id, name) VALUES (1, '北京')")
+    await q("INSERT INTO districts (id, city_id, name) VALUES (5, 1, '朝阳')")
+    await q("INSERT INTO merchants (id, telegram_chat_id, name, city_id, district_id, status) "
+            "VALUES (10, 9001, '小<美>', 1, 5, 'approved')")
+    for oid in (1, 2, 3):
+        await q("INSERT INTO orders (id, merchant_id, customer_user_id, course_type, price, created_at) "
+                "VALUES (?, 10, ?, 'P', 500, '2026-03-01 10:00:00')", (oid, 1000 + oid))
+        await q("INSERT INTO reviews (id, order_id, merchant_id, customer_user_id, rating_appearance, rating_figure, "
+                "rating_service, rating_attitude, rating_environment, text_review_by_user, is_anonymous, "
+                "is_confirmed_by_admin) VALUES (?, ?, 10, ?, 9, 8, 7, 10, 1, ?, ?, 1)",
+                (oid, oid, 1000 + oid, "很好 & 满意" if oid == 1 else None, 1 if oid == 2 else 0))
+    await q("INSERT INTO merchant_reviews (id, order_id, merchant_id, user_id, rating_attack_quality, rating_length, "
+            "rating_hardness, rating_duration, rating_user_temperament, is_confirmed_by_admin) "
+            "VALUES (1, 1, 10, 1001, 5, 5, 5, 5, 5, 1)")
+    await posting_channels_db.add_channel("发布", "@posts", "https://t.me/posts", role='post')
+    await posting_channels_db.add_channel("评价", "-100123", "", role='review_u2m')
+    await posting_channels_db.add_channel("商家评价", "@m2u", "", role='review_m2u')
+    yield SimpleNamespace(db=v2_db, refreshed=refreshed)
+    posting_channels_db.invalidate_cache()
+    profile_cache.clear()
+
+
+def test_report_template_rejects_positional_fields():
+    assert ReportTemplate("a{x}b{y}").render({"x": "1", "y": "2"}) == "a1b2"
+    with pytest.raises(ValueError):
+        ReportTemplate("{}")
+    with pytest.raises(ValueError):
+        ReportTemplate("{x:02d}")
+
+
+@pytest.mark.asyncio
+async def test_publish_u2m_renders_report(publish_db):
+    bot = FakeBot()
+    assert await review_publish_service.publish_u2m(1, bot)
+    chat_id, text = bot.sent[0]
+    assert chat_id == "-100123"
+    assert text == (
+        "🔖 报告 https://t.me/posts\n"
+        "🔆 艺名 <a href=\"https://t.me/demo_bot?start=m_10\">小&lt;美&gt;</a>\n"
+        "📌 位置 <a href=\"https://t.me/demo_bot?start=d_5\">朝阳</a>\n"
+        "✨ 费用 <a href=\"https://t.me/demo_bot?start=price_p_500_c_1\">500P</a>\n\n"
+        "🌟 总体评分：\n"
+        "<pre>▫️ 外貌 09 | [█████████░]\n▫️ 身材 08 | [████████░░]\n▫️ 服务 07 | [███████░░░]\n"
+        "▫️ 态度 10 | [██████████]\n▫️ 环境 01 | [█░░░░░░░░░]</pre>\n\n"
+        "📜 文字详情：\n很好 &amp; 满意\n\n"
+        "🙋🏻 留名 用户1001 ｜ 🗓️ 时间 2026.03.01\n\n"
+    )
+    row = await publish_db.db.fetch_one("SELECT report_message_id, report_post_url FROM reviews WHERE id = 1")
+    assert (row['report_message_id'], row['report_post_url']) == (101, "https://t.me/c/123/101")
+    assert publish_db.refreshed == [10]
+
+    # 已发布的评价不重复发送
+    assert await review_publish_service.publish_u2m(1, bot)
+    assert len(bot.sent) == 1
+
+    assert await review_publish_service.publish_m2u(1, bot)
+    chat_id, text = bot.sent[1]
+    assert chat_id == "@m2u"
+    assert text.startswith("报告 https://t.me/posts\n艺名 ")
+    assert text.endswith("</pre>\n\n留名 小&lt;美&gt; ｜ 时间 2026.03.01")
+
+
+@pytest.mark.asyncio
+async def test_channel_config_is_cached_until_changed(publish_db):
+    first = await posting_channels_db.get_active_channel_cached('review_u2m')
+    await publish_db.db.execute_query("UPDATE posting_channels SET channel_chat_id = '@other' WHERE role = 'review_u2m'")
+    assert (await posting_channels_db.get_active_channel_cached('review_u2m'))['channel_chat_id'] == first['channel_chat_id']
+
+    await posting_channels_db.update_channel(first['id'], channel_chat_id='@changed')
+    assert (await posting_channels_db.get_active_channel_cached('review_u2m'))['channel_chat_id'] == '@changed'
+
+
+@pytest.mark.asyncio
+async def test_publish_backlog(publish_db):
+    await publish_db.db.execute_query(
+        "UPDATE reviews SET report_post_url = 'https://t.me/c/123/1' WHERE id = 3"
+    )
+    bot = FakeBot()
+    stats = await review_publish_service.publish_backlog(bot)
+    assert stats == {'u2m': {'total': 2, 'published': 2}, 'm2u': {'total': 1, 'published': 1}}
+    u2m_texts = [text for chat_id, text in bot.sent if chat_id == "-100123"]
+    assert len(u2m_texts) == 2 and "留名 匿名" in u2m_texts[1]
+    # 同一商户的主帖评价区每批只刷新一次
+    assert publish_db.refreshed == [10]
+    assert await review_publish_service.publish_backlog(bot) == {
+        'u2m': {'total': 0, 'published': 0}, 'm2u': {'total': 0, 'published': 0}
+    }
@@ -0,0 +1,120 @@
+"""
+评分增量维护单元测试
+测试评价表触发器对累计表/平均分表的维护，以及对账修正
+"""
+
+import pytest
+import pytest_asyncio
+
+from database.db_connection import db_manager
+from database.db_reviews_u2m import u2m_reviews_manager
+from database.db_merchant_reviews import merchant_reviews_manager
+from database.db_score_totals import score_totals_manager
+
+
+@pytest_asyncio.fixture
+async def seeded(v2_db):
+    """一个商户 + 三个订单"""
+    await db_manager.execute_query(
+        "INSERT INTO merchants (id, telegram_chat_id, name) VALUES (1, 1001, '商户A')"
+    )
+    for order_id in (1, 2, 3):
+        await db_manager.execute_query(
+            "INSERT INTO orders (id, merchant_id, customer_user_id, price) VALUES (?, 1, ?, 500)",
+            (order_id, 2000 + order_id % 2),
+        )
+    return v2_db
+
+
+def u2m(score):
+    return {k: score for k in (
+        "rating_appearance", "rating_figure", "rating_service", "rating_attitude", "rating_environment"
+    )}
+
+
+def m2u(score):
+    return {k: score for k in (
+        "rating_attack_quality", "rating_length", "rating_hardness", "rating_duration", "rating_user_temperament"
+    )}
+
+
+async def merchant_scores():
+    return await db_manager.fetch_one("SELECT * FROM merchant_scores WHERE merchant_id = 1")
+
+
+class TestMerchantScoreTriggers:
+    """U2M 评价 -> merchant_scores"""
+
+    @pytest.mark.asyncio
+    async def test_only_confirmed_reviews_count(self, seeded):
+        r1 = await u2m_reviews_manager.create(1, 1, 2001, u2m(8))
+        assert await merchant_scores() is None
+
+        await u2m_reviews_manager.confirm_by_admin(r1, 99)
+        r2 = await u2m_reviews_manager.create(2, 1, 2000, u2m(4))
+        await u2m_reviews_manager.confirm_by_admin(r2, 99)
+
+        row = await merchant_scores()
+        assert row["total_reviews_count"] == 2
+        assert row["avg_appearance"] == 6.0
+
+    @pytest.mark.asyncio
+    async def test_update_toggle_and_delete(self, seeded):
+        ids = []
+        for order_id, score in ((1, 9), (2, 6), (3, 3)):
+            rid = await u2m_reviews_manager.create(order_id, 1, 2001, u2m(score))
+            await u2m_reviews_manager.confirm_by_admin(rid, 99)
+            ids.append(rid)
+
+        await u2m_reviews_manager.update_scores(ids[2], u2m(6))
+        assert (await merchant_scores())["avg_service"] == 7.0
+
+        await u2m_reviews_manager.toggle_active(ids[0], False)
+        row = await merchant_scores()
+        assert (row["total_reviews_count"], row["avg_service"]) == (2, 6.0)
+
+        await u2m_reviews_manager.soft_delete(ids[1])
+        await u2m_reviews_manager.soft_delete(ids[2])
+        row = await merchant_scores()
+        assert row["total_reviews_count"] == 0
+        assert row["avg_service"] is None
+
+        totals = await score_totals_manager.get_totals("merchant", 1)
+        assert totals["sum_service"] == 0
+
+
+class TestUserScoreTriggers:
+    """M2U 评价 -> user_scores"""
+
+    @pytest.mark.asyncio
+    async def test_confirm_and_retract(self, seeded):
+        r1 = await merchant_reviews_manager.create(1, 1, 2001, m2u(10))
+        r2 = await merchant_reviews_manager.create(3, 1, 2001, m2u(5))
+        await merchant_reviews_manager.confirm_by_admin(r1, 99)
+        await merchant_reviews_manager.confirm_by_admin(r2, 99)
+
+        row = await db_manager.fetch_one("SELECT * FROM user_scores WHERE user_id = 2001")
+        assert (row["total_reviews_count"], row["avg_length"]) == (2, 7.5)
+
+        await merchant_reviews_manager.toggle_active(r1, False)
+        row = await db_manager.fetch_one("SELECT * FROM user_scores WHERE user_id = 2001")
+        assert (row["total_reviews_count"], row["avg_length"]) == (1, 5.0)
+
+
+class TestReconcile:
+    """对账测试"""
+
+    @pytest.mark.asyncio
+    async def test_reconcile_repairs_drift(self, seeded):
+        rid = await u2m_reviews_manager.create(1, 1, 2001, u2m(8))
+        await u2m_reviews_manager.confirm_by_admin(rid, 99)
+        assert await score_totals_manager.reconcile("merchant") == 0
+
+        await db_manager.execute_query(
+            "UPDATE merchant_score_totals SET sum_figure = 99, reviews_count = 5 WHERE merchant_id = 1"
+        )
+        assert await score_totals_manager.reconcile("merchant") == 1
+
+        row = await merchant_scores()
+        assert (row["total_reviews_count"], row["avg_figure"]) == (1, 8.0)
+        assert await score_totals_manager.find_drift("merchant") == []
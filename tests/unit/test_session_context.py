@@ -0,0 +1,82 @@
+"""
+会话上下文单元测试
+测试内存 LRU、批量落库、跨实例（重启/多 worker）读取、过期与删除
+"""
+
+import time
+
+import pytest
+
+from services.session_context import CTX_CITY, SessionContextStore
+
+
+def _store(**overrides):
+    config = {'max_entries': 100, 'ttl': 3600, 'recheck_after': 300, 'flush_interval': 60}
+    config.update(overrides)
+    return SessionContextStore(config)
+
+
+async def _count_rows(db):
+    row = await db.fetch_one("SELECT COUNT(*) AS n FROM session_context")
+    return row['n']
+
+
+class TestSessionContext:
+    """会话上下文测试"""
+
+    @pytest.mark.asyncio
+    async def test_set_get_and_flush(self, v2_db):
+        store = _store()
+        store.set(1, CTX_CITY, 3)
+        store.set(1, 'last_listing', {'district_id': 7, 'page': 2})
+        assert await store.get(1, CTX_CITY) == 3
+        assert await _count_rows(v2_db) == 0  # write-behind
+
+        assert await store.flush() == 2
+        assert await store.flush() == 0
+        # 新实例（重启或另一个 worker）从表中读取
+        other = _store()
+        assert await other.get(1, CTX_CITY) == 3
+        assert await other.get(1, 'last_listing') == {'district_id': 7, 'page': 2}
+        assert await other.get(2, CTX_CITY, default=0) == 0
+
+    @pytest.mark.asyncio
+    async def test_delete_and_expiry(self, v2_db):
+        store = _store()
+        store.set(1, CTX_CITY, 3)
+        store.set(2, CTX_CITY, 4, ttl=-1)
+        await store.flush()
+        assert await store.get(2, CTX_CITY) is None
+
+        store.delete(1, CTX_CITY)
+        assert await store.get(1, CTX_CITY) is None
+        await store.flush()
+        assert await _store().get(1, CTX_CITY) is None
+        assert await _count_rows(v2_db) == 1  # 已过期的行留给每日清理
+
+        await v2_db.execute_query("DELETE FROM session_context WHERE expires_at < ?", (int(time.time()),))
+        assert await _count_rows(v2_db) == 0
+
+    @pytest.mark.asyncio
+    async def test_lru_bound_and_unflushed_entries(self, v2_db):
+        store = _store(max_entries=3)
+        for user_id in range(10):
+            store.set(user_id, CTX_CITY, user_id + 100)
+        assert len(store) == 3
+        # 被淘汰但尚未落库的条目仍可读到
+        assert await store.get(0, CTX_CITY) == 100
+        await store.flush()
+        assert await _count_rows(v2_db) == 10
+
+    @pytest.mark.asyncio
+    async def test_negative_lookup_cached_until_recheck(self, v2_db):
+        reader = _store(recheck_after=300)
+        assert await reader.get(5, CTX_CITY) is None
+
+        writer = _store()
+        writer.set(5, CTX_CITY, 9)
+        await writer.flush()
+        assert await reader.get(5, CTX_CITY) is None  # 缓存的“不存在”
+
+        reader.recheck_after = 0
+        assert await reader.get(5, CTX_CITY) == 9
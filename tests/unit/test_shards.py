@@ -0,0 +1,150 @@
+"""
+城市分片单元测试
+测试按城市/ID 路由、分片表结构同步、跨分片汇总读取与级联删除
+"""
+
+import os
+
+import pytest
+import pytest_asyncio
+
+from database.db_counters import row_counters
+from database.db_merchants import MerchantManager
+from database.db_orders import order_manager
+from database.db_reviews_u2m import u2m_reviews_manager
+from database.db_score_totals import score_totals_manager
+from database.db_shards import ShardError, ShardRouter, attach_limit, strip_foreign_keys
+
+TABLES = ["orders", "reviews", "merchant_score_totals", "merchant_scores", "row_counters"]
+
+
+@pytest_asyncio.fixture
+async def router(v2_db, tmp_path, monkeypatch):
+    """两个城市各一个商户，外加一个无城市的商户"""
+    router = ShardRouter(v2_db, {
+        "enabled": True, "dir": str(tmp_path / "shards"), "tables": TABLES, "buckets": 0, "id_span": 1000,
+    })
+    router.SCAN_INTERVAL = 0
+    monkeypatch.setattr(v2_db, "shards", router)
+    await v2_db.execute_query("INSERT INTO cities (id, name) VALUES (1, '城一'), (2, '城二')")
+    for merchant_id, city_id in ((1, 1), (2, 2), (3, None)):
+        await v2_db.execute_query(
+            "INSERT INTO merchants (id, telegram_chat_id, name, city_id) VALUES (?, ?, ?, ?)",
+            (merchant_id, 1000 + merchant_id, f"商户{merchant_id}", city_id),
+        )
+    await router.prepare()
+    yield router
+    await router.close()
+
+
+def order(merchant_id, user_id=2001):
+    return {"merchant_id": merchant_id, "customer_user_id": user_id, "price": 500, "status": "尝试预约"}
+
+
+def u2m(score):
+    return {k: score for k in (
+        "rating_appearance", "rating_figure", "rating_service", "rating_attitude", "rating_environment"
+    )}
+
+
+def test_strip_foreign_keys_keeps_sharded_parents():
+    sql = """CREATE TABLE reviews (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+        merchant_id INTEGER NOT NULL,
+        FOREIGN KEY (merchant_id) REFERENCES merchants(id) ON DELETE CASCADE
+    )"""
+    stripped, removed = strip_foreign_keys(sql, {"orders", "reviews"})
+    assert "REFERENCES orders" in stripped and "merchants" not in stripped
+    assert removed == [("merchant_id", "merchants", True)]
+
+
+def test_city_ids_fold_within_attach_limit():
+    # 汇总连接要附加全部分片，分片数不能超过 SQLite 附加库上限
+    limit = attach_limit()
+    router = ShardRouter(None, {"buckets": 0})
+    assert router.buckets == limit
+    assert {router.shard_id_for_city(c) for c in range(1, 3 * limit + 1)} == set(range(1, limit + 1))
+    assert router.shard_id_for_city(limit + 1) == 1
+    assert ShardRouter(None, {"buckets": limit * 5}).buckets == limit
+
+
+@pytest.mark.asyncio
+async def test_prepare_refuses_more_shard_files_than_attach_limit(router):
+    os.makedirs(router.directory, exist_ok=True)
+    for shard_id in range(1, attach_limit() + 2):
+        open(router.path_for(shard_id), 'ab').close()
+    with pytest.raises(ShardError):
+        await router.prepare()
+
+
+@pytest.mark.asyncio
+async def test_orders_route_by_city_and_id_range(v2_db, router):
+    id1, created = await order_manager.create_order_idempotent(order(1), ["k1"])
+    assert created and 1000 < id1 < 2000
+    assert await order_manager.create_order_idempotent(order(1), ["k1"]) == (id1, False)
+    id2 = await order_manager.create_order(order(2))
+    id3 = await order_manager.create_order(order(3))
+    assert 2000 < id2 < 3000 and id3 < 1000
+    assert router._scan() == (1, 2)
+
+    # 分片文件没有指向主库表的外键；用户与活动日志写主库
+    shard = router.shard(1)
+    assert await shard.fetch_all("PRAGMA foreign_key_list(orders)") == []
+    with v2_db.local_reads():
+        assert (await v2_db.fetch_one("SELECT COUNT(*) FROM orders"))[0] == 1
+    assert await v2_db.fetch_one("SELECT user_id FROM users WHERE user_id = 2001") is not None
+
+    # 汇总读取：分片订单可与主库商户关联
+    rows = await v2_db.fetch_all(
+        "SELECT o.id, m.name FROM orders o JOIN merchants m ON m.id = o.merchant_id ORDER BY o.id"
+    )
+    assert [tuple(r) for r in rows] == [(id3, "商户3"), (id1, "商户1"), (id2, "商户2")]
+
+    # 按ID定位写入，触发器在分片内维护计数器，读取按键求和
+    assert await order_manager.update_order_status(id1, "已完成")
+    assert (await shard.fetch_one("SELECT status FROM orders WHERE id = ?", (id1,)))[0] == "已完成"
+    counts = await row_counters.get_many(["orders", "orders:status:已完成", "orders:status:尝试预约"])
+    assert counts == {"orders": 3, "orders:status:已完成": 1, "orders:status:尝试预约": 2}
+    await v2_db.execute_query("DELETE FROM row_counters WHERE counter_key LIKE 'orders%'")
+    await row_counters.rebuild()
+    assert await row_counters.get("orders") == 3
+
+
+@pytest.mark.asyncio
+async def test_score_totals_merge_across_files(v2_db, router):
+    # 启用分片前的订单与评价留在主库
+    await v2_db.execute_query(
+        "INSERT INTO orders (id, merchant_id, customer_user_id, price) VALUES (5, 1, 2001, 500)"
+    )
+    legacy = await u2m_reviews_manager.create(5, 1, 2001, u2m(4))
+    await u2m_reviews_manager.confirm_by_admin(legacy, 99)
+    order_id = await order_manager.create_order(order(1))
+    review_id = await u2m_reviews_manager.create(order_id, 1, 2001, u2m(8))
+    assert 1000 < review_id < 2000
+    await u2m_reviews_manager.confirm_by_admin(review_id, 99)
+
+    row = await v2_db.fetch_one("SELECT * FROM merchant_scores WHERE merchant_id = 1")
+    assert row["total_reviews_count"] == 2 and row["avg_appearance"] == 6.0
+    assert (await score_totals_manager.get_totals("merchant", 1))["sum_figure"] == 12
+    assert await score_totals_manager.find_drift("merchant") == []
+
+    await router.shard(1).execute_query("UPDATE merchant_score_totals SET reviews_count = 5 WHERE merchant_id = 1")
+    assert await score_totals_manager.reconcile("merchant") == 1
+    assert (await score_totals_manager.get_totals("merchant", 1))["reviews_count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cascade_delete_and_schema_sync(v2_db, router):
+    kept = await order_manager.create_order(order(2))
+    await order_manager.create_order(order(1))
+    assert await MerchantManager.delete_merchant(1)
+    assert (await router.shard(1).fetch_one("SELECT COUNT(*) FROM orders"))[0] == 0
+    assert [r[0] for r in await v2_db.fetch_all("SELECT id FROM orders")] == [kept]
+
+    # 主库迁移新增列，启动时同步到已有分片
+    await v2_db.execute_query("ALTER TABLE orders ADD COLUMN probe TEXT DEFAULT 'x'")
+    await router.prepare()
+    columns = [r[1] for r in await router.shard(2).fetch_all("PRAGMA table_info(orders)")]
+    assert columns[-1] == "probe"
+    assert (await v2_db.fetch_one("SELECT probe FROM orders WHERE id = ?", (kept,)))[0] == "x"
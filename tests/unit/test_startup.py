@@ -0,0 +1,78 @@
+"""
+启动优化单元测试
+测试表结构指纹缓存、批量模板校验与启动耗时报告
+"""
+
+import pytest
+
+from database.db_init import DatabaseInitializer
+from utils.startup_timer import StartupTimer
+
+
+@pytest.mark.asyncio
+async def test_schema_fingerprint_skips_table_verification(v2_db, monkeypatch):
+    initializer = DatabaseInitializer()
+    assert await initializer._schema_unchanged()
+
+    calls = []
+    original = initializer._verify_tables
+
+    async def verify_tables():
+        calls.append(1)
+        return await original()
+
+    monkeypatch.setattr(initializer, "_verify_tables", verify_tables)
+    assert await initializer.initialize_database()
+    assert calls == []
+
+    # 任何 DDL 都会改变指纹，下次启动完整验证
+    await v2_db.execute_query("CREATE TABLE fingerprint_probe (id INTEGER)")
+    assert not await initializer._schema_unchanged()
+    assert await initializer.initialize_database()
+    assert calls == [1]
+    assert await initializer._schema_unchanged()
+
+
+@pytest.mark.asyncio
+async def test_schema_fingerprint_tracks_migration_contents(v2_db, tmp_path):
+    initializer = DatabaseInitializer()
+    initializer.migrations_dir = str(tmp_path)
+    migration = tmp_path / "migration_2099_01_01_1_probe.sql"
+    migration.write_text("ALTER TABLE users ADD COLUMN probe_a TEXT;", encoding="utf-8")
+    before = await initializer._schema_fingerprint()
+
+    # 文件大小不变、内容改变：指纹随之改变
+    migration.write_text("ALTER TABLE users ADD COLUMN probe_b TEXT;", encoding="utf-8")
+    assert await initializer._schema_fingerprint() != before
+
+
+@pytest.mark.asyncio
+async def test_warm_boot_runs_no_ddl(v2_db):
+    # 热启动不应执行任何 DDL（如活动日志视图/触发器重建），否则每次启动都抢表结构写锁
+    before = (await v2_db.fetch_one("PRAGMA schema_version"))[0]
+    assert await DatabaseInitializer().initialize_database()
+    assert await DatabaseInitializer().initialize_database()
+    assert (await v2_db.fetch_one("PRAGMA schema_version"))[0] == before
+
+
+@pytest.mark.asyncio
+async def test_missing_critical_templates_filled_in_batch(v2_db):
+    await v2_db.execute_query("DELETE FROM templates WHERE key IN ('error_general', 'admin_help')")
+    initializer = DatabaseInitializer()
+    assert not await initializer._verify_critical_templates()
+
+    templates = await initializer._fetch_templates(['error_general', 'admin_help', 'no_such_key'])
+    assert set(templates) == {'error_general', 'admin_help'}
+    assert await initializer._verify_critical_templates()
+
+
+def test_startup_timer_report():
+    timer = StartupTimer()
+    with timer.stage("database_init"):
+        pass
+    with timer.stage("database_init"):
+        pass
+    summary = timer.report()
+    assert set(summary) == {"database_init", "total"}
+    assert summary["total"] >= summary["database_init"]
+    assert timer.reported
@@ -0,0 +1,123 @@
+"""
+请求追踪单元测试
+测试 span 传递、数据库与 Bot API 埋点、采样规则及 OTLP 导出
+"""
+
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from database.db_connection import db_manager
+from middleware.tracing import BotApiTracingMiddleware, StageTracingMiddleware
+from utils.tracing import NOOP_SPAN, Tracer, sql_fingerprint, tracer
+
+
+@pytest.fixture
+def enabled_tracer():
+    tracer.configure(enabled=True, sample_rate=1.0, slow_ms=1000.0)
+    tracer.clear()
+    yield tracer
+    tracer.configure(enabled=False)
+    tracer.clear()
+
+
+class TestTracer:
+    """追踪器测试"""
+
+    def test_disabled_is_noop(self):
+        local = Tracer(enabled=False)
+        assert local.start_trace("x") is NOOP_SPAN
+        assert local.start_span("y") is NOOP_SPAN
+
+    def test_fingerprint(self):
+        sql = "SELECT *  FROM users\n WHERE id IN (1, 2, 3) AND name = 'a''b' AND score > 2.5"
+        assert sql_fingerprint(sql) == "SELECT * FROM users WHERE id IN (?) AND name = ? AND score > ?"
+
+    @pytest.mark.asyncio
+    async def test_db_spans_nest_under_update(self, v2_db, enabled_tracer):
+        root = tracer.start_trace("telegram.update", **{"update.id": 1})
+        with tracer.start_span("handler"):
+            await db_manager.fetch_one("SELECT username FROM users WHERE user_id = 42")
+            # 派生任务继承当前 span
+            await asyncio.create_task(db_manager.fetch_all("SELECT 1"))
+        tracer.finish_trace(root)
+
+        trace = tracer.recent(1)[0]
+        names = [s.name for s in trace.spans]
+        assert names == ["telegram.update", "handler", "db.fetch_one", "db.fetch_all"]
+        handler = trace.spans[1]
+        assert all(s.parent_id == handler.span_id for s in trace.spans[2:])
+        assert trace.spans[2].attributes["db.statement"] == "SELECT username FROM users WHERE user_id = ?"
+        assert trace.spans[2].attributes["db.rows"] == 0
+        assert tracer.current_span() is None
+        assert trace.summary()["breakdown_ms"].keys() >= {"handler", "db"}
+
+    @pytest.mark.asyncio
+    async def test_sampling_keeps_errors_and_slow(self, enabled_tracer):
+        tracer.configure(sample_rate=0.0, slow_ms=10_000)
+        tracer.finish_trace(tracer.start_trace("fast"))
+        errored = tracer.start_trace("failed")
+        errored.set_error(RuntimeError("boom"))
+        tracer.finish_trace(errored)
+        tracer.configure(slow_ms=0)
+        tracer.finish_trace(tracer.start_trace("slow"))
+        assert [t.root.name for t in tracer.recent()] == ["slow", "failed"]
+
+    @pytest.mark.asyncio
+    async def test_otlp_export(self, enabled_tracer):
+        root = tracer.start_trace("telegram.update", **{"user.id": 7})
+        with tracer.start_span("render.caption") as span:
+            span.add_event("cache.hit", cache="media")
+        tracer.finish_trace(root)
+
+        exported = tracer.export_otlp()
+        spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert len(spans) == 2
+        root_json, child_json = spans
+        assert len(root_json["traceId"]) == 32 and len(root_json["spanId"]) == 16
+        assert "parentSpanId" not in root_json
+        assert child_json["parentSpanId"] == root_json["spanId"]
+        assert root_json["attributes"] == [{"key": "user.id", "value": {"intValue": "7"}}]
+        assert child_json["events"][0]["name"] == "cache.hit"
+
+
+class TestTracingMiddleware:
+    """中间件埋点测试"""
+
+    @pytest.mark.asyncio
+    async def test_stage_span_excludes_downstream(self, enabled_tracer):
+        async def inner(handler, event, data):
+            return await handler(event, data)
+
+        async def downstream(event, data):
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        root = tracer.start_trace("telegram.update")
+        assert await StageTracingMiddleware(inner, "throttling")(downstream, object(), {}) == "ok"
+        tracer.finish_trace(root)
+
+        stage = tracer.recent(1)[0].spans[1]
+        assert stage.name == "middleware.throttling"
+        assert stage.attributes["middleware.passed"] is True
+        assert stage.duration_ms < 20
+
+    @pytest.mark.asyncio
+    async def test_bot_api_retry_after(self, enabled_tracer):
+        method = SendMessage(chat_id=1, text="hi")
+
+        async def make_request(bot, m):
+            raise TelegramRetryAfter(method=m, message="Too Many Requests", retry_after=5)
+
+        root = tracer.start_trace("telegram.update")
+        with pytest.raises(TelegramRetryAfter):
+            await BotApiTracingMiddleware()(make_request, None, method)
+        tracer.finish_trace(root)
+
+        span = tracer.recent(1)[0].spans[1]
+        assert span.name == "bot_api.sendMessage"
+        assert span.attributes["bot_api.status"] == "retry_after"
+        assert span.attributes["bot_api.retry_after"] == 5
+        assert span.error.startswith("TelegramRetryAfter")
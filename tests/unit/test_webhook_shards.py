@@ -0,0 +1,112 @@
+"""
+Webhook 分片单元测试
+测试分片键、worker 内按 chat 串行调度与共享 FSM 存储
+"""
+
+import asyncio
+
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from database.db_fsm_storage import SQLiteFSMStorage
+from services.webhook_shards import ChatSequencer, shard_for, update_chat_id
+
+
+class Flow(StatesGroup):
+    waiting_name = State()
+
+
+def message_update(update_id: int, chat_id: int) -> dict:
+    return {'update_id': update_id, 'message': {'message_id': 1, 'chat': {'id': chat_id}, 'from': {'id': chat_id}}}
+
+
+class TestShardKey:
+    """分片键测试"""
+
+    def test_message_and_callback_of_user_share_shard(self):
+        callback = {
+            'update_id': 2,
+            'callback_query': {'id': 'x', 'from': {'id': 1001}, 'message': {'chat': {'id': 1001}}},
+        }
+        assert update_chat_id(callback) == 1001
+        assert shard_for(message_update(1, 1001), 4) == shard_for(callback, 4)
+
+    def test_fallbacks(self):
+        inline = {'update_id': 3, 'inline_query': {'id': 'q', 'from': {'id': 77}}}
+        assert update_chat_id(inline) == 77
+        assert shard_for({'update_id': 9}, 4) == 1
+        assert shard_for(message_update(1, -100123), 3) == 100123 % 3
+
+
+class TestChatSequencer:
+    """worker 内调度测试"""
+
+    @pytest.mark.asyncio
+    async def test_same_chat_serial_other_chats_concurrent(self):
+        sequencer = ChatSequencer(max_concurrency=8)
+        events = []
+        gate = asyncio.Event()
+
+        def job(name, wait=False):
+            async def run():
+                events.append(f"start {name}")
+                if wait:
+                    await gate.wait()
+                events.append(f"end {name}")
+            return run
+
+        sequencer.submit(1, job('a1', wait=True))
+        sequencer.submit(1, job('a2'))
+        sequencer.submit(2, job('b1'))
+        await asyncio.sleep(0.01)
+        # chat 2 不被 chat 1 的慢更新阻塞，chat 1 的第二个更新仍在排队
+        assert events == ['start a1', 'start b1', 'end b1']
+
+        gate.set()
+        await sequencer.drain(1)
+        assert events[3:] == ['end a1', 'start a2', 'end a2']
+        assert len(sequencer) == 0
+
+    @pytest.mark.asyncio
+    async def test_failure_does_not_block_chat(self):
+        sequencer = ChatSequencer()
+        done = []
+
+        async def boom():
+            raise RuntimeError('x')
+
+        async def ok():
+            done.append(True)
+
+        sequencer.submit(5, boom)
+        sequencer.submit(5, ok)
+        await sequencer.drain(1)
+        assert done == [True]
+
+
+class TestSQLiteFSMStorage:
+    """共享 FSM 存储测试"""
+
+    @pytest.mark.asyncio
+    async def test_state_and_data_round_trip(self, v2_db):
+        storage = SQLiteFSMStorage()
+        key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+        other = StorageKey(bot_id=1, chat_id=10, user_id=10, destiny='aiogd:stack')
+
+        assert await storage.get_state(key) is None
+        assert await storage.get_data(key) == {}
+
+        await storage.set_state(key, Flow.waiting_name)
+        await storage.update_data(key, {'name': '张三'})
+        assert await storage.update_data(key, {'step': 2}) == {'name': '张三', 'step': 2}
+
+        # 另一个存储实例（即另一个 worker 进程）读到同样的状态
+        reader = SQLiteFSMStorage()
+        assert await reader.get_state(key) == Flow.waiting_name.state
+        assert await reader.get_data(key) == {'name': '张三', 'step': 2}
+        assert await reader.get_state(other) is None
+
+        await storage.set_state(key, None)
+        assert await reader.get_state(key) is None
+        assert await reader.get_data(key) == {'name': '张三', 'step': 2}
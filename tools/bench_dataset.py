@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试数据集生成（确定性）
+
+按规模（10k / 100k / 1m，指订单量级）生成可复现的 SQLite 数据库：
+城市/区县、用户、商户、关键词、订单、U2M/M2U 评价、活动日志、自动回复触发词。
+同一 scale + seed 生成的数据逐行一致，便于跨版本比较基准结果。
+
+与 generate_review_dataset.py 不同：
+- 不经过各 Manager 逐条写入，而是建表（完整迁移）后用 sqlite3 executemany 批量插入，
+  百万级也能在分钟级完成；评分累计表、计数器仍由库内触发器维护
+- 所有时间基于固定基准时间 BASE_TIME，不依赖运行时刻
+
+用法示例：
+    python3 tools/bench_dataset.py --scale 100k --db data/bench/bench_100k.db
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# 追加根目录进路径，便于独立运行
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from database.db_connection import db_manager
+from database.db_init import DatabaseInitializer
+from database.db_log_partitions import log_partitions, month_key, partition_name
+
+# 各规模的数据量；reviews 为 U2M 占订单比例，m2u 为 M2U 占 U2M 比例
+SCALES: Dict[str, Dict[str, Any]] = {
+    '10k': {'cities': 5, 'districts_per_city': 8, 'users': 5_000, 'merchants': 200,
+            'keywords': 20, 'orders': 10_000, 'reviews': 0.6, 'm2u': 0.7,
+            'logs': 10_000, 'triggers': 50},
+    '100k': {'cities': 10, 'districts_per_city': 12, 'users': 50_000, 'merchants': 2_000,
+             'keywords': 40, 'orders': 100_000, 'reviews': 0.6, 'm2u': 0.7,
+             'logs': 100_000, 'triggers': 200},
+    '1m': {'cities': 20, 'districts_per_city': 16, 'users': 500_000, 'merchants': 10_000,
+           'keywords': 60, 'orders': 1_000_000, 'reviews': 0.6, 'm2u': 0.7,
+           'logs': 1_000_000, 'triggers': 500},
+}
+
+BASE_TIME = datetime(2026, 1, 1)
+SPAN_DAYS = 90
+USER_ID_BASE = 100_000
+CHAT_ID_BASE = 9_000_000_000
+META_KEY = 'bench_dataset'
+BATCH_SIZE = 20_000
+
+NAME_PARTS = ['小', '安', '白', '晴', '雪', '月', '琪', '可', '欣', '乐', '米', '朵', '糖', '柚', '橙', '梨']
+WORDS = ['温柔', '耐心', '专业', '颜值', '服务', '环境', '准时', '学生', '御姐', '萝莉', '高挑', '性价比']
+ACTIONS = ['button_click', 'search_region', 'view_merchant', 'order_create', 'review_submit', 'start']
+ORDER_STATUSES = [('尝试预约', 0.15), ('已完成', 0.15), ('已评价', 0.3), ('双方评价', 0.3), ('单方评价', 0.1)]
+MERCHANT_STATUSES = [('published', 0.6), ('approved', 0.15), ('pending_approval', 0.1),
+                     ('expired', 0.1), ('pending_submission', 0.05)]
+
+
+def resolve_scale(scale: Any) -> Dict[str, Any]:
+    """把规模名或自定义字典解析为完整规格（自定义字典缺省项取 10k）"""
+    if isinstance(scale, dict):
+        return {**SCALES['10k'], **scale}
+    if scale not in SCALES:
+        raise ValueError(f"未知规模: {scale}（可选 {', '.join(SCALES)}）")
+    return dict(SCALES[scale])
+
+
+def _ts(rng: random.Random, start: datetime = BASE_TIME, days: int = SPAN_DAYS) -> datetime:
+    return start + timedelta(seconds=rng.randrange(days * 86400))
+
+
+def _fmt(dt: datetime) -> str:
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _weighted(rng: random.Random, choices: List[Tuple[str, float]]) -> str:
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def _name(rng: random.Random, length: int = 2) -> str:
+    return ''.join(rng.choice(NAME_PARTS) for _ in range(length))
+
+
+def _batched(rows: Iterable[tuple], size: int = BATCH_SIZE) -> Iterator[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class DatasetBuilder:
+    """在已完成迁移的库上批量写入确定性数据"""
+
+    def __init__(self, db_path: str, spec: Dict[str, Any], seed: int = 42):
+        self.db_path = db_path
+        self.spec = spec
+        self.seed = seed
+        self.counts: Dict[str, int] = {}
+
+    def _rng(self, name: str) -> random.Random:
+        # 每张表独立随机流：调整某表的生成逻辑不影响其他表的数据
+        return random.Random(f"{self.seed}:{name}")
+
+    def _insert(self, conn: sqlite3.Connection, table: str, columns: Tuple[str, ...], rows: Iterable[tuple]) -> int:
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        total = 0
+        for batch in _batched(rows):
+            conn.executemany(sql, batch)
+            total += len(batch)
+        self.counts[table] = self.counts.get(table, 0) + total
+        return total
+
+    def populate(self) -> Dict[str, int]:
+        """写入全部数据，返回各表行数"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA foreign_keys=OFF")
+            with conn:
+                districts = self._regions(conn)
+                self._users(conn)
+                merchants = self._merchants(conn, districts)
+                self._keywords(conn, merchants)
+                orders = self._orders(conn, merchants)
+                self._reviews(conn, orders)
+                self._logs(conn, merchants)
+                self._auto_replies(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO system_config (config_key, config_value, description) VALUES (?, ?, ?)",
+                    (META_KEY, json.dumps({'seed': self.seed, 'spec': self.spec, 'counts': self.counts}),
+                     '基准测试数据集元信息'),
+                )
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
+        return self.counts
+
+    def _regions(self, conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+        cities = [(i, f"城市{i:02d}", i, 1) for i in range(1, self.spec['cities'] + 1)]
+        self._insert(conn, 'cities', ('id', 'name', 'display_order', 'is_active'), cities)
+        districts = []
+        for city_id, *_ in cities:
+            for n in range(1, self.spec['districts_per_city'] + 1):
+                districts.append((len(districts) + 1, f"城市{city_id:02d}-区{n:02d}", city_id, n, 1))
+        self._insert(conn, 'districts', ('id', 'name', 'city_id', 'display_order', 'is_active'), districts)
+        return [(d[0], d[2]) for d in districts]
+
+    def _users(self, conn: sqlite3.Connection) -> None:
+        rng = self._rng('users')
+
+        def rows():
+            for i in range(self.spec['users']):
+                created = _fmt(_ts(rng))
+                xp = rng.randrange(0, 5000)
+                yield (USER_ID_BASE + i, f"user_{USER_ID_BASE + i}", xp, xp // 2,
+                       rng.randrange(0, 30), created, created)
+
+        self._insert(conn, 'users', ('user_id', 'username', 'xp', 'points', 'order_count', 'created_at', 'updated_at'),
+                     rows())
+
+    def _merchants(self, conn: sqlite3.Connection, districts: List[Tuple[int, int]]) -> List[int]:
+        rng = self._rng('merchants')
+        expires = _fmt(BASE_TIME + timedelta(days=3650))
+
+        def rows():
+            for i in range(1, self.spec['merchants'] + 1):
+                district_id, city_id = rng.choice(districts)
+                status = _weighted(rng, MERCHANT_STATUSES)
+                created = _ts(rng)
+                published = status in ('published', 'approved', 'expired')
+                p_price = rng.choice(range(400, 1600, 100))
+                description = '，'.join(rng.sample(WORDS, 3))
+                yield (i, CHAT_ID_BASE + i, f"{_name(rng, 3)}{i}", f"@merchant_{i}", status,
+                       rng.choice(['teacher', 'business']), city_id, district_id, p_price, p_price + 400,
+                       description, int(rng.random() < 0.8),
+                       _fmt(created + timedelta(days=1)) if published else None,
+                       (_fmt(created) if status == 'expired' else expires) if published else None,
+                       _fmt(created), _fmt(created))
+
+        self._insert(conn, 'merchants', (
+            'id', 'telegram_chat_id', 'name', 'contact_info', 'status', 'merchant_type', 'city_id',
+            'district_id', 'p_price', 'pp_price', 'custom_description', 'show_in_region_search',
+            'publish_time', 'expiration_time', 'created_at', 'updated_at'), rows())
+        return list(range(1, self.spec['merchants'] + 1))
+
+    def _keywords(self, conn: sqlite3.Connection, merchants: List[int]) -> None:
+        rng = self._rng('keywords')
+        keywords = [(i, f"{WORDS[(i - 1) % len(WORDS)]}{i}", i, 1) for i in range(1, self.spec['keywords'] + 1)]
+        self._insert(conn, 'keywords', ('id', 'name', 'display_order', 'is_active'), keywords)
+        ids = [k[0] for k in keywords]
+        links = ((m, k) for m in merchants for k in rng.sample(ids, min(3, len(ids))))
+        self._insert(conn, 'merchant_keywords', ('merchant_id', 'keyword_id'), links)
+
+    def _orders(self, conn: sqlite3.Connection, merchants: List[int]) -> List[Tuple[int, int, int, str]]:
+        rng = self._rng('orders')
+        orders = []
+
+        def rows():
+            for i in range(1, self.spec['orders'] + 1):
+                merchant_id = rng.choice(merchants)
+                user_id = USER_ID_BASE + rng.randrange(self.spec['users'])
+                course = 'P' if rng.random() < 0.7 else 'PP'
+                status = _weighted(rng, ORDER_STATUSES)
+                created = _ts(rng)
+                completed = _fmt(created + timedelta(hours=2)) if status != '尝试预约' else None
+                orders.append((i, merchant_id, user_id, status))
+                yield (i, merchant_id, user_id, f"user_{user_id}", course, 500 if course == 'P' else 900,
+                       _fmt(created + timedelta(hours=1)), completed, status, _fmt(created), _fmt(created))
+
+        self._insert(conn, 'orders', (
+            'id', 'merchant_id', 'customer_user_id', 'customer_username', 'course_type', 'price',
+            'appointment_time', 'completion_time', 'status', 'created_at', 'updated_at'), rows())
+        return orders
+
+    def _reviews(self, conn: sqlite3.Connection, orders: List[Tuple[int, int, int, str]]) -> None:
+        rng = self._rng('reviews')
+        reviewed = [o for o in orders if o[3] != '尝试预约' and rng.random() < self.spec['reviews'] / 0.85]
+        u2m, m2u = [], []
+        for order_id, merchant_id, user_id, _ in reviewed:
+            created = _fmt(_ts(rng))
+            confirmed = int(rng.random() < 0.9)
+            u2m.append((order_id, merchant_id, user_id, *(rng.randint(1, 10) for _ in range(5)),
+                        'completed', confirmed, created, created))
+            if confirmed and rng.random() < self.spec['m2u']:
+                m2u.append((order_id, merchant_id, user_id, *(rng.randint(1, 10) for _ in range(5)),
+                            int(rng.random() < 0.95), created, created))
+        self._insert(conn, 'reviews', (
+            'order_id', 'merchant_id', 'customer_user_id', 'rating_appearance', 'rating_figure',
+            'rating_service', 'rating_attitude', 'rating_environment', 'status', 'is_confirmed_by_admin',
+            'created_at', 'updated_at'), u2m)
+        self._insert(conn, 'merchant_reviews', (
+            'order_id', 'merchant_id', 'user_id', 'rating_attack_quality', 'rating_length', 'rating_hardness',
+            'rating_duration', 'rating_user_temperament', 'is_confirmed_by_admin', 'created_at', 'updated_at'), m2u)
+
+    def _logs(self, conn: sqlite3.Connection, merchants: List[int]) -> None:
+        rng = self._rng('logs')
+        by_partition: Dict[str, List[tuple]] = {}
+        for _ in range(self.spec['logs']):
+            ts = _ts(rng)
+            action = rng.choice(ACTIONS)
+            merchant_id = rng.choice(merchants) if action in ('view_merchant', 'order_create') else None
+            by_partition.setdefault(partition_name(month_key(ts)), []).append(
+                (USER_ID_BASE + rng.randrange(self.spec['users']), action, None,
+                 f"btn_{rng.randrange(20)}" if action == 'button_click' else None, merchant_id, _fmt(ts)))
+        for table in sorted(by_partition):
+            self._insert(conn, table, ('user_id', 'action_type', 'details', 'button_id', 'merchant_id', 'timestamp'),
+                         by_partition[table])
+            self.counts['activity_logs'] = self.counts.get('activity_logs', 0) + len(by_partition[table])
+            del self.counts[table]
+
+    def _auto_replies(self, conn: sqlite3.Connection) -> None:
+        rng = self._rng('auto_reply')
+        triggers, messages = [], []
+        for i in range(1, self.spec['triggers'] + 1):
+            match_type = 'exact' if i % 3 == 0 else 'contains'
+            triggers.append((i, f"{rng.choice(WORDS)}{i}", match_type, 1, rng.randrange(10)))
+            messages.extend((i, f"回复{i}-{n}：{{username}} 你好", 1, n) for n in range(2))
+        self._insert(conn, 'auto_reply_triggers', ('id', 'trigger_text', 'match_type', 'is_active', 'priority_order'),
+                     triggers)
+        self._insert(conn, 'auto_reply_messages', ('trigger_id', 'message_content', 'is_active', 'display_order'),
+                     messages)
+
+
+def read_meta(db_path: str) -> Dict[str, Any]:
+    """读取库内记录的数据集元信息；库不存在或未生成时返回空字典"""
+    if not os.path.exists(db_path):
+        return {}
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT config_value FROM system_config WHERE config_key = ?", (META_KEY,)).fetchone()
+        return json.loads(row[0]) if row else {}
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+
+
+async def build_dataset(db_path: str, scale: Any = '10k', seed: int = 42) -> Dict[str, int]:
+    """
+    生成基准数据库（会删除同路径旧库）
+
+    Args:
+        db_path: 目标库路径
+        scale: 规模名（10k/100k/1m）或自定义规格字典
+        seed: 随机种子
+
+    Returns:
+        各表写入行数
+    """
+    spec = resolve_scale(scale)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    original = db_manager.db_path
+    await db_manager.close_all_connections()
+    db_manager.set_db_path(db_path)
+    try:
+        if not await DatabaseInitializer().initialize_database():
+            raise RuntimeError("基准库初始化失败")
+        # 活动日志按月分区：预先建好数据时间跨度内的分区
+        month = BASE_TIME.replace(day=1)
+        while month <= BASE_TIME + timedelta(days=SPAN_DAYS):
+            await log_partitions.ensure_partition(month_key(month))
+            month = (month + timedelta(days=32)).replace(day=1)
+    finally:
+        await db_manager.close_all_connections()
+        db_manager.set_db_path(original)
+
+    return await asyncio.to_thread(DatasetBuilder(db_path, spec, seed).populate)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='生成确定性基准测试数据库')
+    parser.add_argument('--scale', choices=list(SCALES), default='10k', help='数据规模（订单量级）')
+    parser.add_argument('--db', default=None, help='输出库路径（默认 data/bench/bench_<scale>.db）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(ROOT, 'data', 'bench', f'bench_{args.scale}.db')
+    started = datetime.now()
+    counts = await build_dataset(db_path, args.scale, args.seed)
+    print(f"✅ 基准库已生成: {db_path}（耗时 {(datetime.now() - started).total_seconds():.1f}s）")
+    for table, count in counts.items():
+        print(f"  {table}: {count}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
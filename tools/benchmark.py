@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+热点路径基准测试
+
+在 bench_dataset.py 生成的确定性数据库上，直接调用真实的 Manager/Service 计时：
+- region_listing：地区浏览商户列表（用户端选择区县）
+- merchant_search：商户关键词搜索
+- order_list_page / order_list_keyset / order_list_user：订单列表首页、键集翻页、按用户筛选
+- dashboard_stats：仪表板统计（跳过缓存）
+- score_drift_check / score_recalculate：评分累计对账与全量聚合
+- leaderboard_build：从 user_scores 冷加载五个维度的排行榜
+- auto_reply_match：自动回复触发词匹配
+
+结果写入 JSON（默认 data/benchmarks/<scale>-<时间>.json），可用 --compare 与历史结果对比。
+
+用法示例：
+    python3 tools/benchmark.py --scale 10k
+    python3 tools/benchmark.py --scale 100k --repeat 50 --compare data/benchmarks/100k-20261018-120000.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 追加根目录进路径，便于独立运行
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from database.db_auto_reply import auto_reply_manager
+from database.db_connection import db_manager
+from database.db_merchants import merchant_manager
+from database.db_orders import OrderManager
+from database.db_pagination import cursor_after
+from database.db_query_profiler import query_profiler
+from database.db_score_totals import score_totals_manager
+from services.live_leaderboard import DIM_COLUMNS, LiveLeaderboard
+from services.user_scores_service import user_scores_service
+from web.services.dashboard_service import DashboardService
+from tools.bench_dataset import SCALES, WORDS, build_dataset, read_meta
+
+RESULTS_VERSION = 1
+DEFAULT_OUTPUT = os.path.join(ROOT, 'data', 'benchmarks')
+
+# (名称, 说明, 调用工厂, 是否重型)；重型用例的重复次数为常规的 1/5
+Case = Tuple[str, str, Callable[[int], Awaitable[Any]], bool]
+
+
+def _samples(db_path: str) -> Dict[str, List[Any]]:
+    """从库中取固定顺序的样本 ID，供各用例轮流使用"""
+    conn = sqlite3.connect(db_path)
+    try:
+        def column(sql: str) -> List[Any]:
+            return [r[0] for r in conn.execute(sql)]
+        return {
+            'districts': column("SELECT id FROM districts ORDER BY id"),
+            'users': column("SELECT customer_user_id FROM orders GROUP BY customer_user_id "
+                            "ORDER BY COUNT(*) DESC, customer_user_id LIMIT 50"),
+            'triggers': column("SELECT trigger_text FROM auto_reply_triggers ORDER BY id LIMIT 50"),
+        }
+    finally:
+        conn.close()
+
+
+def build_cases(samples: Dict[str, List[Any]]) -> List[Case]:
+    """构造基准用例；每个调用接收迭代序号，用于在样本间轮转"""
+    districts = samples['districts'] or [1]
+    users = samples['users'] or [0]
+    triggers = samples['triggers'] or ['']
+    searches = WORDS[:6]
+    statuses = [None, '已评价', '双方评价', '尝试预约']
+
+    async def region_listing(i: int):
+        return await merchant_manager.list_active_by_district(districts[i % len(districts)], limit=30, offset=0)
+
+    async def merchant_search(i: int):
+        return await merchant_manager.search_merchants(searches[i % len(searches)], status_filter='published')
+
+    async def order_list_page(i: int):
+        return await OrderManager.get_orders(status=statuses[i % len(statuses)], limit=20, offset=0)
+
+    async def order_list_keyset(i: int):
+        # 连续翻 5 页，模拟后台订单列表向后浏览
+        cursor = None
+        for _ in range(5):
+            rows = await OrderManager.get_orders(limit=20, cursor=cursor)
+            cursor = cursor_after(rows, 20)
+            if not cursor:
+                break
+
+    async def order_list_user(i: int):
+        return await OrderManager.get_orders(user_id=users[i % len(users)], limit=20)
+
+    async def dashboard_stats(i: int):
+        return await DashboardService.get_dashboard_data(force_refresh=True)
+
+    async def score_drift_check(i: int):
+        return [await score_totals_manager.find_drift(kind) for kind in ('merchant', 'user')]
+
+    async def score_recalculate(i: int):
+        return await user_scores_service.recalculate_all_user_scores()
+
+    async def leaderboard_build(i: int):
+        board = LiveLeaderboard()
+        await board.ensure_loaded()
+        return [await board.top(dim, 50) for dim in DIM_COLUMNS]
+
+    async def auto_reply_match(i: int):
+        text = triggers[i % len(triggers)]
+        # 一半为“句中包含”的常见形态，一半为不命中的普通消息
+        message = f"请问{text}还有吗" if i % 2 == 0 else f"普通消息{i}"
+        return await auto_reply_manager.find_matching_triggers(message)
+
+    return [
+        ('region_listing', '地区浏览商户列表', region_listing, False),
+        ('merchant_search', '商户关键词搜索', merchant_search, False),
+        ('order_list_page', '订单列表首页（按状态）', order_list_page, False),
+        ('order_list_keyset', '订单列表键集翻页 5 页', order_list_keyset, False),
+        ('order_list_user', '按用户筛选订单', order_list_user, False),
+        ('dashboard_stats', '仪表板统计（无缓存）', dashboard_stats, False),
+        ('score_drift_check', '评分累计对账查询', score_drift_check, True),
+        ('score_recalculate', 'M2U 评分全量聚合', score_recalculate, True),
+        ('leaderboard_build', '排行榜冷加载', leaderboard_build, True),
+        ('auto_reply_match', '自动回复匹配', auto_reply_match, False),
+    ]
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """计算耗时统计（毫秒）"""
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    total = sum(ordered)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'mean_ms': round(total / len(ordered), 3),
+        'p95_ms': round(p95, 3),
+        'max_ms': round(ordered[-1], 3),
+        'ops_per_sec': round(len(ordered) / (total / 1000), 2) if total else 0.0,
+    }
+
+
+async def run_cases(cases: List[Case], repeat: int = 20, warmup: int = 2,
+                    only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    依次执行基准用例
+
+    Args:
+        cases: build_cases 的返回值
+        repeat: 常规用例计时次数（重型用例取 1/5，至少 1 次）
+        warmup: 计时前的预热次数（填充连接池/页缓存）
+        only: 仅执行指定名称的用例
+
+    Returns:
+        {用例名: 统计结果}
+    """
+    results = {}
+    for name, description, func, heavy in cases:
+        if only and name not in only:
+            continue
+        runs = max(1, repeat // 5) if heavy else repeat
+        for i in range(min(warmup, runs)):
+            await func(i)
+        timings = []
+        for i in range(runs):
+            started = time.perf_counter()
+            await func(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = {'description': description, **summarize(timings)}
+    return results
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2) -> List[Dict[str, Any]]:
+    """
+    按中位数对比两次结果
+
+    Args:
+        current: 本次结果
+        baseline: 基线结果
+        threshold: 变慢超过该比例视为回退
+
+    Returns:
+        每个共同用例的对比行（含 change 与 regression 标记）
+    """
+    rows = []
+    for name, stats in current.get('results', {}).items():
+        base = baseline.get('results', {}).get(name)
+        if not base or not base.get('median_ms'):
+            continue
+        change = stats['median_ms'] / base['median_ms'] - 1
+        rows.append({
+            'name': name,
+            'baseline_ms': base['median_ms'],
+            'current_ms': stats['median_ms'],
+            'change': round(change, 4),
+            'regression': change > threshold,
+        })
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run_benchmark(db_path: str, scale: str = '10k', seed: int = 42, rebuild: bool = False,
+                        repeat: int = 20, warmup: int = 2, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    准备数据集（规模/种子不符或指定 rebuild 时重建）并执行全部用例
+
+    Returns:
+        可直接序列化为 JSON 的结果
+    """
+    meta = read_meta(db_path)
+    if rebuild or meta.get('seed') != seed or meta.get('spec') != SCALES.get(scale, meta.get('spec')):
+        started = time.perf_counter()
+        await build_dataset(db_path, scale, seed)
+        logging.getLogger(__name__).warning(f"基准库已重建: {db_path}（{time.perf_counter() - started:.1f}s）")
+        meta = read_meta(db_path)
+
+    original = db_manager.db_path
+    profiler_enabled = query_profiler.enabled
+    await db_manager.close_all_connections()
+    db_manager.set_db_path(db_path)
+    # 慢查询分析器会为新指纹后台执行 EXPLAIN，计时期间关闭以免干扰
+    query_profiler.enabled = False
+    try:
+        results = await run_cases(build_cases(_samples(db_path)), repeat=repeat, warmup=warmup, only=only)
+    finally:
+        query_profiler.enabled = profiler_enabled
+        await db_manager.close_all_connections()
+        db_manager.set_db_path(original)
+
+    return {
+        'version': RESULTS_VERSION,
+        'scale': scale,
+        'seed': seed,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'dataset': meta.get('counts', {}),
+        'results': results,
+    }
+
+
+def print_results(report: Dict[str, Any], comparison: Optional[List[Dict[str, Any]]] = None) -> None:
+    print(f"\n基准结果 scale={report['scale']} commit={report['git_commit']} sqlite={report['sqlite']}")
+    print(f"{'用例':<20}{'次数':>6}{'中位(ms)':>12}{'p95(ms)':>12}{'最大(ms)':>12}{'ops/s':>10}")
+    for name, stats in report['results'].items():
+        print(f"{name:<20}{stats['runs']:>6}{stats['median_ms']:>12.2f}{stats['p95_ms']:>12.2f}"
+              f"{stats['max_ms']:>12.2f}{stats['ops_per_sec']:>10.1f}")
+    if comparison:
+        print(f"\n{'用例':<20}{'基线(ms)':>12}{'本次(ms)':>12}{'变化':>10}")
+        for row in comparison:
+            flag = '  ⚠️ 回退' if row['regression'] else ''
+            print(f"{row['name']:<20}{row['baseline_ms']:>12.2f}{row['current_ms']:>12.2f}"
+                  f"{row['change']:>+10.1%}{flag}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='热点路径基准测试')
+    parser.add_argument('--scale', choices=list(SCALES), default='10k', help='数据规模（订单量级）')
+    parser.add_argument('--db', default=None, help='基准库路径（默认 data/bench/bench_<scale>.db）')
+    parser.add_argument('--seed', type=int, default=42, help='数据集随机种子')
+    parser.add_argument('--rebuild', action='store_true', help='强制重建基准库')
+    parser.add_argument('--repeat', type=int, default=20, help='每个用例的计时次数')
+    parser.add_argument('--warmup', type=int, default=2, help='每个用例的预热次数')
+    parser.add_argument('--only', nargs='*', help='仅执行指定用例')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='结果目录或 .json 文件路径')
+    parser.add_argument('--compare', default=None, help='与之对比的历史结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='中位数变慢超过该比例视为回退')
+    parser.add_argument('--fail-on-regression', action='store_true', help='存在回退时以非零状态退出')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    db_path = args.db or os.path.join(ROOT, 'data', 'bench', f'bench_{args.scale}.db')
+    report = await run_benchmark(db_path, args.scale, args.seed, args.rebuild, args.repeat, args.warmup, args.only)
+
+    comparison = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != report['scale']:
+            print(f"⚠️ 基线规模 {baseline.get('scale')} 与本次 {report['scale']} 不同，对比仅供参考")
+        comparison = compare(report, baseline, args.threshold)
+        report['compared_to'] = {'file': os.path.basename(args.compare), 'git_commit': baseline.get('git_commit'),
+                                 'rows': comparison}
+
+    output = args.output
+    if not output.endswith('.json'):
+        os.makedirs(output, exist_ok=True)
+        output = os.path.join(output, f"{report['scale']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_results(report, comparison)
+    print(f"\n结果已写入: {output}")
+    if args.fail_on_regression and comparison and any(r['regression'] for r in comparison):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
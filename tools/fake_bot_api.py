@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟 Telegram Bot API 服务器（压测用）
+
+接受 aiogram 发出的 /bot<token>/<method> 请求，返回结构合法的结果：
+sendMessage / editMessageText / editMessageCaption / editMessageReplyMarkup / sendPhoto / sendVideo /
+sendMediaGroup / copyMessage / forwardMessage / getChatMember / getChat / getFile / getMe 等，
+其余方法一律返回 True。
+
+可模拟：
+- 调用延迟（基础值 + 随机抖动）
+- 按比例返回 429 Too Many Requests（携带 retry_after）
+- 已拉黑机器人的用户（403 Forbidden: bot was blocked by the user）
+
+服务器按会话记录发往每个聊天的消息及其内联键盘，供负载生成器“点击按钮”继续流程。
+
+用法示例（独立运行，配合 TELEGRAM_API_SERVER=http://127.0.0.1:8081 启动机器人）：
+    python3 tools/fake_bot_api.py --port 8081 --latency-ms 40 --rate-limit 0.01 --blocked-rate 0.02
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_load_bot'}
+
+# 会给目标聊天“发出”一条新消息的方法
+SEND_METHODS = {'sendMessage', 'sendPhoto', 'sendVideo', 'sendDocument', 'sendAnimation', 'sendAudio',
+                'sendVoice', 'sendSticker', 'sendLocation', 'sendContact', 'forwardMessage'}
+EDIT_METHODS = {'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup', 'editMessageMedia'}
+# 发给用户时受“拉黑”影响的方法（编辑/回调应答不受影响，与真实行为一致）
+BLOCKABLE_METHODS = SEND_METHODS | {'sendMediaGroup', 'copyMessage'}
+
+
+def _to_int(value: Any) -> Any:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _loads(value: Any) -> Any:
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def callback_buttons(reply_markup: Any) -> List[str]:
+    """提取内联键盘中的 callback_data（按行列顺序）"""
+    if not isinstance(reply_markup, dict):
+        return []
+    return [button['callback_data'] for row in reply_markup.get('inline_keyboard') or []
+            for button in row if button.get('callback_data')]
+
+
+class FakeBotApi:
+    """模拟 Bot API 服务器"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_limit: float = 0.0,
+                 retry_after: int = 1, blocked_rate: float = 0.0, blocked_users: Iterable[int] = (),
+                 seed: int = 0, history: int = 20):
+        """
+        初始化模拟服务器
+
+        Args:
+            latency_ms: 每次调用的基础延迟（毫秒）
+            jitter_ms: 延迟的随机抖动上限（毫秒）
+            rate_limit: 返回 429 的概率 0..1
+            retry_after: 429 响应携带的 retry_after（秒）
+            blocked_rate: 按用户 ID 确定性判定为“已拉黑”的比例 0..1
+            blocked_users: 显式指定的拉黑用户
+            seed: 随机种子（抖动与 429 判定）
+            history: 每个聊天保留的最近消息条数
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.blocked_rate = blocked_rate
+        self.blocked_users = set(blocked_users)
+        self.history = history
+        self._rng = random.Random(seed)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self.chats: Dict[Any, Dict[int, Dict[str, Any]]] = {}
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    # ---------- 生命周期 ---------- #
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        app.router.add_get('/file/bot{token}/{path:.*}', self.handle_file)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """启动服务器，返回基础地址（port=0 时自动选择空闲端口）"""
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{bound}"
+        logger.info(f"模拟 Bot API 已启动: {self.url}")
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # ---------- 会话状态 ---------- #
+
+    def is_blocked(self, chat_id: Any) -> bool:
+        if not isinstance(chat_id, int) or chat_id <= 0:
+            return False
+        if chat_id in self.blocked_users:
+            return True
+        # 按 ID 哈希判定，保证同一用户在整个压测中结果一致
+        return (chat_id * 2654435761 % 2 ** 32) / 2 ** 32 < self.blocked_rate
+
+    def messages(self, chat_id: Any) -> Dict[int, Dict[str, Any]]:
+        return self.chats.get(_to_int(chat_id), {})
+
+    def last_buttons(self, chat_id: Any) -> Tuple[Optional[int], List[str]]:
+        """最近一条带内联按钮的消息：(message_id, callback_data 列表)"""
+        for message_id, message in sorted(self.messages(chat_id).items(), reverse=True):
+            buttons = callback_buttons(message.get('reply_markup'))
+            if buttons:
+                return message_id, buttons
+        return None, []
+
+    def _remember(self, chat_id: Any, message: Dict[str, Any]) -> None:
+        chat = self.chats.setdefault(chat_id, {})
+        chat[message['message_id']] = message
+        while len(chat) > self.history:
+            chat.pop(min(chat))
+
+    # ---------- 请求处理 ---------- #
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        params: Dict[str, Any] = dict(request.query)
+        if request.method == 'POST':
+            if request.content_type == 'application/json':
+                params.update(await request.json())
+            else:
+                for key, value in (await request.post()).items():
+                    params[key] = value if isinstance(value, str) else f"<file:{getattr(value, 'filename', key)}>"
+        return {key: _loads(value) for key, value in params.items()}
+
+    def _error(self, code: int, description: str, **parameters) -> web.Response:
+        payload: Dict[str, Any] = {'ok': False, 'error_code': code, 'description': description}
+        if parameters:
+            payload['parameters'] = parameters
+        return web.json_response(payload, status=code)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.calls[method] += 1
+
+        delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if self.rate_limit and self._rng.random() < self.rate_limit:
+            self.errors['429'] += 1
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                               retry_after=self.retry_after)
+
+        chat_id = _to_int(params.get('chat_id'))
+        if method in BLOCKABLE_METHODS and self.is_blocked(chat_id):
+            self.errors['403'] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        result = self.result(method, params)
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self.calls['file'] += 1
+        return web.Response(body=b'\0' * 1024, content_type='application/octet-stream')
+
+    def _message(self, chat_id: Any, params: Dict[str, Any], **extra) -> Dict[str, Any]:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if isinstance(chat_id, int) and chat_id > 0 else 'channel'},
+            'from': BOT_USER,
+            **extra,
+        }
+        if 'text' in params:
+            message['text'] = str(params['text'])
+        if 'caption' in params:
+            message['caption'] = str(params['caption'])
+        if isinstance(params.get('reply_markup'), dict):
+            message['reply_markup'] = params['reply_markup']
+        self._remember(chat_id, message)
+        return message
+
+    def _media(self, kind: str) -> Any:
+        file_id = f"fake_{kind}_{next(self._file_ids)}"
+        item = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': 1024}
+        if kind == 'photo':
+            return [{**item, 'width': 800, 'height': 600}]
+        if kind == 'video':
+            return {**item, 'width': 640, 'height': 360, 'duration': 5}
+        return item
+
+    def result(self, method: str, params: Dict[str, Any]) -> Any:
+        """构造各方法的返回值"""
+        chat_id = _to_int(params.get('chat_id'))
+        if method == 'getMe':
+            return BOT_USER
+        if method in SEND_METHODS:
+            extra = {}
+            if method == 'sendPhoto':
+                extra['photo'] = self._media('photo')
+            elif method == 'sendVideo':
+                extra['video'] = self._media('video')
+            elif method in ('sendDocument', 'sendAnimation'):
+                extra['document'] = self._media('document')
+            return self._message(chat_id, params, **extra)
+        if method == 'sendMediaGroup':
+            group = str(next(self._file_ids))
+            media = params.get('media') if isinstance(params.get('media'), list) else []
+            return [
+                self._message(chat_id, {'caption': item['caption']} if item.get('caption') else {},
+                              media_group_id=group,
+                              **{item.get('type', 'photo'): self._media(item.get('type', 'photo'))})
+                for item in media
+            ]
+        if method == 'copyMessage':
+            return {'message_id': self._message(chat_id, params)['message_id']}
+        if method in EDIT_METHODS:
+            if params.get('inline_message_id'):
+                return True
+            message_id = _to_int(params.get('message_id'))
+            message = self.messages(chat_id).get(message_id) or {
+                'message_id': message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER,
+            }
+            for key in ('text', 'caption'):
+                if key in params:
+                    message[key] = str(params[key])
+            if isinstance(params.get('reply_markup'), dict):
+                message['reply_markup'] = params['reply_markup']
+            else:
+                message.pop('reply_markup', None)
+            message['edit_date'] = int(time.time())
+            self._remember(chat_id, message)
+            return message
+        if method == 'getChatMember':
+            return {'status': 'member', 'user': {'id': _to_int(params.get('user_id')), 'is_bot': False,
+                                                  'first_name': 'user'}}
+        if method == 'getChat':
+            is_user = isinstance(chat_id, int) and chat_id > 0
+            return {'id': chat_id, 'type': 'private' if is_user else 'channel',
+                    'title': None if is_user else 'Fake Channel', 'first_name': 'user' if is_user else None}
+        if method == 'getFile':
+            file_id = str(params.get('file_id') or 'unknown')
+            return {'file_id': file_id, 'file_unique_id': file_id, 'file_size': 1024,
+                    'file_path': f"files/{file_id}.bin"}
+        if method == 'getUpdates':
+            return []
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {'calls': dict(self.calls), 'errors': dict(self.errors), 'chats': len(self.chats)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='本地模拟 Telegram Bot API 服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=30.0, help='基础延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help='延迟抖动上限（毫秒）')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='返回 429 的概率')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 携带的 retry_after（秒）')
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help='“已拉黑”用户比例')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeBotApi(args.latency_ms, args.jitter_ms, args.rate_limit, args.retry_after, args.blocked_rate)
+    url = await server.start(args.host, args.port)
+    print(f"模拟 Bot API 运行中: {url}（Ctrl+C 退出）")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"调用统计: {server.stats()}")
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
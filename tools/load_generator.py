@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+端到端机器人压测
+
+启动本地模拟 Bot API（fake_bot_api.py），在 bench_dataset.py 生成的数据库上构造真实的
+TelegramMerchantBot（完整中间件链与路由），按设定速率注入模拟用户会话：
+- start：普通 /start 主菜单
+- deeplink_m / deeplink_d / deeplink_kw / deeplink_price：/start m_ / d_ / kw_ / price_p_ 深链
+- region_browse：主菜单 → 选择城市 → 选择区县 → 查看商户
+- order：商户深链 → 立即预约 → 选择 P 课程
+- order_review：下单后完成 U2M 五项评分并公开提交
+- auto_reply：命中自动回复触发词的普通文本
+
+会话中的后续操作通过“点击”模拟服务器记录的最近一条内联键盘完成，订单号等均来自机器人的真实回复。
+输出每个处理器的 p50/p95/p99 延迟（含接入排队与全部中间件）与整体吞吐。
+
+用法示例：
+    python3 tools/load_generator.py --scale 10k --rate 50 --duration 60 --latency-ms 40 --rate-limit 0.01
+"""
+
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# 追加根目录进路径，便于独立运行
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from config import bot_config
+from database.db_connection import db_manager
+from middleware.tracing import handler_name
+from tools.bench_dataset import SCALES, USER_ID_BASE, build_dataset, read_meta
+from tools.fake_bot_api import BOT_USER, FakeBotApi
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT = os.path.join(ROOT, 'data', 'benchmarks')
+FAKE_TOKEN = f"{BOT_USER['id']}:fake-load-test-token"
+
+SCENARIO_WEIGHTS = {
+    'start': 0.10,
+    'deeplink_m': 0.15,
+    'deeplink_d': 0.10,
+    'deeplink_kw': 0.05,
+    'deeplink_price': 0.05,
+    'region_browse': 0.25,
+    'order': 0.10,
+    'order_review': 0.10,
+    'auto_reply': 0.10,
+}
+
+# 当前更新命中的处理器名称（由最内层中间件写入）
+_handled: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar('load_handled', default=None)
+
+
+class HandlerProbeMiddleware(BaseMiddleware):
+    """记录每个更新最终命中的处理器（注册为最内层中间件）"""
+
+    async def __call__(self, handler, event, data):
+        holder = _handled.get()
+        if holder is not None:
+            holder.append(handler_name(data))
+        return await handler(event, data)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """最近秩百分位（ordered 需已排序）"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def latency_summary(samples: List[float], elapsed: float) -> Dict[str, Any]:
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50), 2),
+        'p95_ms': round(percentile(ordered, 0.95), 2),
+        'p99_ms': round(percentile(ordered, 0.99), 2),
+        'max_ms': round(ordered[-1], 2) if ordered else 0.0,
+        'per_sec': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def load_samples(db_path: str) -> Dict[str, List[Any]]:
+    """从基准库读取会话用到的 ID 集合"""
+    conn = sqlite3.connect(db_path)
+    try:
+        def column(sql: str) -> List[Any]:
+            return [r[0] for r in conn.execute(sql)]
+        active = ("status IN ('approved','published') AND "
+                  "(expiration_time IS NULL OR expiration_time > datetime('now'))")
+        return {
+            'users': column(f"SELECT user_id FROM users WHERE user_id >= {USER_ID_BASE} ORDER BY user_id"),
+            'merchants': column(f"SELECT id FROM merchants WHERE {active} ORDER BY id"),
+            'districts': column("SELECT id FROM districts ORDER BY id"),
+            'keywords': column("SELECT id FROM keywords ORDER BY id"),
+            'prices': column(f"SELECT DISTINCT p_price FROM merchants WHERE {active} ORDER BY p_price"),
+            'triggers': column("SELECT trigger_text FROM auto_reply_triggers WHERE is_active = 1 ORDER BY id"),
+        }
+    finally:
+        conn.close()
+
+
+class LoadGenerator:
+    """按会话模型向调度器注入更新并统计延迟"""
+
+    def __init__(self, dispatcher, bot, api: FakeBotApi, samples: Dict[str, List[Any]],
+                 seed: int = 1, think_time: float = 0.0):
+        """
+        Args:
+            dispatcher: 已注册全部路由与中间件的调度器
+            bot: 指向模拟 Bot API 的 Bot 实例
+            api: 模拟服务器（读取发往各聊天的内联键盘）
+            samples: load_samples 的结果
+            seed: 会话选择的随机种子
+            think_time: 会话内相邻两步之间的平均停顿（秒）
+        """
+        self.dp = dispatcher
+        self.bot = bot
+        self.api = api
+        self.samples = samples
+        self.rng = random.Random(seed)
+        self.think_time = think_time
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.scenarios: Counter = Counter()
+        self.outcomes: Counter = Counter()
+        self.failed_steps: Counter = Counter()
+
+    # ---------- 更新构造 ---------- #
+
+    def _user(self, uid: int) -> Dict[str, Any]:
+        return {'id': uid, 'is_bot': False, 'first_name': f"U{uid}", 'username': f"user_{uid}",
+                'language_code': 'zh-hans'}
+
+    def message_update(self, uid: int, text: str) -> Update:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': uid, 'type': 'private'},
+            'from': self._user(uid),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.model_validate({'update_id': next(self._update_ids), 'message': message},
+                                     context={'bot': self.bot})
+
+    def callback_update(self, uid: int, message_id: int, data: str) -> Update:
+        stored = self.api.messages(uid).get(message_id, {})
+        message = {
+            'message_id': message_id,
+            'date': stored.get('date', int(time.time())),
+            'chat': {'id': uid, 'type': 'private'},
+            'from': BOT_USER,
+            'text': stored.get('text') or stored.get('caption') or '-',
+        }
+        callback = {
+            'id': str(next(self._update_ids)),
+            'from': self._user(uid),
+            'chat_instance': str(uid),
+            'data': data,
+            'message': message,
+        }
+        return Update.model_validate({'update_id': next(self._update_ids), 'callback_query': callback},
+                                     context={'bot': self.bot})
+
+    # ---------- 执行 ---------- #
+
+    async def feed(self, update: Update, step: str) -> Optional[str]:
+        """注入一个更新并计时，返回命中的处理器名称（未命中返回 None）"""
+        holder: List[str] = []
+        token = _handled.set(holder)
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.outcomes['error'] += 1
+            logger.warning(f"更新处理异常（{step}）: {e}")
+            return None
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            _handled.reset(token)
+        if not holder:
+            # 被限流、接入调度丢弃或无匹配处理器
+            self.outcomes['unhandled'] += 1
+            self.latencies['<unhandled>'].append(elapsed)
+            return None
+        self.outcomes['handled'] += 1
+        self.latencies[holder[-1]].append(elapsed)
+        return holder[-1]
+
+    async def _pause(self) -> None:
+        if self.think_time > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_time))
+
+    async def send_text(self, uid: int, text: str, step: str) -> Optional[str]:
+        return await self.feed(self.message_update(uid, text), step)
+
+    async def click(self, uid: int, prefix: str, step: str, choose: Callable[[List[str]], str] = None) -> bool:
+        """点击最近一条内联键盘中以 prefix 开头的按钮；没有可点的按钮时返回 False"""
+        message_id, buttons = self.api.last_buttons(uid)
+        candidates = [b for b in buttons if b.startswith(prefix)]
+        if not candidates:
+            self.failed_steps[step] += 1
+            return False
+        await self._pause()
+        data = (choose or self.rng.choice)(candidates)
+        return await self.feed(self.callback_update(uid, message_id, data), step) is not None
+
+    # ---------- 会话 ---------- #
+
+    async def start(self, uid: int) -> None:
+        await self.send_text(uid, '/start', 'start')
+
+    async def deeplink_m(self, uid: int) -> None:
+        await self.send_text(uid, f"/start m_{self.rng.choice(self.samples['merchants'])}", 'deeplink_m')
+
+    async def deeplink_d(self, uid: int) -> None:
+        await self.send_text(uid, f"/start d_{self.rng.choice(self.samples['districts'])}", 'deeplink_d')
+
+    async def deeplink_kw(self, uid: int) -> None:
+        await self.send_text(uid, f"/start kw_{self.rng.choice(self.samples['keywords'])}", 'deeplink_kw')
+
+    async def deeplink_price(self, uid: int) -> None:
+        await self.send_text(uid, f"/start price_p_{self.rng.choice(self.samples['prices'])}", 'deeplink_price')
+
+    async def region_browse(self, uid: int) -> None:
+        await self.send_text(uid, '/start', 'start')
+        for prefix in ('search_start', 'city_', 'district_', 'merchant_'):
+            if not await self.click(uid, prefix, f"browse:{prefix}"):
+                return
+
+    async def order(self, uid: int) -> bool:
+        await self.send_text(uid, f"/start m_{self.rng.choice(self.samples['merchants'])}", 'deeplink_m')
+        return (await self.click(uid, 'order_now_', 'order:now')
+                and await self.click(uid, 'order_choose_p_', 'order:choose'))
+
+    async def order_review(self, uid: int) -> None:
+        if not await self.order(uid):
+            return
+        if not await self.click(uid, 'rv:u2m:start:', 'review:start'):
+            return
+        for _ in range(5):
+            if not await self.click(uid, 'rv:u2m:rate:', 'review:rate'):
+                return
+        if await self.click(uid, 'rv:u2m:submit:', 'review:submit'):
+            await self.click(uid, 'rv:u2m:submit_pub:', 'review:publish')
+
+    async def auto_reply(self, uid: int) -> None:
+        text = self.rng.choice(self.samples['triggers'] or ['你好'])
+        await self.send_text(uid, f"请问{text}还有吗", 'auto_reply')
+
+    def pick_scenario(self, weights: Dict[str, float]) -> str:
+        names = list(weights)
+        return self.rng.choices(names, weights=[weights[n] for n in names])[0]
+
+    async def run(self, rate: float, duration: float, max_sessions: int = 200,
+                  weights: Dict[str, float] = None) -> float:
+        """
+        以泊松到达的方式在 duration 秒内发起会话
+
+        Args:
+            rate: 每秒新会话数
+            duration: 发起会话的时长（秒），结束后等待进行中的会话完成
+            max_sessions: 同时进行的会话上限（达到上限时到达的会话排队）
+            weights: 场景权重（默认 SCENARIO_WEIGHTS）
+
+        Returns:
+            实际耗时（秒）
+        """
+        weights = weights or SCENARIO_WEIGHTS
+        limiter = asyncio.Semaphore(max_sessions)
+        tasks = []
+
+        async def session(name: str, uid: int):
+            async with limiter:
+                try:
+                    await getattr(self, name)(uid)
+                except Exception as e:
+                    self.outcomes['session_error'] += 1
+                    logger.warning(f"会话 {name} 异常: {e}")
+
+        started = time.perf_counter()
+        deadline = started + duration
+        next_at = started
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = self.pick_scenario(weights)
+            self.scenarios[name] += 1
+            tasks.append(asyncio.create_task(session(name, self.rng.choice(self.samples['users']))))
+            next_at += self.rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        all_samples = [v for values in self.latencies.values() for v in values]
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'updates': len(all_samples),
+            'throughput_per_sec': round(len(all_samples) / elapsed, 2) if elapsed else 0.0,
+            'overall': latency_summary(all_samples, elapsed),
+            'handlers': {name: latency_summary(values, elapsed)
+                         for name, values in sorted(self.latencies.items(), key=lambda kv: -len(kv[1]))},
+            'scenarios': dict(self.scenarios),
+            'outcomes': dict(self.outcomes),
+            'failed_steps': dict(self.failed_steps),
+        }
+
+
+async def run_load(db_path: str, scale: str = '10k', seed: int = 42, rebuild: bool = False,
+                   rate: float = 20.0, duration: float = 30.0, max_sessions: int = 200,
+                   think_time: float = 0.0, api_options: Optional[Dict[str, Any]] = None,
+                   weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    准备数据、启动模拟 Bot API 与机器人，执行压测并返回报告
+
+    同一进程只能构造一次 TelegramMerchantBot（路由为模块级单例）。
+    """
+    meta = read_meta(db_path)
+    if rebuild or meta.get('seed') != seed or meta.get('spec') != SCALES.get(scale, meta.get('spec')):
+        await build_dataset(db_path, scale, seed)
+        meta = read_meta(db_path)
+
+    api = FakeBotApi(seed=seed, **(api_options or {}))
+    url = await api.start()
+    original_token, original_server = bot_config.token, bot_config.api_server
+    bot_config.token, bot_config.api_server = FAKE_TOKEN, url
+    original_db = db_manager.db_path
+    await db_manager.close_all_connections()
+    db_manager.set_db_path(db_path)
+
+    app = None
+    try:
+        from bot import TelegramMerchantBot
+        app = TelegramMerchantBot()
+        await app._on_worker_startup()
+        probe = HandlerProbeMiddleware()
+        app.dp.message.middleware(probe)
+        app.dp.callback_query.middleware(probe)
+
+        generator = LoadGenerator(app.dp, app.bot, api, load_samples(db_path), seed=seed, think_time=think_time)
+        elapsed = await generator.run(rate, duration, max_sessions, weights)
+        report = generator.report(elapsed)
+    finally:
+        if app is not None:
+            await app._on_worker_shutdown()
+        await api.stop()
+        await db_manager.close_all_connections()
+        db_manager.set_db_path(original_db)
+        bot_config.token, bot_config.api_server = original_token, original_server
+
+    return {
+        'kind': 'load',
+        'scale': scale,
+        'seed': seed,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'rate': rate,
+        'duration': duration,
+        'max_sessions': max_sessions,
+        'think_time': think_time,
+        'api': {**(api_options or {}), **api.stats()},
+        'dataset': meta.get('counts', {}),
+        **report,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n压测结果 scale={report['scale']} rate={report['rate']}/s duration={report['duration']}s")
+    print(f"更新 {report['updates']} 个，耗时 {report['elapsed_s']}s，吞吐 {report['throughput_per_sec']}/s，"
+          f"结果 {report['outcomes']}")
+    print(f"{'处理器':<40}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'最大(ms)':>10}")
+    for name, stats in report['handlers'].items():
+        print(f"{name[:40]:<40}{stats['count']:>8}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    overall = report['overall']
+    print(f"{'<overall>':<40}{overall['count']:>8}{overall['p50_ms']:>10.1f}{overall['p95_ms']:>10.1f}"
+          f"{overall['p99_ms']:>10.1f}{overall['max_ms']:>10.1f}")
+    if report['failed_steps']:
+        print(f"未能继续的会话步骤: {report['failed_steps']}")
+    print(f"Bot API: {report['api']['calls']} 错误 {report['api']['errors']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='端到端机器人压测（本地模拟 Bot API）')
+    parser.add_argument('--scale', choices=list(SCALES), default='10k', help='数据规模')
+    parser.add_argument('--db', default=None, help='压测库路径（默认 data/bench/load_<scale>.db，压测会写入订单/评价）')
+    parser.add_argument('--seed', type=int, default=42, help='数据集与会话随机种子')
+    parser.add_argument('--rebuild', action='store_true', help='强制重建压测库')
+    parser.add_argument('--rate', type=float, default=20.0, help='每秒新会话数')
+    parser.add_argument('--duration', type=float, default=30.0, help='发起会话的时长（秒）')
+    parser.add_argument('--max-sessions', type=int, default=200, help='同时进行的会话上限')
+    parser.add_argument('--think-time', type=float, default=0.0, help='会话内步骤间平均停顿（秒）')
+    parser.add_argument('--latency-ms', type=float, default=30.0, help='模拟 Bot API 基础延迟（毫秒）')
+    parser.add_argument('--jitter-ms', type=float, default=20.0, help='模拟 Bot API 延迟抖动（毫秒）')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Bot API 返回 429 的概率')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 携带的 retry_after（秒）')
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help='已拉黑机器人的用户比例')
+    parser.add_argument('--scenario', action='append', default=None,
+                        help=f"只运行指定场景（可重复）：{', '.join(SCENARIO_WEIGHTS)}")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='结果目录或 .json 文件路径')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(ROOT, 'data', 'bench', f'load_{args.scale}.db')
+    weights = None
+    if args.scenario:
+        unknown = set(args.scenario) - set(SCENARIO_WEIGHTS)
+        if unknown:
+            parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+        weights = {name: SCENARIO_WEIGHTS[name] for name in args.scenario}
+    api_options = {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms, 'rate_limit': args.rate_limit,
+                   'retry_after': args.retry_after, 'blocked_rate': args.blocked_rate}
+
+    # 先于 bot 模块配置根日志（其 basicConfig 随之失效），只保留告警以上，避免逐条更新日志刷屏
+    logging.basicConfig(level=logging.WARNING)
+    report = await run_load(db_path, args.scale, args.seed, args.rebuild, args.rate, args.duration,
+                            args.max_sessions, args.think_time, api_options, weights)
+
+    output = args.output
+    if not output.endswith('.json'):
+        os.makedirs(output, exist_ok=True)
+        output = os.path.join(output, f"load-{report['scale']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"\n结果已写入: {output}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
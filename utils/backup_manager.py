@@ -1,6 +1,26 @@
 """
 数据库备份管理器
-提供自动备份、恢复和数据完整性验证功能
+提供全量/增量（变更页）备份、恢复和数据完整性验证功能
+
+备份格式（每个备份一个目录 <backup_dir>/<name>/）：
+    manifest.json     类型、基线备份、页大小/页数、各文件与数据库镜像的 SHA-256
+    database.db.gz    全量备份：压缩的完整数据库镜像
+    pages.delta.gz    增量备份：压缩的变更页记录（4 字节页号 + 页内容）
+    pages.hash.gz     每页摘要（blake2b-128），下一次增量据此比较
+    config.json       消息/按钮模板与系统设置
+    shard_<n>.*       启用城市分片时各分片文件的同名三类文件（manifest 的 shards 下记录各分片的信息）
+
+流程：
+    - 在一个只读事务（一个一致快照）内按页号顺序读出主库各页，直接流入压缩的全量或变更页文件，
+      不落地暂存镜像（线程中执行；WAL 下读不阻塞写入，也不阻塞事件循环）
+      · 编译了 sqlite_dbpage 时按页号分批读取该虚拟表
+      · 否则读主库文件，快照内尚未检查点回写的页改从 WAL 帧读取（按 wal-index 确定快照边界）
+    - 逐页摘要并与上一个备份比较；变更页比例超过阈值时在同一快照上重新写出全量
+    - 链上增量数达到 full_every 或变更页比例超过 full_change_ratio 时改做全量
+    - 分片（db_manager.all_databases()）逐个在各自的读快照内写出：主库改做全量时各分片也全量；
+      主库为增量时，分片各自按上一个备份的摘要写变更页（新出现的分片或变更过多的分片写全量）
+    - 恢复：沿基线链流式校验文件摘要，各库从其最近的全量镜像起依次写入变更页，校验镜像摘要与 integrity_check，
+      再原子替换主库及各分片（原文件保留为 <文件>.pre_restore；备份中没有的分片文件同样移开）
 """
 
 import os
@@ -10,153 +30,355 @@ import gzip
 import json
 import asyncio
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+import struct
+from typing import Dict, Iterator, List, Optional, Any, Sequence, Tuple
+from datetime import datetime
 from pathlib import Path
 import hashlib
 import sqlite3
 
+from config import BACKUP_CONFIG
 from database.db_connection import db_manager
-from path_manager import PathManager
+from pathmanager import PathManager
 
 logger = logging.getLogger(__name__)
 
+# 流式读写的块大小
+CHUNK_SIZE = 1024 * 1024
+# 每页摘要长度（字节）
+PAGE_HASH_SIZE = 16
+# WAL 文件头与帧头长度；wal-index（-shm）头部：两份 48 字节的索引头 + 检查点信息
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+WAL_INDEX_HEADER_SIZE = 48
+WAL_INDEX_READ_SIZE = 136
+
+MANIFEST_FILE = "manifest.json"
+FULL_FILE = "database.db.gz"
+DELTA_FILE = "pages.delta.gz"
+HASH_FILE = "pages.hash.gz"
+CONFIG_FILE = "config.json"
+
+
+def file_sha256(path: Path) -> str:
+    """分块计算文件 SHA-256（不把整个文件读入内存）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _page_hash(page: bytes) -> bytes:
+    return hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+
+
+def _shard_prefix(shard_id: Optional[int]) -> str:
+    """分片备份文件名前缀（主库为空）"""
+    return f"shard_{shard_id}." if shard_id else ""
+
+
+class PageSnapshot:
+    """
+    主库的一致页快照（同步，线程中使用）：持有一个只读事务，按页号顺序读出快照内的各页
+
+    WAL 模式下读事务不阻塞写入；持有期间检查点不会回写快照之后的帧，也不会重置 WAL，
+    因此快照内的页要么仍在主库文件中，要么在 WAL 的前 mxFrame 帧中。
+    """
+
+    def __init__(self, db_path: str, batch_pages: int = 1024, max_attempts: int = 20):
+        self.db_path = db_path
+        self.batch_pages = max(1, batch_pages)
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self._wal_frames: Dict[int, int] = {}
+        try:
+            self.page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+            self.wal = self.conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal'
+            self.mode = 'dbpage' if self._has_dbpage() else 'file'
+            for _ in range(max(1, max_attempts)):
+                before = self._read_wal_index() if self.wal else None
+                self.conn.execute("BEGIN")
+                self.conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                if not self.wal or (before is not None and before == self._read_wal_index()):
+                    break
+                # 开启读事务的同时有写入提交，快照边界不确定，重试
+                self.conn.execute("ROLLBACK")
+            else:
+                raise RuntimeError("主库写入过于频繁，无法确定一致快照")
+            self.page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            if self.mode == 'file' and self.wal:
+                self._wal_frames = self._map_wal_frames(before)
+        except Exception:
+            self.conn.close()
+            raise
+
+    def _has_dbpage(self) -> bool:
+        try:
+            self.conn.execute("SELECT pgno FROM sqlite_dbpage WHERE pgno = 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _read_wal_index(self) -> Optional[bytes]:
+        """读取 wal-index 头；两份副本不一致（正在更新）时返回 None"""
+        try:
+            with open(f"{self.db_path}-shm", 'rb') as f:
+                data = f.read(WAL_INDEX_READ_SIZE)
+        except OSError:
+            return None
+        if len(data) < WAL_INDEX_READ_SIZE or data[:WAL_INDEX_HEADER_SIZE] != data[WAL_INDEX_HEADER_SIZE:2 * WAL_INDEX_HEADER_SIZE]:
+            return None
+        return data[:WAL_INDEX_HEADER_SIZE]
+
+    def _map_wal_frames(self, index_header: bytes) -> Dict[int, int]:
+        """快照内尚未回写主库文件的页 -> 最新帧在 WAL 中的偏移"""
+        max_frame = struct.unpack_from('=I', index_header, 16)[0]
+        salt = index_header[32:40]
+        with open(f"{self.db_path}-shm", 'rb') as f:
+            f.seek(2 * WAL_INDEX_HEADER_SIZE)
+            backfilled = struct.unpack('=I', f.read(4))[0]
+        if backfilled >= max_frame:
+            return {}
+        frames: Dict[int, int] = {}
+        frame_size = WAL_FRAME_HEADER_SIZE + self.page_size
+        with open(f"{self.db_path}-wal", 'rb') as wal:
+            for frame in range(max_frame):
+                offset = WAL_HEADER_SIZE + frame * frame_size
+                wal.seek(offset)
+                header = wal.read(WAL_FRAME_HEADER_SIZE)
+                if len(header) != WAL_FRAME_HEADER_SIZE or header[8:16] != salt:
+                    raise ValueError(f"WAL 帧与 wal-index 不一致（帧 {frame + 1}）")
+                frames[int.from_bytes(header[:4], 'big')] = offset + WAL_FRAME_HEADER_SIZE
+        return frames
+
+    def pages(self) -> Iterator[bytes]:
+        """按页号顺序产出快照内的全部页（可在同一快照上重复遍历）"""
+        if self.mode == 'dbpage':
+            for start in range(1, self.page_count + 1, self.batch_pages):
+                rows = self.conn.execute(
+                    "SELECT data FROM sqlite_dbpage WHERE pgno BETWEEN ? AND ? ORDER BY pgno",
+                    (start, min(start + self.batch_pages - 1, self.page_count))
+                ).fetchall()
+                for (data,) in rows:
+                    yield data
+            return
+        wal = open(f"{self.db_path}-wal", 'rb') if self._wal_frames else None
+        try:
+            with open(self.db_path, 'rb', buffering=CHUNK_SIZE) as db:
+                for pgno in range(1, self.page_count + 1):
+                    offset = self._wal_frames.get(pgno)
+                    if offset is None:
+                        db.seek((pgno - 1) * self.page_size)
+                        page = db.read(self.page_size)
+                    else:
+                        wal.seek(offset)
+                        page = wal.read(self.page_size)
+                    if len(page) != self.page_size:
+                        raise ValueError(f"读取第 {pgno} 页失败（文件被截断）")
+                    yield page
+        finally:
+            if wal:
+                wal.close()
+
+    def source_info(self) -> Dict[str, Any]:
+        return {'pages': self.page_count, 'mode': self.mode, 'wal_frames': len(self._wal_frames)}
+
+    def close(self) -> None:
+        try:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+        finally:
+            self.conn.close()
+
 
 class BackupManager:
     """数据库备份管理器"""
-    
-    def __init__(
-        self,
-        backup_dir: Optional[str] = None,
-        max_backups: int = 10,
-        compression: bool = True
-    ):
+
+    def __init__(self, backup_dir: Optional[str] = None, config: Optional[Dict[str, Any]] = None):
         """
         初始化备份管理器
-        
+
         Args:
-            backup_dir: 备份目录，默认为data/backups
-            max_backups: 最大备份文件数量
-            compression: 是否压缩备份文件
+            backup_dir: 备份目录，默认为 BACKUP_CONFIG['dir'] 或 data/backups
+            config: 备份配置，默认 BACKUP_CONFIG
         """
-        self.backup_dir = Path(backup_dir or PathManager.get_data_path("backups"))
-        self.max_backups = max_backups
-        self.compression = compression
-        
-        # 确保备份目录存在
-        self.backup_dir.mkdir(parents=True, exist_ok=True)
-        
-        logger.info(f"备份管理器初始化 - 目录: {self.backup_dir}, 最大备份数: {max_backups}")
-    
+        config = config or BACKUP_CONFIG
+        self.backup_dir = Path(
+            backup_dir or config.get('dir') or Path(PathManager.get_root_directory()) / "data" / "backups"
+        )
+        self.max_chains = max(1, int(config.get('max_chains', 3)))
+        self.full_every = int(config.get('full_every', 7))
+        self.full_change_ratio = float(config.get('full_change_ratio', 0.5))
+        self.pages_per_step = int(config.get('pages_per_step', 1024))
+        self.compresslevel = int(config.get('compresslevel', 3))
+        self._running = False
+
+    # ---------- 创建 ---------- #
+
     async def create_backup(
-        self, 
+        self,
         backup_name: Optional[str] = None,
-        include_logs: bool = True,
-        include_metadata: bool = True
+        incremental: bool = True
     ) -> Dict[str, Any]:
         """
         创建数据库备份
-        
+
         Args:
             backup_name: 备份名称，默认使用时间戳
-            include_logs: 是否包含日志数据
-            include_metadata: 是否包含元数据
-            
+            incremental: 是否允许基于上一个备份做增量（否则强制全量）
+
         Returns:
-            备份信息字典
+            备份信息（manifest 内容 + status）
         """
+        backup_name = backup_name or datetime.now().strftime("backup_%Y%m%d_%H%M%S")
+        if self._running:
+            return {"name": backup_name, "status": "failed", "error": "已有备份在进行中"}
+        self._running = True
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        work_dir = self.backup_dir / f".{backup_name}.tmp"
+        started = datetime.now()
         try:
-            if not backup_name:
-                backup_name = datetime.now().strftime("backup_%Y%m%d_%H%M%S")
-            
-            backup_info = {
+            if (self.backup_dir / backup_name).exists():
+                raise ValueError(f"备份已存在: {backup_name}")
+            base = self._latest_manifest() if incremental else None
+            if base and base.get('chain_length', 0) >= self.full_every:
+                base = None
+
+            logger.info(f"开始创建备份: {backup_name}（基线: {base['name'] if base else '无，全量'}）")
+            if work_dir.exists():
+                shutil.rmtree(work_dir)
+            work_dir.mkdir()
+            shards = [(db.shard_id, db.db_path) for db in db_manager.all_databases()[1:]]
+            manifest = await asyncio.to_thread(self._write_backup_files, work_dir, base, shards)
+
+            self._backup_config(work_dir)
+            files = {}
+            for name in sorted(os.listdir(work_dir)):
+                files[name] = await asyncio.to_thread(file_sha256, work_dir / name)
+            manifest.update({
                 "name": backup_name,
-                "timestamp": datetime.now().isoformat(),
-                "version": "1.0",
-                "compression": self.compression,
-                "include_logs": include_logs,
-                "include_metadata": include_metadata
-            }
-            
-            logger.info(f"开始创建备份: {backup_name}")
-            
-            # 创建临时备份目录
-            temp_backup_dir = self.backup_dir / f"temp_{backup_name}"
-            temp_backup_dir.mkdir(exist_ok=True)
-            
-            try:
-                # 1. 备份主数据库
-                db_backup_path = await self._backup_database(temp_backup_dir)
-                backup_info["database_file"] = db_backup_path.name
-                backup_info["database_size"] = db_backup_path.stat().st_size
-                
-                # 2. 备份配置文件
-                config_backup_path = await self._backup_config(temp_backup_dir)
-                backup_info["config_file"] = config_backup_path.name
-                
-                # 3. 生成数据完整性校验
-                checksums = await self._generate_checksums(temp_backup_dir)
-                backup_info["checksums"] = checksums
-                
-                # 4. 备份元数据
-                if include_metadata:
-                    metadata_path = await self._backup_metadata(temp_backup_dir, backup_info)
-                    backup_info["metadata_file"] = metadata_path.name
-                
-                # 5. 创建最终备份文件
-                final_backup_path = await self._create_final_backup(
-                    temp_backup_dir, 
-                    backup_name, 
-                    backup_info
-                )
-                
-                backup_info["backup_file"] = final_backup_path.name
-                backup_info["backup_size"] = final_backup_path.stat().st_size
-                backup_info["status"] = "success"
-                
-                # 6. 清理旧备份
-                await self._cleanup_old_backups()
-                
-                logger.info(f"备份创建成功: {final_backup_path}")
-                return backup_info
-                
-            finally:
-                # 清理临时目录
-                if temp_backup_dir.exists():
-                    shutil.rmtree(temp_backup_dir)
-        
+                "version": "2.0",
+                "created_at": started.isoformat(),
+                "source": manifest.pop("source"),
+                "files": files,
+                "duration_seconds": round((datetime.now() - started).total_seconds(), 3),
+            })
+            with open(work_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            os.replace(work_dir, self.backup_dir / backup_name)
+
+            await self._cleanup_old_backups()
+            manifest["size"] = self._get_dir_size(self.backup_dir / backup_name)
+            manifest["status"] = "success"
+            logger.info(
+                f"备份创建成功: {backup_name}（{manifest['type']}，{manifest['changed_pages']}/"
+                f"{manifest['page_count']} 页，分片 {len(manifest.get('shards', {}))} 个，"
+                f"{manifest['size'] // 1024}KB，耗时 {manifest['duration_seconds']}s）"
+            )
+            return manifest
+
         except Exception as e:
             logger.error(f"备份创建失败: {e}")
-            backup_info = backup_info if 'backup_info' in locals() else {}
-            backup_info.update({
+            return {
+                "name": backup_name,
                 "status": "failed",
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
-            })
-            return backup_info
-    
-    async def _backup_database(self, backup_dir: Path) -> Path:
-        """备份数据库文件"""
+            }
+        finally:
+            self._running = False
+            if work_dir.exists():
+                shutil.rmtree(work_dir)
+
+    def _write_backup_files(
+        self, out_dir: Path, base: Optional[Dict[str, Any]], shards: Sequence[Tuple[int, str]] = ()
+    ) -> Dict[str, Any]:
+        """
+        写出主库与各城市分片的全量或变更页文件（同步，线程中执行）
+
+        Args:
+            out_dir: 备份工作目录
+            base: 基线备份的 manifest（None 为全量）
+            shards: [(分片号, 文件路径)]
+
+        Returns:
+            主库的备份信息；有分片时另含 shards: {分片号: 分片的备份信息}
+        """
+        result = self._write_database_files(db_manager.db_path, out_dir, None, base, base)
+        if result['type'] == 'incremental':
+            result.update({"base": base['name'], "chain_length": base.get('chain_length', 0) + 1})
+        else:
+            # 主库全量即开始新链，分片也须全量
+            base = None
+            result.update({"base": None, "chain_length": 0})
+        shard_results = {}
+        for shard_id, path in shards:
+            previous = (base.get('shards') or {}).get(str(shard_id)) if base else None
+            shard_results[str(shard_id)] = self._write_database_files(path, out_dir, shard_id, base, previous)
+        if shard_results:
+            result['shards'] = shard_results
+        return result
+
+    def _write_database_files(
+        self, db_path: str, out_dir: Path, shard_id: Optional[int],
+        base: Optional[Dict[str, Any]], previous: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """在一个读快照内流式写出单个库的全量或变更页文件与每页摘要"""
+        prefix = _shard_prefix(shard_id)
+        snapshot = PageSnapshot(db_path, batch_pages=self.pages_per_step)
         try:
-            db_path = PathManager.get_db_path()
-            backup_db_path = backup_dir / "database.db"
-            
-            # 使用SQLite的VACUUM INTO命令创建干净的备份
-            async with db_manager.get_connection() as conn:
-                await conn.execute(f"VACUUM INTO '{backup_db_path}'")
-            
-            logger.info(f"数据库备份完成: {backup_db_path}")
-            return backup_db_path
-            
-        except Exception as e:
-            logger.error(f"数据库备份失败: {e}")
-            # 备用方法：直接复制文件
-            db_path = PathManager.get_db_path()
-            backup_db_path = backup_dir / "database.db"
-            shutil.copy2(db_path, backup_db_path)
-            return backup_db_path
-    
-    async def _backup_config(self, backup_dir: Path) -> Path:
+            page_size, page_count = snapshot.page_size, snapshot.page_count
+            base_hashes = None
+            if previous and previous.get('page_size') == page_size:
+                with gzip.open(self.backup_dir / base['name'] / f"{prefix}{HASH_FILE}", 'rb') as f:
+                    base_hashes = f.read()
+
+            if base_hashes is not None:
+                result = self._scan_pages(snapshot, out_dir, base_hashes, prefix)
+                if result['changed_pages'] <= self.full_change_ratio * page_count:
+                    result["type"] = "incremental"
+                    return result
+                logger.info(f"{db_path} 变更页 {result['changed_pages']}/{page_count} 超过阈值，改做全量备份")
+                (out_dir / f"{prefix}{DELTA_FILE}").unlink()
+
+            result = self._scan_pages(snapshot, out_dir, None, prefix)
+            result["type"] = "full"
+            return result
+        finally:
+            snapshot.close()
+
+    def _scan_pages(
+        self, snapshot: PageSnapshot, out_dir: Path, base_hashes: Optional[bytes], prefix: str = ""
+    ) -> Dict[str, Any]:
+        image_digest = hashlib.sha256()
+        hashes = bytearray()
+        changed = 0
+        pgno = 0
+        data_file = out_dir / f"{prefix}{DELTA_FILE if base_hashes is not None else FULL_FILE}"
+        with gzip.open(data_file, 'wb', compresslevel=self.compresslevel) as out:
+            for page in snapshot.pages():
+                pgno += 1
+                image_digest.update(page)
+                digest = _page_hash(page)
+                hashes += digest
+                if base_hashes is None:
+                    out.write(page)
+                    changed += 1
+                elif base_hashes[(pgno - 1) * PAGE_HASH_SIZE:pgno * PAGE_HASH_SIZE] != digest:
+                    out.write(pgno.to_bytes(4, 'big'))
+                    out.write(page)
+                    changed += 1
+        with gzip.open(out_dir / f"{prefix}{HASH_FILE}", 'wb', compresslevel=self.compresslevel) as f:
+            f.write(bytes(hashes))
+        return {
+            "page_size": snapshot.page_size,
+            "page_count": pgno,
+            "changed_pages": changed,
+            "image_sha256": image_digest.hexdigest(),
+            "source": snapshot.source_info(),
+        }
+
+    def _backup_config(self, backup_dir: Path) -> Path:
         """备份配置信息"""
         config_data = {
             "timestamp": datetime.now().isoformat(),
@@ -164,187 +386,89 @@ class BackupManager:
             "button_templates": {},
             "system_settings": {}
         }
-        
+
         try:
             # 备份消息模板
             from config import MESSAGE_TEMPLATES, BUTTON_TEMPLATES
             config_data["message_templates"] = MESSAGE_TEMPLATES
             config_data["button_templates"] = BUTTON_TEMPLATES
-            
+
             # 备份系统设置
             config_data["system_settings"] = {
                 "use_webhook": os.getenv("USE_WEBHOOK", "true"),
                 "log_level": os.getenv("LOG_LEVEL", "INFO"),
-                "rate_limits": {
-                    "default": os.getenv("RATE_LIMIT_DEFAULT", "10"),
-                    "admin": os.getenv("RATE_LIMIT_ADMIN", "100")
-                }
+                "python_version": sys.version,
             }
-            
+
         except Exception as e:
             logger.warning(f"配置备份部分失败: {e}")
-        
-        config_backup_path = backup_dir / "config.json"
+
+        config_backup_path = backup_dir / CONFIG_FILE
         with open(config_backup_path, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, indent=2, ensure_ascii=False)
-        
-        logger.info(f"配置备份完成: {config_backup_path}")
+
         return config_backup_path
-    
-    async def _generate_checksums(self, backup_dir: Path) -> Dict[str, str]:
-        """生成文件校验和"""
-        checksums = {}
-        
-        for file_path in backup_dir.glob("*"):
-            if file_path.is_file():
-                with open(file_path, 'rb') as f:
-                    file_hash = hashlib.sha256(f.read()).hexdigest()
-                    checksums[file_path.name] = file_hash
-        
-        return checksums
-    
-    async def _backup_metadata(self, backup_dir: Path, backup_info: Dict[str, Any]) -> Path:
-        """备份元数据和统计信息"""
-        metadata = {
-            "backup_info": backup_info,
-            "database_stats": await self._get_database_stats(),
-            "system_info": {
-                "python_version": sys.version,
-                "timestamp": datetime.now().isoformat(),
-                "hostname": os.uname().nodename if hasattr(os, 'uname') else 'unknown'
-            }
-        }
-        
-        metadata_path = backup_dir / "metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
-        
-        return metadata_path
-    
-    async def _get_database_stats(self) -> Dict[str, Any]:
-        """获取数据库统计信息"""
-        try:
-            stats = {}
-            
-            # 获取各表的行数
-            tables = ['merchants', 'orders', 'binding_codes', 'activity_logs', 'fsm_states']
-            
-            for table in tables:
+
+    # ---------- 查询与清理 ---------- #
+
+    def _read_manifest(self, backup_name: str) -> Optional[Dict[str, Any]]:
+        path = self.backup_dir / backup_name / MANIFEST_FILE
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _manifests(self) -> List[Dict[str, Any]]:
+        """按创建时间从旧到新返回全部备份的 manifest"""
+        manifests = []
+        if not self.backup_dir.exists():
+            return manifests
+        for entry in self.backup_dir.iterdir():
+            if entry.is_dir() and not entry.name.startswith('.'):
                 try:
-                    count = await db_manager.fetch_one(f"SELECT COUNT(*) FROM {table}")
-                    stats[f"{table}_count"] = count[0] if count else 0
-                except Exception:
-                    stats[f"{table}_count"] = 0
-            
-            # 获取数据库大小
-            db_path = PathManager.get_db_path()
-            if os.path.exists(db_path):
-                stats["database_size_bytes"] = os.path.getsize(db_path)
-            
-            return stats
-            
-        except Exception as e:
-            logger.warning(f"获取数据库统计信息失败: {e}")
-            return {}
-    
-    async def _create_final_backup(
-        self, 
-        temp_dir: Path, 
-        backup_name: str, 
-        backup_info: Dict[str, Any]
-    ) -> Path:
-        """创建最终备份文件"""
-        
-        # 写入备份信息文件
-        backup_info_path = temp_dir / "backup_info.json"
-        with open(backup_info_path, 'w', encoding='utf-8') as f:
-            json.dump(backup_info, f, indent=2, ensure_ascii=False)
-        
-        if self.compression:
-            # 创建压缩备份
-            backup_file = self.backup_dir / f"{backup_name}.tar.gz"
-            
-            import tarfile
-            with tarfile.open(backup_file, 'w:gz') as tar:
-                for file_path in temp_dir.glob("*"):
-                    if file_path.is_file():
-                        tar.add(file_path, arcname=file_path.name)
-        else:
-            # 创建目录备份
-            backup_file = self.backup_dir / backup_name
-            shutil.copytree(temp_dir, backup_file)
-        
-        return backup_file
-    
+                    manifest = self._read_manifest(entry.name)
+                except Exception as e:
+                    logger.warning(f"读取备份信息失败 {entry}: {e}")
+                    continue
+                if manifest:
+                    manifests.append(manifest)
+        manifests.sort(key=lambda m: m.get('created_at', ''))
+        return manifests
+
+    def _latest_manifest(self) -> Optional[Dict[str, Any]]:
+        manifests = self._manifests()
+        return manifests[-1] if manifests else None
+
     async def _cleanup_old_backups(self):
-        """清理旧备份文件"""
+        """按备份链清理：保留最近 max_chains 条链（全量及其增量一并保留或删除）"""
         try:
-            # 获取所有备份文件
-            if self.compression:
-                backup_files = list(self.backup_dir.glob("backup_*.tar.gz"))
-            else:
-                backup_files = [d for d in self.backup_dir.iterdir() 
-                              if d.is_dir() and d.name.startswith("backup_")]
-            
-            # 按修改时间排序
-            backup_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-            
-            # 删除超出数量限制的备份
-            if len(backup_files) > self.max_backups:
-                for old_backup in backup_files[self.max_backups:]:
-                    if old_backup.is_dir():
-                        shutil.rmtree(old_backup)
-                    else:
-                        old_backup.unlink()
-                    logger.info(f"删除旧备份: {old_backup}")
-        
+            manifests = self._manifests()
+            fulls = [m['name'] for m in manifests if m.get('type') == 'full']
+            if len(fulls) <= self.max_chains:
+                return
+            keep_from = fulls[-self.max_chains]
+            for manifest in manifests:
+                if manifest['name'] == keep_from:
+                    break
+                shutil.rmtree(self.backup_dir / manifest['name'])
+                logger.info(f"删除旧备份: {manifest['name']}")
+
         except Exception as e:
             logger.warning(f"清理旧备份失败: {e}")
-    
+
     async def list_backups(self) -> List[Dict[str, Any]]:
-        """列出所有备份"""
+        """列出所有备份（新的在前）"""
         backups = []
-        
-        try:
-            if self.compression:
-                backup_files = list(self.backup_dir.glob("backup_*.tar.gz"))
-            else:
-                backup_files = [d for d in self.backup_dir.iterdir() 
-                              if d.is_dir() and d.name.startswith("backup_")]
-            
-            for backup_path in sorted(backup_files, key=lambda x: x.stat().st_mtime, reverse=True):
-                backup_info = {
-                    "name": backup_path.name,
-                    "path": str(backup_path),
-                    "size": backup_path.stat().st_size if backup_path.is_file() else self._get_dir_size(backup_path),
-                    "created": datetime.fromtimestamp(backup_path.stat().st_mtime).isoformat(),
-                    "type": "compressed" if self.compression else "directory"
-                }
-                
-                # 尝试读取备份信息
-                try:
-                    if self.compression:
-                        import tarfile
-                        with tarfile.open(backup_path, 'r:gz') as tar:
-                            info_member = tar.getmember("backup_info.json")
-                            info_data = json.loads(tar.extractfile(info_member).read().decode('utf-8'))
-                            backup_info.update(info_data)
-                    else:
-                        info_file = backup_path / "backup_info.json"
-                        if info_file.exists():
-                            with open(info_file, 'r', encoding='utf-8') as f:
-                                info_data = json.load(f)
-                                backup_info.update(info_data)
-                except Exception as e:
-                    logger.warning(f"读取备份信息失败 {backup_path}: {e}")
-                
-                backups.append(backup_info)
-        
-        except Exception as e:
-            logger.error(f"列出备份失败: {e}")
-        
+        for manifest in reversed(self._manifests()):
+            backup_path = self.backup_dir / manifest['name']
+            backups.append({
+                **manifest,
+                "path": str(backup_path),
+                "size": self._get_dir_size(backup_path),
+                "created": manifest.get('created_at'),
+            })
         return backups
-    
+
     def _get_dir_size(self, path: Path) -> int:
         """获取目录大小"""
         total_size = 0
@@ -355,70 +479,120 @@ class BackupManager:
         except Exception:
             pass
         return total_size
-    
+
+    # ---------- 恢复 ---------- #
+
+    def _resolve_chain(self, backup_name: str) -> List[Dict[str, Any]]:
+        """返回从全量到目标备份的链（按应用顺序）"""
+        chain = []
+        name = backup_name
+        while name:
+            manifest = self._read_manifest(name)
+            if manifest is None:
+                raise FileNotFoundError(f"备份不存在或缺少 manifest: {name}")
+            chain.append(manifest)
+            name = manifest.get('base')
+            if len(chain) > 10000:
+                raise ValueError("备份链存在循环引用")
+        chain.reverse()
+        if chain[0].get('type') != 'full':
+            raise ValueError(f"备份链缺少全量基线: {backup_name}")
+        return chain
+
+    def _verify_files(self, chain: List[Dict[str, Any]]) -> None:
+        """流式校验链上每个备份文件的 SHA-256"""
+        for manifest in chain:
+            backup_path = self.backup_dir / manifest['name']
+            for file_name, expected in manifest.get('files', {}).items():
+                file_path = backup_path / file_name
+                if not file_path.exists():
+                    raise ValueError(f"备份文件缺失: {manifest['name']}/{file_name}")
+                if file_sha256(file_path) != expected:
+                    raise ValueError(f"文件校验和不匹配: {manifest['name']}/{file_name}")
+
+    def _rebuild_image(self, chain: List[Dict[str, Any]], target_path: Path, shard_id: Optional[int] = None) -> None:
+        """
+        解压该库在链上最近的全量镜像并依次写入其后的增量变更页，最后校验镜像摘要（同步，线程中执行）
+
+        Args:
+            chain: _resolve_chain 的结果
+            target_path: 还原镜像的路径
+            shard_id: 城市分片号（默认主库）
+        """
+        prefix = _shard_prefix(shard_id)
+        entries = [m if shard_id is None else (m.get('shards') or {}).get(str(shard_id)) for m in chain]
+        start = len(entries) - 1
+        while start > 0 and entries[start] is not None and entries[start].get('type') != 'full':
+            start -= 1
+        if entries[start] is None or entries[start].get('type') != 'full':
+            raise ValueError(f"备份链缺少全量镜像: {prefix or '主库'}")
+        full = chain[start]
+        with gzip.open(self.backup_dir / full['name'] / f"{prefix}{FULL_FILE}", 'rb') as src, \
+                open(target_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        for manifest, entry in zip(chain[start + 1:], entries[start + 1:]):
+            page_size = entry['page_size']
+            with gzip.open(self.backup_dir / manifest['name'] / f"{prefix}{DELTA_FILE}", 'rb') as src, \
+                    open(target_path, 'r+b') as dst:
+                for header in iter(lambda: src.read(4), b''):
+                    pgno = int.from_bytes(header, 'big')
+                    page = src.read(page_size)
+                    if len(page) != page_size:
+                        raise ValueError(f"增量文件截断: {manifest['name']}/{prefix}{DELTA_FILE}")
+                    dst.seek((pgno - 1) * page_size)
+                    dst.write(page)
+                dst.truncate(entry['page_count'] * page_size)
+        if file_sha256(target_path) != entries[-1]['image_sha256']:
+            raise ValueError(f"恢复后的数据库镜像校验和不匹配: {prefix or '主库'}")
+
+    @staticmethod
+    def _integrity_check(db_path: Path) -> str:
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("PRAGMA integrity_check").fetchone()[0]
+        finally:
+            conn.close()
+
     async def restore_backup(self, backup_name: str, verify_integrity: bool = True) -> Dict[str, Any]:
         """
-        恢复备份
-        
+        恢复备份（应在机器人/web 停止写入时执行）
+
         Args:
-            backup_name: 备份名称
-            verify_integrity: 是否验证完整性
-            
+            backup_name: 备份名称（增量备份会自动沿基线链还原）
+            verify_integrity: 是否校验文件摘要与数据库完整性
+
         Returns:
-            恢复结果信息
+            恢复结果
         """
+        # {目标库路径: (分片号, 还原镜像路径)}
+        images = {db_manager.db_path: (None, Path(f"{db_manager.db_path}.restore"))}
         try:
-            logger.info(f"开始恢复备份: {backup_name}")
-            
-            # 查找备份文件
-            if self.compression:
-                backup_path = self.backup_dir / f"{backup_name}.tar.gz"
-                if not backup_path.exists():
-                    backup_path = self.backup_dir / backup_name
-            else:
-                backup_path = self.backup_dir / backup_name
-            
-            if not backup_path.exists():
-                raise FileNotFoundError(f"备份文件不存在: {backup_name}")
-            
-            # 创建临时恢复目录
-            temp_restore_dir = self.backup_dir / f"restore_temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            temp_restore_dir.mkdir(exist_ok=True)
-            
-            try:
-                # 解压备份文件
-                if self.compression and backup_path.suffix == '.gz':
-                    import tarfile
-                    with tarfile.open(backup_path, 'r:gz') as tar:
-                        tar.extractall(temp_restore_dir)
-                else:
-                    for item in backup_path.iterdir():
-                        if item.is_file():
-                            shutil.copy2(item, temp_restore_dir)
-                        elif item.is_dir():
-                            shutil.copytree(item, temp_restore_dir / item.name)
-                
-                # 验证完整性
+            chain = self._resolve_chain(backup_name)
+            shard_ids = sorted(int(key) for key in chain[-1].get('shards') or {})
+            if shard_ids and db_manager.shards is None:
+                raise ValueError("备份包含城市分片，需启用分片（DB_SHARDING=true）后恢复")
+            for shard_id in shard_ids:
+                path = db_manager.shards.path_for(shard_id)
+                images[path] = (shard_id, Path(f"{path}.restore"))
+            if verify_integrity:
+                await asyncio.to_thread(self._verify_files, chain)
+            for shard_id, restore_path in images.values():
+                await asyncio.to_thread(self._rebuild_image, chain, restore_path, shard_id)
                 if verify_integrity:
-                    if not await self._verify_backup_integrity(temp_restore_dir):
-                        raise ValueError("备份完整性验证失败")
-                
-                # 执行恢复
-                await self._perform_restore(temp_restore_dir)
-                
-                logger.info(f"备份恢复成功: {backup_name}")
-                return {
-                    "status": "success",
-                    "backup_name": backup_name,
-                    "restored_at": datetime.now().isoformat(),
-                    "message": "备份恢复成功"
-                }
-            
-            finally:
-                # 清理临时目录
-                if temp_restore_dir.exists():
-                    shutil.rmtree(temp_restore_dir)
-        
+                    result = await asyncio.to_thread(self._integrity_check, restore_path)
+                    if result != "ok":
+                        raise ValueError(f"数据库完整性检查失败: {restore_path.name} {result}")
+
+            await self._perform_restore({path: restore_path for path, (_, restore_path) in images.items()})
+            logger.info(f"备份恢复成功: {backup_name}（链长 {len(chain)}）")
+            return {
+                "status": "success",
+                "backup_name": backup_name,
+                "chain": [m['name'] for m in chain],
+                "restored_at": datetime.now().isoformat(),
+                "message": "备份恢复成功"
+            }
+
         except Exception as e:
             logger.error(f"备份恢复失败: {e}")
             return {
@@ -427,108 +601,61 @@ class BackupManager:
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
             }
-    
-    async def _verify_backup_integrity(self, restore_dir: Path) -> bool:
-        """验证备份完整性"""
-        try:
-            # 检查必需文件
-            required_files = ["database.db", "config.json", "backup_info.json"]
-            for file_name in required_files:
-                if not (restore_dir / file_name).exists():
-                    logger.error(f"备份完整性验证失败：缺少文件 {file_name}")
-                    return False
-            
-            # 验证校验和（如果存在）
-            backup_info_path = restore_dir / "backup_info.json"
-            if backup_info_path.exists():
-                with open(backup_info_path, 'r', encoding='utf-8') as f:
-                    backup_info = json.load(f)
-                
-                checksums = backup_info.get("checksums", {})
-                if checksums:
-                    for file_name, expected_hash in checksums.items():
-                        file_path = restore_dir / file_name
-                        if file_path.exists():
-                            with open(file_path, 'rb') as f:
-                                actual_hash = hashlib.sha256(f.read()).hexdigest()
-                                if actual_hash != expected_hash:
-                                    logger.error(f"文件校验和不匹配: {file_name}")
-                                    return False
-            
-            # 验证数据库文件
-            db_path = restore_dir / "database.db"
-            if db_path.exists():
-                # 尝试打开数据库检查完整性
-                conn = sqlite3.connect(db_path)
+        finally:
+            for _, restore_path in images.values():
+                if restore_path.exists():
+                    restore_path.unlink()
+
+    async def _perform_restore(self, restore_paths: Dict[str, Path]):
+        """
+        原子替换主库及各分片：先回写 WAL，原文件改名保留，再把还原的镜像移入
+
+        Args:
+            restore_paths: {目标库路径: 还原镜像路径}；当前存在而备份中没有的分片文件也改名移开
+        """
+        current = [db.db_path for db in db_manager.all_databases()]
+        await db_manager.close_all_connections()
+        for db_path in dict.fromkeys(current + list(restore_paths)):
+            if os.path.exists(db_path):
+                conn = sqlite3.connect(db_path, timeout=30)
                 try:
-                    cursor = conn.execute("PRAGMA integrity_check")
-                    result = cursor.fetchone()
-                    if result[0] != "ok":
-                        logger.error(f"数据库完整性检查失败: {result[0]}")
-                        return False
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 finally:
                     conn.close()
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"备份完整性验证异常: {e}")
-            return False
-    
-    async def _perform_restore(self, restore_dir: Path):
-        """执行恢复操作"""
-        try:
-            # 关闭数据库连接
-            await db_manager.close()
-            
-            # 备份当前数据库
-            current_db_path = PathManager.get_db_path()
-            backup_current_path = f"{current_db_path}.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            
-            if os.path.exists(current_db_path):
-                shutil.copy2(current_db_path, backup_current_path)
-                logger.info(f"当前数据库已备份至: {backup_current_path}")
-            
-            # 恢复数据库
-            restore_db_path = restore_dir / "database.db"
-            if restore_db_path.exists():
-                shutil.copy2(restore_db_path, current_db_path)
-                logger.info("数据库恢复完成")
-            
-            # 重新初始化数据库连接
-            await db_manager.initialize()
-            
-        except Exception as e:
-            logger.error(f"执行恢复失败: {e}")
-            raise
-    
+                os.replace(db_path, f"{db_path}.pre_restore")
+                logger.info(f"当前数据库已保留为: {db_path}.pre_restore")
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(f"{db_path}{suffix}"):
+                    os.remove(f"{db_path}{suffix}")
+            if db_path in restore_paths:
+                os.replace(restore_paths[db_path], db_path)
+
+    # ---------- 其他 ---------- #
+
     async def create_scheduled_backup(self) -> Dict[str, Any]:
-        """创建定时备份"""
+        """创建定时备份（按链规则自动选择全量或增量）"""
         backup_name = f"scheduled_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        return await self.create_backup(
-            backup_name=backup_name,
-            include_logs=True,
-            include_metadata=True
-        )
-    
+        return await self.create_backup(backup_name=backup_name)
+
     async def get_backup_statistics(self) -> Dict[str, Any]:
         """获取备份统计信息"""
         try:
             backups = await self.list_backups()
-            
+
             total_size = sum(backup.get("size", 0) for backup in backups)
-            
+
             return {
                 "total_backups": len(backups),
+                "full_backups": sum(1 for b in backups if b.get("type") == "full"),
+                "incremental_backups": sum(1 for b in backups if b.get("type") == "incremental"),
                 "total_size_bytes": total_size,
                 "total_size_mb": round(total_size / (1024 * 1024), 2),
                 "oldest_backup": backups[-1]["created"] if backups else None,
                 "newest_backup": backups[0]["created"] if backups else None,
                 "backup_directory": str(self.backup_dir),
-                "max_backups": self.max_backups,
-                "compression_enabled": self.compression
+                "max_chains": self.max_chains,
             }
-            
+
         except Exception as e:
             logger.error(f"获取备份统计失败: {e}")
             return {
@@ -538,4 +665,4 @@ class BackupManager:
 
 
 # 全局备份管理器实例
-backup_manager = BackupManager()
\ No newline at end of file
+backup_manager = BackupManager()
@@ -17,6 +17,7 @@ from html import escape as _esc_html
 from typing import Dict, Any, List, Tuple
 
 from database.db_connection import db_manager
+from utils.tracing import traced_function
 
 
 def _esc_md(s: str) -> str:
@@ -77,6 +78,7 @@ async def _build_caption_context(
     }
 
 
+@traced_function("render.caption_md")
 async def render_channel_caption_md(
     merchant: Dict[str, Any],
     bot_username: str,
@@ -169,6 +171,7 @@ async def render_channel_caption_md(
     return "\n".join([line for line in body if line is not None])
 
 
+@traced_function("render.caption_html")
 async def render_channel_caption_html(
     merchant: Dict[str, Any],
     bot_username: str,
@@ -11,6 +11,8 @@ import json
 
 from aiogram import Bot
 
+from utils.metrics import HEALTH_CHECK_SECONDS, HEALTH_CHECK_STATUS
+
 logger = logging.getLogger(__name__)
 
 class HealthMonitor:
@@ -125,6 +127,9 @@ class HealthMonitor:
             
             # 计算检查耗时
             check_duration = (datetime.now() - check_start).total_seconds()
+            HEALTH_CHECK_SECONDS.observe(check_duration)
+            for check_name, result in health_results.items():
+                HEALTH_CHECK_STATUS.set(1 if result.get("healthy", False) else 0, check=check_name)
             
             # 更新指标
             self._update_health_metrics(health_results, check_duration, overall_healthy)
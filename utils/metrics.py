@@ -0,0 +1,517 @@
+"""
+运行指标注册表
+计数器（Counter）、仪表（Gauge）与固定分桶直方图（Histogram），以 Prometheus 文本格式输出
+
+多进程汇总:
+- 机器人、Webhook 分片 worker、调度器与 Web 进程各自在内存中记录指标
+- start_exporter() 启动后台线程，定期把本进程快照原子写入共享目录（<角色>-<PID>-<启动时间>.json）
+- Web 进程的 /metrics 读取目录中的全部快照并与本进程实时数据合并:
+  计数器与直方图跨进程求和（已退出进程的累计值在保留期内继续计入），
+  仪表只汇总仍在写入快照的进程
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# 延迟类指标的默认分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+OVERFLOW_LABEL = "other"
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """指标基类：按标签值元组保存序列"""
+
+    kind = "untyped"
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str] = (), max_series: Optional[int] = None):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series or registry.max_series
+        self._series: Dict[LabelKey, Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        if key not in self._series and len(self._series) >= self.max_series:
+            # 标签组合过多时归并，避免快照与输出无限增长
+            return (OVERFLOW_LABEL,) * len(self.labelnames)
+        return key
+
+    def clear(self):
+        with self.registry._lock:
+            self._series.clear()
+
+    def _dump_series(self) -> List[list]:
+        return [[list(key), value] for key, value in self._series.items()]
+
+    def dump(self) -> Dict[str, Any]:
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "series": self._dump_series(),
+        }
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        with self.registry._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._series.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0.0)
+
+    def total(self) -> float:
+        return sum(self._series.values())
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值；set_function() 注册的回调在采集时求值"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], Any]] = None
+
+    def set(self, value: float, **labels: Any):
+        with self.registry._lock:
+            self._series[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        with self.registry._lock:
+            key = self._key(labels)
+            self._series[key] = self._series.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], Any]):
+        """
+        采集时调用的取值函数
+
+        Args:
+            function: 无标签时返回数值；有标签时返回 {标签值元组: 数值}
+        """
+        self._function = function
+
+    def value(self, **labels: Any) -> float:
+        return self._series.get(tuple(str(labels.get(n, "")) for n in self.labelnames), 0.0)
+
+    def _dump_series(self) -> List[list]:
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                logger.debug(f"指标 {self.name} 取值失败: {e}")
+                result = None
+            if isinstance(result, dict):
+                return [[[str(v) for v in key], float(value)] for key, value in result.items()]
+            if result is not None:
+                return [[[], float(result)]]
+        return super()._dump_series()
+
+
+class Histogram(_Metric):
+    """固定分桶直方图：每个序列保存 [各桶计数（末位为 +Inf）, 总和, 次数]"""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, **labels: Any):
+        index = bisect_left(self.buckets, value)
+        with self.registry._lock:
+            key = self._key(labels)
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels: Any) -> '_Timer':
+        """with metric.time(...): 记录代码块耗时"""
+        return _Timer(self, labels)
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(tuple(str(labels.get(n, "")) for n in self.labelnames))
+        return series[2] if series else 0
+
+    def _dump_series(self) -> List[list]:
+        return [[list(key), [list(s[0]), s[1], s[2]]] for key, s in self._series.items()]
+
+    def dump(self) -> Dict[str, Any]:
+        data = super().dump()
+        data["buckets"] = list(self.buckets)
+        return data
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def _merge_family(target: Dict[str, Any], family: Dict[str, Any], include_values: bool):
+    """把一个进程的指标族合并进汇总结果（标签或分桶定义不一致时跳过该进程的数据）"""
+    if family.get("labels") != target["labels"] or family.get("buckets") != target.get("buckets"):
+        return
+    if target["type"] == "gauge" and not include_values:
+        return
+    series = target["series"]
+    for labels, value in family.get("series", []):
+        key = tuple(labels)
+        if target["type"] == "histogram":
+            current = series.get(key)
+            if current is None:
+                series[key] = [list(value[0]), value[1], value[2]]
+            else:
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+                current[2] += value[2]
+        else:
+            series[key] = series.get(key, 0.0) + value
+
+
+class MetricsRegistry:
+    """进程级指标注册表"""
+
+    def __init__(self, max_series: int = 500):
+        self.max_series = max_series
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self.role: Optional[str] = None
+        self.directory: Optional[str] = None
+        self.flush_interval = 15.0
+        self.retention_seconds = 7 * 86400
+        self.started_at = time.time()
+        self._path: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Any:
+        existing = self._metrics.get(name)
+        if existing is not None:
+            if not isinstance(existing, cls) or existing.labelnames != tuple(labelnames):
+                raise ValueError(f"指标 {name} 已以不同的类型或标签注册")
+            return existing
+        metric = cls(self, name, documentation, labelnames, **kwargs)
+        self._metrics[name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                max_series: Optional[int] = None) -> Counter:
+        return self._register(Counter, name, documentation, labelnames, max_series=max_series)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              max_series: Optional[int] = None) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames, max_series=max_series)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, max_series: Optional[int] = None) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets, max_series=max_series)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """本进程全部指标的可序列化快照"""
+        with self._lock:
+            families = {name: metric.dump() for name, metric in self._metrics.items()
+                        if not isinstance(metric, Gauge) or metric._function is None}
+        # 取值函数可能访问其它组件，不在锁内执行
+        for name, metric in list(self._metrics.items()):
+            if isinstance(metric, Gauge) and metric._function is not None:
+                families[name] = metric.dump()
+        return {
+            "pid": os.getpid(),
+            "role": self.role or "main",
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "metrics": families,
+        }
+
+    # ------------------------------------------------------------------
+    # 多进程快照
+    # ------------------------------------------------------------------
+
+    def start_exporter(self, role: str, directory: Optional[str] = None,
+                       interval: Optional[float] = None) -> bool:
+        """
+        启动快照写入线程（幂等，同一进程只以第一次调用的角色导出）
+
+        Args:
+            role: 进程角色（bot / web / scheduler）
+            directory: 快照目录，默认取 METRICS_CONFIG
+            interval: 写入间隔（秒）
+
+        Returns:
+            是否已启用多进程导出
+        """
+        if self._thread is not None:
+            return True
+        if not METRICS_CONFIG.get("enabled", True):
+            return False
+        directory = directory or METRICS_CONFIG.get("multiprocess_dir") or _default_directory()
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"指标快照目录不可用，仅输出本进程指标: {e}")
+            return False
+
+        self.role = role
+        self.directory = directory
+        self.flush_interval = interval or METRICS_CONFIG.get("flush_interval", 15.0)
+        self.retention_seconds = METRICS_CONFIG.get("retention_seconds", self.retention_seconds)
+        self._path = os.path.join(directory, f"{role}-{os.getpid()}-{int(self.started_at)}.json")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="metrics-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+        logger.info(f"指标快照导出已启动: {self._path}")
+        return True
+
+    def stop_exporter(self):
+        """停止写入线程并写入最后一次快照"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """把本进程快照原子写入共享目录"""
+        if not self._path:
+            return
+        try:
+            data = json.dumps(self.snapshot(), ensure_ascii=False, separators=(",", ":"))
+            tmp = f"{self._path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self._path)
+        except Exception as e:
+            logger.warning(f"写入指标快照失败: {e}")
+
+    def _read_snapshots(self) -> List[Tuple[Dict[str, Any], bool]]:
+        """读取其它进程的快照，返回 [(快照, 是否仍在写入)]；清理超过保留期的文件"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        now = time.time()
+        stale_after = max(self.flush_interval * 3, 30)
+        snapshots = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, filename)
+            if path == self._path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            age = now - float(data.get("updated_at", 0))
+            if age > self.retention_seconds:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            snapshots.append((data, age <= stale_after))
+        return snapshots
+
+    def collect(self, aggregate: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        汇总指标
+
+        Args:
+            aggregate: 是否合并共享目录中其它进程的快照
+
+        Returns:
+            {指标名: {"type", "help", "labels", "buckets", "series": {标签值元组: 值}}}
+        """
+        own = self.snapshot()
+        sources = [(own, True)]
+        if aggregate:
+            sources.extend(self._read_snapshots())
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        processes: Dict[str, int] = {}
+        for snapshot, live in sources:
+            if live:
+                role = snapshot.get("role", "main")
+                processes[role] = processes.get(role, 0) + 1
+            for name, family in snapshot.get("metrics", {}).items():
+                target = merged.get(name)
+                if target is None:
+                    target = merged[name] = {
+                        "type": family.get("type", "untyped"),
+                        "help": family.get("help", ""),
+                        "labels": family.get("labels", []),
+                        "buckets": family.get("buckets"),
+                        "series": {},
+                    }
+                _merge_family(target, family, include_values=live)
+
+        merged["app_processes"] = {
+            "type": "gauge",
+            "help": "仍在写入指标快照的进程数",
+            "labels": ["role"],
+            "buckets": None,
+            "series": {(role,): float(count) for role, count in processes.items()},
+        }
+        return merged
+
+    def render(self, aggregate: bool = True) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        for name, family in sorted(self.collect(aggregate).items()):
+            labels = family["labels"]
+            lines.append(f"# HELP {name} {_escape(family['help'])}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key, value in sorted(family["series"].items()):
+                if family["type"] == "histogram":
+                    cumulative = 0
+                    bounds = list(family["buckets"]) + [float("inf")]
+                    for bound, count in zip(bounds, value[0]):
+                        cumulative += count
+                        le = f'le="{_format_value(bound)}"'
+                        lines.append(f"{name}_bucket{_format_labels(labels, key, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels, key)} {_format_value(value[1])}")
+                    lines.append(f"{name}_count{_format_labels(labels, key)} {value[2]}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels, key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def cache_hit_ratio(self) -> Dict[str, float]:
+        """本进程各缓存的命中率"""
+        requests = self._metrics.get("cache_requests_total")
+        if requests is None:
+            return {}
+        totals: Dict[str, List[float]] = {}
+        for (cache, result), value in list(requests._series.items()):
+            entry = totals.setdefault(cache, [0.0, 0.0])
+            entry[1] += value
+            if result == "hit":
+                entry[0] += value
+        return {cache: round(hit / total, 4) if total else 0.0 for cache, (hit, total) in totals.items()}
+
+
+def _default_directory() -> str:
+    from pathmanager import PathManager
+    return os.path.join(PathManager.get_root_directory(), "data", "metrics")
+
+
+# 全局指标注册表
+metrics = MetricsRegistry(max_series=METRICS_CONFIG.get("max_series", 500))
+
+# ==================== 指标定义 ====================
+
+# 机器人
+BOT_REQUESTS = metrics.counter("bot_requests_total", "机器人处理的消息与回调数", ["event_type"])
+BOT_REQUEST_SECONDS = metrics.histogram(
+    "bot_request_duration_seconds", "消息与回调的处理耗时（含中间件）", ["event_type"]
+)
+BOT_HANDLER_SECONDS = metrics.histogram("bot_handler_duration_seconds", "各处理器的执行耗时", ["handler"])
+BOT_HANDLER_ERRORS = metrics.counter("bot_handler_errors_total", "处理器抛出的异常数", ["handler"])
+BOT_ERRORS = metrics.counter("bot_errors_total", "错误处理中间件捕获的错误数", ["type"])
+BOT_THROTTLED = metrics.counter("bot_throttled_total", "被限流拦截的事件数", ["event_type"])
+
+# 数据库
+DB_QUERY_SECONDS = metrics.histogram(
+    "db_query_duration_seconds", "数据库语句耗时（按 SQL 指纹）", ["op", "statement"]
+)
+DB_QUERY_ERRORS = metrics.counter("db_query_errors_total", "数据库语句失败数", ["op"])
+
+# 后台任务队列
+TASK_QUEUE_DEPTH = metrics.gauge("task_queue_depth", "后台任务队列中等待执行的任务数")
+TASK_QUEUE_TASKS = metrics.counter("task_queue_tasks_total", "后台任务执行结果", ["result"])
+
+# 广播
+BROADCAST_MESSAGES = metrics.counter("broadcast_messages_total", "广播发送的消息数", ["result"])
+
+# 定时任务
+SCHEDULER_JOB_SECONDS = metrics.histogram(
+    "scheduler_job_duration_seconds", "定时任务执行耗时", ["job"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0),
+)
+SCHEDULER_JOB_RUNS = metrics.counter("scheduler_job_runs_total", "定时任务执行次数", ["job", "status"])
+
+# 数据库维护
+DB_FILE_BYTES = metrics.gauge("db_file_bytes", "数据库文件大小（database=main|shard_<n>，file=db|wal）", ["database", "file"])
+DB_FREELIST_PAGES = metrics.gauge("db_freelist_pages", "数据库空闲页数", ["database"])
+DB_CHECKPOINT_SECONDS = metrics.histogram("db_checkpoint_duration_seconds", "WAL 检查点耗时", ["mode"])
+DB_CHECKPOINT_RUNS = metrics.counter("db_checkpoint_runs_total", "WAL 检查点执行次数", ["mode", "result"])
+DB_VACUUM_PAGES = metrics.counter("db_vacuum_pages_total", "VACUUM 回收的页数", ["mode"])
+
+# 分析快照
+ANALYTICS_SNAPSHOT_AGE = metrics.gauge("analytics_snapshot_age_seconds", "分析只读快照距今的秒数（无快照时为 -1）")
+ANALYTICS_SNAPSHOT_SECONDS = metrics.histogram("analytics_snapshot_refresh_seconds", "生成一次分析快照的耗时")
+
+# 启动
+STARTUP_STAGE_SECONDS = metrics.gauge("startup_stage_seconds", "进程启动各阶段耗时（stage=total 为总耗时）", ["stage"])
+
+# 缓存
+CACHE_REQUESTS = metrics.counter("cache_requests_total", "缓存查询次数", ["cache", "result"])
+
+# 健康检查
+HEALTH_CHECK_STATUS = metrics.gauge("health_check_status", "最近一次健康检查结果（1 为正常）", ["check"])
+HEALTH_CHECK_SECONDS = metrics.histogram("health_check_duration_seconds", "一轮健康检查的耗时")
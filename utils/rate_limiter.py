@@ -0,0 +1,248 @@
+"""
+令牌桶限流器
+机器人中间件（ThrottlingMiddleware）与安全管理器（SecurityManager）共用的限流组件
+
+特性:
+- 每个 (动作, 用户) 一个令牌桶，状态只有 (令牌数, 更新时间) 两个字段，判定为常数时间
+- 按动作分桶：消息 / 回调 / 创建订单 / 安全检查各自独立的速率与容量
+- LRU 淘汰：超过 max_keys 时淘汰最久未访问的桶，无需定期全量清理
+- 可选 SQLite 共享存储：多个机器人 worker 指向同一文件时共享同一套限额
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import RATE_LIMIT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """单个令牌桶状态"""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+def _wait_time(tokens: float, cost: float, rate: float) -> float:
+    if rate <= 0:
+        return float('inf')
+    return max(0.0, (cost - tokens) / rate)
+
+
+class SQLiteBucketStore:
+    """
+    SQLite 共享令牌桶存储
+
+    一次 UPSERT ... RETURNING 完成“补充令牌 + 判定 + 扣减”，由 SQLite 写锁保证
+    多进程下的原子性。使用独立的数据库文件，不占用业务库的写锁。
+    """
+
+    _UPSERT = """
+        INSERT INTO rate_limit_buckets (bucket_key, tokens, updated_at, allowed)
+        VALUES (:key, :burst - :cost, :now, :burst >= :cost)
+        ON CONFLICT(bucket_key) DO UPDATE SET
+            tokens = MIN(:burst, tokens + MAX(0, :now - updated_at) * :rate)
+                     - CASE WHEN MIN(:burst, tokens + MAX(0, :now - updated_at) * :rate) >= :cost
+                            THEN :cost ELSE 0 END,
+            allowed = MIN(:burst, tokens + MAX(0, :now - updated_at) * :rate) >= :cost,
+            updated_at = :now
+        RETURNING tokens, allowed
+    """
+
+    def __init__(self, path: str, idle_seconds: int = 3600, prune_every: int = 1000):
+        """
+        Args:
+            path: 共享的 SQLite 文件路径
+            idle_seconds: 超过该时长未访问的桶会被清理
+            prune_every: 每执行多少次判定清理一次闲置桶
+        """
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self.prune_every = prune_every
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            " bucket_key TEXT PRIMARY KEY, tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL, allowed INTEGER NOT NULL DEFAULT 1)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated ON rate_limit_buckets(updated_at)"
+        )
+        return conn
+
+    def take(self, key: str, rate: float, burst: float, cost: float, now: float) -> Tuple[bool, float]:
+        """
+        尝试从共享桶中取令牌
+
+        Returns:
+            (是否放行, 扣减后的令牌数)
+        """
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+            tokens, allowed = self._conn.execute(self._UPSERT, {
+                'key': key, 'rate': rate, 'burst': burst, 'cost': cost, 'now': now,
+            }).fetchone()
+            self._calls += 1
+            if self._calls % self.prune_every == 0:
+                self._conn.execute(
+                    "DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - self.idle_seconds,)
+                )
+        return bool(allowed), float(tokens)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RateLimiter:
+    """按动作分桶的令牌桶限流器"""
+
+    def __init__(
+        self,
+        buckets: Dict[str, Tuple[float, float]],
+        max_keys: int = 100000,
+        store: Optional[SQLiteBucketStore] = None
+    ):
+        """
+        Args:
+            buckets: {动作: (每秒补充令牌数, 桶容量)}，'default' 用于未配置的动作
+            max_keys: 进程内最多保留的桶数量（LRU 淘汰）
+            store: 共享存储（可选），配置后 acquire() 优先使用
+        """
+        self.buckets = dict(buckets)
+        self.max_keys = max_keys
+        self.store = store
+        self._states: 'OrderedDict[Tuple[str, Any], TokenBucket]' = OrderedDict()
+        self._store_failed = False
+        self.allowed_count = 0
+        self.limited_count = 0
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def limits_for(
+        self, action: str, rate: Optional[float] = None, burst: Optional[float] = None
+    ) -> Tuple[float, float]:
+        """动作的 (rate, burst)，调用方给出的值优先"""
+        base_rate, base_burst = self.buckets.get(action) or self.buckets.get('default', (1.0, 3))
+        return (base_rate if rate is None else rate), (base_burst if burst is None else burst)
+
+    def _bucket(self, action: str, key: Any, burst: float, rate: float, now: float) -> TokenBucket:
+        state_key = (action, key)
+        bucket = self._states.get(state_key)
+        if bucket is None:
+            bucket = TokenBucket(float(burst), now)
+            self._states[state_key] = bucket
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(state_key)
+            bucket.tokens = min(float(burst), bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        return bucket
+
+    def _count(self, allowed: bool):
+        if allowed:
+            self.allowed_count += 1
+        else:
+            self.limited_count += 1
+
+    def try_acquire(
+        self,
+        key: Any,
+        action: str = 'default',
+        cost: float = 1.0,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None
+    ) -> Tuple[bool, float]:
+        """
+        进程内判定并扣减令牌
+
+        Returns:
+            (是否放行, 建议等待秒数)
+        """
+        rate, burst = self.limits_for(action, rate, burst)
+        bucket = self._bucket(action, key, burst, rate, time.monotonic())
+        allowed = bucket.tokens >= cost
+        if allowed:
+            bucket.tokens -= cost
+        self._count(allowed)
+        return allowed, (0.0 if allowed else _wait_time(bucket.tokens, cost, rate))
+
+    async def acquire(
+        self,
+        key: Any,
+        action: str = 'default',
+        cost: float = 1.0,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None
+    ) -> Tuple[bool, float]:
+        """判定并扣减令牌；配置了共享存储时跨进程生效，存储异常时退回进程内限流"""
+        if self.store is None or self._store_failed:
+            return self.try_acquire(key, action, cost, rate, burst)
+        rate, burst = self.limits_for(action, rate, burst)
+        try:
+            allowed, tokens = await asyncio.to_thread(
+                self.store.take, f"{action}:{key}", rate, burst, cost, time.time()
+            )
+        except Exception as e:
+            self._store_failed = True
+            logger.warning(f"共享限流存储不可用，改用进程内限流: {e}")
+            return self.try_acquire(key, action, cost, rate, burst)
+        self._count(allowed)
+        return allowed, (0.0 if allowed else _wait_time(tokens, cost, rate))
+
+    def tokens(
+        self, key: Any, action: str = 'default', rate: Optional[float] = None, burst: Optional[float] = None
+    ) -> float:
+        """当前剩余令牌数（进程内状态，不扣减）"""
+        rate, burst = self.limits_for(action, rate, burst)
+        bucket = self._states.get((action, key))
+        if bucket is None:
+            return float(burst)
+        return min(float(burst), bucket.tokens + (time.monotonic() - bucket.updated) * rate)
+
+    def reset(self, key: Any, action: str = 'default'):
+        self._states.pop((action, key), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "tracked_keys": len(self._states),
+            "max_keys": self.max_keys,
+            "allowed": self.allowed_count,
+            "limited": self.limited_count,
+            "shared_store": self.store.path if self.store and not self._store_failed else None,
+            "buckets": dict(self.buckets),
+        }
+
+
+def _build_default_limiter() -> RateLimiter:
+    path = RATE_LIMIT_CONFIG.get("shared_store")
+    return RateLimiter(
+        RATE_LIMIT_CONFIG["buckets"],
+        max_keys=RATE_LIMIT_CONFIG["max_keys"],
+        store=SQLiteBucketStore(path) if path else None,
+    )
+
+
+# 全局限流器实例
+rate_limiter = _build_default_limiter()
@@ -12,9 +12,11 @@ import secrets
 import logging
 from typing import Dict, List, Optional, Any, Set
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
+from collections import defaultdict
 import json
 
+from utils.rate_limiter import rate_limiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,8 +30,8 @@ class SecurityManager:
         self.admin_sessions: Dict[int, datetime] = {}
         self.failed_login_attempts: Dict[str, List[datetime]] = defaultdict(list)
         
-        # 速率限制跟踪
-        self.request_history: Dict[int, deque] = defaultdict(lambda: deque(maxlen=100))
+        # 速率限制：与机器人限流中间件共用令牌桶限流器（'security' 动作桶）
+        self.rate_limiter = rate_limiter
         self.suspicious_activity: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
         
         # 安全配置
@@ -171,34 +173,28 @@ class SecurityManager:
         }
         
         try:
-            # 获取用户请求历史
-            user_requests = self.request_history[user_id]
-            
-            # 清理过期请求
-            cutoff_time = now - timedelta(minutes=1)
-            while user_requests and user_requests[0] < cutoff_time:
-                user_requests.popleft()
-            
-            # 检查当前请求数
-            current_requests = len(user_requests)
+            # 令牌桶：容量 max_requests_per_minute，每分钟补满
+            limit = self.max_requests_per_minute
+            allowed, wait_time = self.rate_limiter.try_acquire(
+                user_id, "security", rate=limit / 60.0, burst=limit
+            )
+            remaining = int(self.rate_limiter.tokens(user_id, "security", rate=limit / 60.0, burst=limit))
             
-            if current_requests >= self.max_requests_per_minute:
+            if not allowed:
                 result["allowed"] = False
                 result["remaining"] = 0
-                result["blocked_until"] = (user_requests[0] + timedelta(minutes=1)).isoformat()
+                result["blocked_until"] = (now + timedelta(seconds=wait_time)).isoformat()
                 
                 # 记录可疑活动
                 self._record_suspicious_activity(user_id, "rate_limit_exceeded", {
-                    "requests_count": current_requests,
+                    "limit_per_minute": limit,
                     "action": action
                 })
                 
-                logger.warning(f"用户 {user_id} 触发速率限制: {current_requests} 请求/分钟")
+                logger.warning(f"用户 {user_id} 触发速率限制: 超过 {limit} 请求/分钟")
             else:
-                # 记录请求
-                user_requests.append(now)
-                result["remaining"] = self.max_requests_per_minute - current_requests - 1
-                result["reset_time"] = (now + timedelta(minutes=1)).isoformat()
+                result["remaining"] = remaining
+                result["reset_time"] = (now + timedelta(seconds=(limit - remaining) * 60.0 / limit)).isoformat()
         
         except Exception as e:
             logger.error(f"速率限制检查异常: {e}")
@@ -366,7 +362,7 @@ class SecurityManager:
                     len(attempts) for attempts in self.failed_login_attempts.values()
                 ),
                 "recent_suspicious_activity": recent_suspicious,
-                "total_users_tracked": len(self.request_history),
+                "total_users_tracked": self.rate_limiter.get_stats()["tracked_keys"],
                 "security_patterns_count": len(self.malicious_patterns),
                 "status": "healthy" if recent_suspicious < 10 else "alert"
             }
@@ -0,0 +1,71 @@
+"""
+启动耗时统计
+记录进程启动各阶段耗时，启动完成时输出一份报告并写入指标
+
+使用方式：
+    from utils.startup_timer import startup_timer
+
+    with startup_timer.stage("database_init"):
+        ...
+    startup_timer.report()   # 启动完成时调用一次
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from utils.metrics import STARTUP_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """启动阶段计时器（以本模块首次导入为起点）"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.reported = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """统计一个启动阶段的耗时（同名阶段重复出现时分别记录）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started))
+
+    def elapsed(self) -> float:
+        """距计时起点的秒数"""
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> Dict[str, float]:
+        """各阶段耗时（同名阶段累加）与总耗时"""
+        result: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            result[name] = result.get(name, 0.0) + seconds
+        result['total'] = self.elapsed()
+        return {name: round(seconds, 3) for name, seconds in result.items()}
+
+    def report(self) -> Dict[str, float]:
+        """
+        输出启动耗时报告并写入 startup_stage_seconds 指标（仅首次调用输出）
+
+        Returns:
+            summary() 的结果
+        """
+        summary = self.summary()
+        if self.reported:
+            return summary
+        self.reported = True
+        for name, seconds in summary.items():
+            STARTUP_STAGE_SECONDS.set(seconds, stage=name)
+        detail = "，".join(f"{name} {seconds:.3f}s" for name, seconds in summary.items() if name != 'total')
+        logger.info(f"⏱️ 启动耗时 {summary['total']:.3f}s（{detail or '无阶段记录'}）")
+        return summary
+
+
+# 全局启动计时器
+startup_timer = StartupTimer()
@@ -0,0 +1,383 @@
+"""
+轻量级请求追踪
+按更新（update）记录一棵 span 树，用于定位慢请求耗时在数据库、Bot API、订阅检查还是渲染
+
+用法:
+    root = tracer.start_trace("telegram.update", **{"update.id": 1})
+    ...
+    with tracer.start_span("render.caption"):
+        ...
+    tracer.finish_trace(root)
+
+特性:
+- 当前 span 通过 contextvars 传递：同一更新内的 DatabaseManager 调用、Bot API 请求、
+  中间件阶段自动挂到该更新的 trace 下（asyncio.create_task 派生的任务同样继承）
+- 未启用或不在 trace 内时返回共享的空 span，开销只有一次 ContextVar 读取
+- 追踪结束时按采样率保留，超过慢阈值的 trace 一律保留；保留的 trace 放入环形缓冲区
+- export_otlp() 输出 OpenTelemetry OTLP/JSON 格式，可直接导入 Jaeger / Tempo 等工具
+"""
+
+import functools
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from config import TRACING_CONFIG
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "lanyangyang-bot"
+
+# OTLP span kind
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('tracing_current_span', default=None)
+
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@functools.lru_cache(maxsize=2048)
+def sql_fingerprint(query: str) -> str:
+    """SQL 指纹：压缩空白、字面量替换为 ?、IN 列表合并，便于聚合同类语句"""
+    text = ' '.join(query.split())
+    text = _SQL_LITERAL.sub('?', text)
+    text = _SQL_IN_LIST.sub('(?)', text)
+    return text[:300]
+
+
+class _NoopSpan:
+    """未追踪时返回的空 span"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        pass
+
+    def set_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """一次计时的操作"""
+
+    __slots__ = (
+        'trace', 'name', 'kind', 'span_id', 'parent_id', 'start_ns', 'end_ns',
+        'attributes', 'events', 'error', '_token',
+    )
+
+    def __init__(self, trace: 'Trace', name: str, kind: int, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.events: List[tuple] = []
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append((time.time_ns(), name, attributes))
+
+    def set_error(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {str(error)[:200]}"
+
+    def end(self) -> None:
+        """结束 span 并把当前 span 还原为父级（可重复调用）"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # 在其它上下文中结束（如回调），只能直接恢复父级
+                _current_span.set(self.trace.find(self.parent_id))
+            self._token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.set_error(exc)
+        self.end()
+        return False
+
+
+class Trace:
+    """一次更新处理的全部 span"""
+
+    __slots__ = ('trace_id', 'spans', 'dropped', 'finished')
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self.finished = False
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    def find(self, span_id: Optional[str]) -> Optional[Span]:
+        if span_id is None:
+            return None
+        for span in self.spans:
+            if span.span_id == span_id:
+                return span
+        return None
+
+    def summary(self) -> Dict[str, Any]:
+        """列表页摘要：按类别汇总耗时"""
+        by_kind: Dict[str, float] = {}
+        for span in self.spans[1:]:
+            category = span.name.split('.', 1)[0]
+            by_kind[category] = by_kind.get(category, 0.0) + span.duration_ms
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start": root.start_ns,
+            "duration_ms": round(root.duration_ms, 2),
+            "span_count": len(self.spans),
+            "dropped": self.dropped,
+            "error": root.error or next((s.error for s in self.spans if s.error), None),
+            "attributes": dict(root.attributes),
+            "breakdown_ms": {k: round(v, 2) for k, v in sorted(by_kind.items(), key=lambda kv: -kv[1])},
+        }
+
+
+class Tracer:
+    """追踪器：创建 span、采样并保存最近的 trace"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.1,
+        slow_ms: float = 1000.0,
+        buffer_size: int = 200,
+        max_spans: int = 500
+    ):
+        """
+        Args:
+            enabled: 是否启用
+            sample_rate: 普通 trace 的保留比例（0~1）
+            slow_ms: 超过该耗时的 trace 一律保留
+            buffer_size: 环形缓冲区保留的 trace 数
+            max_spans: 单个 trace 最多记录的 span 数（超出计入 dropped）
+        """
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+        self._buffer: Deque[Trace] = deque(maxlen=buffer_size)
+        self.started = 0
+        self.kept = 0
+
+    def configure(self, **options: Any) -> None:
+        """运行时调整参数（调试页开关）"""
+        for key in ('enabled', 'sample_rate', 'slow_ms', 'max_spans'):
+            if key in options and options[key] is not None:
+                setattr(self, key, options[key])
+        if options.get('buffer_size'):
+            self._buffer = deque(self._buffer, maxlen=int(options['buffer_size']))
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    def active(self) -> bool:
+        """当前上下文是否处于一个进行中的 trace 内"""
+        return self.enabled and _current_span.get() is not None
+
+    def start_trace(self, name: str, kind: int = KIND_SERVER, **attributes: Any):
+        """开始一个新的 trace，返回根 span（未启用时返回空 span）"""
+        if not self.enabled:
+            return NOOP_SPAN
+        trace = Trace()
+        span = Span(trace, name, kind, None, attributes)
+        trace.spans.append(span)
+        span._token = _current_span.set(span)
+        self.started += 1
+        return span
+
+    def finish_trace(self, root) -> None:
+        """结束 trace 并按采样规则决定是否保留"""
+        if root is NOOP_SPAN:
+            return
+        root.end()
+        trace = root.trace
+        trace.finished = True
+        if root.duration_ms >= self.slow_ms or root.error or random.random() < self.sample_rate:
+            self._buffer.append(trace)
+            self.kept += 1
+
+    def start_span(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any):
+        """在当前 span 下开始子 span（可用作 with 语句）；不在 trace 内时返回空 span"""
+        parent = _current_span.get()
+        if parent is None or not self.enabled:
+            return NOOP_SPAN
+        trace = parent.trace
+        if trace.finished:
+            return NOOP_SPAN
+        if len(trace.spans) >= self.max_spans:
+            trace.dropped += 1
+            return NOOP_SPAN
+        span = Span(trace, name, kind, parent.span_id, attributes)
+        trace.spans.append(span)
+        span._token = _current_span.set(span)
+        return span
+
+    def db_span(self, operation: str, query: str):
+        """数据库调用的 span（仅在 trace 内计算 SQL 指纹）"""
+        if _current_span.get() is None or not self.enabled:
+            return NOOP_SPAN
+        return self.start_span(
+            f"db.{operation}", KIND_CLIENT,
+            **{"db.system": "sqlite", "db.statement": sql_fingerprint(query)}
+        )
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        """在当前 span 上记录事件（如缓存命中）"""
+        span = _current_span.get()
+        if span is not None and self.enabled:
+            span.add_event(name, **attributes)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        span = _current_span.get()
+        if span is not None and self.enabled:
+            span.set(key, value)
+
+    # ---------------- 查询与导出 ---------------- #
+
+    def recent(self, limit: int = 50) -> List[Trace]:
+        """最近保留的 trace（新的在前）"""
+        return list(reversed(self._buffer))[:limit]
+
+    def get(self, trace_id: str) -> Optional[Trace]:
+        for trace in self._buffer:
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    def clear(self) -> None:
+        self._buffer.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "buffered": len(self._buffer),
+            "buffer_size": self._buffer.maxlen,
+            "started": self.started,
+            "kept": self.kept,
+        }
+
+    def export_otlp(self, traces: Optional[List[Trace]] = None) -> Dict[str, Any]:
+        """导出为 OTLP/JSON（ExportTraceServiceRequest）"""
+        traces = self.recent(len(self._buffer)) if traces is None else traces
+        spans = [_otlp_span(span) for trace in traces for span in trace.spans]
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "utils.tracing"},
+                    "spans": spans,
+                }],
+            }]
+        }
+
+
+def traced_function(name: str) -> Callable:
+    """协程函数装饰器：在 trace 内调用时记录为一个 span"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_span.get() is None or not tracer.enabled:
+                return await func(*args, **kwargs)
+            with tracer.start_span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    return {"key": key, "value": _otlp_value(value)}
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    data = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns if span.end_ns is not None else span.start_ns),
+        "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+        "events": [
+            {
+                "timeUnixNano": str(ts),
+                "name": name,
+                "attributes": [_otlp_attribute(k, v) for k, v in attrs.items()],
+            }
+            for ts, name, attrs in span.events
+        ],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 0},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+# 全局追踪器实例
+tracer = Tracer(
+    enabled=TRACING_CONFIG["enabled"],
+    sample_rate=TRACING_CONFIG["sample_rate"],
+    slow_ms=TRACING_CONFIG["slow_ms"],
+    buffer_size=TRACING_CONFIG["buffer_size"],
+    max_spans=TRACING_CONFIG["max_spans"],
+)
@@ -6,11 +6,13 @@
 
 import logging
 import os
+import importlib
 from fasthtml.common import *
 import os
 import asyncio
+import hmac
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.responses import RedirectResponse, JSONResponse
+from starlette.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.staticfiles import StaticFiles
 from starlette.requests import Request
@@ -19,19 +21,36 @@ from starlette.requests import Request
 from .layout import create_layout
 
 # 导入配置
-from config import WEB_CONFIG, bot_config
+from config import WEB_CONFIG, STARTUP_CONFIG, bot_config
 
-# 导入所有路由模块
+# 导入常用路由模块（调试、开发工具、分析等低频页面见下方 _lazy_route）
 from .routes import (
     auth, dashboard, merchants, users, orders,
     reviews, regions, incentives, subscription,
-    binding_codes, posts, templates, debug, media, user_analytics, scheduling, channels, broadcast, keywords
+    binding_codes, posts, templates, media, scheduling, channels, broadcast, keywords
 )
-if os.getenv('RUN_MODE', 'dev') == 'dev':
-    from .routes import dev_tools
 
 logger = logging.getLogger(__name__)
 
+
+def _lazy_route(module: str, name: str):
+    """
+    低频路由懒加载：首次请求时才导入路由模块（这些处理函数都只接收 request）
+
+    Args:
+        module: 相对 web.routes 的模块名
+        name: 处理函数名
+    """
+    if not STARTUP_CONFIG.get("lazy_routes", True):
+        return getattr(importlib.import_module(f".routes.{module}", __package__), name)
+
+    async def handler(request: Request):
+        func = getattr(importlib.import_module(f".routes.{module}", __package__), name)
+        return await func(request)
+
+    handler.__name__ = name
+    return handler
+
 # === 应用初始化 ===
 
 # UI资源
@@ -60,6 +79,32 @@ async def _start_bg_queue():
     except Exception as e:
         logger.warning(f"后台任务队列启动失败（web）: {e}")
 
+# 定期写入本进程指标快照（/metrics 汇总各进程）
+@app.on_event("startup")
+async def _start_metrics_exporter():
+    from utils.metrics import metrics
+    metrics.start_exporter("web")
+
+# 预加载用户实时排行榜（只读；快照表由机器人主进程写入）
+@app.on_event("startup")
+async def _warm_leaderboard():
+    try:
+        from services.live_leaderboard import live_leaderboard
+        await live_leaderboard.ensure_loaded()
+    except Exception as e:
+        logger.warning(f"预加载实时排行榜失败（web）: {e}")
+
+# 关闭媒体缓存共享的HTTP会话
+@app.on_event("shutdown")
+async def _close_media_cache():
+    try:
+        from services.media_cache import media_cache
+        from services.media_thumbnails import shutdown_executor
+        await media_cache.close()
+        shutdown_executor()
+    except Exception as e:
+        logger.warning(f"关闭媒体缓存会话失败: {e}")
+
 # === 异常处理 ===
 
 @app.exception_handler(StarletteHTTPException)
@@ -111,8 +156,8 @@ app.post("/merchants/{merchant_id}/refresh")(merchants.merchant_refresh_info)
 app.get("/users")(users.users_dashboard)
 app.get("/users/{user_id}/detail")(users.user_detail)
 app.get("/users/export")(users.export_users)
-app.get("/users/analytics")(user_analytics.user_analytics_dashboard)
-app.get("/users/analytics-data")(user_analytics.user_analytics_data_api)
+app.get("/users/analytics")(_lazy_route("user_analytics", "user_analytics_dashboard"))
+app.get("/users/analytics-data")(_lazy_route("user_analytics", "user_analytics_data_api"))
 app.get("/users/leaderboards")(users.users_leaderboards)
 
 # 订单管理路由（完整对齐旧版功能）
@@ -251,14 +296,24 @@ app.post("/templates/{key:str}/delete")(templates.template_delete)
 
 # 媒体代理路由
 app.get("/media-proxy/{media_id:int}")(media.media_proxy)
+app.get("/media-proxy/{media_id:int}/thumb/{variant:str}")(media.media_thumbnail)
+
+# 运行状态页（需登录）
+app.get("/debug/ingestion")(_lazy_route("debug", "debug_ingestion"))
+app.get("/debug/traces")(_lazy_route("debug", "debug_traces"))
+app.get("/debug/traces/export")(_lazy_route("debug", "debug_traces_export"))
+app.post("/debug/traces/config")(_lazy_route("debug", "debug_traces_config"))
+app.get("/debug/traces/{trace_id:str}")(_lazy_route("debug", "debug_trace_detail"))
+app.get("/debug/queries")(_lazy_route("debug", "debug_queries"))
+app.post("/debug/queries/reset")(_lazy_route("debug", "debug_queries_reset"))
 
 # 调试路由（开发环境）
 if os.getenv('RUN_MODE', 'dev') == 'dev':
-    app.get("/debug/style-check")(debug.debug_dashboard)
+    app.get("/debug/style-check")(_lazy_route("debug", "debug_dashboard"))
     # 开发工具：重置模板
-    app.post("/dev/reset-templates")(dev_tools.reset_templates)
+    app.post("/dev/reset-templates")(_lazy_route("dev_tools", "reset_templates"))
     # 开发工具：重置数据库
-    app.post("/dev/reset-database")(dev_tools.reset_database)
+    app.post("/dev/reset-database")(_lazy_route("dev_tools", "reset_database"))
 
 # === 启动日志 ===
 
@@ -273,6 +328,26 @@ logger.info("所有路由已注册完成")
 async def healthcheck():
     return JSONResponse({"status": "ok"})
 
+# Prometheus 指标端点（汇总 bot / web / scheduler 各进程的快照）
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    from config import METRICS_CONFIG
+    from utils.metrics import metrics
+
+    if not METRICS_CONFIG.get("enabled", True):
+        return PlainTextResponse("metrics disabled", status_code=404)
+    # 配置了令牌时按 Bearer 令牌校验（供 Prometheus 抓取），否则仅限已登录的管理员会话
+    token = METRICS_CONFIG.get("token")
+    if token:
+        supplied = request.headers.get("authorization", "")
+        authorized = hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+    else:
+        authorized = bool(request.session.get("is_admin", False))
+    if not authorized:
+        return PlainTextResponse("unauthorized", status_code=401)
+    body = await asyncio.to_thread(metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # 在Web进程内启动调度器（单服务部署时使用）
 try:
     # 本地(dev)默认不启动；云端/生产默认启动。可通过 SCHEDULER_ENABLED 显式覆盖。
@@ -302,18 +377,27 @@ try:
     if bot_config.use_webhook:
         from bot import TelegramMerchantBot
         from aiogram.types import Update
+        from services.webhook_shards import create_shard_pool
 
         _bot_instance = TelegramMerchantBot()
+        # WEBHOOK_WORKERS > 1 时更新按 chat_id 分发到 worker 进程，本进程只负责接收
+        _shard_pool = create_shard_pool()
 
         async def _bot_startup():
             try:
                 await _bot_instance._on_startup()
                 logger.info("Bot 已随 Web 应用启动 (Webhook 模式)")
+                if _shard_pool:
+                    # 表结构已由上面的启动流程初始化完毕，worker 直接处理更新
+                    _shard_pool.start()
+                    logger.info(f"Webhook 分片已启动: {_shard_pool.workers} 个 worker 进程")
             except Exception as e:
                 logger.error(f"Bot 启动失败: {e}")
 
         async def _bot_shutdown():
             try:
+                if _shard_pool:
+                    await asyncio.to_thread(_shard_pool.stop)
                 await _bot_instance._on_shutdown()
                 logger.info("Bot 已随 Web 应用关闭")
             except Exception as e:
@@ -326,6 +410,11 @@ try:
         async def telegram_webhook(request: Request):
             try:
                 payload = await request.json()
+                if _shard_pool and _shard_pool.started:
+                    if not _shard_pool.submit(payload):
+                        # worker 积压已满：返回非 2xx，Telegram 会稍后重投该更新
+                        return JSONResponse({"ok": False, "error": "busy"}, status_code=503)
+                    return JSONResponse({"ok": True})
                 update = Update.model_validate(payload)
                 await _bot_instance.dp.feed_update(_bot_instance.bot, update)
                 return JSONResponse({"ok": True})
@@ -19,15 +19,16 @@ from . import (
     binding_codes,
     posts,
     templates,
-    debug,
     media
 )
 
+# debug / dev_tools / user_analytics 为低频页面，由 web/app.py 在首次访问时懒加载
+
 # 路由已在web/app.py中直接注册，无需批量注册函数
 
 # 导出所有路由模块供web/app.py直接导入使用
 __all__ = [
     'auth', 'dashboard', 'merchants', 'users', 'orders',
     'reviews', 'regions', 'incentives', 'subscription',
-    'binding_codes', 'posts', 'templates', 'debug', 'media'
+    'binding_codes', 'posts', 'templates', 'media'
 ]
@@ -13,6 +13,17 @@ from ..layout import create_layout, require_auth
 from ..services.dashboard_service import DashboardService
 
 
+def _data_source_label(stats_data: dict) -> str:
+    """统计数据来源说明：分析快照显示快照时间与距今时长，否则为主库实时数据"""
+    source = stats_data.get('data_source') or {}
+    if not source.get('snapshot'):
+        return "数据来源: 主库实时"
+    as_of = datetime.fromisoformat(source['as_of'])
+    minutes = int((datetime.now() - as_of).total_seconds() // 60)
+    age = f"{minutes} 分钟前" if minutes > 0 else "刚刚"
+    return f"数据来源: 分析快照（{as_of.strftime('%H:%M:%S')}，{age}）"
+
+
 @require_auth
 async def dashboard(request: Request):
     """仪表板页面 - 基于实际数据的统计显示"""
@@ -25,6 +36,7 @@ async def dashboard(request: Request):
         Div(
             H1("系统仪表板", cls="page-title"),
             P(f"数据更新时间: { (stats_data.get('last_updated') or '')[:19] }", cls="page-subtitle"),
+            P(_data_source_label(stats_data), cls="page-subtitle"),
             cls="page-header"
         ),
         
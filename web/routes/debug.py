@@ -10,9 +10,10 @@ import os
 from datetime import datetime
 from fasthtml.common import *
 from starlette.requests import Request
+from starlette.responses import JSONResponse, RedirectResponse
 
 # 导入布局和认证组件
-from ..layout import create_layout, require_auth
+from ..layout import create_layout, require_auth, get_or_create_csrf_token, validate_csrf
 
 logger = logging.getLogger(__name__)
 
@@ -99,4 +100,347 @@ async def debug_database(request: Request):
             H1("数据库调试错误", cls="text-2xl font-bold text-red-600 mb-4"),
             P(f"错误信息: {str(e)}", cls="text-gray-600")
         )
-        return create_layout("系统错误", error_content)
\ No newline at end of file
+        return create_layout("系统错误", error_content)
+
+@require_auth
+async def debug_ingestion(request: Request):
+    """更新接入调度状态（本进程内各优先级通道的排队深度与延迟）"""
+    try:
+        from middleware.ingestion import ingestion_gate
+
+        stats = ingestion_gate.get_stats()
+        columns = [
+            ("queued", "排队"), ("active", "处理中"), ("admitted", "已放行"), ("shed", "排队满丢弃"),
+            ("expired", "超时丢弃"), ("wait_p50_ms", "等待P50(ms)"), ("wait_p95_ms", "等待P95(ms)"),
+            ("handle_p50_ms", "处理P50(ms)"), ("handle_p95_ms", "处理P95(ms)"),
+        ]
+        rows = [
+            Tr(Td(lane), *[Td(str(lane_stats[key])) for key, _ in columns])
+            for lane, lane_stats in stats["lanes"].items()
+        ]
+
+        content = Div(
+            Div(
+                H1("接入调度", cls="page-title"),
+                P(f"并发上限 {stats['max_concurrency']}，当前处理中 {stats['active']}", cls="page-subtitle"),
+                cls="page-header"
+            ),
+            Div(
+                Table(
+                    Thead(Tr(Th("通道"), *[Th(title) for _, title in columns])),
+                    Tbody(*rows),
+                    cls="table table-zebra w-full"
+                ),
+                P("仅统计本进程；Webhook 分片模式下各 worker 进程分别统计。", cls="text-sm text-gray-500 mt-2"),
+                cls="card bg-base-100 shadow-xl p-4"
+            ),
+            cls="page-content"
+        )
+
+        return create_layout("接入调度", content)
+
+    except Exception as e:
+        logger.error(f"接入调度页面错误: {e}")
+        error_content = Div(
+            H1("接入调度页面错误", cls="text-2xl font-bold text-red-600 mb-4"),
+            P(f"错误信息: {str(e)}", cls="text-gray-600")
+        )
+        return create_layout("系统错误", error_content)
+
+
+def _format_ns(ns: int) -> str:
+    return datetime.fromtimestamp(ns / 1e9).strftime('%m-%d %H:%M:%S')
+
+
+@require_auth
+async def debug_traces(request: Request):
+    """请求追踪：最近保留的 trace 列表与开关"""
+    try:
+        from utils.tracing import tracer
+
+        stats = tracer.get_stats()
+        csrf = get_or_create_csrf_token(request)
+        rows = []
+        for trace in tracer.recent(100):
+            summary = trace.summary()
+            breakdown = "，".join(f"{k} {v}ms" for k, v in summary["breakdown_ms"].items())
+            attrs = summary["attributes"]
+            rows.append(Tr(
+                Td(_format_ns(summary["start"])),
+                Td(A(summary["trace_id"][:12], href=f"/debug/traces/{summary['trace_id']}", cls="link")),
+                Td(f"{attrs.get('update.type', summary['name'])} / {attrs.get('user.id', '-')}"),
+                Td(f"{summary['duration_ms']}ms"),
+                Td(str(summary["span_count"])),
+                Td(breakdown or "-"),
+                Td(summary["error"] or "", cls="text-red-600"),
+            ))
+
+        content = Div(
+            Div(
+                H1("请求追踪", cls="page-title"),
+                P(
+                    f"{'已启用' if stats['enabled'] else '未启用'}，采样率 {stats['sample_rate']}，"
+                    f"慢阈值 {stats['slow_ms']}ms，缓冲 {stats['buffered']}/{stats['buffer_size']}，"
+                    f"累计 {stats['started']} 个 / 保留 {stats['kept']} 个",
+                    cls="page-subtitle"
+                ),
+                cls="page-header"
+            ),
+            Div(
+                Form(
+                    Input(type="hidden", name="csrf_token", value=csrf),
+                    Input(type="hidden", name="enabled", value="false" if stats["enabled"] else "true"),
+                    Label("采样率", cls="mr-2"),
+                    Input(type="number", name="sample_rate", value=str(stats["sample_rate"]),
+                          step="0.01", min="0", max="1", cls="input input-bordered input-sm w-24 mr-2"),
+                    Label("慢阈值(ms)", cls="mr-2"),
+                    Input(type="number", name="slow_ms", value=str(stats["slow_ms"]),
+                          min="0", cls="input input-bordered input-sm w-24 mr-2"),
+                    Button("停用追踪" if stats["enabled"] else "启用追踪", type="submit", cls="btn btn-sm btn-primary mr-2"),
+                    A("导出 OTLP JSON", href="/debug/traces/export", cls="btn btn-sm btn-secondary"),
+                    method="post", action="/debug/traces/config", cls="flex flex-wrap items-center gap-1"
+                ),
+                cls="card bg-base-100 shadow-xl p-4 mb-6"
+            ),
+            Div(
+                Table(
+                    Thead(Tr(Th("时间"), Th("Trace"), Th("类型 / 用户"), Th("耗时"), Th("Span"), Th("分布"), Th("错误"))),
+                    Tbody(*rows) if rows else Tbody(Tr(Td("暂无数据", colspan="7"))),
+                    cls="table table-zebra w-full"
+                ),
+                P("仅本进程；Webhook 分片模式下各 worker 进程分别记录。", cls="text-sm text-gray-500 mt-2"),
+                cls="card bg-base-100 shadow-xl p-4"
+            ),
+            cls="page-content"
+        )
+        return create_layout("请求追踪", content)
+
+    except Exception as e:
+        logger.error(f"请求追踪页面错误: {e}")
+        error_content = Div(
+            H1("请求追踪页面错误", cls="text-2xl font-bold text-red-600 mb-4"),
+            P(f"错误信息: {str(e)}", cls="text-gray-600")
+        )
+        return create_layout("系统错误", error_content)
+
+
+@require_auth
+async def debug_trace_detail(request: Request):
+    """单个 trace 的 span 时间线"""
+    from utils.tracing import tracer
+
+    trace_id = request.path_params.get('trace_id', '')
+    trace = tracer.get(trace_id)
+    if trace is None:
+        return create_layout("请求追踪", Div(
+            H1("Trace 不存在或已被淘汰", cls="page-title"),
+            A("返回列表", href="/debug/traces", cls="btn btn-sm"),
+            cls="page-content"
+        ))
+
+    root = trace.root
+    total = max(root.duration_ms, 0.001)
+    depth = {root.span_id: 0}
+    rows = []
+    for span in trace.spans:
+        level = depth.get(span.parent_id, -1) + 1 if span.parent_id else 0
+        depth[span.span_id] = level
+        offset = (span.start_ns - root.start_ns) / 1e6
+        attrs = "，".join(f"{k}={v}" for k, v in span.attributes.items())
+        events = "，".join(name + "(" + ",".join(f"{k}={v}" for k, v in a.items()) + ")" for _, name, a in span.events)
+        rows.append(Tr(
+            Td(Span("\u00a0\u00a0" * level + span.name), cls="font-mono whitespace-nowrap"),
+            Td(f"+{offset:.1f}ms"),
+            Td(f"{span.duration_ms:.2f}ms"),
+            Td(Div(style=f"margin-left:{offset / total * 100:.1f}%;width:{max(span.duration_ms / total * 100, 0.5):.1f}%;"
+                         "height:8px;background:#3b82f6;"), cls="w-64"),
+            Td(attrs, cls="text-xs break-all"),
+            Td(events, cls="text-xs"),
+            Td(span.error or "", cls="text-red-600 text-xs"),
+        ))
+
+    content = Div(
+        Div(
+            H1(f"Trace {trace.trace_id}", cls="page-title"),
+            P(f"{root.name}，{root.duration_ms:.2f}ms，{len(trace.spans)} 个 span"
+              + (f"（另有 {trace.dropped} 个超出上限未记录）" if trace.dropped else ""), cls="page-subtitle"),
+            Div(
+                A("返回列表", href="/debug/traces", cls="btn btn-sm mr-2"),
+                A("导出 OTLP JSON", href=f"/debug/traces/export?trace_id={trace.trace_id}", cls="btn btn-sm btn-secondary"),
+            ),
+            cls="page-header"
+        ),
+        Div(
+            Table(
+                Thead(Tr(Th("Span"), Th("开始"), Th("耗时"), Th("时间线"), Th("属性"), Th("事件"), Th("错误"))),
+                Tbody(*rows),
+                cls="table table-compact w-full"
+            ),
+            cls="card bg-base-100 shadow-xl p-4"
+        ),
+        cls="page-content"
+    )
+    return create_layout("请求追踪", content)
+
+
+@require_auth
+async def debug_traces_export(request: Request):
+    """导出 OTLP/JSON（可用 trace_id 参数只导出单个 trace）"""
+    from utils.tracing import tracer
+
+    trace_id = request.query_params.get('trace_id')
+    if trace_id:
+        trace = tracer.get(trace_id)
+        traces = [trace] if trace else []
+    else:
+        traces = None
+    return JSONResponse(
+        tracer.export_otlp(traces),
+        headers={"Content-Disposition": "attachment; filename=traces.otlp.json"}
+    )
+
+
+@require_auth
+async def debug_traces_config(request: Request):
+    """调整追踪开关、采样率与慢阈值"""
+    from utils.tracing import tracer
+
+    form = await request.form()
+    if not validate_csrf(request, form.get('csrf_token', '')):
+        return RedirectResponse(url="/debug/traces", status_code=302)
+    try:
+        tracer.configure(
+            enabled=str(form.get('enabled', '')).lower() == 'true',
+            sample_rate=min(1.0, max(0.0, float(form.get('sample_rate') or tracer.sample_rate))),
+            slow_ms=max(0.0, float(form.get('slow_ms') or tracer.slow_ms)),
+        )
+        logger.info(f"请求追踪配置已更新: {tracer.get_stats()}")
+    except ValueError as e:
+        logger.warning(f"请求追踪配置无效: {e}")
+    return RedirectResponse(url="/debug/traces", status_code=302)
+
+
+def _plan_cell(plan):
+    if not plan:
+        return Td("-")
+    return Td(Details(Summary("查看"), Pre(plan, cls="text-xs whitespace-pre-wrap")))
+
+
+@require_auth
+async def debug_queries(request: Request):
+    """慢查询与全表扫描：按 SQL 指纹汇总（全部进程），用于决定补哪些索引"""
+    try:
+        from database.db_query_profiler import query_profiler
+
+        await query_profiler.flush()
+        stats = query_profiler.get_stats()
+        slow_rows = await query_profiler.load_top("slow")
+        scan_rows = await query_profiler.load_top("scan")
+        csrf = get_or_create_csrf_token(request)
+
+        slow_table = [
+            Tr(
+                Td(row["fingerprint"], cls="font-mono text-xs break-all"),
+                Td(row["op"]),
+                Td(str(row["slow_count"])),
+                Td(f"{row['slow_total_ms']:.0f}ms"),
+                Td(f"{row['max_ms']:.1f}ms"),
+                Td(f"{row['total_ms'] / max(row['exec_count'], 1):.2f}ms"),
+                Td(row["param_shape"] or "-", cls="font-mono text-xs"),
+                Td(row["scan_tables"] or "-", cls="text-red-600"),
+                _plan_cell(row["query_plan"]),
+            )
+            for row in slow_rows
+        ]
+        scan_table = [
+            Tr(
+                Td(row["fingerprint"], cls="font-mono text-xs break-all"),
+                Td(row["scan_tables"], cls="text-red-600"),
+                Td(str(row["exec_count"])),
+                Td(f"{row['total_ms']:.0f}ms"),
+                Td(f"{row['total_ms'] / max(row['exec_count'], 1):.2f}ms"),
+                _plan_cell(row["query_plan"]),
+            )
+            for row in scan_rows
+        ]
+        recent_table = [
+            Tr(
+                Td(item["at"].strftime('%m-%d %H:%M:%S')),
+                Td(item["op"]),
+                Td(f"{item['ms']}ms"),
+                Td(item["fingerprint"], cls="font-mono text-xs break-all"),
+                Td(item["param_shape"] or "-", cls="font-mono text-xs"),
+            )
+            for item in reversed(query_profiler.recent)
+        ]
+
+        content = Div(
+            Div(
+                H1("慢查询", cls="page-title"),
+                P(
+                    f"{'已启用' if stats['enabled'] else '未启用'}，慢查询阈值 {stats['threshold_ms']}ms，"
+                    f"大表阈值 {stats['large_table_rows']} 行；本进程跟踪 {stats['tracked']} 个指纹，"
+                    f"慢查询 {stats['slow']} 次",
+                    cls="page-subtitle"
+                ),
+                Form(
+                    Input(type="hidden", name="csrf_token", value=csrf),
+                    Button("清空统计", type="submit", cls="btn btn-sm btn-warning"),
+                    method="post", action="/debug/queries/reset",
+                    onsubmit="return confirm('确定清空慢查询统计？');"
+                ),
+                cls="page-header"
+            ),
+            Div(
+                H2("慢查询排行（按慢查询总耗时）", cls="text-lg font-bold mb-2"),
+                Table(
+                    Thead(Tr(Th("SQL 指纹"), Th("操作"), Th("慢次数"), Th("慢总耗时"), Th("最大"),
+                             Th("平均"), Th("参数形态"), Th("全表扫描"), Th("执行计划"))),
+                    Tbody(*slow_table) if slow_table else Tbody(Tr(Td("暂无数据", colspan="9"))),
+                    cls="table table-zebra w-full"
+                ),
+                cls="card bg-base-100 shadow-xl p-4 mb-6"
+            ),
+            Div(
+                H2("全表扫描大表的语句（按执行次数）", cls="text-lg font-bold mb-2"),
+                Table(
+                    Thead(Tr(Th("SQL 指纹"), Th("扫描的表(行数)"), Th("执行次数"), Th("总耗时"),
+                             Th("平均"), Th("执行计划"))),
+                    Tbody(*scan_table) if scan_table else Tbody(Tr(Td("暂无数据", colspan="6"))),
+                    cls="table table-zebra w-full"
+                ),
+                P("执行次数只统计被标记之后；汇总每分钟由各进程写入。", cls="text-sm text-gray-500 mt-2"),
+                cls="card bg-base-100 shadow-xl p-4 mb-6"
+            ),
+            Div(
+                H2("最近慢查询（本进程）", cls="text-lg font-bold mb-2"),
+                Table(
+                    Thead(Tr(Th("时间"), Th("操作"), Th("耗时"), Th("SQL 指纹"), Th("参数形态"))),
+                    Tbody(*recent_table) if recent_table else Tbody(Tr(Td("暂无数据", colspan="5"))),
+                    cls="table table-zebra w-full"
+                ),
+                cls="card bg-base-100 shadow-xl p-4"
+            ),
+            cls="page-content"
+        )
+        return create_layout("慢查询", content)
+
+    except Exception as e:
+        logger.error(f"慢查询页面错误: {e}")
+        error_content = Div(
+            H1("慢查询页面错误", cls="text-2xl font-bold text-red-600 mb-4"),
+            P(f"错误信息: {str(e)}", cls="text-gray-600")
+        )
+        return create_layout("系统错误", error_content)
+
+
+@require_auth
+async def debug_queries_reset(request: Request):
+    """清空慢查询统计"""
+    from database.db_query_profiler import query_profiler
+
+    form = await request.form()
+    if validate_csrf(request, form.get('csrf_token', '')):
+        await query_profiler.reset()
+        logger.info("慢查询统计已清空")
+    return RedirectResponse(url="/debug/queries", status_code=302)
@@ -6,24 +6,24 @@
 """
 
 import logging
-import io
-from typing import Any
+import os
 from starlette.routing import Route
-from starlette.responses import Response
+from starlette.responses import Response, FileResponse, RedirectResponse
 from starlette.exceptions import HTTPException
 from starlette.requests import Request
 
 # 导入项目模块
+from config import MEDIA_CACHE_CONFIG, MEDIA_THUMBNAIL_CONFIG
 from database.db_media import media_db
+from services.media_cache import media_cache
 
 logger = logging.getLogger(__name__)
 
 async def media_proxy(request: Request):
     """
     核心媒体代理路由。
-    根据URL中的media_id，从Telegram实时下载文件并作为HTTP响应返回。
-    
-    使用 request.app.state.bot 获取Bot实例（标准Starlette/FastAPI模式）
+    根据URL中的media_id，经媒体缓存层取得本地文件并作为HTTP响应返回。
+    支持 ETag/If-None-Match 与 Range 请求，重复浏览不会重复从Telegram下载。
     """
     media_id = request.path_params.get('media_id')
     if not media_id:
@@ -48,51 +48,79 @@ async def media_proxy(request: Request):
         logger.warning(f"请求的 media_id {media_id} 在数据库中不存在。")
         raise HTTPException(status_code=404, detail="找不到指定的媒体文件")
 
+    # 2. 通过媒体缓存获取本地文件（file_path 缓存 + 磁盘 LRU + 并发合并）
     try:
-        # 2. 通过HTTP请求Telegram API获取文件路径并流式回传
-        import aiohttp
-        api_base = f"https://api.telegram.org/bot{bot_token}"
-        file_base = f"https://api.telegram.org/file/bot{bot_token}"
-
-        # 支持从环境变量读取代理，并允许走系统代理（trust_env=True）
-        import os
-        proxy_url = os.getenv('TG_PROXY') or os.getenv('HTTPS_PROXY') or os.getenv('HTTP_PROXY')
-        async with aiohttp.ClientSession(trust_env=True) as session:
-            # 获取 file_path
-            getfile_kwargs = {"timeout": aiohttp.ClientTimeout(total=15)}
-            if proxy_url:
-                getfile_kwargs["proxy"] = proxy_url
-            async with session.get(f"{api_base}/getFile", params={"file_id": telegram_file_id}, **getfile_kwargs) as r:
-                data = await r.json()
-                if not data.get('ok'):
-                    raise RuntimeError(f"getFile失败: {data}")
-                file_path = data['result']['file_path']
-
-            # 根据扩展名推断 MIME
-            import os
-            ext = os.path.splitext(file_path)[1].lower()
-            mime_map = {
-                '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png',
-                '.gif': 'image/gif', '.webp': 'image/webp', '.mp4': 'video/mp4'
-            }
-            media_type = mime_map.get(ext, 'application/octet-stream')
-
-            # 拉取文件并以完整响应返回（避免 chunked 传输在浏览器侧报错）
-            file_kwargs = {"timeout": aiohttp.ClientTimeout(total=30)}
-            if proxy_url:
-                file_kwargs["proxy"] = proxy_url
-            async with session.get(f"{file_base}/{file_path}", **file_kwargs) as rf:
-                if rf.status != 200:
-                    raise RuntimeError(f"下载文件失败: HTTP {rf.status}")
-                content = await rf.read()
-                return Response(content, media_type=media_type, headers={"Content-Length": str(len(content))})
-
+        cached = await media_cache.get(telegram_file_id)
     except Exception as e:
         # 处理各种可能的Telegram API错误
         logger.error(f"处理 media_id {media_id} (file_id: {telegram_file_id}) 时发生Telegram API或IO错误: {e}")
         raise HTTPException(status_code=502, detail="无法从Telegram获取媒体文件")
 
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": f"private, max-age={MEDIA_CACHE_CONFIG['browser_max_age']}, immutable",
+    }
+
+    # 3. 条件请求：浏览器已有同一文件则直接 304
+    if_none_match = request.headers.get("if-none-match", "")
+    if cached.etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    # 4. FileResponse 负责 Range/If-Range 与零拷贝发送
+    return FileResponse(cached.path, media_type=cached.media_type, headers=headers)
+
+# 已提交、尚未结束的缩略图补生成任务（避免同一页面反复提交；结束后移除，失败可再次提交）
+_pending_thumbnails: set = set()
+
+
+async def _generate_pending_thumbnails(media_id, telegram_file_id: str, media_type: str) -> None:
+    from services.media_thumbnails import generate_thumbnails
+    try:
+        await generate_thumbnails(int(media_id), telegram_file_id, media_type)
+    finally:
+        _pending_thumbnails.discard(media_id)
+
+
+async def media_thumbnail(request: Request):
+    """
+    媒体缩略图路由。
+    返回后台生成的 WebP 缩略图；尚未生成时提交补生成任务，图片回退到原图代理。
+    """
+    media_id = request.path_params.get('media_id')
+    variant = request.path_params.get('variant')
+    if variant not in MEDIA_THUMBNAIL_CONFIG["sizes"] and variant != 'poster':
+        raise HTTPException(status_code=404, detail="不支持的缩略图规格")
+
+    thumb = await media_db.get_thumbnail(media_id, variant)
+    if thumb and os.path.exists(thumb['file_path']):
+        etag = f'"{os.path.basename(thumb["file_path"])}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"private, max-age={MEDIA_CACHE_CONFIG['browser_max_age']}, immutable",
+        }
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        return FileResponse(thumb['file_path'], media_type="image/webp", headers=headers)
+
+    media = await media_db.get_media(media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="找不到指定的媒体文件")
+
+    if media_id not in _pending_thumbnails:
+        _pending_thumbnails.add(media_id)
+        try:
+            from services.task_queue import enqueue_task
+            enqueue_task(_generate_pending_thumbnails, media_id, media['telegram_file_id'], media['media_type'])
+        except Exception as e:
+            _pending_thumbnails.discard(media_id)
+            logger.warning(f"提交媒体 {media_id} 缩略图补生成任务失败: {e}")
+
+    if media['media_type'] == 'photo':
+        return RedirectResponse(f"/media-proxy/{media_id}", status_code=302)
+    raise HTTPException(status_code=404, detail="视频封面尚未生成")
+
 # 导出路由列表
 media_routes = [
-    Route("/media-proxy/{media_id:int}", endpoint=media_proxy, methods=["GET"])
+    Route("/media-proxy/{media_id:int}", endpoint=media_proxy, methods=["GET"]),
+    Route("/media-proxy/{media_id:int}/thumb/{variant:str}", endpoint=media_thumbnail, methods=["GET"])
 ]
@@ -6,7 +6,7 @@
 
 import logging
 from fasthtml.common import *
-from typing import Any
+from typing import Any, Optional
 from starlette.requests import Request
 
 # 导入布局和认证组件
@@ -46,7 +46,8 @@ async def merchants_list(request: Request):
             status=final_status,
             search=search_query,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=params.get('cursor') or None
         )
         
         merchants = merchants_data["merchants"]
@@ -247,7 +248,7 @@ async def merchants_list(request: Request):
                 ),
 
                 # 分页组件（与 /reviews 保持一致的本地实现）
-                (lambda cur, pages, qp, pp, tot: _generate_pagination(cur, pages, qp, pp, tot) if pages and pages > 1 else Div())(
+                (lambda cur, pages, qp, pp, tot: _generate_pagination(cur, pages, qp, pp, tot, pagination.get('next_cursor')) if pages and pages > 1 else Div())(
                     pagination.get('page', 1), pagination.get('pages', 1), request.query_params, pagination.get('per_page', per_page), pagination.get('total', 0)
                 ),
                 cls="page-content"
@@ -441,15 +442,17 @@ async def merchant_refresh_info(request: Request):
         return RedirectResponse(url=f"/merchants/{merchant_id}/detail?error=exception", status_code=302)
 
 
-def _generate_pagination(current_page: int, total_pages: int, query_params, per_page: int, total_items: int) -> Any:
+def _generate_pagination(current_page: int, total_pages: int, query_params, per_page: int, total_items: int,
+                         next_cursor: Optional[str] = None) -> Any:
     """生成分页导航（复制并简化自 reviews/_generate_pagination）"""
     if total_pages <= 1:
         return Div()
 
-    # 构建查询字符串（移除旧的page参数）
+    # 构建查询字符串（移除旧的page/cursor参数；游标只附在紧邻的下一页上）
     query_dict = dict(query_params)
-    if 'page' in query_dict:
-        del query_dict['page']
+    query_dict.pop('page', None)
+    query_dict.pop('cursor', None)
+    next_suffix = f"&cursor={next_cursor}" if next_cursor else ""
     query_string = "&".join([f"{k}={v}" for k, v in query_dict.items() if v is not None and v != ""])
     query_prefix = f"?{query_string}&" if query_string else "?"
 
@@ -465,10 +468,11 @@ def _generate_pagination(current_page: int, total_pages: int, query_params, per_
         if page_num == current_page:
             pages.append(Span(str(page_num), cls="btn btn-primary btn-sm"))
         else:
-            pages.append(A(str(page_num), href=f"/merchants{query_prefix}page={page_num}", cls="btn btn-outline btn-sm"))
+            pages.append(A(str(page_num), href=f"/merchants{query_prefix}page={page_num}" + (next_suffix if page_num == current_page + 1 else ""),
+                           cls="btn btn-outline btn-sm"))
 
     if current_page < total_pages:
-        pages.append(A("下一页 ›", href=f"/merchants{query_prefix}page={current_page+1}", cls="btn btn-outline btn-sm"))
+        pages.append(A("下一页 ›", href=f"/merchants{query_prefix}page={current_page+1}{next_suffix}", cls="btn btn-outline btn-sm"))
 
     # 附带当前显示区间信息
     start_idx = (current_page - 1) * per_page + 1
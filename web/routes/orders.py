@@ -29,6 +29,7 @@ async def orders_list(request: Request):
         search_query = request.query_params.get('search', '').strip()
         page = int(request.query_params.get('page', '1'))
         per_page = int(request.query_params.get('per_page', '20'))
+        cursor = request.query_params.get('cursor') or None
         
         # 调用服务层获取订单数据（传入所有筛选参数）
         orders_data = await OrderMgmtService.get_orders_list(
@@ -39,7 +40,8 @@ async def orders_list(request: Request):
             date_to=date_to if date_to else None,
             search_query=search_query if search_query else None,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=cursor
         )
         
         orders = orders_data["orders"]
@@ -261,7 +263,8 @@ async def orders_list(request: Request):
                     cls="text-sm text-gray-500 mb-4"),
                 Div(
                     *([A(str(p), 
-                        href=f"/orders?page={p}&status={status_filter}&merchant_id={merchant_filter}&customer_id={customer_filter}&date_from={date_from}&date_to={date_to}&per_page={per_page}",
+                        href=f"/orders?page={p}&status={status_filter}&merchant_id={merchant_filter}&customer_id={customer_filter}&date_from={date_from}&date_to={date_to}&per_page={per_page}"
+                             + (f"&cursor={pagination['next_cursor']}" if p == pagination['page'] + 1 and pagination.get('next_cursor') else ""),
                         cls=f"btn btn-sm {'btn-primary' if p == pagination['page'] else 'btn-ghost'} mr-1")
                       for p in range(max(1, pagination['page'] - 2), min(pagination['pages'] + 1, pagination['page'] + 3))]
                      if pagination['pages'] > 1 else []),
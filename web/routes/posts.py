@@ -279,7 +279,8 @@ async def posts_list(request: Request):
             kw_id=kw_id,
             price_p=price_p,
             price_pp=price_pp,
-            sort_by=sort_by
+            sort_by=sort_by,
+            cursor=params.get('cursor') or None
         )
         
         posts = posts_data["posts"]
@@ -417,7 +418,8 @@ async def posts_list(request: Request):
                 *[
                     A(
                         str(p),
-                        href=f"/posts?page={p}&per_page={per_page}&status={status_filter or '_all'}&district={district_filter or '_all'}&search={search_query}&sort={sort_by}",
+                        href=f"/posts?page={p}&per_page={per_page}&status={status_filter or '_all'}&district={district_filter or '_all'}&search={search_query}&sort={sort_by}"
+                             + (f"&cursor={pagination['next_cursor']}" if p == page + 1 and pagination.get('next_cursor') else ""),
                         cls=f"btn btn-sm {'btn-active' if p == page else 'btn-ghost'}"
                     )
                     for p in range(max(1, page-2), min(total_pages+1, page+3))
@@ -657,7 +659,14 @@ async def post_detail(request: Request, post_id: int):
                     for m in media_files[:6]:
                         mid = m.get('id')
                         mtype = m.get('media_type')
-                        thumb = Img(src=f"/media-proxy/{mid}", cls="w-full h-40 object-cover rounded") if mtype=='photo' else Div(A("预览视频", href=f"/media-proxy/{mid}", cls="link"))
+                        # 列表只加载缩略图，原图/视频通过链接按需打开
+                        thumb = A(
+                            Img(src=f"/media-proxy/{mid}/thumb/md", loading="lazy", alt=f"{mtype} #{mid}", cls="w-full h-40 object-cover rounded"),
+                            href=f"/media-proxy/{mid}", target="_blank"
+                        ) if mtype=='photo' else Div(
+                            Img(src=f"/media-proxy/{mid}/thumb/md", loading="lazy", alt="视频封面", cls="w-full h-40 object-cover rounded", onerror="this.style.display='none'"),
+                            A("预览视频", href=f"/media-proxy/{mid}", target="_blank", cls="link")
+                        )
                         tiles.append(
                             Div(
                                 Div(thumb, cls=""),
@@ -5,6 +5,7 @@
 """
 
 import logging
+from typing import Any, Optional
 from fasthtml.common import *
 from starlette.requests import Request
 
@@ -50,7 +51,8 @@ async def reviews_list(request: Request):
             date_to=date_to,
             search_query=search_query,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=request.query_params.get('cursor') or None
         )
         
         # 容错读取数据（修复字段命名不一致问题）
@@ -347,7 +349,7 @@ async def reviews_list(request: Request):
             # 分页组件与显示区间
             Div(
                 # 分页按钮
-                _generate_pagination(page, total_pages, request.query_params) if total_pages > 1 else Div(),
+                _generate_pagination(page, total_pages, request.query_params, pagination.get('next_cursor')) if total_pages > 1 else Div(),
                 # 显示区间文案
                 P(f"显示第 {(page-1)*per_page+1}-{min(page*per_page, total_reviews)} 条，共 {total_reviews} 条评价",
                   cls="text-sm text-gray-500"),
@@ -611,15 +613,16 @@ async def export_reviews(request: Request):
         return create_layout("导出失败", error_content)
 
 
-def _generate_pagination(current_page: int, total_pages: int, query_params) -> Any:
-    """生成分页导航"""
+def _generate_pagination(current_page: int, total_pages: int, query_params, next_cursor: Optional[str] = None) -> Any:
+    """生成分页导航（下一页携带键集游标，跳页仍按页码）"""
     if total_pages <= 1:
         return Div()
     
     # 构建查询字符串
     query_dict = dict(query_params)
-    if 'page' in query_dict:
-        del query_dict['page']
+    query_dict.pop('page', None)
+    query_dict.pop('cursor', None)
+    next_suffix = f"&cursor={next_cursor}" if next_cursor else ""
     query_string = "&".join([f"{k}={v}" for k, v in query_dict.items() if v])
     query_prefix = f"?{query_string}&" if query_string else "?"
     
@@ -638,12 +641,13 @@ def _generate_pagination(current_page: int, total_pages: int, query_params) -> A
         if page_num == current_page:
             pages.append(Span(str(page_num), cls="btn btn-primary btn-sm"))
         else:
-            pages.append(A(str(page_num), href=f"/reviews{query_prefix}page={page_num}",
+            pages.append(A(str(page_num), href=f"/reviews{query_prefix}page={page_num}"
+                                              + (next_suffix if page_num == current_page + 1 else ""),
                           cls="btn btn-outline btn-sm"))
     
     # 下一页
     if current_page < total_pages:
-        pages.append(A("下一页 ›", href=f"/reviews{query_prefix}page={current_page+1}",
+        pages.append(A("下一页 ›", href=f"/reviews{query_prefix}page={current_page+1}{next_suffix}",
                       cls="btn btn-outline btn-sm"))
     
     return Div(*pages, cls="join")
@@ -12,6 +12,7 @@ from starlette.requests import Request
 from ..layout import create_layout, require_auth, okx_form_group, okx_input, okx_button, okx_select
 from ..services.user_mgmt_service import UserMgmtService
 from database.db_connection import db_manager
+from services.live_leaderboard import live_leaderboard
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +26,7 @@ async def users_dashboard(request: Request):
     search_query = request.query_params.get("search", "")
     page = int(request.query_params.get("page", "1"))
     per_page = int(request.query_params.get("per_page", "20"))
+    cursor = request.query_params.get("cursor") or None
     
     try:
         # 调用服务层获取用户数据
@@ -32,7 +34,8 @@ async def users_dashboard(request: Request):
             level_filter=level_filter,
             search_query=search_query,
             page=page,
-            per_page=per_page
+            per_page=per_page,
+            cursor=cursor
         )
         
         users = users_data["users"]
@@ -199,7 +202,8 @@ async def users_dashboard(request: Request):
             cls="text-sm text-gray-500 mb-4"),
         Div(
             *([A(str(p), 
-                href=f"/users?page={p}&level={level_filter}&search={search_query}&per_page={per_page}",
+                href=f"/users?page={p}&level={level_filter}&search={search_query}&per_page={per_page}"
+                     + (f"&cursor={pagination['next_cursor']}" if p == pagination['page'] + 1 and pagination.get('next_cursor') else ""),
                 cls=f"btn btn-sm {'btn-primary' if p == pagination['page'] else 'btn-ghost'} mr-1")
               for p in range(max(1, pagination['page'] - 2), min(total_pages + 1, pagination['page'] + 3))]
              if total_pages > 1 else []),
@@ -244,29 +248,26 @@ async def users_leaderboards(request: Request):
         ]
         dim_label = dict(dim_options).get(dim, '长度')
 
-        # Top50
-        rows = await db_manager.fetch_all(
-            """
-            SELECT l.user_id, l.avg_score, l.reviews_count, l.rank,
-                   u.username
-            FROM user_score_leaderboards l
-            LEFT JOIN users u ON u.user_id = l.user_id
-            WHERE l.dimension = ?
-            ORDER BY l.rank
-            LIMIT 50
-            """,
-            (dim,)
-        )
+        if dim not in dict(dim_options):
+            dim = 'length'
+
+        # Top50（实时榜单）
+        rows = await live_leaderboard.top(dim, 50)
+        if rows:
+            ids = [int(r['user_id']) for r in rows]
+            name_rows = await db_manager.fetch_all(
+                f"SELECT user_id, username FROM users WHERE user_id IN ({','.join('?' * len(ids))})",
+                tuple(ids)
+            )
+            names = {int(n['user_id']): n['username'] for n in name_rows or []}
+            rows = [{**r, 'username': names.get(int(r['user_id']))} for r in rows]
         # 自查
         user_id_q = request.query_params.get('user_id', '').strip()
         my_rows = []
         if user_id_q:
             try:
                 uid = int(user_id_q)
-                my_rows = await db_manager.fetch_all(
-                    "SELECT dimension, avg_score, reviews_count, rank FROM user_score_leaderboards WHERE user_id=? ORDER BY dimension",
-                    (uid,)
-                )
+                my_rows = sorted(await live_leaderboard.ranks_for_user(uid), key=lambda d: d['dimension'])
             except ValueError:
                 my_rows = []
 
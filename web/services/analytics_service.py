@@ -17,6 +17,7 @@ from .subscription_mgmt_service import SubscriptionMgmtService
 from .incentive_mgmt_service import IncentiveMgmtService
 # from .binding_mgmt_service import BindingMgmtService  # V2.0: 已迁移到DB Manager
 from database.db_binding_codes import binding_codes_manager
+from database.db_snapshot import reads_from_snapshot
 from .dashboard_service import DashboardService
 
 # 导入缓存服务
@@ -31,6 +32,7 @@ class AnalyticsService:
     CACHE_NAMESPACE = "analytics"
     
     @staticmethod
+    @reads_from_snapshot
     async def get_comprehensive_analytics() -> Dict[str, Any]:
         """
         获取综合分析数据
@@ -79,6 +81,7 @@ class AnalyticsService:
             }
     
     @staticmethod
+    @reads_from_snapshot
     async def get_business_metrics() -> Dict[str, Any]:
         """
         获取业务核心指标
@@ -111,6 +114,7 @@ class AnalyticsService:
             return {'error': str(e)}
     
     @staticmethod
+    @reads_from_snapshot
     async def get_performance_dashboard() -> Dict[str, Any]:
         """
         获取性能仪表板数据
@@ -136,6 +140,7 @@ class AnalyticsService:
             return {'error': str(e)}
     
     @staticmethod
+    @reads_from_snapshot
     async def get_time_series_analytics(
         metric: str,
         time_range: str = '30d',
@@ -188,6 +193,7 @@ class AnalyticsService:
             return {'error': str(e)}
     
     @staticmethod
+    @reads_from_snapshot
     async def get_custom_report(
         report_type: str,
         filters: Dict[str, Any],
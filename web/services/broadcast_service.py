@@ -22,6 +22,7 @@ import aiohttp
 
 from config import BOT_TOKEN
 from database.db_connection import db_manager
+from utils.metrics import BROADCAST_MESSAGES
 
 logger = logging.getLogger(__name__)
 
@@ -292,9 +293,11 @@ async def _run_job(job_id: str, targets: List[int], text: str) -> None:
             job.sent += 1
             if ok:
                 job.success += 1
+                BROADCAST_MESSAGES.inc(result="success")
             else:
                 job.failed += 1
                 job.last_error = last_err
+                BROADCAST_MESSAGES.inc(result="failed")
 
     job.status = "done"
     job.stage = "done"
@@ -9,6 +9,8 @@ import logging
 from typing import Dict, Any, Optional, Callable
 import os
 
+from utils.metrics import CACHE_REQUESTS
+
 logger = logging.getLogger(__name__)
 
 
@@ -79,6 +81,7 @@ class CacheService:
             cache_entry = CacheService._cache_store.get(cache_key)
             
             if not cache_entry:
+                CACHE_REQUESTS.inc(cache=namespace, result="miss")
                 return default
             
             # 检查是否过期
@@ -86,9 +89,11 @@ class CacheService:
                 # 删除过期缓存
                 del CacheService._cache_store[cache_key]
                 logger.debug(f"缓存已过期并删除: {cache_key}")
+                CACHE_REQUESTS.inc(cache=namespace, result="miss")
                 return default
             
             logger.debug(f"缓存命中: {cache_key}")
+            CACHE_REQUESTS.inc(cache=namespace, result="hit")
             return cache_entry['value']
             
         except Exception as e:
@@ -18,6 +18,8 @@ from database.db_reviews import review_manager
 from database.db_binding_codes import binding_codes_manager
 from database.db_media import media_db
 from database.db_orders import OrderManager
+from database.db_snapshot import analytics_snapshot, reads_from_snapshot
+from utils.metrics import metrics
 
 # 导入缓存服务
 from .cache_service import CacheService
@@ -75,6 +77,7 @@ class DashboardService:
             return DashboardService._get_default_dashboard_data()
     
     @staticmethod
+    @reads_from_snapshot
     async def _fetch_dashboard_data() -> Dict[str, Any]:
         """获取实际的仪表板数据"""
         try:
@@ -98,6 +101,10 @@ class DashboardService:
             
             # 系统统计数据
             system_stats = await DashboardService._get_system_statistics()
+
+            # 数据来源：可用时读取分析快照，数据截至快照完成时间
+            snapshot = analytics_snapshot.status()
+            as_of = datetime.fromtimestamp(snapshot['taken_at']) if snapshot['available'] else datetime.now()
             
             return {
                 'merchants': merchant_stats,
@@ -107,6 +114,7 @@ class DashboardService:
                 'users': user_stats,
                 'orders': order_stats,
                 'system': system_stats,
+                'data_source': {'snapshot': snapshot['available'], 'as_of': as_of.isoformat()},
                 'last_updated': datetime.now().isoformat(),
                 'cache_info': {
                     'cached_at': time.time(),
@@ -294,6 +302,7 @@ class DashboardService:
             return {
                 'cache_performance': cache_stats,
                 'cleaned_expired_items': cleaned_count,
+                'cache_hit_ratio': metrics.cache_hit_ratio(),
                 'memory_usage': {
                     'cache_size_mb': cache_stats.get('cache_size_mb', 0),
                     'active_entries': cache_stats.get('active_entries', 0)
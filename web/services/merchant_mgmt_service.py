@@ -13,7 +13,6 @@ from database.db_merchants import merchant_manager
 from database.db_connection import db_manager
 from database.db_fsm import create_fsm_db_manager
 from utils.enums import MERCHANT_STATUS
-from utils.user_detector import TelegramUserDetector
 from config import BOT_TOKEN
 import json
 
@@ -33,7 +32,8 @@ class MerchantMgmtService:
         status: Optional[str] = None,
         search: Optional[str] = None,
         page: int = 1,
-        per_page: int = 20
+        per_page: int = 20,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取商户列表
@@ -43,6 +43,7 @@ class MerchantMgmtService:
             search: 搜索关键词
             page: 页码
             per_page: 每页数量
+            cursor: 上一页末行游标（“下一页”链接携带，提供时走键集分页）
             
         Returns:
             dict: 商户列表数据
@@ -53,7 +54,8 @@ class MerchantMgmtService:
                 page=page,
                 per_page=per_page,
                 status=status,
-                search=search
+                search=search,
+                cursor=cursor
             )
             
             merchants = merchants_data.get('posts', [])  # get_merchants_list返回的是posts字段
@@ -70,7 +72,8 @@ class MerchantMgmtService:
                     'page': page,
                     'per_page': per_page,
                     'total': total_count,
-                    'pages': (total_count + per_page - 1) // per_page
+                    'pages': (total_count + per_page - 1) // per_page,
+                    'next_cursor': merchants_data.get('next_cursor')
                 },
                 'filters': {
                     'status': status,
@@ -242,6 +245,8 @@ class MerchantMgmtService:
             if not chat_id:
                 return {'success': False, 'error': '缺少telegram_chat_id'}
 
+            # python-telegram-bot 仅此处使用，按需导入以缩短启动时间
+            from utils.user_detector import TelegramUserDetector
             detector = TelegramUserDetector(BOT_TOKEN)
             await detector.initialize()
             info = await detector.get_user_info(int(chat_id))
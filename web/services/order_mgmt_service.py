@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 # 导入数据库管理器
 from database.db_orders import OrderManager
 from database.db_connection import db_manager
+from database.db_pagination import cursor_after
 from database.db_merchants import merchant_manager
 from database.db_users import user_manager
 from database.db_reviews import ReviewManager
@@ -71,7 +72,8 @@ class OrderMgmtService:
         date_to: Optional[str] = None,
         search_query: Optional[str] = None,
         page: int = 1,
-        per_page: int = 20
+        per_page: int = 20,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取订单列表
@@ -85,6 +87,7 @@ class OrderMgmtService:
             search_query: 搜索关键词
             page: 页码
             per_page: 每页数量
+            cursor: 上一页末行游标（“下一页”链接携带，提供时走键集分页）
             
         Returns:
             dict: 订单列表数据
@@ -99,7 +102,8 @@ class OrderMgmtService:
                 date_from=date_from,
                 date_to=date_to,
                 limit=per_page,
-                offset=(page - 1) * per_page
+                offset=(page - 1) * per_page,
+                cursor=cursor
             )
             
             # 获取总数 - 使用实际存在的方法
@@ -137,7 +141,8 @@ class OrderMgmtService:
                     'page': page,
                     'per_page': per_page,
                     'total': total_orders,
-                    'pages': (total_orders + per_page - 1) // per_page
+                    'pages': (total_orders + per_page - 1) // per_page,
+                    'next_cursor': cursor_after(orders, per_page)
                 },
                 'filters': {
                     'status_filter': status_filter,
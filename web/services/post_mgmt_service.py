@@ -96,7 +96,8 @@ class PostMgmtService:
         kw_id: Optional[int] = None,
         price_p: Optional[int] = None,
         price_pp: Optional[int] = None,
-        sort_by: str = 'publish_time'
+        sort_by: str = 'publish_time',
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取帖子列表
@@ -109,6 +110,7 @@ class PostMgmtService:
             search_query: 搜索关键词
             page: 页码
             per_page: 每页数量
+            cursor: 上一页末行游标（仅 created_at 排序时生效）
             
         Returns:
             dict: 帖子列表数据
@@ -131,7 +133,8 @@ class PostMgmtService:
                 status=status_val,
                 district_id=district_id_val,
                 search=search_query,
-                sort_by=sort_by
+                sort_by=sort_by,
+                cursor=cursor
             )
             merchants = merchants_data.get('posts', [])
             total_posts = merchants_data.get('total', 0)
@@ -153,7 +156,8 @@ class PostMgmtService:
                     'page': page,
                     'per_page': per_page,
                     'total': total_posts,
-                    'pages': (total_posts + per_page - 1) // per_page
+                    'pages': (total_posts + per_page - 1) // per_page,
+                    'next_cursor': merchants_data.get('next_cursor')
                 },
                 'filters': {
                     'status_filter': status_filter,
@@ -659,6 +663,12 @@ class PostMgmtService:
             if result is None:
                 return {'success': False, 'error': '帖子清理失败'}
 
+            try:
+                from services.publish_timeline import notify_merchant_schedule_changed
+                notify_merchant_schedule_changed(merchant_id)
+            except Exception as e:
+                logger.warning(f"通知发布时间线失败: {e}")
+
             # 2) 清缓存
             CacheService.clear_namespace(PostMgmtService.CACHE_NAMESPACE)
             CacheService.clear_namespace("dashboard")
@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 from database.db_reviews import review_manager
 from database.db_merchants import merchant_manager
 from database.db_users import user_manager
+from database.db_pagination import cursor_after
 
 # 导入缓存服务
 from .cache_service import CacheService
@@ -46,7 +47,8 @@ class ReviewMgmtService:
         date_to: Optional[str] = None,
         search_query: Optional[str] = None,
         page: int = 1,
-        per_page: int = 20
+        per_page: int = 20,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取评价列表
@@ -60,6 +62,7 @@ class ReviewMgmtService:
             search_query: 搜索关键词
             page: 页码
             per_page: 每页数量
+            cursor: 上一页末行游标（“下一页”链接携带，提供时走键集分页）
             
         Returns:
             dict: 评价列表数据
@@ -88,7 +91,8 @@ class ReviewMgmtService:
                 date_from=date_from,
                 date_to=date_to,
                 limit=per_page,
-                offset=(page - 1) * per_page
+                offset=(page - 1) * per_page,
+                cursor=cursor
             )
             
             # 获取总数
@@ -112,7 +116,8 @@ class ReviewMgmtService:
                     'page': page,
                     'per_page': per_page,
                     'total': total_reviews,
-                    'pages': (total_reviews + per_page - 1) // per_page
+                    'pages': (total_reviews + per_page - 1) // per_page,
+                    'next_cursor': cursor_after(reviews, per_page)
                 },
                 'filters': {
                     'status_filter': status_filter,
@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 # 导入数据库管理器
 from database.db_users import user_manager
 from database.db_incentives import incentive_manager
+from database.db_pagination import cursor_after
 
 # 导入缓存服务
 from .cache_service import CacheService
@@ -28,7 +29,8 @@ class UserMgmtService:
         level_filter: Optional[str] = None,
         search_query: Optional[str] = None,
         page: int = 1,
-        per_page: int = 20
+        per_page: int = 20,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         获取用户列表
@@ -38,6 +40,7 @@ class UserMgmtService:
             search_query: 搜索关键词
             page: 页码
             per_page: 每页数量
+            cursor: 上一页末行游标（“下一页”链接携带，提供时走键集分页）
             
         Returns:
             dict: 用户列表数据
@@ -48,7 +51,8 @@ class UserMgmtService:
                 level_filter=level_filter,
                 search=search_query,
                 limit=per_page,
-                offset=(page - 1) * per_page
+                offset=(page - 1) * per_page,
+                cursor=cursor
             )
             
             # 获取总数
@@ -69,7 +73,8 @@ class UserMgmtService:
                     'page': page,
                     'per_page': per_page,
                     'total': total_users,
-                    'pages': (total_users + per_page - 1) // per_page
+                    'pages': (total_users + per_page - 1) // per_page,
+                    'next_cursor': cursor_after(users, per_page, id_key='user_id')
                 },
                 'filters': {
                     'level_filter': level_filter,